@@ -54,3 +54,25 @@ urlpatterns = [
         name="password_change_done",
     ),
 ]
+
+
+# Budget per vista (b2b_portale.view_budgets, test orders/tests/test_view_budgets.py):
+# ruolo dell'utente di prova, argomenti dell'URL (chiavi del dataset di prova),
+# numero massimo di query con il dataset ingrandito.
+VIEW_BUDGETS = {
+    "my_orders": {"role": "client", "queries": 3},
+    "my_order_detail": {"role": "client", "args": ["order"], "queries": 6},
+    "my_order_duplicate": {"skip": "crea un nuovo ordine anche in GET"},
+    "my_structures_list": {"role": "client", "queries": 3},
+    "my_structure_create": {"role": "client", "queries": 2},
+    "my_structure_edit": {"role": "client", "args": ["structure"], "queries": 3},
+    "my_structure_delete": {"role": "client", "args": ["structure"], "queries": 3},
+    "my_dashboard": {"role": "client", "queries": 3},
+    "register": {"role": None, "queries": 0},
+    "login": {"role": None, "queries": 0},
+    "logout": {"skip": "chiude la sessione"},
+    "my_profile": {"role": "client", "queries": 2},
+    "profile": {"role": "client", "queries": 2},
+    "password_change": {"role": "client", "queries": 2},
+    "password_change_done": {"role": "client", "queries": 2},
+}
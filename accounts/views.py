@@ -14,6 +14,7 @@ from .forms import (
     AdminProfileForm,
 )
 from orders.models import Order, OrderItem, OrderMessage
+from orders.services import build_order
 from django.urls import reverse
 from partners.models import PartnerProfile, PartnerNotification
 
@@ -87,17 +88,14 @@ def my_orders_list(request):
     if not _ensure_client(request.user):
         return HttpResponseForbidden("Area riservata ai clienti.")
 
-    # Query base ordini del cliente
-    orders_qs = (
+    # Ordini del cliente (una query, struttura inclusa)
+    orders = list(
         Order.objects
         .filter(client=request.user)
+        .select_related("structure")
         .order_by("-created_at")
-        .prefetch_related("items", "structure")
     )
 
-    # Numeri per i 4 box
-    total_orders = orders_qs.count()
-
     # Stati considerati "in corso" (ordine ancora vivo)
     open_statuses = [
         Order.STATUS_PENDING_PAYMENT,
@@ -105,19 +103,19 @@ def my_orders_list(request):
         Order.STATUS_PROCESSING,
         Order.STATUS_SHIPPED,
     ]
-    open_orders = orders_qs.filter(status__in=open_statuses).count()
 
+    # Numeri per i 4 box (dalla lista già caricata)
+    total_orders = len(orders)
+    open_orders = sum(1 for order in orders if order.status in open_statuses)
     # Completati = realmente conclusi
-    completed_orders = orders_qs.filter(status=Order.STATUS_COMPLETED).count()
-
-    # Annullati
-    cancelled_orders = orders_qs.filter(status=Order.STATUS_CANCELLED).count()
+    completed_orders = sum(1 for order in orders if order.status == Order.STATUS_COMPLETED)
+    cancelled_orders = sum(1 for order in orders if order.status == Order.STATUS_CANCELLED)
 
     # Ultimi 3 ordini (per la sezione "Ultimi ordini")
-    recent_orders = orders_qs[:3]
+    recent_orders = orders[:3]
 
     context = {
-        "orders": orders_qs,
+        "orders": orders,
         "total_orders": total_orders,
         "completed_orders": completed_orders,
         "open_orders": open_orders,
@@ -150,6 +148,7 @@ def my_order_detail(request, order_id):
                 sender=request.user,
                 sender_role=OrderMessage.ROLE_CLIENT,
                 message=text,
+                is_read_by_client=True,   # lo sto inviando io cliente
             )
             print("DEBUG: Messaggio creato con ID", msg.id)
 
@@ -183,9 +182,7 @@ def my_order_detail(request, order_id):
     # --- GET normale (mostra pagina) ---
 
     # segna come letti per il CLIENTE tutti i messaggi non ancora letti
-    OrderMessage.objects.filter(order=order, is_read_by_client=False).update(
-        is_read_by_client=True
-    )
+    OrderMessage.mark_read(order, OrderMessage.ROLE_CLIENT)
 
     items = order.items.select_related("product", "partner").all()
     order_messages = order.messages.all().order_by("created_at")
@@ -215,22 +212,8 @@ def my_order_duplicate(request, order_id):
     # - importi ricalcolati dai prezzi correnti del catalogo
     # (così evitiamo incoerenze se i prezzi cambiano nel tempo).
 
-    # crea una bozza di nuovo ordine con gli stessi dati base (ma totali a 0: li ricalcoliamo)
-    new_order = Order.objects.create(
-        client=order.client,
-        structure=order.structure,
-        status=Order.STATUS_DRAFT,
-        payment_method=order.payment_method,
-        subtotal=Decimal("0.00"),
-        shipping_cost=Decimal("0.00"),
-        total=Decimal("0.00"),
-        notes=f"Duplicato dall'ordine #{order.id}",
-    )
-
-    subtotal = Decimal("0.00")
-    created_items = 0
-
-    for old_item in order.items.select_related("product").all():
+    lines = []
+    for old_item in order.items.select_related("product"):
         product = old_item.product
 
         # Se un prodotto è stato disattivato, non lo duplichiamo (evita ordini "impossibili")
@@ -241,65 +224,28 @@ def my_order_duplicate(request, order_id):
             )
             continue
 
-        unit_price = (getattr(product, "base_price", None) or Decimal("0.00")).quantize(Decimal("0.01"))
-        qty = int(old_item.quantity or 0)
-        if qty <= 0:
-            continue
-
-        total_price = (unit_price * Decimal(qty)).quantize(Decimal("0.01"))
-
-        new_item = OrderItem.objects.create(
-            order=new_order,
-            product=product,
-            partner=getattr(product, "supplier", None),
-            quantity=qty,
-            unit_price=unit_price,
-            total_price=total_price,
-            partner_status=OrderItem.PARTNER_STATUS_PENDING,
-        )
+        # prezzo: base_price corrente (deciso da build_order)
+        lines.append((product.id, old_item.quantity))
 
-        # Calcolo commissioni coerente con la logica corrente
-        try:
-            new_item.calculate_commission()
-            new_item.save(update_fields=["commission_rate", "commission_amount", "partner_earnings"])
-        except Exception:
-            # Non blocchiamo la duplicazione se la commissione non è calcolabile (es. dati incompleti)
-            pass
-
-        subtotal += total_price
-        created_items += 1
+    # nuova bozza con gli stessi dati base; righe, commissioni, spedizione e
+    # totali ricalcolati dai prezzi correnti del catalogo in blocco
+    new_order = build_order(
+        client=order.client,
+        structure=order.structure,
+        lines=lines,
+        status=Order.STATUS_DRAFT,
+        payment_method=order.payment_method,
+        notes=f"Duplicato dall'ordine #{order.id}",
+    )
 
-    # Se non abbiamo duplicato nulla, annulliamo la bozza e torniamo indietro
-    if created_items == 0:
-        new_order.delete()
+    # Se non abbiamo duplicato nulla torniamo indietro (nessuna bozza creata)
+    if new_order is None:
         messages.error(
             request,
             "Impossibile duplicare l'ordine: nessun prodotto duplicabile (prodotti non disponibili o quantità non valide).",
         )
         return redirect("accounts:my_order_detail", order_id=order.id)
 
-    # Shipping e totale: riusiamo calculate_shipping() senza toccare la sessione carrello.
-    try:
-        from orders.shipping import calculate_shipping
-
-        class _DummyCart:
-            def __init__(self, total):
-                self._total = total
-
-            def get_total_price(self):
-                return self._total
-
-        shipping_cost = calculate_shipping(_DummyCart(subtotal), new_order.structure)
-    except Exception:
-        shipping_cost = Decimal("0.00")
-
-    total = (subtotal + (shipping_cost or Decimal("0.00"))).quantize(Decimal("0.01"))
-
-    new_order.subtotal = subtotal.quantize(Decimal("0.01"))
-    new_order.shipping_cost = (shipping_cost or Decimal("0.00")).quantize(Decimal("0.01"))
-    new_order.total = total
-    new_order.save(update_fields=["subtotal", "shipping_cost", "total"])
-
     return redirect("accounts:my_order_detail", order_id=new_order.id)
 
 
@@ -0,0 +1,143 @@
+"""
+Motore di export condiviso (CSV / XLSX) per area partner e backoffice.
+
+- Le righe arrivano da proiezioni values() lette a blocchi
+  (queryset.iterator(chunk_size=CHUNK_SIZE)): nessun modello istanziato,
+  nessuna lista completa in memoria.
+- CSV: StreamingHttpResponse, una riga alla volta verso il client.
+- XLSX: openpyxl in modalità write-only (memoria costante, righe scritte
+  subito su file temporaneo) e FileResponse sul file risultante.
+  Le larghezze colonna sono stimate su un campione delle prime righe,
+  senza rileggere le celle a fine foglio.
+
+Uso tipico:
+    columns = [
+        Column("ID Ordine", "order_id"),
+        Column("Totale", lambda row: float(row["total_price"])),
+    ]
+    rows = iter_rows(items.values("order_id", "total_price"))
+    return csv_response("ordini.csv", columns, rows)
+"""
+import csv
+import tempfile
+from itertools import islice
+
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+CHUNK_SIZE = 2000
+WIDTH_SAMPLE_ROWS = 200
+MAX_COLUMN_WIDTH = 60
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class Column:
+    """
+    Colonna di export: intestazione + valore, come chiave del dict di values()
+    oppure come funzione che riceve il dict della riga.
+    """
+
+    def __init__(self, header, value):
+        self.header = header
+        self.value = value
+
+    def get(self, row):
+        if callable(self.value):
+            return self.value(row)
+        return row[self.value]
+
+
+class Sheet:
+    """Foglio XLSX: titolo, colonne e iterabile di righe (dict)."""
+
+    def __init__(self, title, columns, rows):
+        self.title = title
+        self.columns = columns
+        self.rows = rows
+
+
+def iter_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Righe di una proiezione values() lette dal DB a blocchi."""
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """Pseudo-buffer per csv.writer: restituisce la riga invece di scriverla."""
+
+    def write(self, value):
+        return value
+
+
+def csv_response(filename, columns, rows, delimiter=";"):
+    """Risposta CSV in streaming (intestazione + una riga per elemento di rows)."""
+    writer = csv.writer(_Echo(), delimiter=delimiter)
+
+    def generate():
+        yield writer.writerow([column.header for column in columns])
+        for row in rows:
+            yield writer.writerow([column.get(row) for column in columns])
+
+    response = StreamingHttpResponse(generate(), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def estimate_widths(headers, sample):
+    """Larghezze colonna dalla lunghezza massima di intestazioni e righe campione."""
+    widths = [len(str(header)) for header in headers]
+    for values in sample:
+        for idx, value in enumerate(values):
+            if value is not None and value != "":
+                widths[idx] = max(widths[idx], len(str(value)))
+    return [min(width + 2, MAX_COLUMN_WIDTH) for width in widths]
+
+
+def write_sheet(workbook, sheet):
+    """Scrive un foglio in un Workbook write-only (intestazione in grassetto)."""
+    ws = workbook.create_sheet(sheet.title)
+    columns = sheet.columns
+    rows = iter(sheet.rows)
+
+    # campione per le larghezze: va impostato prima di scrivere qualsiasi riga
+    sample = [[column.get(row) for column in columns] for row in islice(rows, WIDTH_SAMPLE_ROWS)]
+    headers = [column.header for column in columns]
+    for idx, width in enumerate(estimate_widths(headers, sample), start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+
+    bold = Font(bold=True)
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = bold
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for values in sample:
+        ws.append(values)
+    for row in rows:
+        ws.append([column.get(row) for column in columns])
+
+
+def xlsx_response(filename, sheets):
+    """
+    Risposta XLSX con uno o più fogli, generata a memoria costante su file
+    temporaneo e restituita a blocchi (FileResponse chiude il file a fine invio).
+    """
+    workbook = Workbook(write_only=True)
+    for sheet in sheets:
+        write_sheet(workbook, sheet)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=filename,
+        content_type=XLSX_CONTENT_TYPE,
+    )
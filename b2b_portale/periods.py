@@ -0,0 +1,67 @@
+"""
+Filtri di periodo sui datetime (es. order__created_at) senza ``__date``.
+
+``created_at__date__gte/lte`` applica un cast alla colonna (la data va
+calcolata riga per riga nel fuso corrente) e impedisce l'uso degli indici su
+created_at. Qui un intervallo di giorni [start, end] diventa un intervallo
+semiaperto di datetime aware nel fuso corrente (TIME_ZONE se non attivato
+altro):
+
+    start 00:00  <=  valore  <  (end + 1 giorno) 00:00
+
+stessi risultati di ``__date`` (anche ai confini del giorno), ma come
+confronto diretto sulla colonna.
+
+Uso tipico:
+    items = items.filter(period_q("order__created_at", start_date, end_date))
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def day_start(day):
+    """Mezzanotte (aware, fuso corrente) del giorno indicato."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def period_bounds(start=None, end=None):
+    """
+    Estremi (inclusivo, esclusivo) del periodo di giorni [start, end]
+    come datetime aware; None per un estremo assente.
+    """
+    lower = day_start(start) if start else None
+    upper = day_start(end + timedelta(days=1)) if end else None
+    return lower, upper
+
+
+def period_q(field, start=None, end=None):
+    """Q per il campo datetime nel periodo di giorni [start, end] (estremi opzionali)."""
+    lower, upper = period_bounds(start, end)
+    q = Q()
+    if lower is not None:
+        q &= Q(**{f"{field}__gte": lower})
+    if upper is not None:
+        q &= Q(**{f"{field}__lt": upper})
+    return q
+
+
+def days_q(field, days):
+    """
+    Q per il campo datetime in uno qualsiasi dei giorni indicati: i giorni
+    consecutivi sono accorpati in un unico intervallo.
+    """
+    runs = []
+    for day in sorted(set(days)):
+        if runs and day == runs[-1][1] + timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    if not runs:
+        return Q(pk__in=[])
+
+    q = Q()
+    for start, end in runs:
+        q |= period_q(field, start, end)
+    return q
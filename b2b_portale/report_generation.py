@@ -0,0 +1,58 @@
+"""
+Generazione dei dati dei report (contatore globale nel DB, orders.ReportGeneration).
+
+Ogni scrittura su Order, OrderItem e PartnerPayout (save / delete e UPDATE
+massivi espliciti) chiama bump_report_generation; le cache che dipendono da
+questi dati (report backoffice, backoffice/report_cache.py) mettono la
+generazione corrente nella chiave, quindi le voci calcolate prima della
+scrittura non vengono più lette.
+
+Il contatore è una riga del DB, non una chiave di cache: la cache di default
+(LocMemCache) è separata per ogni processo / worker, mentre la generazione
+deve essere la stessa per tutti. Le voci dei report possono restare nella
+cache locale: la chiave include la generazione letta dal DB.
+
+L'incremento avviene al commit della transazione (transaction.on_commit):
+dentro un atomic un report ricalcolato prima del commit leggerebbe i dati
+vecchi e verrebbe salvato con la generazione nuova; con un rollback la
+generazione non cambia; la riga non resta bloccata per tutta la transazione.
+Fuori da una transazione l'incremento è immediato.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import F
+
+ROW_ID = 1
+
+
+def _model():
+    # import locale: orders.models importa questo modulo
+    from orders.models import ReportGeneration
+
+    return ReportGeneration
+
+
+def _create():
+    # valore mai usato prima (non 1): voci in cache di un DB precedente
+    # (ripristino, test) non tornano valide
+    row, _ = _model().objects.get_or_create(pk=ROW_ID, defaults={"value": time.time_ns()})
+    return row.value
+
+
+def current_generation():
+    """Generazione corrente dei dati (1 query; riga creata se assente)."""
+    generation = _model().objects.filter(pk=ROW_ID).values_list("value", flat=True).first()
+    if generation is None:
+        generation = _create()
+    return generation
+
+
+def _bump():
+    if not _model().objects.filter(pk=ROW_ID).update(value=F("value") + 1):
+        _create()
+
+
+def bump_report_generation():
+    """Invalida tutti i report in cache al commit della transazione corrente."""
+    transaction.on_commit(_bump)
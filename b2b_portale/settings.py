@@ -73,8 +73,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "partners.context_processors.partner_dashboard_counts",
-                "partners.context_processors.partner_sidebar_counters",
+                "partners.context_processors.partner_context",
                 "orders.context_processors.cart_summary",
             ],
         },
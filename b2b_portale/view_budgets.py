@@ -0,0 +1,271 @@
+"""
+Budget di query e tempo per vista (test orders/tests/test_view_budgets.py).
+
+Ogni app dichiara in ``<app>/urls.py``, accanto agli urlpatterns, il dict
+``VIEW_BUDGETS`` {nome URL: budget}:
+
+    "my_order_detail": {"role": "client", "args": ["order"], "queries": 12},
+
+- role: ruolo dell'utente di prova (None = anonimo)
+- args: argomenti dell'URL, come chiavi del dataset di prova (seed_view_dataset)
+- params: querystring opzionale
+- cart: True per chiamare la vista con il prodotto di prova nel carrello
+- queries: numero massimo di query
+- duplicates: query identiche ripetute ammesse (default 0)
+- ms: tempo massimo di risposta (default DEFAULT_MAX_MS)
+- skip: motivo per cui la vista non viene chiamata (solo POST o modifica
+  dati anche in GET)
+
+Il test chiama ogni URL due volte, con il dataset piccolo e dopo averlo
+ingrandito (grow_view_dataset): oltre ai budget, il numero di query non deve
+crescere con il numero di righe (N+1).
+"""
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from b2b_portale.report_generation import current_generation
+
+BUDGET_APPS = ("accounts", "catalog", "orders", "partners", "backoffice")
+
+DEFAULT_MAX_DUPLICATES = 0
+DEFAULT_MAX_MS = 1000
+
+
+def view_budgets():
+    """
+    Righe (nome URL con namespace, budget) di tutte le app controllate.
+    Budget None per gli URL senza voce in VIEW_BUDGETS.
+    """
+    rows = []
+    for app in BUDGET_APPS:
+        urls = import_module(f"{app}.urls")
+        budgets = getattr(urls, "VIEW_BUDGETS", {})
+        names = dict.fromkeys(p.name for p in urls.urlpatterns if p.name)
+        for name in names:
+            rows.append((f"{urls.app_name}:{name}", budgets.get(name)))
+    return rows
+
+
+def prepare_client(client, budget, data):
+    """Login con l'utente del ruolo del budget (logout se anonimo) ed eventuale carrello."""
+    user = data["users"].get(budget["role"])
+    if user is None:
+        client.logout()
+        return
+    client.force_login(user)
+    if budget.get("cart"):
+        client.get(reverse("orders:cart_add", args=[data["product_id"]]))
+
+
+def measure_view(client, url):
+    """GET dell'URL: {status, queries, duplicates, ms}."""
+    cache.clear()
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = (time.perf_counter() - started) * 1000
+    if getattr(response, "streaming", False):
+        # gli export in streaming eseguono le query mentre il corpo viene letto
+        with CaptureQueriesContext(connection) as streamed:
+            b"".join(response.streaming_content)
+        sqls = [q["sql"] for q in captured.captured_queries + streamed.captured_queries]
+        elapsed = (time.perf_counter() - started) * 1000
+    else:
+        sqls = [q["sql"] for q in captured.captured_queries]
+    return {
+        "status": response.status_code,
+        "queries": len(sqls),
+        "duplicates": len(sqls) - len(set(sqls)),
+        "ms": elapsed,
+    }
+
+
+def check_budget(budget, result):
+    """Sforamenti del budget (lista di messaggi, vuota se rispettato)."""
+    errors = []
+    if result["status"] >= 400:
+        errors.append(f"status {result['status']}")
+    if result["queries"] > budget["queries"]:
+        errors.append(f"{result['queries']} query (budget {budget['queries']})")
+    max_duplicates = budget.get("duplicates", DEFAULT_MAX_DUPLICATES)
+    if result["duplicates"] > max_duplicates:
+        errors.append(f"{result['duplicates']} query duplicate (budget {max_duplicates})")
+    max_ms = budget.get("ms", DEFAULT_MAX_MS)
+    if result["ms"] > max_ms:
+        errors.append(f"{result['ms']:.0f} ms (budget {max_ms} ms)")
+    return errors
+
+
+def budget_url(name, budget, data):
+    url = reverse(name, args=[data[key] for key in budget.get("args", ())])
+    params = budget.get("params")
+    if params:
+        url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+    return url
+
+
+# ---------------------------------------------------------------------------
+# Dataset di prova
+# ---------------------------------------------------------------------------
+
+def seed_view_dataset():
+    """
+    Utenti di prova (uno per ruolo) e oggetti referenziati dagli URL.
+    Restituisce il dict del dataset: "users" {ruolo: utente} + id / slug
+    usati come argomenti degli URL.
+    """
+    from accounts.models import ClientStructure
+    from catalog.models import Category, KitComponent, Product, ProductAvailability
+    from cms.models import Page
+    from orders.models import PartnerPayout
+    from partners.models import PartnerProfile
+
+    User = get_user_model()
+    users = {
+        role: User.objects.create_user(
+            username=f"budget_{role}", password="pass", email=f"{role}@example.com", role=role
+        )
+        for role in (User.ROLE_ADMIN, User.ROLE_PARTNER, User.ROLE_CLIENT, User.ROLE_CONTENT_MANAGER)
+    }
+    partner = PartnerProfile.objects.create(
+        user=users[User.ROLE_PARTNER],
+        company_name="Partner Budget Srl",
+        vat_number="IT00000000001",
+        default_commission_percent=Decimal("10.00"),
+    )
+    other_partner = PartnerProfile.objects.create(
+        user=User.objects.create_user(username="budget_partner2", password="pass", role=User.ROLE_PARTNER),
+        company_name="Altro Partner Srl",
+        vat_number="IT00000000002",
+        default_commission_percent=Decimal("15.00"),
+    )
+    structure = ClientStructure.objects.create(
+        owner=users[User.ROLE_CLIENT], name="Hotel Budget", address="Via Roma 1", city="Rimini", zip_code="47921"
+    )
+    category = Category.objects.create(name="Biancheria", slug="biancheria")
+    product = Product.objects.create(
+        category=category, name="Kit camera", supplier=partner, base_price=Decimal("40.00")
+    )
+    other_product = Product.objects.create(
+        category=category, name="Servizio lavaggio", supplier=other_partner,
+        base_price=Decimal("25.00"), is_service=True,
+    )
+    KitComponent.objects.create(kit=product, name="Lenzuolo", quantity=2)
+    today = date.today()
+    ProductAvailability.objects.bulk_create(
+        ProductAvailability(product=product, date=today + timedelta(days=n), available_quantity=10)
+        for n in range(30)
+    )
+    Page.objects.create(slug="chi-siamo", title="Chi siamo", body="Testo")
+
+    data = {
+        "users": users,
+        "structure": structure.pk,
+        "partner": partner.pk,
+        "product": product.slug,
+        "product_id": product.pk,
+        "chart": "time",
+        "_partners": [partner, other_partner],
+        "_products": [product, other_product],
+    }
+    order = _create_order(data)
+    data["order"] = order.pk
+    data["item"] = order.items.filter(partner=partner).values_list("pk", flat=True).first()
+    data["payout"] = PartnerPayout.objects.create(
+        partner=partner, period_start=today.replace(day=1), period_end=today,
+    ).pk
+    data["review"] = _create_rating(data, users[User.ROLE_CLIENT]).pk
+    grow_view_dataset(data, 1)
+    # riga della generazione dei report già presente, come su un sistema avviato
+    current_generation()
+    return data
+
+
+def _create_order(data):
+    from orders.models import Order
+    from orders.services import build_order
+
+    User = get_user_model()
+    client = data["users"][User.ROLE_CLIENT]
+    return build_order(
+        client=client,
+        structure=client.structures.first(),
+        lines=[(product.pk, 2) for product in data["_products"]],
+        status=Order.STATUS_COMPLETED,
+    )
+
+
+def _create_rating(data, user):
+    from catalog.models import ProductRating
+
+    return ProductRating.objects.create(
+        product=data["_products"][0],
+        user=user,
+        rating=4,
+        comment="Ottimo servizio",
+        is_approved=True,
+        moderation_status=ProductRating.STATUS_APPROVED,
+    )
+
+
+def grow_view_dataset(data, orders):
+    """
+    Aggiunge al dataset ``orders`` ordini completati con righe di entrambi i
+    partner, messaggi, notifiche, log di stato, recensioni e righe agganciate
+    al payout di prova; ogni giro aggiunge anche una riga e un messaggio
+    all'ordine di prova.
+    """
+    from orders.facts import refresh_commission_facts
+    from orders.models import Order, OrderItem, OrderItemStatusLog, OrderMessage
+    from partners.models import PartnerNotification
+
+    User = get_user_model()
+    client = data["users"][User.ROLE_CLIENT]
+    partner_user = data["users"][User.ROLE_PARTNER]
+    partner = data["_partners"][0]
+    main_order = Order.objects.get(pk=data["order"])
+
+    for n in range(orders):
+        order = _create_order(data)
+        items = list(order.items.all())
+        for item in items:
+            OrderItemStatusLog.objects.create(
+                order_item=item,
+                old_status=OrderItem.PARTNER_STATUS_PENDING,
+                new_status=OrderItem.PARTNER_STATUS_COMPLETED,
+                changed_by=partner_user,
+            )
+        OrderItem.objects.filter(pk__in=[item.pk for item in items], partner=partner).update(
+            payout=data["payout"]
+        )
+        for target in (order, main_order):
+            OrderMessage.objects.create(
+                order=target, sender=client, sender_role=OrderMessage.ROLE_CLIENT,
+                message="Consegna entro le 10?", is_read_by_client=True,
+            )
+        OrderItem.objects.create(
+            order=main_order,
+            product=data["_products"][0],
+            partner=partner,
+            unit_price=Decimal("40.00"),
+            total_price=Decimal("40.00"),
+        )
+        PartnerNotification.objects.create(
+            partner=partner, title=f"Nuovo ordine #{order.pk}", message="Nuovo ordine ricevuto"
+        )
+        reviewer = User.objects.create_user(
+            username=f"budget_reviewer_{order.pk}", password="pass", role=User.ROLE_CLIENT
+        )
+        _create_rating(data, reviewer)
+
+    Order.refresh_accounting_lock(Order.objects.filter(client=client).values("pk"))
+    refresh_commission_facts()
+    return data
@@ -0,0 +1,117 @@
+"""
+Cache dei risultati dei report backoffice (dashboard, report commissioni,
+commissioni partner, export).
+
+- Chiave: (vista, parametri di filtro normalizzati, generazione dei dati).
+  Parametri vuoti ignorati e ordinati: stessi filtri in ordine diverso o con
+  campi vuoti condividono la stessa voce.
+- Generazione: contatore globale nel DB, incrementato al commit di ogni
+  scrittura su Order, OrderItem e PartnerPayout (b2b_portale/report_generation.py).
+  Essendo nel DB è lo stesso per tutti i worker anche con cache locale al
+  processo. Le voci delle generazioni precedenti non vengono più lette e
+  scadono da sole: un report in cache non è mai più vecchio dei dati.
+- In cache vanno solo dati già calcolati e di dimensione limitata (righe
+  values() con un tetto, aggregati), mai queryset o istanze di modelli.
+- Statistiche hit / miss per vista, mostrate nella pagina backoffice
+  "Cache report" (report_cache_stats).
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+
+from b2b_portale.report_generation import current_generation
+
+CACHE_TIMEOUT = 60 * 60
+
+# viste servite dalla cache (etichette mostrate nella pagina statistiche)
+REPORT_VIEWS = {
+    "dashboard": "Dashboard",
+    "commission_report": "Report commissioni",
+    "commission_report_chart": "Report commissioni: grafici",
+    "commission_report_detail": "Report commissioni: dettaglio righe",
+    "partner_commission_list": "Commissioni partner",
+    "commission_export_summary": "Export commissioni CSV / XLSX (riepilogo)",
+    "commission_export_pdf": "Export commissioni PDF",
+}
+
+
+def _stats_key(view, outcome):
+    return f"backoffice:reports:stats:{view}:{outcome}"
+
+
+def _count(view, outcome):
+    key = _stats_key(view, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # contatore assente (mai creato o espulso): si riparte da 1
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def normalize_params(params, keys=None):
+    """
+    Filtri come lista ordinata di coppie (chiave, valore): solo le chiavi
+    indicate (tutte se keys è None), valori vuoti scartati.
+    Accetta QueryDict (valori multipli compresi) o dict semplici.
+    """
+    getlist = getattr(params, "getlist", None)
+    pairs = []
+    for key in sorted(params.keys() if keys is None else keys):
+        values = getlist(key) if getlist else [params.get(key)]
+        for value in values:
+            value = "" if value is None else str(value).strip()
+            if value:
+                pairs.append((key, value))
+    return sorted(pairs)
+
+
+def report_key(view, params=None, keys=None):
+    filters = urlencode(normalize_params(params or {}, keys))
+    digest = hashlib.md5(filters.encode("utf-8")).hexdigest()
+    return f"backoffice:reports:{view}:g{current_generation()}:{digest}"
+
+
+def cached_report(view, params, compute, keys=None):
+    """
+    Risultato del report dalla cache, oppure compute() salvato per la
+    generazione corrente. compute deve restituire dati serializzabili.
+    """
+    key = report_key(view, params, keys)
+    data = cache.get(key)
+    if data is None:
+        _count(view, "misses")
+        data = compute()
+        cache.set(key, data, CACHE_TIMEOUT)
+    else:
+        _count(view, "hits")
+    return data
+
+
+def report_cache_stats():
+    """Righe {view, label, hits, misses, requests, hit_ratio} per tutte le viste in cache."""
+    values = cache.get_many([
+        _stats_key(view, outcome) for view in REPORT_VIEWS for outcome in ("hits", "misses")
+    ])
+
+    rows = []
+    for view, label in REPORT_VIEWS.items():
+        hits = values.get(_stats_key(view, "hits"), 0)
+        misses = values.get(_stats_key(view, "misses"), 0)
+        requests = hits + misses
+        rows.append({
+            "view": view,
+            "label": label,
+            "hits": hits,
+            "misses": misses,
+            "requests": requests,
+            "hit_ratio": (hits * 100 / requests) if requests else None,
+        })
+    return rows
+
+
+def reset_report_cache_stats():
+    cache.delete_many([
+        _stats_key(view, outcome) for view in REPORT_VIEWS for outcome in ("hits", "misses")
+    ])
@@ -1,3 +1,210 @@
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from openpyxl import load_workbook
+
+from accounts.models import ClientStructure
+from catalog.models import Category, Product
+from orders.models import CommissionFactDirtyDay, Order, OrderItem, ReportGeneration
+from partners.models import PartnerProfile
+
+
+class CommissionReportExportTests(TestCase):
+    """Export CSV / XLSX del report commissioni tramite il motore di export condiviso."""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        admin = User.objects.create_user(username="admin1", password="pass", role=User.ROLE_ADMIN)
+        partner_user = User.objects.create_user(
+            username="partner1", password="pass", role=User.ROLE_PARTNER
+        )
+        self.partner = partner = PartnerProfile.objects.create(
+            user=partner_user, company_name="Partner Srl", vat_number="IT00000000000"
+        )
+        client_user = User.objects.create_user(
+            username="client1", password="pass", role=User.ROLE_CLIENT
+        )
+        structure = ClientStructure.objects.create(owner=client_user, name="Hotel Test")
+        category = Category.objects.create(name="Categoria", slug="categoria")
+        product = Product.objects.create(
+            category=category, name="Prodotto", supplier=partner, base_price=Decimal("100.00")
+        )
+        order = Order.objects.create(
+            client=client_user, structure=structure, status=Order.STATUS_PAID,
+            subtotal=Decimal("300.00"), total=Decimal("300.00"),
+        )
+        for _ in range(3):
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                partner=partner,
+                quantity=1,
+                unit_price=Decimal("100.00"),
+                total_price=Decimal("100.00"),
+                commission_rate=Decimal("10.00"),
+                commission_amount=Decimal("10.00"),
+                partner_earnings=Decimal("90.00"),
+            )
+        self.client.force_login(admin)
+
+    def test_csv_is_streamed(self):
+        response = self.client.get(reverse("backoffice:commission_report_export_csv"))
+
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(";")[0], "Partner")
+        self.assertEqual(lines[1].split(";")[2:5], ["300.00", "30.00", "270.00"])
+
+    def test_xlsx_has_summary_and_detail_sheets(self):
+        response = self.client.get(reverse("backoffice:commission_report_export_xlsx"))
+
+        workbook = load_workbook(BytesIO(b"".join(response.streaming_content)))
+        summary, detail = workbook["Riepilogo partner"], workbook["Dettaglio righe"]
+        self.assertEqual(summary["C2"].value, 300.0)
+        self.assertEqual(detail.max_row, 4)
+        self.assertEqual(detail["K2"].value, 90.0)
+        self.assertTrue(summary["A1"].font.bold)
+        self.assertGreaterEqual(summary.column_dimensions["D"].width, len("Commissioni portale (€)"))
+
+    def test_report_reads_daily_facts(self):
+        response = self.client.get(reverse("backoffice:commission_report"))
+
+        self.assertEqual(response.context["total_revenue"], Decimal("300.00"))
+        self.assertEqual(response.context["total_portal_commission"], Decimal("30.00"))
+        self.assertEqual(response.context["order_count"], 1)
+        self.assertEqual(response.context["partner_rows"][0]["order_count"], 1)
+        # i giorni in coda sono stati ricalcolati all'apertura del report
+        self.assertFalse(CommissionFactDirtyDay.objects.exists())
+
+    def _chart(self, chart, **params):
+        return self.client.get(
+            reverse("backoffice:commission_report_chart", args=[chart]), params
+        )
+
+    def test_report_shell_has_no_chart_series(self):
+        response = self.client.get(reverse("backoffice:commission_report"))
+
+        self.assertNotIn("chart_time_labels", response.context)
+        self.assertContains(response, reverse("backoffice:commission_report_chart", args=["time"]))
+
+    def test_chart_endpoints(self):
+        data = self._chart("time").json()
+        self.assertEqual(data["type"], "line")
+        self.assertEqual(len(data["labels"]), 1)
+        self.assertEqual([ds["data"][0] for ds in data["datasets"]], [300.0, 30.0, 270.0])
+
+        data = self._chart("partners").json()
+        self.assertEqual(data["labels"], ["Partner Srl"])
+
+        self.assertEqual(self._chart("compare").json()["labels"], [])
+        self.assertEqual(self._chart("unknown").status_code, 404)
+
+    def test_chart_cache_per_filters(self):
+        self._chart("categories", period_start="2000-01-01")
+
+        with CaptureQueriesContext(connection) as queries:
+            self._chart("categories", period_start="2000-01-01")
+        self.assertFalse(any("commissiondailyfact" in q["sql"] for q in queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            self._chart("categories", period_start="2000-01-02")
+        self.assertTrue(any("commissiondailyfact" in q["sql"] for q in queries))
+
+    def test_repeat_report_loads_skip_order_items(self):
+        urls = [
+            reverse("backoffice:dashboard"),
+            reverse("backoffice:commission_report"),
+            reverse("backoffice:commission_report_detail") + "?partner=%d" % self.partner.pk,
+            reverse("backoffice:partner_commission_list") + "?period_start=2000-01-01",
+            reverse("backoffice:commission_report_export_csv"),
+            reverse("backoffice:commission_report_export_pdf"),
+        ]
+        for url in urls:
+            self.client.get(url)
+
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(any("orders_orderitem" in q["sql"] for q in queries), url)
+
+    def test_filter_params_are_normalized(self):
+        url = reverse("backoffice:commission_report")
+        self.client.get(url, {"period_start": "2000-01-01", "period_end": ""})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {"period_end": "", "period_start": "2000-01-01", "utm": "x"})
+        self.assertFalse(any("commissiondailyfact" in q["sql"] for q in queries))
+
+    def test_writes_invalidate_cached_reports(self):
+        url = reverse("backoffice:commission_report")
+        self.assertEqual(self.client.get(url).context["total_revenue"], Decimal("300.00"))
+
+        item = OrderItem.objects.filter(partner=self.partner).first()
+        item.total_price = Decimal("200.00")
+        # la generazione avanza al commit, non alla scrittura
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+            self.assertEqual(self.client.get(url).context["total_revenue"], Decimal("300.00"))
+
+        self.assertEqual(self.client.get(url).context["total_revenue"], Decimal("400.00"))
+
+    def test_generation_is_shared_through_the_database(self):
+        url = reverse("backoffice:commission_report_detail")
+        self.client.get(url)
+        OrderItem.objects.filter(partner=self.partner).update(total_price=Decimal("50.00"))
+
+        # scrittura gestita da un altro worker: nessuna chiave in comune nella cache locale,
+        # solo la riga della generazione nel DB
+        ReportGeneration.objects.update(value=F("value") + 1)
+
+        self.assertEqual(self.client.get(url).context["total_revenue"], Decimal("150.00"))
+
+    def test_detail_caches_capped_plain_rows(self):
+        url = reverse("backoffice:commission_report_detail")
+        with mock.patch("backoffice.views.COMMISSION_DETAIL_MAX_ROWS", 2):
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.context["items"]), 2)
+        self.assertTrue(response.context["items_truncated"])
+        self.assertEqual(response.context["items_count"], 3)
+        self.assertEqual(response.context["total_revenue"], Decimal("300.00"))
+        self.assertEqual(response.context["items"][0]["partner_name"], "Partner Srl")
+        self.assertContains(response, "Mostrate le 2 righe più recenti su 3")
+
+    def test_cache_stats_page(self):
+        url = reverse("backoffice:commission_report")
+        self.client.get(url)
+        self.client.get(url)
+
+        response = self.client.get(reverse("backoffice:report_cache_stats"))
+        row = next(r for r in response.context["stats"] if r["view"] == "commission_report")
+        self.assertEqual((row["hits"], row["misses"]), (1, 1))
+
+        self.client.post(reverse("backoffice:report_cache_stats"))
+        response = self.client.get(reverse("backoffice:report_cache_stats"))
+        self.assertTrue(all(r["requests"] == 0 for r in response.context["stats"]))
 
-# Create your tests here.
+    def test_reports_scan_order_items_without_joining_orders(self):
+        urls = [
+            reverse("backoffice:commission_report_detail") + "?period_start=2000-01-01",
+            reverse("backoffice:unliquidated_commission_list") + "?period_start=2000-01-01",
+            reverse("backoffice:liquidated_commission_list") + "?period_start=2000-01-01",
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            item_queries = [q["sql"] for q in queries if '"orders_orderitem"' in q["sql"]]
+            self.assertTrue(item_queries, url)
+            self.assertFalse(any('JOIN "orders_order" ' in sql for sql in item_queries), url)
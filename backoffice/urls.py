@@ -43,6 +43,11 @@ urlpatterns = [
         views.commission_report,
         name="commission_report",
     ),
+    path(
+        "commission-report/chart/<slug:chart>/",
+        views.commission_report_chart,
+        name="commission_report_chart",
+    ),
     path(
         "commission-report/export-csv/",
         views.commission_report_export_csv,
@@ -69,6 +74,10 @@ urlpatterns = [
         views.commission_report_detail,
         name="commission_report_detail",
     ),
+
+    # CACHE REPORT (statistiche hit / miss)
+    path("report-cache/", views.report_cache_stats, name="report_cache_stats"),
+
     # UTENTI COMPLETI
     path("users/", views.user_list, name="user_list"),
 
@@ -113,11 +122,57 @@ urlpatterns = [
         name="partner_payout_list",
     ),
 
+    # PAYOUT RUN DI FINE PERIODO (tutti i partner)
+    path("partner-payouts/run/", views.payout_run, name="payout_run"),
+
     # RECENSIONI PRODOTTI (BACKOFFICE)
     path("reviews/", views.review_list, name="review_list"),
-    path("reviews/<int:pk>/", views.review_detail, name="review_detail"),
+    path("reviews/<int:review_id>/", views.review_detail, name="review_detail"),
     path("reviews/<int:pk>/approve/", views.review_approve, name="review_approve"),
     path("reviews/<int:pk>/reject/", views.review_reject, name="review_reject"),
     path("partner-payouts/<int:payout_id>/", views.partner_payout_detail, name="partner_payout_detail"),
     path("partner-payouts/<int:payout_id>/report/", views.partner_payout_report, name="partner_payout_report"),
+    path("partner-payouts/<int:payout_id>/pdf/", views.partner_payout_pdf, name="partner_payout_pdf"),
 ]
+
+
+# Budget per vista (b2b_portale.view_budgets, test orders/tests/test_view_budgets.py):
+# ruolo dell'utente di prova, argomenti dell'URL (chiavi del dataset di prova),
+# numero massimo di query con il dataset ingrandito.
+VIEW_BUDGETS = {
+    "dashboard": {"role": "admin", "queries": 7},
+    "dashboard_live_stats": {"role": "admin", "queries": 8},
+    "order_list": {"role": "admin", "queries": 4},
+    "order_detail": {"role": "admin", "args": ["order"], "queries": 4},
+    "partner_list": {"role": "admin", "queries": 3},
+    "client_list": {"role": "admin", "queries": 3},
+    "client_structure_list": {"role": "admin", "queries": 3},
+    "client_structure_detail": {"role": "admin", "args": ["structure"], "queries": 4},
+    "product_list": {"role": "admin", "queries": 5},
+    "kit_list": {"role": "admin", "queries": 3},
+    "category_list": {"role": "admin", "queries": 3},
+    "cms_page_list": {"role": "admin", "queries": 3},
+    "commission_report": {"role": "admin", "queries": 9},
+    "commission_report_chart": {"role": "admin", "args": ["chart"], "queries": 7},
+    "commission_report_export_csv": {"role": "admin", "queries": 7},
+    "commission_report_export_xlsx": {"role": "admin", "queries": 8},
+    "commission_report_export_pdf": {"role": "admin", "queries": 8},
+    "commission_partner_pdf": {"role": "admin", "args": ["partner"], "queries": 6},
+    "commission_report_detail": {"role": "admin", "queries": 8},
+    "report_cache_stats": {"role": "admin", "queries": 3},
+    "user_list": {"role": "admin", "queries": 3},
+    "partner_commission_list": {"role": "admin", "queries": 2},
+    "partner_commission_export_csv": {"role": "admin", "queries": 3},
+    "partner_payout_create": {"role": "admin", "args": ["partner"], "queries": 3},
+    "unliquidated_commission_list": {"role": "admin", "queries": 5},
+    "liquidated_commission_list": {"role": "admin", "queries": 5},
+    "partner_payout_list": {"role": "admin", "queries": 5},
+    "payout_run": {"role": "admin", "queries": 3},
+    "review_list": {"role": "content_manager", "queries": 5},
+    "review_detail": {"role": "content_manager", "args": ["review"], "queries": 3},
+    "review_approve": {"skip": "modifica la recensione anche in GET"},
+    "review_reject": {"skip": "modifica la recensione anche in GET"},
+    "partner_payout_detail": {"role": "admin", "args": ["payout"], "queries": 5},
+    "partner_payout_report": {"role": "admin", "args": ["payout"], "queries": 5},
+    "partner_payout_pdf": {"skip": "genera il PDF con WeasyPrint e lo salva su storage"},
+}
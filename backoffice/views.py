@@ -1,21 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.db.models import Count, Sum, F, ExpressionWrapper, DecimalField, Value, Q, Subquery, OuterRef, Window
-from django.db.models.functions import Coalesce, TruncMonth, TruncDate, RowNumber
+from django.db.models.functions import Coalesce, TruncMonth, RowNumber
 
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.urls import reverse
 from django.utils.dateparse import parse_date
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 
 from urllib.parse import urlencode
+from datetime import timedelta
 from decimal import Decimal
 import csv
-import json
-
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -23,7 +21,13 @@ from reportlab.lib.units import mm
 from reportlab.lib import colors
 
 from accounts.decorators import admin_required, content_staff_required
-from orders.models import Order, OrderItem, PartnerPayout
+from b2b_portale import exports
+from b2b_portale.periods import period_q
+from . import report_cache
+from orders import partner_ledger, payout_runs
+from orders.pdf_utils import cached_payout_pdf
+from orders.facts import refresh_commission_facts
+from orders.models import CommissionDailyFact, Order, OrderItem, PartnerPayout
 from partners.models import PartnerProfile
 from accounts.models import User, ClientStructure
 from catalog.models import Product, Category, KitComponent,ProductRating
@@ -81,11 +85,9 @@ class NumberedCanvas(canvas.Canvas):
 # -------------------------------
 # DASHBOARD ADMIN
 # -------------------------------
-@admin_required
-def dashboard(request):
-
+def _dashboard_data():
     # KPI: ordini per stato
-    orders_by_status = (
+    orders_by_status = list(
         Order.objects.values("status")
         .annotate(total=Count("id"))
         .order_by("status")
@@ -98,25 +100,32 @@ def dashboard(request):
     )["total"] or 0
 
     # Top partner per fatturato
-    partner_revenue = (
-        OrderItem.objects.exclude(order__status="cancelled")
+    partner_revenue = list(
+        OrderItem.objects.exclude(order_status="cancelled")
         .values("partner__id", "partner__company_name")
         .annotate(total=Sum("total_price"))
         .order_by("-total")[:5]
     )
 
     # Ordini critici (pending o processing)
-    critical_orders = (
+    critical_orders = list(
         Order.objects.filter(status__in=["pending_payment", "processing"])
+        .select_related("client")
         .order_by("-created_at")[:10]
     )
 
-    context = {
+    return {
         "orders_by_status": orders_by_status,
         "total_revenue": total_revenue,
         "partner_revenue": partner_revenue,
         "critical_orders": critical_orders,
     }
+
+
+@admin_required
+def dashboard(request):
+    # KPI calcolati una volta per generazione dei dati (report_cache)
+    context = report_cache.cached_report("dashboard", None, _dashboard_data)
     return render(request, "backoffice/dashboard.html", context)
 
 
@@ -136,12 +145,12 @@ def dashboard_live_stats(request):
 
     # Righe con commissioni maturate
     commission_qs = OrderItem.objects.exclude(
-        order__status=Order.STATUS_CANCELLED
+        order_status=Order.STATUS_CANCELLED
     ).filter(
         commission_amount__gt=0
     )
     commission_count = commission_qs.count()
-    latest_commission_item = commission_qs.order_by("-order__created_at", "-id").first()
+    latest_commission_item = commission_qs.order_by("-order_created_at", "-id").first()
 
     # Payout partner
     payout_qs = PartnerPayout.objects.all()
@@ -155,8 +164,8 @@ def dashboard_live_stats(request):
 
         "commission_count": commission_count,
         "last_commission_id": latest_commission_item.id if latest_commission_item else None,
-        "last_commission_order_id": latest_commission_item.order.id if latest_commission_item else None,
-        "last_commission_created_at": latest_commission_item.order.created_at.isoformat() if latest_commission_item else None,
+        "last_commission_order_id": latest_commission_item.order_id if latest_commission_item else None,
+        "last_commission_created_at": latest_commission_item.order_created_at.isoformat() if latest_commission_item else None,
 
         "payout_count": payout_count,
         "last_payout_id": latest_payout.id if latest_payout else None,
@@ -193,11 +202,11 @@ def order_list(request):
     if structure_id:
         qs = qs.filter(structure_id=structure_id)
 
-    if date_from:
-        qs = qs.filter(created_at__date__gte=date_from)
-
-    if date_to:
-        qs = qs.filter(created_at__date__lte=date_to)
+    qs = qs.filter(period_q(
+        "created_at",
+        parse_date(date_from) if date_from else None,
+        parse_date(date_to) if date_to else None,
+    ))
 
     partners = PartnerProfile.objects.filter(is_active=True)
 
@@ -234,12 +243,10 @@ def order_detail(request, order_id):
     # - se esiste QUALSIASI payout emesso su almeno una riga (anche Bozza/Confermato),
     #   blocchiamo downgrade/cancellazione dello stato ordine;
     # - se payout è PAID oppure riga liquidata, è comunque lock (caso più "hard").
-    has_any_payout = items.filter(payout__isnull=False).exists()
-    has_paid_payout = (
-        items.filter(is_liquidated=True).exists()
-        or items.filter(payout__status=PartnerPayout.STATUS_PAID).exists()
-    )
-    has_accounting_lock = has_any_payout or has_paid_payout
+    # (lock denormalizzato su Order.accounting_lock: nessuna query sulle righe)
+    has_paid_payout = order.accounting_lock == Order.LOCK_PAID
+    has_any_payout = has_paid_payout or order.accounting_lock == Order.LOCK_PAYOUT
+    has_accounting_lock = has_any_payout
 
     # ranking stati (ordine definito da STATUS_CHOICES)
     status_rank = {code: idx for idx, (code, _) in enumerate(Order.STATUS_CHOICES)}
@@ -315,7 +322,8 @@ def partner_list(request):
 
     qs = (
         PartnerProfile.objects.select_related("user")
-        .all()
+        # saldo da pagare: ultima voce del registro partner
+        .annotate(ledger_balance=partner_ledger.latest_value("balance"))
         .order_by("company_name")
     )
 
@@ -639,7 +647,9 @@ def review_moderate(request, review_id):
         from django.utils import timezone
         review.moderated_at = timezone.now()
 
-    review.save()
+    # ProductRating.save riallinea gli aggregati del prodotto: stessa transazione
+    with transaction.atomic():
+        review.save()
 
     return HttpResponseRedirect(reverse("backoffice:review_list"))
 
@@ -654,7 +664,8 @@ def review_approve(request, pk):
     review.is_approved = True
     review.moderated_by = request.user
     review.moderated_at = timezone.now()
-    review.save(update_fields=["moderation_status", "is_approved", "moderated_by", "moderated_at"])
+    with transaction.atomic():
+        review.save(update_fields=["moderation_status", "is_approved", "moderated_by", "moderated_at"])
     messages.success(
         request,
         f"Recensione #{review.id} per '{review.product}' approvata.",
@@ -672,7 +683,8 @@ def review_reject(request, pk):
     review.is_approved = False
     review.moderated_by = request.user
     review.moderated_at = timezone.now()
-    review.save(update_fields=["moderation_status", "is_approved", "moderated_by", "moderated_at"])
+    with transaction.atomic():
+        review.save(update_fields=["moderation_status", "is_approved", "moderated_by", "moderated_at"])
     messages.warning(
         request,
         f"Recensione #{review.id} per '{review.product}' segnata come RIFIUTATA.",
@@ -703,6 +715,111 @@ def user_list(request):
 # -------------------------------
 # COMMISSIONI PARTNER
 # -------------------------------
+# parametri GET che influenzano la vista (chiave di cache)
+PARTNER_COMMISSION_PARAMS = ("company", "email", "active", "period_start", "period_end")
+
+
+def _partner_commission_data(company, email, active, start_date, end_date):
+    """
+    Partner con commissioni ancora da liquidare nel periodo (annotazioni per
+    partner) + totali, come dati già calcolati per la cache report.
+    """
+    qs = PartnerProfile.objects.select_related("user")
+
+    # filtri base (ragione sociale, email, attivo)
+    if company:
+        qs = qs.filter(company_name__icontains=company)
+
+    if email:
+        qs = qs.filter(user__email__icontains=email)
+
+    if active == "yes":
+        qs = qs.filter(is_active=True)
+    elif active == "no":
+        qs = qs.filter(is_active=False)
+
+    # filtro periodo DA APPLICARE dentro le SUM
+    # NB: le commissioni "maturano" solo su righe COMPLETED con commission_amount > 0.
+    period_filter = Q(order_items__partner_status=OrderItem.PARTNER_STATUS_COMPLETED, order_items__commission_amount__gt=0)
+    period_filter &= period_q("order_items__order_created_at", start_date, end_date)
+
+    # annotazioni per il periodo selezionato
+    qs = (
+        qs.annotate(
+            # FATTURATO del periodo (tutto, partner + portale)
+            total_revenue=Coalesce(
+                Sum("order_items__total_price", filter=period_filter),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        .annotate(
+            # COMMISSIONE PORTALE = somma commission_amount nel periodo
+            portal_commissions=Coalesce(
+                Sum(
+                    "order_items__commission_amount",
+                    filter=period_filter,
+                ),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        .annotate(
+            # IMPORTO PARTNER DA LIQUIDARE nel periodo
+            partner_earnings=Coalesce(
+                Sum(
+                    "order_items__partner_earnings",
+                    filter=period_filter & Q(order_items__is_liquidated=False, order_items__payout__isnull=True),
+                ),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        .annotate(
+            # commissioni ancora da liquidare nel periodo (quota portale)
+            unliquidated_commissions=Coalesce(
+                Sum(
+                    "order_items__commission_amount",
+                    filter=period_filter & Q(order_items__is_liquidated=False, order_items__payout__isnull=True),
+                ),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        .annotate(
+            # saldo da pagare (complessivo, non del periodo): ultima voce del registro partner
+            ledger_balance=partner_ledger.latest_value("balance"),
+        )
+        .annotate(
+            # commissioni già liquidate nel periodo (quota portale)
+            liquidated_commissions=Coalesce(
+                Sum(
+                    "order_items__commission_amount",
+                    filter=period_filter & Q(order_items__is_liquidated=True),
+                ),
+                Value(Decimal("0.00")),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+        .order_by("company_name")
+    )
+
+    # ✅ Mostra SOLO i partner che nel periodo hanno ancora qualcosa da liquidare
+    qs = qs.filter(
+        unliquidated_commissions__gt=Decimal("0.00"),
+    )
+
+    partners = list(qs)
+
+    # Totali calcolati solo sui partner ancora visibili
+    return {
+        "partners": partners,
+        "total_commissions": sum((p.partner_earnings for p in partners), Decimal("0.00")),
+        "total_to_liquidate": sum((p.unliquidated_commissions for p in partners), Decimal("0.00")),
+        "total_liquidated": sum((p.liquidated_commissions for p in partners), Decimal("0.00")),
+    }
+
+
 @admin_required
 def partner_commission_list(request):
     """
@@ -726,473 +843,299 @@ def partner_commission_list(request):
     # Ha effettuato una ricerca solo se almeno un filtro è valorizzato
     has_filters = any([company, email, active, start_date, end_date])
 
-    # base queryset
-    qs = PartnerProfile.objects.select_related("user")
-
     if has_filters:
-        # filtri base (ragione sociale, email, attivo)
-        if company:
-            qs = qs.filter(company_name__icontains=company)
-
-        if email:
-            qs = qs.filter(user__email__icontains=email)
-
-        if active == "yes":
-            qs = qs.filter(is_active=True)
-        elif active == "no":
-            qs = qs.filter(is_active=False)
-
-        # filtro periodo DA APPLICARE dentro le SUM
-        # NB: le commissioni "maturano" solo su righe COMPLETED con commission_amount > 0.
-        period_filter = Q(order_items__partner_status=OrderItem.PARTNER_STATUS_COMPLETED, order_items__commission_amount__gt=0)
-        if start_date:
-            period_filter &= Q(order_items__order__created_at__date__gte=start_date)
-        if end_date:
-            period_filter &= Q(order_items__order__created_at__date__lte=end_date)
-
-        # annotazioni per il periodo selezionato
-        qs = (
-            qs.annotate(
-                # FATTURATO del periodo (tutto, partner + portale)
-                total_revenue=Coalesce(
-                    Sum("order_items__total_price", filter=period_filter),
-                    Value(Decimal("0.00")),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )
-            .annotate(
-                # COMMISSIONE PORTALE = somma commission_amount nel periodo
-                portal_commissions=Coalesce(
-                    Sum(
-                        "order_items__commission_amount",
-                        filter=period_filter,
-                    ),
-                    Value(Decimal("0.00")),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )
-            .annotate(
-                # IMPORTO PARTNER DA LIQUIDARE nel periodo
-                partner_earnings=Coalesce(
-                    Sum(
-                        "order_items__partner_earnings",
-                        filter=period_filter & Q(order_items__is_liquidated=False, order_items__payout__isnull=True),
-                    ),
-                    Value(Decimal("0.00")),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )
-            .annotate(
-                # commissioni ancora da liquidare nel periodo (quota portale)
-                unliquidated_commissions=Coalesce(
-                    Sum(
-                        "order_items__commission_amount",
-                        filter=period_filter & Q(order_items__is_liquidated=False, order_items__payout__isnull=True),
-                    ),
-                    Value(Decimal("0.00")),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )
-            .annotate(
-                # commissioni già liquidate nel periodo (quota portale)
-                liquidated_commissions=Coalesce(
-                    Sum(
-                        "order_items__commission_amount",
-                        filter=period_filter & Q(order_items__is_liquidated=True),
-                    ),
-                    Value(Decimal("0.00")),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )
-            .order_by("company_name")
+        data = report_cache.cached_report(
+            "partner_commission_list",
+            request.GET,
+            lambda: _partner_commission_data(company, email, active, start_date, end_date),
+            keys=PARTNER_COMMISSION_PARAMS,
         )
-
-        # ✅ Mostra SOLO i partner che nel periodo hanno ancora qualcosa da liquidare
-        qs = qs.filter(
-            unliquidated_commissions__gt=Decimal("0.00"),
-        )
-
-        # Totali calcolati solo sui partner ancora visibili
-        total_commissions = qs.aggregate(
-            total=Coalesce(
-                Sum("partner_earnings"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            )
-        )["total"]
-
-        total_to_liquidate = qs.aggregate(
-            total=Coalesce(
-                Sum("unliquidated_commissions"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            )
-        )["total"]
-
-        total_liquidated = qs.aggregate(
-            total=Coalesce(
-                Sum("liquidated_commissions"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            )
-        )["total"]
-
     else:
         # nessun filtro: non mostriamo alcun partner/valore
-        qs = PartnerProfile.objects.none()
-        total_commissions = Decimal("0.00")
-        total_to_liquidate = Decimal("0.00")
-        total_liquidated = Decimal("0.00")
+        data = {
+            "partners": [],
+            "total_commissions": Decimal("0.00"),
+            "total_to_liquidate": Decimal("0.00"),
+            "total_liquidated": Decimal("0.00"),
+        }
 
     context = {
-        "partners": qs,
+        **data,
         "company": company or "",
         "email": email or "",
         "active": active or "",
         "period_start": period_start_str or "",
         "period_end": period_end_str or "",
-        "total_commissions": total_commissions,
-        "total_to_liquidate": total_to_liquidate,
-        "total_liquidated": total_liquidated,
         "show_results": has_filters,  # controlla la visibilità delle card nel template
     }
 
     return render(request, "backoffice/partner_commission_list.html", context)
 
-@admin_required
-def commission_report(request):
+# ============================================================
+#   REPORT COMMISSIONI: lettura dai fatti giornalieri
+# ============================================================
+
+def _fact_sum(field):
+    return Coalesce(
+        Sum(field),
+        Value(Decimal("0.00")),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def _commission_facts(period_start_str, period_end_str, partner_id):
     """
-    Dashboard report commissioni:
-    - KPI globali sul periodo
-    - Grafico andamento giornaliero (fatturato / commissioni / guadagni partner)
-    - Grafico top partner
-    - Grafico fatturato & guadagni per mese
-    - Grafico top categorie prodotto
-    - Tabella riepilogo per partner
-    - Grafico di confronto tra due partner selezionati
+    Fatti giornalieri (CommissionDailyFact) con i filtri del report commissioni:
+    periodo su giorno ordine, partner, ordini annullati esclusi.
+    Prima della lettura ricalcola i giorni in coda (righe / ordini modificati).
     """
-
-    partner_id = request.GET.get("partner")
-    period_start_str = request.GET.get("period_start")
-    period_end_str = request.GET.get("period_end")
-    compare_partner_1_id = request.GET.get("compare_partner_1")
-    compare_partner_2_id = request.GET.get("compare_partner_2")
+    refresh_commission_facts()
 
     start_date = parse_date(period_start_str) if period_start_str else None
     end_date = parse_date(period_end_str) if period_end_str else None
 
-    # Base queryset: tutte le righe d'ordine con commissione (non annullate)
-    items = (
-        OrderItem.objects
-        .select_related("order", "partner", "product", "partner__user", "product__category")
-        .exclude(order__status="cancelled")
-        .filter(commission_amount__gt=0)
-    )
-
+    facts = CommissionDailyFact.objects.exclude(order_status="cancelled")
     if partner_id:
-        items = items.filter(partner_id=partner_id)
+        facts = facts.filter(partner_id=partner_id)
     if start_date:
-        items = items.filter(order__created_at__date__gte=start_date)
+        facts = facts.filter(day__gte=start_date)
     if end_date:
-        items = items.filter(order__created_at__date__lte=end_date)
+        facts = facts.filter(day__lte=end_date)
+    return facts
 
-    # ===========================
-    #  KPI GLOBALI
-    # ===========================
-    agg = items.aggregate(
-        total_revenue=Coalesce(
-            Sum("total_price"),
-            Value(Decimal("0.00")),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        ),
-        total_portal_commission=Coalesce(
-            Sum("commission_amount"),
-            Value(Decimal("0.00")),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        ),
-        order_count=Count("order", distinct=True),
-        partner_count=Count("partner", distinct=True),
-    )
 
-    total_revenue = agg["total_revenue"] or Decimal("0.00")
-    total_portal_commission = agg["total_portal_commission"] or Decimal("0.00")
-    total_partner_earnings = total_revenue - total_portal_commission
-    order_count = agg["order_count"] or 0
-    partner_count = agg["partner_count"] or 0
+# ---------------------------------------------------------------
+#  Serie dei grafici (una funzione per grafico, lette dai fatti)
+#  Formato: {"type", "labels", "datasets": [{"label", "data"}]} per Chart.js
+# ---------------------------------------------------------------
 
-    # ===========================
-    #  RIEPILOGO PER PARTNER
-    #  (tabella + grafico top partner)
-    # ===========================
-    partner_rows_qs = (
-        items.values("partner__id", "partner__company_name", "partner__user__email")
+def _chart_time(facts, params):
+    """Andamento giornaliero (fatturato / commissioni / guadagni partner)."""
+    rows = (
+        facts
+        .values("day")
         .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            order_count=Count("order", distinct=True),
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
         )
-        .order_by("-revenue")
+        .order_by("day")
     )
+    labels, revenue, commission, earnings = [], [], [], []
+    for row in rows:
+        labels.append(row["day"].strftime("%d/%m/%Y"))
+        revenue.append(float(row["revenue"]))
+        commission.append(float(row["portal_commission"]))
+        earnings.append(float(row["revenue"] - row["portal_commission"]))
+    return {
+        "type": "line",
+        "labels": labels,
+        "datasets": [
+            {"label": "Fatturato", "data": revenue},
+            {"label": "Commissioni portale", "data": commission},
+            {"label": "Guadagno partner", "data": earnings},
+        ],
+    }
 
-    partner_rows = []
-    chart_partner_labels_list = []
-    chart_partner_revenue_list = []
-    chart_partner_partner_earnings_list = []
-
-    for row in partner_rows_qs:
-        revenue = row["revenue"] or Decimal("0.00")
-        portal_commission = row["portal_commission"] or Decimal("0.00")
-        partner_earnings = revenue - portal_commission
 
-        row["partner_earnings"] = partner_earnings
-        partner_rows.append(row)
+def _revenue_earnings_chart(rows, label_of):
+    labels, revenue, earnings = [], [], []
+    for row in rows:
+        labels.append(label_of(row))
+        revenue.append(float(row["revenue"]))
+        earnings.append(float(row["revenue"] - row["portal_commission"]))
+    return {
+        "type": "bar",
+        "labels": labels,
+        "datasets": [
+            {"label": "Fatturato", "data": revenue},
+            {"label": "Guadagno partner", "data": earnings},
+        ],
+    }
 
-        chart_partner_labels_list.append(row["partner__company_name"])
-        chart_partner_revenue_list.append(float(revenue))
-        chart_partner_partner_earnings_list.append(float(partner_earnings))
 
-    # ===========================
-    #  GRAFICO ANDAMENTO GIORNALIERO
-    # ===========================
-    time_qs = (
-        items
-        .annotate(day=TruncDate("order__created_at"))
-        .values("day")
+def _chart_partners(facts, params):
+    """Top partner per fatturato."""
+    rows = (
+        facts.values("partner__company_name")
         .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
         )
-        .order_by("day")
+        .order_by("-revenue")
     )
+    return _revenue_earnings_chart(rows, lambda row: row["partner__company_name"])
 
-    chart_time_labels_list = []
-    chart_time_revenue_list = []
-    chart_time_portal_commission_list = []
-    chart_time_partner_earnings_list = []
-
-    for row in time_qs:
-        day = row["day"]
-        revenue = row["revenue"] or Decimal("0.00")
-        portal_commission = row["portal_commission"] or Decimal("0.00")
-        partner_earnings = revenue - portal_commission
 
-        chart_time_labels_list.append(day.strftime("%d/%m/%Y"))
-        chart_time_revenue_list.append(float(revenue))
-        chart_time_portal_commission_list.append(float(portal_commission))
-        chart_time_partner_earnings_list.append(float(partner_earnings))
-
-    # ===========================
-    #  GRAFICO PER MESE
-    # ===========================
-    month_qs = (
-        items
-        .annotate(month=TruncMonth("order__created_at"))
+def _chart_months(facts, params):
+    """Fatturato & guadagni per mese."""
+    rows = (
+        facts
+        .annotate(month=TruncMonth("day"))
         .values("month")
         .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
         )
         .order_by("month")
     )
+    return _revenue_earnings_chart(rows, lambda row: row["month"].strftime("%m/%Y"))
 
-    chart_month_labels_list = []
-    chart_month_revenue_list = []
-    chart_month_partner_earnings_list = []
-
-    for row in month_qs:
-        m = row["month"].strftime("%m/%Y")
-        revenue = row["revenue"] or Decimal("0.00")
-        comm = row["portal_commission"] or Decimal("0.00")
-        partner_earn = revenue - comm
-
-        chart_month_labels_list.append(m)
-        chart_month_revenue_list.append(float(revenue))
-        chart_month_partner_earnings_list.append(float(partner_earn))
 
-    # ===========================
-    #  GRAFICO TOP CATEGORIE
-    # ===========================
-    category_qs = (
-        items.values("product__category__name")
+def _chart_categories(facts, params):
+    """Top categorie prodotto per fatturato."""
+    rows = (
+        facts.values("category__name")
         .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
         )
         .order_by("-revenue")
     )
+    return _revenue_earnings_chart(rows, lambda row: row["category__name"] or "Senza categoria")
 
-    chart_category_labels_list = []
-    chart_category_revenue_list = []
-    chart_category_partner_earnings_list = []
 
-    for row in category_qs:
-        name = row["product__category__name"] or "Senza categoria"
-        revenue = row["revenue"] or Decimal("0.00")
-        comm = row["portal_commission"] or Decimal("0.00")
-        partner_earn = revenue - comm
+def _chart_compare(facts, params):
+    """Confronto tra i due partner selezionati (vuoto se non selezionati / uguali)."""
+    partner_1_id = params.get("compare_partner_1")
+    partner_2_id = params.get("compare_partner_2")
+    empty = {"type": "bar", "labels": [], "datasets": []}
+    if not partner_1_id or not partner_2_id or partner_1_id == partner_2_id:
+        return empty
 
-        chart_category_labels_list.append(name)
-        chart_category_revenue_list.append(float(revenue))
-        chart_category_partner_earnings_list.append(float(partner_earn))
+    names = dict(
+        PartnerProfile.objects
+        .filter(id__in=[partner_1_id, partner_2_id])
+        .values_list("id", "company_name")
+    )
+    if len(names) != 2:
+        return empty
+
+    def agg_partner(partner_id):
+        a = facts.filter(partner_id=partner_id).aggregate(
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
+            order_count=Sum("partner_order_count"),
+        )
+        return [
+            float(a["revenue"]),
+            float(a["portal_commission"]),
+            float(a["revenue"] - a["portal_commission"]),
+            int(a["order_count"] or 0),
+        ]
+
+    return {
+        "type": "bar",
+        "labels": ["Fatturato", "Commissioni portale", "Guadagno partner", "N. ordini"],
+        "datasets": [
+            {"label": names[int(partner_id)], "data": agg_partner(partner_id)}
+            for partner_id in (partner_1_id, partner_2_id)
+        ],
+    }
 
-    # ===========================
-    #  GRAFICO CONFRONTO TRA DUE PARTNER
-    # ===========================
-    compare_metric_labels_list = []
-    compare_partner1_values_list = []
-    compare_partner2_values_list = []
-    compare_partner_1_name = ""
-    compare_partner_2_name = ""
-
-    partners_qs = PartnerProfile.objects.order_by("company_name")
-
-    if compare_partner_1_id and compare_partner_2_id and compare_partner_1_id != compare_partner_2_id:
-        try:
-            p1 = partners_qs.get(id=compare_partner_1_id)
-            p2 = partners_qs.get(id=compare_partner_2_id)
-        except PartnerProfile.DoesNotExist:
-            p1 = p2 = None
-        else:
-            compare_partner_1_name = p1.company_name
-            compare_partner_2_name = p2.company_name
-
-            base_qs = items  # già filtrato per periodo / partner principale
-
-            def agg_partner(qs):
-                a = qs.aggregate(
-                    revenue=Coalesce(
-                        Sum("total_price"),
-                        Value(Decimal("0.00")),
-                        output_field=DecimalField(max_digits=12, decimal_places=2),
-                    ),
-                    portal_commission=Coalesce(
-                        Sum("commission_amount"),
-                        Value(Decimal("0.00")),
-                        output_field=DecimalField(max_digits=12, decimal_places=2),
-                    ),
-                    order_count=Count("order", distinct=True),
-                )
-                revenue_ = a["revenue"] or Decimal("0.00")
-                portal_commission_ = a["portal_commission"] or Decimal("0.00")
-                partner_earnings_ = revenue_ - portal_commission_
-                order_count_ = a["order_count"] or 0
-                return revenue_, portal_commission_, partner_earnings_, order_count_
-
-            rev1, comm1, earn1, orders1 = agg_partner(base_qs.filter(partner_id=compare_partner_1_id))
-            rev2, comm2, earn2, orders2 = agg_partner(base_qs.filter(partner_id=compare_partner_2_id))
-
-            compare_metric_labels_list = [
-                "Fatturato",
-                "Commissioni portale",
-                "Guadagno partner",
-                "N. ordini",
-            ]
-            compare_partner1_values_list = [
-                float(rev1),
-                float(comm1),
-                float(earn1),
-                int(orders1),
-            ]
-            compare_partner2_values_list = [
-                float(rev2),
-                float(comm2),
-                float(earn2),
-                int(orders2),
-            ]
 
-    # ===========================
-    #  SERIALIZZAZIONE PER CHART.JS
-    # ===========================
-    chart_time_labels = json.dumps(chart_time_labels_list)
-    chart_time_revenue = json.dumps(chart_time_revenue_list)
-    chart_time_portal_commission = json.dumps(chart_time_portal_commission_list)
-    chart_time_partner_earnings = json.dumps(chart_time_partner_earnings_list)
+COMMISSION_REPORT_CHARTS = {
+    "time": _chart_time,
+    "partners": _chart_partners,
+    "months": _chart_months,
+    "categories": _chart_categories,
+    "compare": _chart_compare,
+}
 
-    chart_partner_labels = json.dumps(chart_partner_labels_list)
-    chart_partner_revenue = json.dumps(chart_partner_revenue_list)
-    chart_partner_partner_earnings = json.dumps(chart_partner_partner_earnings_list)
+# parametri GET che influenzano KPI ed export (chiave di cache);
+# i grafici dipendono anche dai partner a confronto
+COMMISSION_FILTER_PARAMS = ("partner", "period_start", "period_end")
+COMMISSION_REPORT_PARAMS = COMMISSION_FILTER_PARAMS + ("compare_partner_1", "compare_partner_2")
 
-    chart_month_labels = json.dumps(chart_month_labels_list)
-    chart_month_revenue = json.dumps(chart_month_revenue_list)
-    chart_month_partner_earnings = json.dumps(chart_month_partner_earnings_list)
 
-    chart_category_labels = json.dumps(chart_category_labels_list)
-    chart_category_revenue = json.dumps(chart_category_revenue_list)
-    chart_category_partner_earnings = json.dumps(chart_category_partner_earnings_list)
+def _commission_kpis(facts, partner_id):
+    """KPI globali del report commissioni dai fatti già filtrati."""
+    agg = facts.aggregate(
+        total_revenue=_fact_sum("revenue"),
+        total_portal_commission=_fact_sum("commission"),
+        # con filtro partner contano gli ordini del partner, altrimenti gli ordini distinti
+        order_count=Sum("partner_order_count" if partner_id else "order_count"),
+        partner_count=Count("partner", distinct=True),
+    )
 
-    chart_compare_metric_labels = json.dumps(compare_metric_labels_list)
-    chart_compare_partner1_values = json.dumps(compare_partner1_values_list)
-    chart_compare_partner2_values = json.dumps(compare_partner2_values_list)
+    total_revenue = agg["total_revenue"] or Decimal("0.00")
+    total_portal_commission = agg["total_portal_commission"] or Decimal("0.00")
+    return {
+        "total_revenue": total_revenue,
+        "total_portal_commission": total_portal_commission,
+        "total_partner_earnings": total_revenue - total_portal_commission,
+        "order_count": agg["order_count"] or 0,
+        "partner_count": agg["partner_count"] or 0,
+    }
+
+
+def _commission_report_data(period_start_str, period_end_str, partner_id):
+    """KPI globali + riepilogo per partner (tabella) del report commissioni."""
+    # Fatti giornalieri già filtrati (periodo / partner, ordini annullati esclusi)
+    facts = _commission_facts(period_start_str, period_end_str, partner_id)
+
+    partner_rows_qs = (
+        facts.values("partner__id", "partner__company_name", "partner__user__email")
+        .annotate(
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
+            order_count=Sum("partner_order_count"),
+        )
+        .order_by("-revenue")
+    )
+
+    partner_rows = []
+    for row in partner_rows_qs:
+        row["partner_earnings"] = row["revenue"] - row["portal_commission"]
+        partner_rows.append(row)
+
+    return {**_commission_kpis(facts, partner_id), "partner_rows": partner_rows}
+
+
+@admin_required
+def commission_report(request):
+    """
+    Dashboard report commissioni (shell veloce):
+    - KPI globali sul periodo
+    - Tabella riepilogo per partner
+
+    I grafici (andamento giornaliero, top partner, per mese, top categorie,
+    confronto tra due partner) sono caricati in parallelo dalla pagina tramite
+    commission_report_chart, uno per endpoint JSON.
+    """
+
+    partner_id = request.GET.get("partner")
+    period_start_str = request.GET.get("period_start")
+    period_end_str = request.GET.get("period_end")
+    compare_partner_1_id = request.GET.get("compare_partner_1")
+    compare_partner_2_id = request.GET.get("compare_partner_2")
+
+    # KPI + tabella partner: calcolati una volta per filtri e generazione dei dati
+    data = report_cache.cached_report(
+        "commission_report",
+        request.GET,
+        lambda: _commission_report_data(period_start_str, period_end_str, partner_id),
+        keys=COMMISSION_FILTER_PARAMS,
+    )
 
     # ===========================
     #  CONTEXT
     # ===========================
+    chart_query = urlencode(
+        [(k, request.GET.get(k)) for k in COMMISSION_REPORT_PARAMS if request.GET.get(k)]
+    )
+    compare_selected = bool(
+        compare_partner_1_id and compare_partner_2_id and compare_partner_1_id != compare_partner_2_id
+    )
+
     context = {
-        "partners": partners_qs,
+        "partners": PartnerProfile.objects.order_by("company_name"),
         "selected_partner": int(partner_id) if partner_id else None,
         "period_start": period_start_str or "",
         "period_end": period_end_str or "",
-        "total_revenue": total_revenue,
-        "total_portal_commission": total_portal_commission,
-        "total_partner_earnings": total_partner_earnings,
-        "order_count": order_count,
-        "partner_count": partner_count,
-        "partner_rows": partner_rows,
-
-        "chart_time_labels": chart_time_labels,
-        "chart_time_revenue": chart_time_revenue,
-        "chart_time_portal_commission": chart_time_portal_commission,
-        "chart_time_partner_earnings": chart_time_partner_earnings,
-
-        "chart_partner_labels": chart_partner_labels,
-        "chart_partner_revenue": chart_partner_revenue,
-        "chart_partner_partner_earnings": chart_partner_partner_earnings,
-
-        "chart_month_labels": chart_month_labels,
-        "chart_month_revenue": chart_month_revenue,
-        "chart_month_partner_earnings": chart_month_partner_earnings,
-
-        "chart_category_labels": chart_category_labels,
-        "chart_category_revenue": chart_category_revenue,
-        "chart_category_partner_earnings": chart_category_partner_earnings,
-
-        "chart_compare_metric_labels": chart_compare_metric_labels,
-        "chart_compare_partner1_values": chart_compare_partner1_values,
-        "chart_compare_partner2_values": chart_compare_partner2_values,
-        "compare_partner_1_name": compare_partner_1_name,
-        "compare_partner_2_name": compare_partner_2_name,
+        **data,
+
+        "chart_query": chart_query,
+        "compare_selected": compare_selected,
         "selected_compare_partner_1": int(compare_partner_1_id) if compare_partner_1_id else None,
         "selected_compare_partner_2": int(compare_partner_2_id) if compare_partner_2_id else None,
     }
@@ -1200,6 +1143,31 @@ def commission_report(request):
     return render(request, "backoffice/commission_report.html", context)
 
 
+@admin_required
+def commission_report_chart(request, chart):
+    """
+    Endpoint JSON di un singolo grafico del report commissioni, con gli stessi
+    filtri GET della pagina. Ogni grafico ha la sua chiave di cache (grafico +
+    parametri di filtro normalizzati + generazione dei dati, report_cache).
+    """
+    build_chart = COMMISSION_REPORT_CHARTS.get(chart)
+    if build_chart is None:
+        return JsonResponse({"error": "Grafico sconosciuto."}, status=404)
+
+    params = request.GET
+
+    def compute():
+        facts = _commission_facts(params.get("period_start"), params.get("period_end"), params.get("partner"))
+        return build_chart(facts, params)
+
+    data = report_cache.cached_report(
+        "commission_report_chart",
+        {"chart": chart, **{k: params.get(k) for k in COMMISSION_REPORT_PARAMS}},
+        compute,
+    )
+    return JsonResponse(data)
+
+
 @admin_required
 def commission_report_detail(request):
     """
@@ -1221,19 +1189,55 @@ def commission_report_detail(request):
     order_status = request.GET.get("order_status")
     payout_status = request.GET.get("payout_status")  # '', 'liquidated', 'unliquidated'
 
+    data = report_cache.cached_report(
+        "commission_report_detail",
+        request.GET,
+        lambda: _commission_detail_data(
+            partner_id, period_start_str, period_end_str,
+            category_id, structure_id, order_status, payout_status,
+        ),
+        keys=COMMISSION_DETAIL_PARAMS,
+    )
+
+    partners = PartnerProfile.objects.order_by("company_name")
+    categories = Category.objects.order_by("name")
+    structures = ClientStructure.objects.order_by("id")  # ordina per id, sicuro
+
+    context = {
+        **data,
+        "partners": partners,
+        "categories": categories,
+        "structures": structures,
+        "selected_partner": int(partner_id) if partner_id else None,
+        "selected_category": int(category_id) if category_id else None,
+        "selected_structure": int(structure_id) if structure_id else None,
+        "selected_order_status": order_status or "",
+        "selected_payout_status": payout_status or "",
+        "period_start": period_start_str or "",
+        "period_end": period_end_str or "",
+        "order_status_choices": Order.STATUS_CHOICES,
+    }
+
+    return render(request, "backoffice/commission_report_detail.html", context)
+
+
+COMMISSION_DETAIL_PARAMS = (
+    "partner", "period_start", "period_end", "category", "structure", "order_status", "payout_status",
+)
+
+# righe mostrate (e messe in cache) nel drill-down: i KPI restano sull'intero perimetro
+COMMISSION_DETAIL_MAX_ROWS = 500
+
+
+def _commission_detail_data(partner_id, period_start_str, period_end_str,
+                            category_id, structure_id, order_status, payout_status):
+    """Righe d'ordine del drill-down (con guadagno partner per riga) + KPI di riepilogo."""
     start_date = parse_date(period_start_str) if period_start_str else None
     end_date = parse_date(period_end_str) if period_end_str else None
 
     items = (
         OrderItem.objects
-        .select_related(
-            "order",
-            "order__structure",
-            "product",
-            "product__category",
-            "partner",
-        )
-        .exclude(order__status=Order.STATUS_CANCELLED)
+        .exclude(order_status=Order.STATUS_CANCELLED)
         .filter(commission_amount__gt=0)
     )
 
@@ -1244,19 +1248,14 @@ def commission_report_detail(request):
     if structure_id:
         items = items.filter(order__structure_id=structure_id)
     if order_status:
-        items = items.filter(order__status=order_status)
-    if start_date:
-        items = items.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        items = items.filter(order__created_at__date__lte=end_date)
+        items = items.filter(order_status=order_status)
+    items = items.filter(period_q("order_created_at", start_date, end_date))
 
     if payout_status == "liquidated":
         items = items.filter(is_liquidated=True)
     elif payout_status == "unliquidated":
         items = items.filter(is_liquidated=False)
 
-    items = items.order_by("-order__created_at")
-
     # KPI di riepilogo
     agg = items.aggregate(
         total_revenue=Coalesce(
@@ -1269,50 +1268,46 @@ def commission_report_detail(request):
             Value(Decimal("0.00")),
             output_field=DecimalField(max_digits=12, decimal_places=2),
         ),
+        items_count=Count("pk"),
     )
 
     total_revenue = agg["total_revenue"] or Decimal("0.00")
     total_portal_commission = agg["total_portal_commission"] or Decimal("0.00")
     total_partner_earnings = total_revenue - total_portal_commission
 
-    # calcolo guadagno partner per ogni riga (per il template)
-    for it in items:
-        rev = it.total_price or Decimal("0.00")
-        comm = it.commission_amount or Decimal("0.00")
-        it.calculated_partner_earnings = rev - comm
-
-    partners = PartnerProfile.objects.order_by("company_name")
-    categories = Category.objects.order_by("name")
-    structures = ClientStructure.objects.order_by("id")  # ordina per id, sicuro
+    # righe come dict (valori semplici, niente istanze in cache), al più COMMISSION_DETAIL_MAX_ROWS
+    rows = list(
+        items
+        .order_by("-order_created_at", "-pk")
+        .values(
+            "order_created_at", "order_id", "quantity", "total_price", "commission_amount", "is_liquidated",
+            partner_name=F("partner__company_name"),
+            product_name=F("product__name"),
+            category_name=F("product__category__name"),
+        )[:COMMISSION_DETAIL_MAX_ROWS]
+    )
+    # guadagno partner per riga (per il template)
+    for row in rows:
+        row["calculated_partner_earnings"] = (
+            (row["total_price"] or Decimal("0.00")) - (row["commission_amount"] or Decimal("0.00"))
+        )
 
-    context = {
-        "items": items,
-        "partners": partners,
-        "categories": categories,
-        "structures": structures,
-        "selected_partner": int(partner_id) if partner_id else None,
-        "selected_category": int(category_id) if category_id else None,
-        "selected_structure": int(structure_id) if structure_id else None,
-        "selected_order_status": order_status or "",
-        "selected_payout_status": payout_status or "",
-        "period_start": period_start_str or "",
-        "period_end": period_end_str or "",
+    return {
+        "items": rows,
+        "items_count": agg["items_count"],
+        "items_truncated": agg["items_count"] > len(rows),
+        "max_rows": COMMISSION_DETAIL_MAX_ROWS,
         "total_revenue": total_revenue,
         "total_portal_commission": total_portal_commission,
         "total_partner_earnings": total_partner_earnings,
-        "order_status_choices": Order.STATUS_CHOICES,
     }
 
-    return render(request, "backoffice/commission_report_detail.html", context)
 
-
-@admin_required
-def commission_report_export_csv(request):
+def _commission_export_items(request):
     """
-    Export CSV del report commissioni (aggregato per partner),
-    con gli stessi filtri di commission_report.
+    Righe d'ordine del report commissioni per gli export (stessi filtri di
+    commission_report). Restituisce (items, period_start_str, period_end_str).
     """
-
     period_start_str = request.GET.get("period_start")
     period_end_str = request.GET.get("period_end")
     partner_id = request.GET.get("partner")
@@ -1322,228 +1317,136 @@ def commission_report_export_csv(request):
 
     items = (
         OrderItem.objects
-        .select_related("order", "partner", "partner__user")
-        .exclude(order__status="cancelled")
+        .exclude(order_status="cancelled")
         .filter(commission_amount__gt=0)
     )
 
-    if start_date:
-        items = items.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        items = items.filter(order__created_at__date__lte=end_date)
+    items = items.filter(period_q("order_created_at", start_date, end_date))
     if partner_id:
         items = items.filter(partner_id=partner_id)
 
-    partner_rows_qs = (
-        items.filter(partner__isnull=False)
+    return items, period_start_str, period_end_str
+
+
+def _commission_partner_rows(facts):
+    """Riepilogo per partner (fatturato, commissioni portale, guadagno partner) dai fatti."""
+    rows = (
+        facts.filter(partner__isnull=False)
         .values("partner__id", "partner__company_name", "partner__user__email")
         .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
+            revenue=_fact_sum("revenue"),
+            portal_commission=_fact_sum("commission"),
         )
         .order_by("partner__company_name")
     )
+    for row in exports.iter_rows(rows):
+        row["revenue"] = row["revenue"] or Decimal("0.00")
+        row["portal_commission"] = row["portal_commission"] or Decimal("0.00")
+        row["partner_earnings"] = row["revenue"] - row["portal_commission"]
+        yield row
 
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="report_commissioni_portale.csv"'
 
-    writer = csv.writer(response, delimiter=";")
+def _commission_export_summary(request):
+    """Riepilogo per partner degli export CSV / XLSX (lista in cache report)."""
+    params = request.GET
 
-    writer.writerow([
-        "Partner",
-        "Email",
-        "Fatturato (€)",
-        "Commissioni portale (€)",
-        "Guadagno partner (€)",
-        "Periodo da",
-        "Periodo a",
-    ])
+    def compute():
+        facts = _commission_facts(params.get("period_start"), params.get("period_end"), params.get("partner"))
+        return list(_commission_partner_rows(facts))
 
-    for row in partner_rows_qs:
-        rev = row["revenue"] or Decimal("0.00")
-        comm = row["portal_commission"] or Decimal("0.00")
-        partner_earn = rev - comm
+    return report_cache.cached_report(
+        "commission_export_summary", params, compute, keys=COMMISSION_FILTER_PARAMS
+    )
 
-        writer.writerow([
-            row["partner__company_name"],
-            row["partner__user__email"],
-            f"{rev:.2f}",
-            f"{comm:.2f}",
-            f"{partner_earn:.2f}",
-            period_start_str or "",
-            period_end_str or "",
-        ])
 
-    return response
+def _commission_summary_columns(period_start_str, period_end_str, money):
+    return [
+        exports.Column("Partner", "partner__company_name"),
+        exports.Column("Email", "partner__user__email"),
+        exports.Column("Fatturato (€)", lambda row: money(row["revenue"])),
+        exports.Column("Commissioni portale (€)", lambda row: money(row["portal_commission"])),
+        exports.Column("Guadagno partner (€)", lambda row: money(row["partner_earnings"])),
+        exports.Column("Periodo da", lambda row: period_start_str or ""),
+        exports.Column("Periodo a", lambda row: period_end_str or ""),
+    ]
+
 
 @admin_required
-def commission_report_export_xlsx(request):
+def commission_report_export_csv(request):
     """
-    Export Excel (.xlsx) del report commissioni.
-    - Sheet 1: riepilogo per partner
-    - Sheet 2: dettaglio righe ordine
+    Export CSV (in streaming) del report commissioni (aggregato per partner),
+    con gli stessi filtri di commission_report.
     """
-
     period_start_str = request.GET.get("period_start")
     period_end_str = request.GET.get("period_end")
-    partner_id = request.GET.get("partner")
 
-    start_date = parse_date(period_start_str) if period_start_str else None
-    end_date = parse_date(period_end_str) if period_end_str else None
-
-    items = (
-        OrderItem.objects
-        .select_related("order", "partner", "product", "partner__user", "product__category")
-        .exclude(order__status="cancelled")
-        .filter(commission_amount__gt=0)
+    return exports.csv_response(
+        "report_commissioni_portale.csv",
+        _commission_summary_columns(period_start_str, period_end_str, lambda value: f"{value:.2f}"),
+        _commission_export_summary(request),
     )
 
-    if start_date:
-        items = items.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        items = items.filter(order__created_at__date__lte=end_date)
-    if partner_id:
-        items = items.filter(partner_id=partner_id)
 
-    # ================
-    #  CREA EXCEL
-    # ================
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Riepilogo partner"
-
-    # =====================
-    #  FOGLIO 1: RIEPILOGO
-    # =====================
-    headers = [
-        "Partner",
-        "Email",
-        "Fatturato (€)",
-        "Commissioni portale (€)",
+def _decimal_or_zero(value):
+    return float(value or Decimal("0.00"))
+
+
+COMMISSION_DETAIL_COLUMNS = [
+    exports.Column("Data ordine", lambda row: row["order_created_at"].strftime("%d/%m/%Y")),
+    exports.Column("ID ordine", "order_id"),
+    exports.Column("Cliente", lambda row: ""),
+    exports.Column("Partner", lambda row: row["partner__company_name"] or ""),
+    exports.Column("Prodotto", lambda row: row["product__name"] or ""),
+    exports.Column("Categoria", lambda row: row["product__category__name"] or ""),
+    exports.Column("Quantità", "quantity"),
+    exports.Column("Prezzo unitario (€)", lambda row: float(row["unit_price"])),
+    exports.Column("Totale riga (€)", lambda row: _decimal_or_zero(row["total_price"])),
+    exports.Column("Commissione portale (€)", lambda row: _decimal_or_zero(row["commission_amount"])),
+    exports.Column(
         "Guadagno partner (€)",
-        "Periodo da",
-        "Periodo a",
-    ]
+        lambda row: float(
+            (row["total_price"] or Decimal("0.00")) - (row["commission_amount"] or Decimal("0.00"))
+        ),
+    ),
+    exports.Column("Stato ordine", "order_status"),
+]
 
-    # Header
-    for col_idx, header in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col_idx, value=header)
-        cell.font = Font(bold=True)
 
-    partner_rows_qs = (
-        items.filter(partner__isnull=False)
-        .values("partner__id", "partner__company_name", "partner__user__email")
-        .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
+@admin_required
+def commission_report_export_xlsx(request):
+    """
+    Export Excel (.xlsx) del report commissioni (writer a memoria costante).
+    - Sheet 1: riepilogo per partner
+    - Sheet 2: dettaglio righe ordine
+    """
+    items, period_start_str, period_end_str = _commission_export_items(request)
+
+    detail_rows = exports.iter_rows(
+        items.values(
+            "order_created_at",
+            "order_id",
+            "partner__company_name",
+            "product__name",
+            "product__category__name",
+            "quantity",
+            "unit_price",
+            "total_price",
+            "commission_amount",
+            "order_status",
         )
-        .order_by("partner__company_name")
     )
 
-    row_idx = 2
-    for row in partner_rows_qs:
-        rev = row["revenue"] or Decimal("0.00")
-        comm = row["portal_commission"] or Decimal("0.00")
-        partner_earn = rev - comm
-
-        ws.cell(row=row_idx, column=1, value=row["partner__company_name"])
-        ws.cell(row=row_idx, column=2, value=row["partner__user__email"])
-        ws.cell(row=row_idx, column=3, value=float(rev))
-        ws.cell(row=row_idx, column=4, value=float(comm))
-        ws.cell(row=row_idx, column=5, value=float(partner_earn))
-        ws.cell(row=row_idx, column=6, value=period_start_str or "")
-        ws.cell(row=row_idx, column=7, value=period_end_str or "")
-
-        row_idx += 1
-
-    # Auto width foglio 1
-    for col_idx in range(1, len(headers) + 1):
-        max_length = 0
-        col_letter = get_column_letter(col_idx)
-        for cell in ws[col_letter]:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    # ==========================
-    #  FOGLIO 2: DETTAGLIO RIGHE
-    # ==========================
-    ws2 = wb.create_sheet("Dettaglio righe")
-
-    headers2 = [
-        "Data ordine",
-        "ID ordine",
-        "Cliente",
-        "Partner",
-        "Prodotto",
-        "Categoria",
-        "Quantità",
-        "Prezzo unitario (€)",
-        "Totale riga (€)",
-        "Commissione portale (€)",
-        "Guadagno partner (€)",
-        "Stato ordine",
-    ]
-
-    for col_idx, header in enumerate(headers2, start=1):
-        cell = ws2.cell(row=1, column=col_idx, value=header)
-        cell.font = Font(bold=True)
-
-    row_idx = 2
-    for item in items:
-        rev = item.total_price or Decimal("0.00")
-        comm = item.commission_amount or Decimal("0.00")
-        partner_earn = rev - comm
-
-        ws2.cell(row=row_idx, column=1, value=item.order.created_at.strftime("%d/%m/%Y"))
-        ws2.cell(row=row_idx, column=2, value=item.order.id)
-        ws2.cell(row=row_idx, column=3, value="")
-        ws2.cell(row=row_idx, column=4, value=item.partner.company_name if item.partner else "")
-        ws2.cell(row=row_idx, column=5, value=item.product.name if item.product else "")
-        ws2.cell(row=row_idx, column=6, value=item.product.category.name if item.product and item.product.category else "")
-        ws2.cell(row=row_idx, column=7, value=item.quantity)
-        ws2.cell(row=row_idx, column=8, value=float(item.unit_price))
-        ws2.cell(row=row_idx, column=9, value=float(rev))
-        ws2.cell(row=row_idx, column=10, value=float(comm))
-        ws2.cell(row=row_idx, column=11, value=float(partner_earn))
-        ws2.cell(row=row_idx, column=12, value=item.order.status)
-
-        row_idx += 1
-
-    # Auto width foglio 2
-    for col_idx in range(1, len(headers2) + 1):
-        max_length = 0
-        col_letter = get_column_letter(col_idx)
-        for cell in ws2[col_letter]:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws2.column_dimensions[col_letter].width = max_length + 2
-
-    # ============
-    #  EXPORT
-    # ============
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return exports.xlsx_response(
+        "report_commissioni_portale.xlsx",
+        [
+            exports.Sheet(
+                "Riepilogo partner",
+                _commission_summary_columns(period_start_str, period_end_str, float),
+                _commission_export_summary(request),
+            ),
+            exports.Sheet("Dettaglio righe", COMMISSION_DETAIL_COLUMNS, detail_rows),
+        ],
     )
-    response["Content-Disposition"] = 'attachment; filename="report_commissioni_portale.xlsx"'
-    wb.save(response)
-    return response
 
 @admin_required
 def commission_report_export_pdf(request):
@@ -1557,73 +1460,25 @@ def commission_report_export_pdf(request):
     period_end_str = request.GET.get("period_end")
     partner_id = request.GET.get("partner")
 
-    start_date = parse_date(period_start_str) if period_start_str else None
-    end_date = parse_date(period_end_str) if period_end_str else None
-
-    # Query di base (stessa logica del report)
-    items = (
-        OrderItem.objects
-        .select_related("order", "partner", "product", "partner__user")
-        .exclude(order__status="cancelled")
-        .filter(commission_amount__gt=0)
-    )
-
-    if start_date:
-        items = items.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        items = items.filter(order__created_at__date__lte=end_date)
-    if partner_id:
-        items = items.filter(partner_id=partner_id)
-
-    from django.db.models import Count
-
-    agg = items.aggregate(
-        total_revenue=Coalesce(
-            Sum("total_price"),
-            Value(Decimal("0.00")),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        ),
-        total_portal_commission=Coalesce(
-            Sum("commission_amount"),
-            Value(Decimal("0.00")),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        ),
-        order_count=Count("order", distinct=True),
-        partner_count=Count("partner", distinct=True),
+    def compute():
+        # Fatti giornalieri (stessa logica del report)
+        facts = _commission_facts(period_start_str, period_end_str, partner_id)
+        # KPI + riepilogo per partner (come nella tabella principale)
+        return {
+            **_commission_kpis(facts, partner_id),
+            "partner_rows": list(_commission_partner_rows(facts)),
+        }
+
+    data = report_cache.cached_report(
+        "commission_export_pdf", request.GET, compute, keys=COMMISSION_FILTER_PARAMS
     )
 
-    total_revenue = agg["total_revenue"] or Decimal("0.00")
-    total_portal_commission = agg["total_portal_commission"] or Decimal("0.00")
-    total_partner_earnings = (total_revenue - total_portal_commission).quantize(Decimal("0.01"))
-    order_count = agg["order_count"] or 0
-    partner_count = agg["partner_count"] or 0
-
-    # Riepilogo per partner (come nella tabella principale)
-    partner_rows_qs = (
-        items.filter(partner__isnull=False)
-        .values("partner__id", "partner__company_name", "partner__user__email")
-        .annotate(
-            revenue=Coalesce(
-                Sum("total_price"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-            portal_commission=Coalesce(
-                Sum("commission_amount"),
-                Value(Decimal("0.00")),
-                output_field=DecimalField(max_digits=12, decimal_places=2),
-            ),
-        )
-        .order_by("partner__company_name")
-    )
-
-    partner_rows = []
-    for row in partner_rows_qs:
-        rev = row["revenue"] or Decimal("0.00")
-        comm = row["portal_commission"] or Decimal("0.00")
-        partner_earn = rev - comm
-        row["partner_earnings"] = partner_earn
-        partner_rows.append(row)
+    total_revenue = data["total_revenue"]
+    total_portal_commission = data["total_portal_commission"]
+    total_partner_earnings = data["total_partner_earnings"].quantize(Decimal("0.01"))
+    order_count = data["order_count"]
+    partner_count = data["partner_count"]
+    partner_rows = data["partner_rows"]
 
     # ==================
     #  CREAZIONE PDF
@@ -1740,6 +1595,25 @@ def commission_report_export_pdf(request):
     c.save()
     return response
 
+@admin_required
+def report_cache_stats(request):
+    """
+    Statistiche della cache report: hit / miss per vista e generazione
+    corrente dei dati. In POST azzera i contatori.
+    """
+    if request.method == "POST":
+        report_cache.reset_report_cache_stats()
+        messages.success(request, "Statistiche della cache report azzerate.")
+        return redirect("backoffice:report_cache_stats")
+
+    context = {
+        "stats": report_cache.report_cache_stats(),
+        "generation": report_cache.current_generation(),
+        "cache_timeout_minutes": report_cache.CACHE_TIMEOUT // 60,
+    }
+    return render(request, "backoffice/report_cache_stats.html", context)
+
+
 @admin_required
 def commission_partner_pdf(request, partner_id):
     """
@@ -1762,21 +1636,17 @@ def commission_partner_pdf(request, partner_id):
     items = (
         OrderItem.objects
         .select_related(
-            "order",
             "product",
             "partner",
             "product__category",
         )
         .filter(partner=partner)
-        .exclude(order__status="cancelled")
+        .exclude(order_status="cancelled")
     )
 
-    if start_date:
-        items = items.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        items = items.filter(order__created_at__date__lte=end_date)
+    items = items.filter(period_q("order_created_at", start_date, end_date))
 
-    items = items.order_by("order__created_at")
+    items = items.order_by("order_created_at")
 
     # KPI per questo partner
     agg = items.aggregate(
@@ -1941,7 +1811,7 @@ def commission_partner_pdf(request, partner_id):
                 y -= line_h
                 c.setFont("Helvetica", 8)
 
-            d_str = item.order.created_at.strftime("%d/%m/%Y")
+            d_str = item.order_created_at.strftime("%d/%m/%Y")
             prod_name = item.product.name if item.product else ""
             if len(prod_name) > 40:
                 prod_name = prod_name[:37] + "..."
@@ -1951,7 +1821,7 @@ def commission_partner_pdf(request, partner_id):
             earn = rev - comm
 
             c.drawString(col_date, y, d_str)
-            c.drawString(col_order, y, str(item.order.id))
+            c.drawString(col_order, y, str(item.order_id))
             c.drawString(col_prod, y, prod_name)
             c.drawRightString(col_total + 10, y, f"{rev:.2f}")
             c.drawRightString(col_comm + 10, y, f"{comm:.2f}")
@@ -1983,10 +1853,7 @@ def partner_commission_export_csv(request):
 
     qs = PartnerProfile.objects.select_related("user")
 
-    if start_date:
-        qs = qs.filter(order_items__order__created_at__date__gte=start_date)
-    if end_date:
-        qs = qs.filter(order_items__order__created_at__date__lte=end_date)
+    qs = qs.filter(period_q("order_items__order_created_at", start_date, end_date))
 
     if company:
         qs = qs.filter(company_name__icontains=company)
@@ -2000,11 +1867,7 @@ def partner_commission_export_csv(request):
         qs = qs.filter(is_active=False)
 
     # filtro periodo anche per l'export
-    period_filter = Q()
-    if start_date:
-        period_filter &= Q(order_items__order__created_at__date__gte=start_date)
-    if end_date:
-        period_filter &= Q(order_items__order__created_at__date__lte=end_date)
+    period_filter = period_q("order_items__order_created_at", start_date, end_date)
 
     qs = (
         qs.annotate(
@@ -2075,7 +1938,7 @@ def partner_payout_report(request, payout_id):
     items_qs = (
         payout.items
         .select_related("order", "order__client", "product")
-        .order_by("order__created_at", "id")
+        .order_by("order_created_at", "id")
     )
 
     aggregates = items_qs.aggregate(
@@ -2104,6 +1967,25 @@ def partner_payout_report(request, payout_id):
         "total_partner_net": aggregates["total_partner_net"],
     }
     return render(request, "backoffice/partner_payout_report.html", context)
+
+
+@admin_required
+def partner_payout_pdf(request, payout_id):
+    """
+    PDF del payout, servito dalla copia su storage (orders.pdf_utils):
+    WeasyPrint gira solo al primo download dopo una modifica del payout o del template.
+    """
+    payout = get_object_or_404(
+        PartnerPayout.objects.select_related("partner", "partner__user"),
+        id=payout_id,
+    )
+    name, _ = cached_payout_pdf(payout)
+    return FileResponse(
+        default_storage.open(name, "rb"),
+        as_attachment=True,
+        filename=f"payout_{payout.id}.pdf",
+        content_type="application/pdf",
+    )
  
     
 @admin_required
@@ -2113,11 +1995,12 @@ def partner_payout_create(request, partner_id):
 
     Regole:
     - Se esiste un payout in stato BOZZA per (partner, periodo) -> aggiunge le nuove righe
-      non liquidate al suo totale.
+      non liquidate; il totale viene ricalcolato dalle righe agganciate.
     - Se NON esiste un payout in BOZZA (magari ce ne sono di già pagati) -> crea un
       nuovo payout in stato BOZZA solo con le nuove righe.
 
-    In tutti i casi, le righe vengono associate al payout (campo OrderItem.payout).
+    In tutti i casi, le righe vengono associate al payout (campo OrderItem.payout)
+    da orders.payout_runs.attach_partner_items (lock, aggiornamenti in blocco, log).
     La liquidazione (is_liquidated=True) avviene SOLO quando il payout passa a "Pagato".
     """
 
@@ -2158,16 +2041,12 @@ def partner_payout_create(request, partner_id):
         )
         return HttpResponseRedirect(redirect_url)
 
-    # Righe d'ordine del periodo, NON ancora liquidate
-    items_qs = OrderItem.objects.filter(
-        partner=partner,
-        order__created_at__date__gte=start_date,
-        order__created_at__date__lte=end_date,
-        is_liquidated=False,
-        payout__isnull=True,  # evita doppio inserimento in payout già creati (bozze incluse)
-    )
+    # Aggancio in blocco con lock su partner e righe (orders.payout_runs):
+    # due richieste contemporanee non contano la stessa riga in due bozze.
+    # La liquidazione (is_liquidated=True) avviene SOLO a payout=Pagato.
+    result = payout_runs.attach_partner_items(partner, start_date, end_date, user=request.user)
 
-    if not items_qs.exists():
+    if result is None:
         messages.warning(
             request,
             "Non ci sono righe da liquidare nel periodo selezionato per questo partner "
@@ -2175,76 +2054,23 @@ def partner_payout_create(request, partner_id):
         )
         return HttpResponseRedirect(redirect_url)
 
-    # Assicuriamoci che commission_amount e partner_earnings siano valorizzati
-    for item in items_qs:
-        if (
-            item.commission_amount is None
-            or item.partner_earnings is None
-            or item.commission_amount == 0
-            or item.partner_earnings == 0
-        ):
-            rate = (
-                item.commission_rate
-                or partner.default_commission_percent
-                or Decimal("0.00")
-            )
-            item.commission_rate = rate
-            item.calculate_commission(default_rate=rate)
-            item.save(
-                update_fields=[
-                    "commission_rate",
-                    "commission_amount",
-                    "partner_earnings",
-                ]
-            )
-
-    # Totale da liquidare AL PARTNER per queste NUOVE righe
-    new_partner_earnings = items_qs.aggregate(
-        total=Coalesce(
-            Sum("partner_earnings"),
-            Value(Decimal("0.00")),
-            output_field=DecimalField(max_digits=12, decimal_places=2),
-        )
-    )["total"]
-
-    # Cerchiamo un payout ESISTENTE per questo partner/periodo in BOZZA
-    existing_draft = PartnerPayout.objects.filter(
-        partner=partner,
-        period_start=start_date,
-        period_end=end_date,
-        status=PartnerPayout.STATUS_DRAFT,
-    ).first()
-
-    # Cerchiamo qualunque payout (bozza o pagato) solo per messaggio informativo
-    existing_any = PartnerPayout.objects.filter(
-        partner=partner,
-        period_start=start_date,
-        period_end=end_date,
-    ).exclude(id=getattr(existing_draft, "id", None)).first()
-
-    if existing_draft:
-        # ➤ Caso 1 — aggiorno la bozza
-        previous_total = existing_draft.total_commission or Decimal("0.00")
-        existing_draft.total_commission = previous_total + new_partner_earnings
-        existing_draft.save(update_fields=["total_commission"])
-
-        payout = existing_draft
-
+    payout = result["payout"]
+    if not result["created"]:
+        # ➤ Caso 1 — aggiornata la bozza esistente
         messages.info(
             request,
             f"Payout in bozza già esistente per questo partner e periodo: "
-            f"aggiunti {new_partner_earnings:.2f} € (nuove righe). "
+            f"aggiunti {result['amount']:.2f} € (nuove righe). "
             f"Totale aggiornato a {payout.total_commission:.2f} €.",
         )
     else:
-        # ➤ Caso 2/3 — non esiste bozza: creo SEMPRE un nuovo payout
-        payout = PartnerPayout.objects.create(
+        # ➤ Caso 2/3 — non esisteva una bozza: creato un nuovo payout
+        # Cerchiamo qualunque altro payout (confermato o pagato) solo per messaggio informativo
+        existing_any = PartnerPayout.objects.filter(
             partner=partner,
             period_start=start_date,
             period_end=end_date,
-            total_commission=new_partner_earnings,
-            status=PartnerPayout.STATUS_DRAFT,
-        )
+        ).exclude(id=payout.id).first()
 
         if existing_any:
             messages.warning(
@@ -2257,15 +2083,56 @@ def partner_payout_create(request, partner_id):
             messages.success(
                 request,
                 f"Creato nuovo payout in stato 'Bozza' per {partner.company_name} "
-                f"({start_date} → {end_date}) per {new_partner_earnings:.2f} € (importo partner).",
+                f"({start_date} → {end_date}) per {payout.total_commission:.2f} € (importo partner).",
             )
 
-    # Le righe vengono associate al payout (la liquidazione avviene SOLO a payout=Pagato)
-    items_qs.update(payout=payout)
-
     return HttpResponseRedirect(redirect_url)
     
     
+@admin_required
+def payout_run(request):
+    """
+    Payout run di fine periodo per tutti i partner (orders.payout_runs).
+
+    GET: anteprima delle bozze da creare / aggiornare nel periodo
+    (default: mese precedente). POST: esegue il run in una transazione e
+    torna all'elenco delle bozze.
+    """
+    data = request.POST if request.method == "POST" else request.GET
+    period_start = parse_date(data.get("period_start") or "")
+    period_end = parse_date(data.get("period_end") or "")
+    if not period_start or not period_end:
+        last_month_end = timezone.localdate().replace(day=1) - timedelta(days=1)
+        period_start, period_end = last_month_end.replace(day=1), last_month_end
+
+    if period_start > period_end:
+        messages.error(request, "La data di inizio è successiva alla data di fine.")
+        preview = []
+    elif request.method == "POST":
+        result = payout_runs.run_payouts(period_start, period_end, user=request.user)
+        messages.success(
+            request,
+            f"Payout run {period_start} → {period_end}: {len(result['created'])} bozze create, "
+            f"{len(result['updated'])} aggiornate, {result['items']} righe agganciate.",
+        )
+        return HttpResponseRedirect(
+            f"{reverse('backoffice:partner_payout_list')}?{urlencode({'status': PartnerPayout.STATUS_DRAFT})}"
+        )
+    else:
+        preview = payout_runs.payout_run_preview(period_start, period_end)
+
+    context = {
+        "period_start": period_start.isoformat(),
+        "period_end": period_end.isoformat(),
+        "preview": preview,
+        "create_count": sum(row["action"] == payout_runs.ACTION_CREATE for row in preview),
+        "update_count": sum(row["action"] == payout_runs.ACTION_UPDATE for row in preview),
+        "total_items": sum(row["items"] for row in preview),
+        "total_amount": sum((row["amount"] for row in preview), Decimal("0.00")),
+    }
+    return render(request, "backoffice/payout_run.html", context)
+
+
 @admin_required
 def partner_payout_list(request):
     """
@@ -2329,7 +2196,7 @@ def partner_payout_detail(request, payout_id):
     items_qs = (
         payout.items
         .select_related("order", "order__client", "product")
-        .order_by("-order__created_at", "id")
+        .order_by("-order_created_at", "id")
     )
 
     # Totali di comodo (calcolati solo sulle righe di questo payout)
@@ -2376,7 +2243,7 @@ def unliquidated_commission_list(request):
 
     qs = (
         OrderItem.objects
-        .select_related("order", "product", "partner", "partner__user")
+        .select_related("product", "partner", "partner__user")
         .filter(
             commission_amount__gt=0,
             partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
@@ -2388,12 +2255,9 @@ def unliquidated_commission_list(request):
     if partner_id:
         qs = qs.filter(partner_id=partner_id)
 
-    if start_date:
-        qs = qs.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        qs = qs.filter(order__created_at__date__lte=end_date)
+    qs = qs.filter(period_q("order_created_at", start_date, end_date))
 
-    qs = qs.order_by("partner__company_name", "-order__created_at")
+    qs = qs.order_by("partner__company_name", "-order_created_at")
 
     total_unliquidated = qs.aggregate(
         total=Coalesce(
@@ -2432,7 +2296,7 @@ def liquidated_commission_list(request):
 
     qs = (
         OrderItem.objects
-        .select_related("order", "product", "partner", "partner__user", "payout")
+        .select_related("product", "partner", "partner__user", "payout")
         .filter(
             commission_amount__gt=0,
             is_liquidated=True,
@@ -2442,25 +2306,22 @@ def liquidated_commission_list(request):
     if partner_id:
         qs = qs.filter(partner_id=partner_id)
 
-    if start_date:
-        qs = qs.filter(order__created_at__date__gte=start_date)
-    if end_date:
-        qs = qs.filter(order__created_at__date__lte=end_date)
+    qs = qs.filter(period_q("order_created_at", start_date, end_date))
 
     # Proviamo ad agganciare il payout relativo:
     # cerchiamo un PartnerPayout per lo stesso partner e un periodo che includa la data ordine
     # Subquery: cerchiamo un payout che copra la data dell'ordine
     payout_subquery = PartnerPayout.objects.filter(
         partner=OuterRef("partner"),
-        period_start__lte=OuterRef("order__created_at"),
-        period_end__gte=OuterRef("order__created_at"),
+        period_start__lte=OuterRef("order_created_at"),
+        period_end__gte=OuterRef("order_created_at"),
     ).order_by("-period_end").values("id")[:1]
 
     # NB: su OrderItem esiste già il campo payout_id (FK), quindi non possiamo
     # creare un'annotazione con lo stesso nome.
     qs = qs.annotate(payout_hint_id=Subquery(payout_subquery))
 
-    qs = qs.order_by("partner__company_name", "-order__created_at")
+    qs = qs.order_by("partner__company_name", "-order_created_at")
 
     total_liquidated = qs.aggregate(
         total=Coalesce(
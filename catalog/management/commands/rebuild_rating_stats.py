@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = "Ricalcola gli aggregati recensioni denormalizzati (media, numero, distribuzione) dei prodotti."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="ID prodotto da ricalcolare (ripetibile). Default: tutti i prodotti.",
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.order_by("pk")
+        if options["product_ids"]:
+            products = products.filter(pk__in=options["product_ids"])
+
+        updated = 0
+        for product in products.only("pk").iterator(chunk_size=500):
+            with transaction.atomic():
+                product.refresh_rating_stats()
+            updated += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Aggregati recensioni ricalcolati per {updated} prodotti.")
+        )
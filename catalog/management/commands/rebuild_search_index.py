@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from catalog import search
+from catalog.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricostruisce l'indice full-text del catalogo (tabella FTS5 su SQLite). "
+        "Su PostgreSQL l'indice GIN è mantenuto dal database e non serve ricostruirlo."
+    )
+
+    def handle(self, *args, **options):
+        backend = search.search_backend()
+        if backend != "fts5":
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Nessuna tabella FTS5 da ricostruire (backend: {backend or 'icontains'})."
+                )
+            )
+            return
+
+        with transaction.atomic():
+            count = search.rebuild_index(Product.objects.all())
+
+        self.stdout.write(self.style.SUCCESS(f"Indice di ricerca ricostruito: {count} prodotti."))
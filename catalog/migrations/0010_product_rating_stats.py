@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:32
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Product = apps.get_model("catalog", "Product")
+    ProductRating = apps.get_model("catalog", "ProductRating")
+
+    star_counts = {f"star_{star}": Count("id", filter=Q(rating=star)) for star in range(1, 6)}
+    rows = (
+        ProductRating.objects
+        .filter(is_approved=True)
+        .values("product_id")
+        .annotate(avg=Avg("rating"), count=Count("id"), **star_counts)
+    )
+    for row in rows:
+        Product.objects.filter(pk=row["product_id"]).update(
+            rating_avg=Decimal(str(row["avg"])).quantize(Decimal("0.01")),
+            rating_count=row["count"],
+            rating_histogram={
+                str(star): row[f"star_{star}"]
+                for star in range(1, 6)
+                if row[f"star_{star}"]
+            },
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_product_partner_commission_rate'),
+        ('partners', '0003_partnercategorycommission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=3, verbose_name='Valutazione media'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Numero recensioni'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=dict, help_text='Numero di recensioni approvate per stella, es. {"5": 12, "4": 3}.', verbose_name='Distribuzione valutazioni'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-rating_avg', 'name'], name='catalog_product_rating_idx'),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:10
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+FTS_TABLE = "catalog_product_fts"
+PG_INDEX = "catalog_product_search_idx"
+PG_VECTOR_SQL = (
+    "to_tsvector('italian', "
+    "coalesce(name, '') || ' ' || "
+    "coalesce(short_description, '') || ' ' || "
+    "coalesce(description, ''))"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {PG_INDEX} "
+            f"ON catalog_product USING gin ({PG_VECTOR_SQL})"
+        )
+        return
+
+    if vendor != "sqlite":
+        return
+
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            f"USING fts5(name, short_description, description, "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite compilato senza FTS5: la ricerca ricade su icontains
+        return
+
+    Product = apps.get_model("catalog", "Product")
+    rows = [
+        (p.pk, p.name or "", p.short_description or "", p.description or "")
+        for p in Product.objects.only("pk", "name", "short_description", "description")
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, short_description, description) "
+                f"VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+    elif vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0010_product_rating_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_product_search_index'),
+        ('partners', '0003_partnercategorycommission'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['base_price', 'id'], name='catalog_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='catalog_product_name_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cache_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_product_cache_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productrating',
+            index=models.Index(fields=['product', 'is_approved', 'created_at'], name='catalog_rating_approved_idx'),
+        ),
+    ]
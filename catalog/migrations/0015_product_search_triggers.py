@@ -0,0 +1,64 @@
+from django.db import migrations
+
+FTS_TABLE = "catalog_product_fts"
+COLUMNS = ("name", "short_description", "description")
+
+
+
+def _values(prefix=""):
+    return ", ".join(f"coalesce({prefix}{column}, '')" for column in COLUMNS)
+
+
+_INSERT = f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(COLUMNS)}) VALUES (new.id, {_values('new.')});"
+_DELETE = f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id;"
+
+# trigger SQLite: l'indice segue ogni scrittura su catalog_product, anche quelle
+# che non passano da Product.save/delete (bulk_create, QuerySet.update/delete, cascate)
+TRIGGERS = {
+    "catalog_product_fts_ai": f"AFTER INSERT ON catalog_product BEGIN {_INSERT} END",
+    "catalog_product_fts_ad": f"AFTER DELETE ON catalog_product BEGIN {_DELETE} END",
+    "catalog_product_fts_au": (
+        f"AFTER UPDATE OF id, {', '.join(COLUMNS)} ON catalog_product "
+        f"BEGIN {_DELETE} {_INSERT} END"
+    ),
+}
+
+
+def _has_fts_table(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        return FTS_TABLE in schema_editor.connection.introspection.table_names(cursor)
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite" or not _has_fts_table(schema_editor):
+        # PostgreSQL: indice GIN mantenuto dal database; SQLite senza FTS5: icontains
+        return
+
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    # riallinea le righe scritte finora fuori da Product.save/delete
+    schema_editor.execute(f"DELETE FROM {FTS_TABLE}")
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(COLUMNS)}) "
+        f"SELECT id, {_values()} "
+        f"FROM catalog_product"
+    )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("catalog", "0014_hot_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
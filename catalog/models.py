@@ -1,8 +1,54 @@
 from decimal import Decimal
-from django.db import models
+from django.db import models, transaction
 from django.utils.text import slugify
 from django.conf import settings
-from django.db.models import Avg
+from django.db.models import Avg, Count, F, Q
+
+
+class CardQuerySet(models.QuerySet):
+    """
+    UPDATE / DELETE massivi su modelli mostrati nelle card in catalogo:
+    invalidano, come i save() / delete() dei singoli oggetti, le card dei
+    prodotti collegati (Product.cache_version).
+
+    - product_lookup: relazione da Product verso il modello (filtro ``<lookup>__in``)
+    - relation_fields: campi che spostano l'oggetto su altri prodotti (card
+      sia dei prodotti di prima sia di quelli di dopo)
+    """
+
+    product_lookup = None
+    relation_fields = ()
+
+    def _bump(self, ids):
+        Product.bump_cache_version(**{f"{self.product_lookup}__in": ids})
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            # id letti prima: dopo l'UPDATE il filtro può non valere più
+            ids = list(self.order_by().values_list("pk", flat=True))
+            if ids and any(name in kwargs for name in self.relation_fields):
+                self._bump(ids)
+            rows = super().update(**kwargs)
+            if ids:
+                self._bump(ids)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        with transaction.atomic(using=self.db, savepoint=False):
+            # prima della DELETE: dopo il legame con i prodotti non c'è più
+            ids = list(self.order_by().values_list("pk", flat=True))
+            if ids:
+                self._bump(ids)
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class CategoryQuerySet(CardQuerySet):
+    product_lookup = "category"
 
 
 class Category(models.Model):
@@ -14,6 +60,8 @@ class Category(models.Model):
     description = models.TextField("Descrizione", blank=True)
     is_active = models.BooleanField(default=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Categoria"
         verbose_name_plural = "Categorie"
@@ -21,6 +69,18 @@ class Category(models.Model):
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # il nome categoria compare nelle card in catalogo
+        Product.bump_cache_version(category=self)
+
+    def delete(self, *args, **kwargs):
+        # card dei prodotti della categoria invalidate nella stessa transazione
+        # (annullata se la cancellazione fallisce, es. prodotti protetti)
+        with transaction.atomic():
+            Product.bump_cache_version(category=self)
+            return super().delete(*args, **kwargs)
+
 
 class Product(models.Model):
     """
@@ -84,19 +144,48 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    # Aggregati recensioni denormalizzati (solo recensioni approvate).
+    # Aggiornati da ProductRating.save/delete tramite refresh_rating_stats().
+    rating_avg = models.DecimalField(
+        "Valutazione media",
+        max_digits=3,
+        decimal_places=2,
+        default=Decimal("0.00"),
+    )
+    rating_count = models.PositiveIntegerField("Numero recensioni", default=0)
+    rating_histogram = models.JSONField(
+        "Distribuzione valutazioni",
+        default=dict,
+        blank=True,
+        help_text='Numero di recensioni approvate per stella, es. {"5": 12, "4": 3}.',
+    )
+
+    # Versione della card in catalogo (chiave del fragment cache): viene
+    # incrementata da ogni modifica che cambia ciò che la card mostra.
+    cache_version = models.PositiveIntegerField(default=1, editable=False)
+
+    # aggregati scritti solo da refresh_rating_stats (UPDATE mirato)
+    DENORMALIZED_FIELDS = ("rating_avg", "rating_count", "rating_histogram")
+
     @property
     def average_rating(self):
         """
         Rating medio del prodotto calcolato SOLO sulle recensioni approvate.
+        Legge il valore denormalizzato (nessuna query).
         """
-        qs = self.ratings.filter(is_approved=True)
-        result = qs.aggregate(avg=Avg("rating"))["avg"]
-        return result or 0
+        return self.rating_avg or 0
 
     class Meta:
         verbose_name = "Prodotto/Servizio"
         verbose_name_plural = "Prodotti/Servizi"
+        indexes = [
+            # ordinamento "premialità" del catalogo
+            models.Index(fields=["-rating_avg", "name"], name="catalog_product_rating_idx"),
+            # paginazione a cursore per prezzo / nome (spareggio su id)
+            models.Index(fields=["base_price", "id"], name="catalog_product_price_idx"),
+            models.Index(fields=["name", "id"], name="catalog_product_name_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -122,8 +211,76 @@ class Product(models.Model):
 
             self.slug = slug
 
+        # Nuova versione della card: incremento atomico lato DB (può essere stata
+        # incrementata da altri, es. moderazione recensioni) e rilettura del valore
+        bump_version = not self._state.adding
+        if bump_version:
+            self.cache_version = F("cache_version") + 1
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "cache_version"}
+            else:
+                # aggregati recensioni: un save() completo con valori in memoria
+                # precedenti all'ultima moderazione non deve sovrascriverli
+                kwargs["update_fields"] = [
+                    f.name for f in self._meta.concrete_fields
+                    if not f.primary_key and f.name not in self.DENORMALIZED_FIELDS
+                ]
+
         super().save(*args, **kwargs)
-        
+
+        if bump_version:
+            self.refresh_from_db(fields=["cache_version"])
+
+    @staticmethod
+    def bump_cache_version(**filters):
+        """Invalida le card in catalogo dei prodotti selezionati dai filtri."""
+        return Product.objects.filter(**filters).update(cache_version=F("cache_version") + 1)
+
+    @staticmethod
+    def compute_rating_stats(product_id):
+        """
+        Calcola (con una sola query) media, numero e distribuzione per stella
+        delle recensioni APPROVATE del prodotto.
+        """
+        star_counts = {
+            f"star_{star}": Count("id", filter=Q(rating=star)) for star in range(1, 6)
+        }
+        agg = ProductRating.objects.filter(
+            product_id=product_id,
+            is_approved=True,
+        ).aggregate(avg=Avg("rating"), count=Count("id"), **star_counts)
+
+        avg = agg["avg"]
+        rating_avg = (
+            Decimal(str(avg)).quantize(Decimal("0.01")) if avg is not None else Decimal("0.00")
+        )
+        histogram = {
+            str(star): agg[f"star_{star}"]
+            for star in range(1, 6)
+            if agg[f"star_{star}"]
+        }
+        return {
+            "rating_avg": rating_avg,
+            "rating_count": agg["count"] or 0,
+            "rating_histogram": histogram,
+        }
+
+    def refresh_rating_stats(self):
+        """
+        Ricalcola e salva gli aggregati recensioni del prodotto.
+
+        Usa un UPDATE mirato (non save()) per non toccare slug/updated_at:
+        va chiamato nella stessa transazione che modifica la recensione.
+        """
+        stats = self.compute_rating_stats(self.pk)
+        Product.objects.filter(pk=self.pk).update(
+            cache_version=F("cache_version") + 1, **stats
+        )
+        for field, value in stats.items():
+            setattr(self, field, value)
+        return stats
+
         
 class ProductRating(models.Model):
     # Stati di moderazione
@@ -185,6 +342,10 @@ class ProductRating(models.Model):
     class Meta:
         unique_together = ("product", "user")
         ordering = ["-created_at"]
+        indexes = [
+            # recensioni approvate del prodotto (scheda prodotto, media voti)
+            models.Index(fields=["product", "is_approved", "created_at"], name="catalog_rating_approved_idx"),
+        ]
 
     def __str__(self):
         return f"{self.product} - {self.user} ({self.rating})"
@@ -207,6 +368,25 @@ class ProductRating(models.Model):
         mapping = dict(self.MODERATION_STATUS_CHOICES)
         return mapping.get(self.moderation_status, "")
 
+    def save(self, *args, **kwargs):
+        """
+        Ogni salvataggio (invio, modifica, approvazione, rifiuto) riallinea
+        gli aggregati denormalizzati del prodotto.
+        """
+        super().save(*args, **kwargs)
+        self.product.refresh_rating_stats()
+
+    def delete(self, *args, **kwargs):
+        product = self.product
+        result = super().delete(*args, **kwargs)
+        product.refresh_rating_stats()
+        return result
+
+
+class ProductImageQuerySet(CardQuerySet):
+    product_lookup = "images"
+    relation_fields = ("product", "product_id")
+
 
 class ProductImage(models.Model):
     product = models.ForeignKey(
@@ -215,9 +395,21 @@ class ProductImage(models.Model):
     image = models.ImageField(upload_to="products/gallery/")
     alt_text = models.CharField("Testo alternativo", max_length=255, blank=True)
 
+    objects = ProductImageQuerySet.as_manager()
+
     def __str__(self):
         return f"Immagine di {self.product.name}"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Product.bump_cache_version(pk=self.product_id)
+
+    def delete(self, *args, **kwargs):
+        product_id = self.product_id
+        result = super().delete(*args, **kwargs)
+        Product.bump_cache_version(pk=product_id)
+        return result
+
 
 class KitComponent(models.Model):
     """
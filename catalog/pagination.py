@@ -0,0 +1,191 @@
+"""
+Paginazione a cursore (keyset) per il catalogo pubblico.
+
+A differenza di ``Paginator`` non esegue COUNT(*) né OFFSET: ogni pagina è
+una query ``WHERE (chiavi di ordinamento) > (ultima riga vista) LIMIT n``,
+quindi la pagina 500 costa quanto la pagina 1 (sfruttando gli indici
+sull'ordinamento). Il cursore è opaco (base64 di JSON) e contiene i valori
+delle chiavi di ordinamento dell'ultima/prima riga mostrata, con ``id``
+come spareggio stabile.
+
+Il totale per l'intestazione "Risultati: N prodotti" è calcolato a parte
+con ``cached_count`` (COUNT in cache per combinazione di filtri).
+"""
+import base64
+import binascii
+import hashlib
+import json
+import math
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Q
+
+# Ordinamenti del catalogo: (campo, discendente) — l'ultimo è sempre l'id.
+SORT_KEYS = {
+    "relevance": (("search_rank", True), ("name", False), ("id", False)),
+    "rating": (("rating_avg", True), ("name", False), ("id", False)),
+    "price_asc": (("base_price", False), ("id", False)),
+    "price_desc": (("base_price", True), ("id", False)),
+    "name": (("name", False), ("id", False)),
+}
+
+# Tipo dei valori di ogni chiave di ordinamento (validazione dei cursori ricevuti)
+FIELD_TYPES = {
+    "search_rank": float,
+    "rating_avg": Decimal,
+    "base_price": Decimal,
+    "name": str,
+    "id": int,
+}
+
+COUNT_CACHE_TIMEOUT = 300  # secondi
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def order_by_for(sort):
+    return [f"-{field}" if desc else field for field, desc in SORT_KEYS[sort]]
+
+
+def _to_json(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(sort, obj):
+    values = [_to_json(getattr(obj, field)) for field, _desc in SORT_KEYS[sort]]
+    raw = json.dumps([sort, values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(sort, cursor):
+    """Restituisce i valori delle chiavi di ordinamento; InvalidCursor se non valido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if cursor_sort != sort or not isinstance(values, list) or len(values) != len(SORT_KEYS[sort]):
+        raise InvalidCursor(cursor)
+    return [_coerce(field, value, cursor) for (field, _desc), value in zip(SORT_KEYS[sort], values)]
+
+
+def _coerce(field, value, cursor):
+    """Valore del cursore convertito al tipo della chiave; InvalidCursor se non convertibile."""
+    field_type = FIELD_TYPES[field]
+    # il cursore è manipolabile dal client: niente liste / oggetti / booleani
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise InvalidCursor(cursor)
+    if field_type is str:
+        if not isinstance(value, str):
+            raise InvalidCursor(cursor)
+        return value
+    try:
+        coerced = field_type(value)
+    except (ArithmeticError, ValueError):
+        raise InvalidCursor(cursor)
+    # NaN / infinito non sono valori confrontabili in un filtro
+    if field_type is Decimal and not coerced.is_finite():
+        raise InvalidCursor(cursor)
+    if field_type is float and not math.isfinite(coerced):
+        raise InvalidCursor(cursor)
+    return coerced
+
+
+def _keyset_filter(keys, values, forward):
+    """
+    (k1, k2, ..., id) "dopo" (v1, v2, ..., vid) nell'ordinamento dato:
+    k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...
+    Con forward=False il confronto è invertito (pagina precedente).
+    """
+    condition = Q()
+    equal = Q()
+    for (field, desc), value in zip(keys, values):
+        lookup = "lt" if desc == forward else "gt"
+        condition |= equal & Q(**{f"{field}__{lookup}": value})
+        equal &= Q(**{field: value})
+    return condition
+
+
+class KeysetPage:
+    """Pagina di risultati con cursori per la pagina successiva/precedente."""
+
+    def __init__(self, object_list, sort, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+        self.next_cursor = encode_cursor(sort, object_list[-1]) if self.has_next else ""
+        self.previous_cursor = encode_cursor(sort, object_list[0]) if self.has_previous else ""
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def keyset_page(qs, sort, per_page, after=None, before=None):
+    """
+    Restituisce la KeysetPage di ``qs`` ordinato secondo ``sort``.
+
+    - ``after``: cursore dell'ultima riga della pagina precedente (avanti)
+    - ``before``: cursore della prima riga della pagina successiva (indietro)
+    Un cursore non valido (o di un altro ordinamento) riporta alla prima pagina.
+    """
+    keys = SORT_KEYS[sort]
+    forward = True
+    values = None
+
+    try:
+        if before:
+            values = decode_cursor(sort, before)
+            forward = False
+        elif after:
+            values = decode_cursor(sort, after)
+    except InvalidCursor:
+        values = None
+        forward = True
+
+    order = order_by_for(sort)
+    if values is not None:
+        qs = qs.filter(_keyset_filter(keys, values, forward))
+    if not forward:
+        order = [f[1:] if f.startswith("-") else f"-{f}" for f in order]
+
+    rows = list(qs.order_by(*order)[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if forward:
+        return KeysetPage(rows, sort, has_next=has_more, has_previous=values is not None)
+
+    rows.reverse()
+    return KeysetPage(rows, sort, has_next=True, has_previous=has_more)
+
+
+def cached_count(qs, cache_key_parts, timeout=COUNT_CACHE_TIMEOUT):
+    """
+    COUNT(*) del queryset filtrato, memorizzato in cache per la combinazione
+    di filtri: è un totale indicativo per l'intestazione, non serve esatto
+    al singolo prodotto e non deve essere ricalcolato a ogni cambio pagina.
+    """
+    digest = hashlib.md5(
+        json.dumps(cache_key_parts, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    key = f"catalog:count:{digest}"
+
+    count = cache.get(key)
+    if count is None:
+        count = qs.order_by().count()
+        cache.set(key, count, timeout)
+    return count
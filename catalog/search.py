@@ -0,0 +1,189 @@
+"""
+Ricerca full-text sul catalogo prodotti.
+
+Backend supportati:
+- SQLite: tabella virtuale FTS5 ``catalog_product_fts`` (rowid = Product.id),
+  tokenizer unicode61 con rimozione accenti, ranking bm25.
+- PostgreSQL: indice GIN su ``to_tsvector('italian', ...)`` (lo stemmer
+  snowball italiano tratta anche le vocali finali accentate), ranking ts_rank.
+- Altri backend / FTS5 non disponibile: fallback su icontains (comportamento storico).
+
+La tabella FTS5 viene tenuta allineata da trigger SQLite su catalog_product
+(migrazione 0015_product_search_triggers): ogni INSERT / UPDATE / DELETE la
+aggiorna, anche bulk_create, QuerySet.update/delete e cancellazioni a cascata.
+Può comunque essere ricostruita con ``python manage.py rebuild_search_index``
+(es. dopo un ripristino parziale o un import SQL diretto).
+Attenzione: su SQLite una migrazione che ricrea catalog_product (AlterField e
+simili) elimina anche i trigger, che vanno ricreati nella stessa migrazione
+(il test ProductSearchTests.test_index_triggers_installed lo segnala).
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "catalog_product_fts"
+PG_INDEX = "catalog_product_search_idx"
+
+# Colonne indicizzate e peso nel ranking (nome > descrizione breve > descrizione)
+INDEXED_FIELDS = ("name", "short_description", "description")
+FIELD_WEIGHTS = (10.0, 4.0, 1.0)
+
+PG_VECTOR_SQL = (
+    "to_tsvector('italian', "
+    "coalesce(catalog_product.name, '') || ' ' || "
+    "coalesce(catalog_product.short_description, '') || ' ' || "
+    "coalesce(catalog_product.description, ''))"
+)
+
+_INSERT_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_FIELDS)}) "
+    f"VALUES (%s, %s, %s, %s)"
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Cache del backend per alias DB (la presenza della tabella FTS non cambia a runtime)
+_backend_cache = {}
+
+
+def strip_accents(text: str) -> str:
+    """'Città' -> 'Citta' (stessa normalizzazione del tokenizer FTS5)."""
+    normalized = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+def italian_stem(token: str) -> str:
+    """
+    Stemmer "leggero" per l'italiano, usato come prefisso nelle query FTS5:
+    rimuove le desinenze di genere/numero così che 'lenzuolo', 'lenzuola'
+    e 'lenzuoli' condividano la stessa radice 'lenzuol'.
+    """
+    if len(token) <= 3:
+        return token
+    for suffix in ("ie", "ia", "io", "ii"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: -len(suffix)]
+    if token[-1] in "aeiou":
+        return token[:-1]
+    return token
+
+
+def tokenize(query: str) -> list:
+    """Token normalizzati (minuscolo, senza accenti) della stringa di ricerca."""
+    return _TOKEN_RE.findall(strip_accents(query).lower())
+
+
+def build_fts5_query(query: str) -> str:
+    """
+    Converte il testo libero in una MATCH FTS5: ogni termine diventa una
+    ricerca per prefisso sulla radice ("lenzuol"*), i termini sono in AND.
+    """
+    terms = []
+    for token in tokenize(query):
+        stem = italian_stem(token).replace('"', "")
+        if stem:
+            terms.append(f'"{stem}"*')
+    return " ".join(terms)
+
+
+def search_backend() -> str:
+    """
+    Restituisce 'fts5', 'postgres' oppure '' (fallback icontains).
+    """
+    if connection.alias in _backend_cache:
+        return _backend_cache[connection.alias]
+
+    backend = ""
+    if connection.vendor == "postgresql":
+        backend = "postgres"
+    elif connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            if FTS_TABLE in connection.introspection.table_names(cursor):
+                backend = "fts5"
+
+    _backend_cache[connection.alias] = backend
+    return backend
+
+
+def reset_backend_cache():
+    _backend_cache.clear()
+
+
+def _fts_row(product):
+    return [getattr(product, field) or "" for field in INDEXED_FIELDS]
+
+
+def rebuild_index(products) -> int:
+    """Ricostruisce da zero la tabella FTS5 a partire dal queryset passato."""
+    if search_backend() != "fts5":
+        return 0
+    count = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        rows = []
+        for product in products.only("pk", *INDEXED_FIELDS).iterator(chunk_size=1000):
+            rows.append([product.pk, *_fts_row(product)])
+            if len(rows) >= 1000:
+                cursor.executemany(_INSERT_SQL, rows)
+                count += len(rows)
+                rows = []
+        if rows:
+            cursor.executemany(_INSERT_SQL, rows)
+            count += len(rows)
+    return count
+
+
+def _fts_search(qs, match):
+    # filtro: insieme dei rowid che soddisfano la MATCH (valutata una volta);
+    # rank: bm25 della sola riga (rowid = id: FTS5 salta direttamente al documento).
+    # bm25 restituisce valori negativi (più basso = migliore): invertiamo il segno
+    weights = ", ".join(str(w) for w in FIELD_WEIGHTS)
+    return qs.filter(
+        pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = catalog_product.id",
+            [match],
+            output_field=FloatField(),
+        )
+    )
+
+
+def search_products(qs, query: str):
+    """
+    Filtra il queryset di Product sul testo ``query`` e annota ``search_rank``
+    (più alto = più pertinente).
+
+    Se nessun backend full-text è disponibile ricade su icontains
+    (nome/descrizione) con search_rank costante.
+    """
+    backend = search_backend()
+
+    if backend == "fts5":
+        match = build_fts5_query(query)
+        if not match:
+            return qs.none()
+        return _fts_search(qs, match)
+
+    if backend == "postgres":
+        return qs.filter(
+            pk__in=RawSQL(
+                f"SELECT id FROM catalog_product "
+                f"WHERE {PG_VECTOR_SQL} @@ plainto_tsquery('italian', %s)",
+                [query],
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"ts_rank({PG_VECTOR_SQL}, plainto_tsquery('italian', %s))",
+                [query],
+                output_field=FloatField(),
+            )
+        )
+
+    return qs.filter(
+        Q(name__icontains=query) | Q(description__icontains=query)
+    ).annotate(search_rank=RawSQL("0", [], output_field=FloatField()))
@@ -1,3 +1,460 @@
+import base64
+import json
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import ProtectedError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog import search
+from catalog.models import Category, Product, ProductImage, ProductRating
+from catalog.pagination import SORT_KEYS, encode_cursor, order_by_for
+
+
+User = get_user_model()
+
+
+class ProductRatingStatsTests(TestCase):
+    """Aggregati recensioni denormalizzati su Product.
+
+    Verifica che rating_avg / rating_count / rating_histogram:
+    - considerino SOLO le recensioni approvate
+    - si aggiornino su approvazione / rifiuto / cancellazione
+    - siano ricostruibili con il comando rebuild_rating_stats
+    """
+
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username="admin1",
+            email="admin@example.com",
+            password="pass1234",
+            role=User.ROLE_ADMIN,
+        )
+        self.category = Category.objects.create(name="Categoria", slug="categoria")
+        self.product = Product.objects.create(
+            category=self.category,
+            name="Prodotto",
+            base_price=Decimal("10.00"),
+            is_active=True,
+        )
+
+    def _rating(self, username, rating, approved=False):
+        user = User.objects.create_user(username=username, password="pass1234")
+        return ProductRating.objects.create(
+            product=self.product,
+            user=user,
+            rating=rating,
+            is_approved=approved,
+            moderation_status=(
+                ProductRating.STATUS_APPROVED if approved else ProductRating.STATUS_PENDING
+            ),
+        )
+
+    def test_pending_ratings_are_not_counted(self):
+        self._rating("u1", 5)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+        self.assertEqual(self.product.rating_avg, Decimal("0.00"))
+        self.assertEqual(self.product.rating_histogram, {})
+
+    def test_approve_and_reject_update_stats(self):
+        r1 = self._rating("u1", 5, approved=True)
+        r2 = self._rating("u2", 2)
+
+        self.client.force_login(self.admin_user)
+        self.client.post(reverse("backoffice:review_approve", args=[r2.pk]))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_avg, Decimal("3.50"))
+        self.assertEqual(self.product.rating_histogram, {"2": 1, "5": 1})
+
+        self.client.post(reverse("backoffice:review_reject", args=[r1.pk]))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_avg, Decimal("2.00"))
+        self.assertEqual(self.product.rating_histogram, {"2": 1})
+
+    def test_delete_updates_stats(self):
+        rating = self._rating("u1", 4, approved=True)
+        rating.delete()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+        self.assertEqual(self.product.rating_avg, Decimal("0.00"))
+
+    def test_rebuild_command_restores_stats(self):
+        self._rating("u1", 4, approved=True)
+        self._rating("u2", 3, approved=True)
+        Product.objects.filter(pk=self.product.pk).update(
+            rating_avg=Decimal("0.00"), rating_count=0, rating_histogram={}
+        )
+
+        call_command("rebuild_rating_stats", stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_avg, Decimal("3.50"))
+        self.assertEqual(self.product.rating_histogram, {"3": 1, "4": 1})
+
+    def test_full_save_keeps_stats(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self._rating("u1", 4, approved=True)
+
+        stale.base_price = Decimal("12.00")
+        stale.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.base_price, Decimal("12.00"))
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_avg, Decimal("4.00"))
+        self.assertEqual(self.product.rating_histogram, {"4": 1})
+
+    def test_catalog_sorts_by_stored_rating(self):
+        other = Product.objects.create(
+            category=self.category,
+            name="Altro prodotto",
+            base_price=Decimal("10.00"),
+            is_active=True,
+        )
+        self._rating("u1", 5, approved=True)
+
+        resp = self.client.get(reverse("catalog:product_list"))
+        self.assertEqual(resp.status_code, 200)
+        names = [p.name for p in resp.context["products"]]
+        self.assertEqual(names, [self.product.name, other.name])
+
+
+class ProductSearchTests(TestCase):
+    """Ricerca full-text del catalogo (FTS5 su SQLite, fallback icontains)."""
+
+    def setUp(self):
+        search.reset_backend_cache()
+        self.category = Category.objects.create(name="Biancheria", slug="biancheria")
+        self.sheets = Product.objects.create(
+            category=self.category,
+            name="Lenzuola matrimoniali",
+            short_description="Set in cotone",
+            description="Lavaggio e stiratura inclusi.",
+            base_price=Decimal("20.00"),
+            is_active=True,
+        )
+        self.towels = Product.objects.create(
+            category=self.category,
+            name="Set asciugamani",
+            short_description="Spugna",
+            description="Ideale abbinato alle lenzuola della camera.",
+            base_price=Decimal("12.00"),
+            is_active=True,
+        )
+        self.cleaning = Product.objects.create(
+            category=self.category,
+            name="Pulizia appartamento",
+            description="Servizio di pulizia con igienizzazione della città.",
+            base_price=Decimal("50.00"),
+            is_active=True,
+        )
+
+    def _names(self, **params):
+        resp = self.client.get(reverse("catalog:product_list"), params)
+        self.assertEqual(resp.status_code, 200)
+        return [p.name for p in resp.context["products"]]
+
+    def test_sqlite_uses_fts5(self):
+        self.assertEqual(search.search_backend(), "fts5")
+
+    def test_stemming_and_accents(self):
+        # 'lenzuolo' (singolare) trova 'lenzuola'; 'citta' senza accento trova 'città'
+        self.assertIn(self.sheets.name, self._names(q="lenzuolo"))
+        self.assertEqual(self._names(q="citta"), [self.cleaning.name])
+        self.assertEqual(self._names(q="igienizzazioni"), [self.cleaning.name])
+
+    def test_results_ranked_by_relevance(self):
+        # match nel nome pesa più di un match nella sola descrizione
+        self.assertEqual(self._names(q="lenzuola"), [self.sheets.name, self.towels.name])
+
+    def test_match_as_subqueries(self):
+        # MATCH come filtro pk IN (...) e bm25 per riga, senza join aggiunti al queryset
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._names(q="lenzuola", sort="relevance"), [self.sheets.name, self.towels.name])
+        search_sql = [q["sql"] for q in queries if f"FROM {search.FTS_TABLE}" in q["sql"]]
+        self.assertTrue(search_sql)
+        for sql in search_sql:
+            self.assertIn(f'"catalog_product"."id" IN (SELECT rowid FROM {search.FTS_TABLE}', sql)
+            self.assertNotIn("JOIN (SELECT", sql)
+
+        # queryset componibile come gli altri (count, values, subquery)
+        found = search.search_products(Product.objects.all(), "lenzuola")
+        self.assertEqual(found.count(), 2)
+        self.assertEqual(
+            set(Product.objects.filter(pk__in=found.values("pk")).values_list("name", flat=True)),
+            {self.sheets.name, self.towels.name},
+        )
+
+    def test_index_follows_save_and_delete(self):
+        self.cleaning.name = "Sanificazione appartamento"
+        self.cleaning.save()
+        self.assertEqual(self._names(q="sanificazione"), [self.cleaning.name])
+
+        self.cleaning.delete()
+        self.assertEqual(self._names(q="sanificazione"), [])
+
+    def test_index_follows_bulk_writes(self):
+        # scritture che non passano da Product.save/delete: allineate dai trigger SQLite
+        Product.objects.bulk_create([
+            Product(
+                category=self.category, name="Tovaglie in lino", slug="tovaglie-in-lino",
+                base_price=Decimal("8.00"), is_active=True,
+            ),
+        ])
+        self.assertEqual(self._names(q="tovaglie"), ["Tovaglie in lino"])
+
+        Product.objects.filter(pk=self.towels.pk).update(name="Teli bagno")
+        self.assertEqual(self._names(q="asciugamani"), [])
+        self.assertEqual(self._names(q="teli"), ["Teli bagno"])
+
+        Product.objects.filter(name="Tovaglie in lino").delete()
+        self.assertEqual(self._names(q="tovaglie"), [])
+
+    def test_index_triggers_installed(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'catalog_product'"
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(
+            triggers, {"catalog_product_fts_ai", "catalog_product_fts_ad", "catalog_product_fts_au"}
+        )
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self._names(q="asciugamani"), [])
+
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self._names(q="asciugamani"), [self.towels.name])
+
+    def test_fallback_without_fts(self):
+        search._backend_cache[connection.alias] = ""
+        try:
+            self.assertEqual(self._names(q="asciugamani"), [self.towels.name])
+        finally:
+            search.reset_backend_cache()
+
+
+class ProductKeysetPaginationTests(TestCase):
+    """Paginazione a cursore del catalogo e totale in cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Servizi", slug="servizi")
+        # prezzi e rating con molti pari merito per verificare lo spareggio su id
+        for i in range(45):
+            Product.objects.create(
+                category=self.category,
+                name=f"Prodotto {i % 7}",
+                base_price=Decimal(10 + i % 4),
+                rating_avg=Decimal(i % 3),
+                is_active=True,
+            )
+
+    def _walk(self, sort):
+        """Percorre tutte le pagine in avanti e poi all'indietro."""
+        url = reverse("catalog:product_list")
+        pages = []
+        resp = self.client.get(url, {"sort": sort})
+        while True:
+            page = resp.context["products"]
+            pages.append([p.pk for p in page])
+            if not page.has_next:
+                break
+            resp = self.client.get(url, {"sort": sort, "after": page.next_cursor})
+
+        backwards = [pages[-1]]
+        while page.has_previous:
+            resp = self.client.get(url, {"sort": sort, "before": page.previous_cursor})
+            page = resp.context["products"]
+            backwards.insert(0, [p.pk for p in page])
+        return pages, backwards
+
+    def test_every_sort_matches_offset_ordering(self):
+        for sort in SORT_KEYS:
+            if sort == "relevance":
+                continue
+            with self.subTest(sort=sort):
+                expected = list(
+                    Product.objects.order_by(*order_by_for(sort)).values_list("pk", flat=True)
+                )
+                pages, backwards = self._walk(sort)
+                self.assertEqual([len(p) for p in pages], [20, 20, 5])
+                self.assertEqual(sum(pages, []), expected)
+                self.assertEqual(backwards, pages)
+
+    def test_deep_page_costs_same_as_first(self):
+        url = reverse("catalog:product_list")
+        self.client.get(url)  # popola il totale in cache
+
+        first = self.client.get(url).context["products"]
+        with CaptureQueriesContext(connection) as first_queries:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as deep_queries:
+            self.client.get(url, {"after": first.next_cursor})
+
+        self.assertEqual(len(first_queries), len(deep_queries))
+        self.assertFalse(any("OFFSET" in q["sql"] for q in deep_queries.captured_queries))
+        self.assertFalse(any("COUNT(" in q["sql"] for q in deep_queries.captured_queries))
+
+    def test_result_count_is_cached(self):
+        url = reverse("catalog:product_list")
+        self.assertEqual(self.client.get(url).context["result_count"], 45)
+
+        Product.objects.filter(pk=Product.objects.first().pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).context["result_count"], 45)
+
+        cache.clear()
+        self.assertEqual(self.client.get(url).context["result_count"], 44)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        url = reverse("catalog:product_list")
+        first = [p.pk for p in self.client.get(url).context["products"]]
+        for cursor in ("garbage", encode_cursor("name", Product.objects.first())):
+            resp = self.client.get(url, {"sort": "rating", "after": cursor})
+            self.assertEqual([p.pk for p in resp.context["products"]], first)
+
+    def test_tampered_cursor_values_fall_back_to_first_page(self):
+        url = reverse("catalog:product_list")
+        for sort, values in (
+            ("price_asc", ["abc", 1]),
+            ("price_desc", ["NaN", 1]),
+            ("rating", [[1], "Kit", 1]),
+            ("name", ["Kit", "x"]),
+        ):
+            first = [p.pk for p in self.client.get(url, {"sort": sort}).context["products"]]
+            raw = json.dumps([sort, values]).encode()
+            cursor = base64.urlsafe_b64encode(raw).decode().rstrip("=")
+            for param in ("after", "before"):
+                resp = self.client.get(url, {"sort": sort, param: cursor})
+                self.assertEqual(resp.status_code, 200)
+                self.assertEqual([p.pk for p in resp.context["products"]], first)
+
+
+class ProductCardCacheTests(TestCase):
+    """Fragment cache delle card in catalogo invalidato da Product.cache_version."""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Kit", slug="kit")
+        self.product = Product.objects.create(
+            category=self.category,
+            name="Kit bagno",
+            base_price=Decimal("15.00"),
+            is_active=True,
+        )
+
+    def _version(self):
+        return Product.objects.values_list("cache_version", flat=True).get(pk=self.product.pk)
+
+    def _page(self):
+        return self.client.get(reverse("catalog:product_list")).content.decode()
+
+    def test_card_is_served_from_cache_until_version_changes(self):
+        self.assertIn("Kit bagno", self._page())
+
+        # UPDATE diretto senza bump: la card resta quella in cache
+        Product.objects.filter(pk=self.product.pk).update(name="Kit doccia")
+        self.assertIn("Kit bagno", self._page())
+
+        self.product.name = "Kit doccia"
+        self.product.save()
+        page = self._page()
+        self.assertIn("Kit doccia", page)
+        self.assertNotIn("Kit bagno", page)
+
+    def test_cached_fragment_wraps_complete_elements(self):
+        user = User.objects.create_user(username="c1", password="pass1234", role="client")
+        self.client.force_login(user)
+        self.assertIn("15.00", self._page())
+        key = make_template_fragment_key("catalog_card", [self.product.pk, self._version()])
+        fragment = cache.get(key)
+
+        self.assertIn("Kit bagno", fragment)
+        self.assertEqual(fragment.count("<div"), fragment.count("</div>"))
+        # il prezzo dipende dall'utente: resta fuori dal frammento condiviso
+        self.assertNotIn("15.00", fragment)
+
+    def test_save_bumps_version_atomically(self):
+        start = self._version()
+        stale = Product.objects.get(pk=self.product.pk)
+
+        self.product.save()
+        stale.save()  # istanza non aggiornata: non deve riusare la stessa versione
+
+        self.assertEqual(self._version(), start + 2)
+        self.assertEqual(stale.cache_version, start + 2)
+
+    def test_rating_moderation_and_images_bump_version(self):
+        start = self._version()
+        user = User.objects.create_user(username="u1", password="pass1234")
+        rating = ProductRating.objects.create(
+            product=self.product, user=user, rating=4, is_approved=True,
+            moderation_status=ProductRating.STATUS_APPROVED,
+        )
+        self.assertEqual(self._version(), start + 1)
+
+        rating.delete()
+        self.assertEqual(self._version(), start + 2)
+
+        image = ProductImage.objects.create(product=self.product, image="products/gallery/a.jpg")
+        image.delete()
+        self.assertEqual(self._version(), start + 4)
+
+    def test_queryset_writes_bump_version(self):
+        start = self._version()
+        other = Product.objects.create(
+            category=self.category, name="Kit cucina", base_price=Decimal("9.00"), is_active=True
+        )
+        image = ProductImage.objects.create(product=self.product, image="products/gallery/a.jpg")
+        self.assertEqual(self._version(), start + 1)
+
+        Category.objects.filter(pk=self.category.pk).update(name="Kit camera")
+        self.assertEqual(self._version(), start + 2)
+
+        # immagine spostata su un altro prodotto: card di entrambi
+        other_start = Product.objects.values_list("cache_version", flat=True).get(pk=other.pk)
+        ProductImage.objects.filter(pk=image.pk).update(product=other)
+        self.assertEqual(self._version(), start + 3)
+        self.assertEqual(
+            Product.objects.values_list("cache_version", flat=True).get(pk=other.pk), other_start + 1
+        )
+
+        ProductImage.objects.filter(pk=image.pk).update(product=self.product)
+        ProductImage.objects.filter(product=self.product).delete()
+        self.assertEqual(self._version(), start + 5)
+
+    def test_category_delete_bumps_version_only_if_deleted(self):
+        start = self._version()
+        # prodotti protetti: cancellazione fallita, nessuna nuova versione
+        with self.assertRaises(ProtectedError):
+            self.category.delete()
+        self.assertEqual(self._version(), start)
+
+        self.product.category = Category.objects.create(name="Altro", slug="altro")
+        self.product.save()
+        self.category.delete()
+        self.assertFalse(Category.objects.filter(pk=self.category.pk).exists())
 
-# Create your tests here.
+    def test_category_rename_bumps_version(self):
+        start = self._version()
+        self.category.name = "Kit cortesia"
+        self.category.save()
+        self.assertEqual(self._version(), start + 1)
+        self.assertIn("Kit cortesia", self._page())
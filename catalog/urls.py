@@ -9,3 +9,14 @@ urlpatterns = [
     path("product/<slug:slug>/availability/", views.product_availability, name="product_availability"),
     path("product/<slug:slug>/rate/", views.add_rating, name="add_rating"),
 ]
+
+
+# Budget per vista (b2b_portale.view_budgets, test orders/tests/test_view_budgets.py):
+# ruolo dell'utente di prova, argomenti dell'URL (chiavi del dataset di prova),
+# numero massimo di query con il dataset ingrandito.
+VIEW_BUDGETS = {
+    "product_list": {"role": "client", "queries": 6},
+    "product_detail": {"role": "client", "args": ["product"], "queries": 9},
+    "product_availability": {"role": "client", "args": ["product"], "queries": 5},
+    "add_rating": {"role": "client", "args": ["product"], "queries": 5},
+}
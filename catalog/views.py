@@ -1,5 +1,5 @@
 
-from django.db.models import Q, Avg
+from django.db import transaction
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
@@ -12,21 +12,27 @@ from .forms import ProductRatingForm
 
 from datetime import date, timedelta
 from .models import Product, Category, ProductAvailability, ProductRating
+from .pagination import SORT_KEYS, cached_count, keyset_page
+from .search import search_products
 from partners.models import PartnerProfile
 
 
 def product_list(request):
     """
     Catalogo prodotti con:
-    - filtri per categoria, partner, testo
-    - ordinamento per rating (premialità) / prezzo / nome
+    - filtri per categoria, partner, testo (ricerca full-text, vedi catalog.search)
+    - ordinamento per pertinenza (se c'è una ricerca) / rating (premialità) / prezzo / nome
     - liste categorie e partner per i filtri
 
-    Il rating medio è calcolato SOLO sulle recensioni approvate.
+    Il rating medio è quello denormalizzato su Product (rating_avg / rating_count),
+    calcolato SOLO sulle recensioni approvate.
+
+    La paginazione è a cursore (?after= / ?before=, vedi catalog.pagination);
+    il totale in intestazione è un COUNT in cache per combinazione di filtri.
     """
 
-    # Query base: prodotti attivi
-    qs = Product.objects.filter(is_active=True)
+    # Query base: prodotti attivi (categoria e partner servono a ogni card)
+    qs = Product.objects.filter(is_active=True).select_related("category", "supplier")
 
     # --- FILTRI ---
 
@@ -38,39 +44,28 @@ def product_list(request):
     if partner_id:
         qs = qs.filter(supplier_id=partner_id)
 
-    search = request.GET.get("q")
+    search = (request.GET.get("q") or "").strip()
     if search:
-        qs = qs.filter(
-            Q(name__icontains=search) |
-            Q(description__icontains=search)
-        )
-
-    # --- ANNOTAZIONE RATING MEDIO SOLO DA RECENSIONI APPROVATE ---
-    qs = qs.annotate(
-        avg_rating=Avg(
-            "ratings__rating",
-            filter=Q(ratings__is_approved=True),
-        )
-    )
+        # indice full-text (FTS5 / tsvector) con fallback su icontains
+        qs = search_products(qs, search)
 
     # --- ORDINAMENTO ---
 
-    sort = request.GET.get("sort", "rating")
-    if sort == "price_asc":
-        qs = qs.order_by("base_price")
-    elif sort == "price_desc":
-        qs = qs.order_by("-base_price")
-    elif sort == "name":
-        qs = qs.order_by("name")
-    else:
+    sort = request.GET.get("sort") or ("relevance" if search else "rating")
+    if sort not in SORT_KEYS or (sort == "relevance" and not search):
         # default: premialità → prima rating più alto, poi nome
-        qs = qs.order_by("-avg_rating", "name")
+        sort = "rating"
 
-    # --- PAGINAZIONE ---
+    # --- PAGINAZIONE (a cursore: nessun OFFSET, costo costante su ogni pagina) ---
 
-    paginator = Paginator(qs, 20)
-    page = request.GET.get("page")
-    products = paginator.get_page(page)
+    products = keyset_page(
+        qs,
+        sort,
+        per_page=20,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
+    result_count = cached_count(qs, [category_id, partner_id, search])
 
     # --- DATI PER I FILTRI ---
 
@@ -79,11 +74,12 @@ def product_list(request):
 
     context = {
         "products": products,
+        "result_count": result_count,
         "categories": categories,
         "partners": partners,
         "selected_category": int(category_id) if category_id else None,
         "selected_partner": int(partner_id) if partner_id else None,
-        "search": search or "",
+        "search": search,
         "sort": sort,
     }
     return render(request, "catalog/product_list.html", context)
@@ -95,10 +91,20 @@ def product_detail(request, slug):
     - mostra SOLO recensioni approvate
     - rating medio coerente (usa Product.average_rating che filtra già is_approved=True)
     """
-    product = get_object_or_404(Product, slug=slug, is_active=True)
+    product = get_object_or_404(
+        Product.objects
+        .select_related("category", "supplier")
+        .prefetch_related("components", "images"),
+        slug=slug,
+        is_active=True,
+    )
 
     # Recensioni approvate, paginate (ordine dal più recente)
-    review_qs = product.ratings.filter(is_approved=True).order_by("-created_at")
+    review_qs = (
+        product.ratings.filter(is_approved=True)
+        .select_related("user")
+        .order_by("-created_at")
+    )
     paginator = Paginator(review_qs, 10)
     page = request.GET.get("page")
     reviews = paginator.get_page(page)
@@ -208,7 +214,9 @@ def add_rating(request, slug):
             if hasattr(rating_obj, "moderated_at"):
                 rating_obj.moderated_at = None
 
-            rating_obj.save()
+            # salvataggio + riallineamento aggregati prodotto nella stessa transazione
+            with transaction.atomic():
+                rating_obj.save()
 
             messages.success(
                 request,
@@ -1,15 +1,17 @@
-from datetime import timedelta, datetime
+from datetime import timedelta
 from decimal import Decimal
 import random
 
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.utils import timezone
 
 from catalog.models import Product
 from partners.models import PartnerProfile
 from accounts.models import ClientStructure
-from orders.models import Order, OrderItem
+from orders.models import Order
+from orders.services import build_order
 
 User = get_user_model()
 
@@ -89,56 +91,23 @@ class Command(BaseCommand):
             Crea un ordine per il client e la struttura indicati,
             con 1-3 prodotti, subtotal, shipping, total, e righe ordine.
             """
-            created_at = datetime.now() - timedelta(days=random.randint(0, 10))
+            created_at = timezone.now() - timedelta(days=random.randint(0, 10))
 
             # selezioniamo 1-3 prodotti a caso
             items = random.sample(products, k=min(len(products), random.randint(1, 3)))
 
-            subtotal = Decimal("0.00")
-            shipping_cost = Decimal("10.00")  # fisso per demo
-
-            # creiamo l'ordine usando i CAMPI REALI del tuo modello
-            order = Order.objects.create(
+            # ordine + righe (con commissioni) in blocco tramite il service ordini
+            order = build_order(
                 client=client,
                 structure=structure,
+                lines=[(prod.id, random.randint(1, 4)) for prod in items],
+                shipping_cost=Decimal("10.00"),  # fisso per demo
                 status=Order.STATUS_PAID,
                 payment_method=Order.PAYMENT_BANK_TRANSFER,
                 payment_reference="DEMO",
-                subtotal=subtotal,       # lo aggiorniamo dopo
-                shipping_cost=shipping_cost,
-                total=Decimal("0.00"),   # lo aggiorniamo dopo
                 notes=f"Ordine demo generato automaticamente #{index}",
+                created_at=created_at,
             )
-
-            # creiamo le righe
-            for prod in items:
-                qty = random.randint(1, 4)
-                unit_price = prod.base_price
-                line_total = unit_price * qty
-
-                subtotal += line_total
-
-                partner = getattr(prod, "supplier", None)
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=prod,
-                    partner=partner,
-                    quantity=qty,
-                    unit_price=unit_price,
-                    total_price=line_total,
-                    partner_status=OrderItem.PARTNER_STATUS_PENDING,
-                )
-
-            # aggiorniamo i totali ordine
-            order.subtotal = subtotal
-            order.total = subtotal + shipping_cost
-
-            # se vuoi forzare la data di creazione (non necessario, ma carino per test)
-            if hasattr(order, "created_at"):
-                order.created_at = created_at
-
-            order.save()
             return order
 
         created_orders = []
@@ -0,0 +1,582 @@
+"""
+Dataset sintetico ad alto volume per misurare le prestazioni (benchmark).
+
+Crea partner, clienti, strutture, categorie, prodotti, ordini, righe,
+log di stato, messaggi, recensioni e payout con distribuzioni verosimili:
+
+- partner, prodotti e clienti con popolarità a coda lunga (pochi molto
+  attivi, molti poco attivi);
+- ordini in crescita nel periodo, in orario lavorativo, stato coerente con
+  l'età dell'ordine (i vecchi quasi tutti completati, i recenti in corso);
+- righe con stato partner coerente con lo stato ordine e log dei passaggi;
+- payout mensili per i mesi chiusi (pagati, l'ultimo confermato).
+
+Tutto con bulk_create a blocchi: gli ordini sono generati a lotti
+(--chunk-size), ciascuno in una transazione e con un generatore casuale
+derivato da (--seed, numero lotto): a parità di opzioni il dataset è sempre
+lo stesso, anche con più processi (--workers, solo su PostgreSQL: SQLite
+ammette un solo processo di scrittura).
+
+I modelli denormalizzati sono scritti direttamente (copie data / stato ordine
+sulle righe, contatori messaggi non letti, riepiloghi ordini partner) o
+ricalcolati alla fine in blocco (fatti commissioni, lock contabile,
+aggregati recensioni, indice di ricerca, saldi del registro partner).
+"""
+import math
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from accounts.models import ClientStructure
+from b2b_portale.periods import day_start, period_q
+from b2b_portale.report_generation import bump_report_generation
+from catalog import search
+from catalog.models import Category, Product, ProductRating
+from orders import partner_ledger
+from orders.facts import rebuild_commission_facts
+from orders.models import Order, OrderItem, OrderItemStatusLog, OrderMessage, PartnerPayout
+from partners.models import PartnerOrderSummary, PartnerProfile
+
+User = get_user_model()
+
+CATEGORY_NAMES = [
+    "Biancheria camera", "Biancheria bagno", "Lavanderia", "Pulizie", "Amenities",
+    "Colazione", "Manutenzione", "Piscina", "Giardinaggio", "Trasporti", "Eventi",
+    "Forniture ufficio",
+]
+PRODUCT_NAMES = [
+    "Kit lenzuola", "Set asciugamani", "Servizio lavaggio", "Cortesia bagno",
+    "Pulizia camere", "Tovagliato", "Accappatoi", "Detergenti", "Cesto colazione",
+    "Manutenzione caldaia",
+]
+CITIES = ["Rimini", "Riccione", "Milano", "Roma", "Firenze", "Venezia", "Napoli", "Bologna", "Torino", "Bari"]
+COMMISSION_RATES = [Decimal(rate) for rate in ("8.00", "10.00", "12.00", "15.00", "18.00", "20.00")]
+SHIPPING_COSTS = [Decimal("0.00"), Decimal("10.00"), Decimal("15.00")]
+PAYMENT_METHODS = [Order.PAYMENT_BANK_TRANSFER, Order.PAYMENT_PAYPAL, Order.PAYMENT_COD]
+
+# stato ordine per età (giorni): [(età minima, stati, pesi)]
+ORDER_STATUS_BY_AGE = [
+    (14, [Order.STATUS_COMPLETED, Order.STATUS_CANCELLED, Order.STATUS_SHIPPED, Order.STATUS_PAID],
+     [88, 7, 3, 2]),
+    (3, [Order.STATUS_COMPLETED, Order.STATUS_SHIPPED, Order.STATUS_PROCESSING, Order.STATUS_PAID,
+         Order.STATUS_CANCELLED, Order.STATUS_PENDING_PAYMENT],
+     [50, 20, 15, 8, 5, 2]),
+    (0, [Order.STATUS_PENDING_PAYMENT, Order.STATUS_PAID, Order.STATUS_PROCESSING, Order.STATUS_SHIPPED,
+         Order.STATUS_COMPLETED, Order.STATUS_CANCELLED],
+     [25, 30, 25, 10, 5, 5]),
+]
+
+# stato partner della riga per stato ordine: (stati, pesi)
+ITEM_STATUS_BY_ORDER = {
+    Order.STATUS_PENDING_PAYMENT: ([OrderItem.PARTNER_STATUS_PENDING], [1]),
+    Order.STATUS_PAID: ([OrderItem.PARTNER_STATUS_PENDING, OrderItem.PARTNER_STATUS_ACCEPTED], [60, 40]),
+    Order.STATUS_PROCESSING: ([OrderItem.PARTNER_STATUS_ACCEPTED, OrderItem.PARTNER_STATUS_IN_PROGRESS], [40, 60]),
+    Order.STATUS_SHIPPED: ([OrderItem.PARTNER_STATUS_SHIPPED, OrderItem.PARTNER_STATUS_COMPLETED], [80, 20]),
+    Order.STATUS_COMPLETED: ([OrderItem.PARTNER_STATUS_COMPLETED, OrderItem.PARTNER_STATUS_REJECTED], [97, 3]),
+    Order.STATUS_CANCELLED: ([OrderItem.PARTNER_STATUS_REJECTED, OrderItem.PARTNER_STATUS_PENDING], [50, 50]),
+}
+
+# passaggi di stato registrati nei log (una riga rifiutata passa da pending a rejected)
+PARTNER_STATUS_FLOW = [
+    OrderItem.PARTNER_STATUS_PENDING,
+    OrderItem.PARTNER_STATUS_ACCEPTED,
+    OrderItem.PARTNER_STATUS_IN_PROGRESS,
+    OrderItem.PARTNER_STATUS_SHIPPED,
+    OrderItem.PARTNER_STATUS_COMPLETED,
+]
+
+RATING_SHARE = 0.05  # quota di righe completate recensite
+RATING_WEIGHTS = [3, 5, 12, 35, 45]  # 1..5 stelle
+MESSAGE_SHARE = 0.25  # quota di ordini con messaggi
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Disattiva auto_now / auto_now_add sui modelli indicati: le date impostate
+    a mano (storico simulato) non vengono sostituite con "adesso".
+    """
+    fields = [
+        field
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _zipf_weights(count, exponent, rng):
+    """Pesi a coda lunga (1 / rango^exponent) assegnati in ordine casuale."""
+    weights = [1 / (rank ** exponent) for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+def _cumulative(weights):
+    total, cumulative = 0, []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def _money(value):
+    return Decimal(value).quantize(Decimal("0.01"))
+
+
+def _order_moment(rng, start, span_days):
+    """Istante dell'ordine: volumi in crescita nel periodo, orario 7-22."""
+    day = int(rng.triangular(0, span_days, span_days))
+    hour = rng.choices(range(7, 23), weights=[2, 5, 8, 9, 9, 7, 6, 7, 8, 8, 7, 6, 4, 3, 2, 1])[0]
+    return start + timedelta(days=min(day, span_days - 1), hours=hour, minutes=rng.randrange(60))
+
+
+def _order_status(rng, age_days):
+    for min_age, statuses, weights in ORDER_STATUS_BY_AGE:
+        if age_days >= min_age:
+            return rng.choices(statuses, weights=weights)[0]
+    return Order.STATUS_PENDING_PAYMENT
+
+
+def _status_steps(status):
+    """Passaggi (old, new) che portano una riga da pending allo stato indicato."""
+    if status == OrderItem.PARTNER_STATUS_REJECTED:
+        return [(OrderItem.PARTNER_STATUS_PENDING, OrderItem.PARTNER_STATUS_REJECTED)]
+    flow = PARTNER_STATUS_FLOW[:PARTNER_STATUS_FLOW.index(status) + 1]
+    return list(zip(flow, flow[1:]))
+
+
+def generate_order_chunk(task):
+    """
+    Genera un lotto di ordini (con righe, log, messaggi, recensioni e
+    riepiloghi partner) in una transazione. Eseguibile in un processo separato:
+    riceve solo dati serializzabili e restituisce i conteggi.
+    """
+    rng = random.Random(f"{task['seed']}:{task['chunk']}")
+    plan = task["plan"]
+    batch_size = plan["batch_size"]
+    now, start, span_days = plan["now"], plan["start"], plan["span_days"]
+    products, clients = plan["products"], plan["clients"]
+
+    orders, order_lines, order_messages = [], [], []
+    for _ in range(task["orders"]):
+        client_id, structure_ids = rng.choices(clients, cum_weights=plan["client_cum"])[0]
+        created_at = min(now, _order_moment(rng, start, span_days))
+        status = _order_status(rng, (now - created_at).days)
+
+        line_count = min(plan["max_lines"], 1 + int(rng.expovariate(1 / max(plan["avg_lines"] - 1, 0.1))))
+        picked = {}
+        for product in rng.choices(products, cum_weights=plan["product_cum"], k=line_count):
+            picked[product[0]] = product
+        lines = []
+        for product_id, partner_id, partner_user_id, price, rate in picked.values():
+            item = OrderItem(
+                product_id=product_id,
+                partner_id=partner_id,
+                quantity=min(20, 1 + int(rng.expovariate(0.5))),
+                unit_price=price,
+                order_created_at=created_at,
+                order_status=status,
+            )
+            item.total_price = item.unit_price * item.quantity
+            item.calculate_commission(default_rate=rate)
+            statuses, weights = ITEM_STATUS_BY_ORDER[status]
+            item.partner_status = rng.choices(statuses, weights=weights)[0]
+            lines.append((item, partner_user_id))
+
+        messages = []
+        if rng.random() < MESSAGE_SHARE:
+            partner_user_id = lines[0][1]
+            for n in range(rng.randint(1, 4)):
+                role = OrderMessage.ROLE_CLIENT if n % 2 == 0 else OrderMessage.ROLE_PARTNER
+                messages.append(OrderMessage(
+                    sender_id=client_id if role == OrderMessage.ROLE_CLIENT else partner_user_id,
+                    sender_role=role,
+                    message="Confermate la consegna?" if role == OrderMessage.ROLE_CLIENT else "Confermato.",
+                    is_read_by_client=role == OrderMessage.ROLE_CLIENT,
+                    is_read_by_partner=role == OrderMessage.ROLE_PARTNER,
+                    created_at=created_at + timedelta(hours=n + 1),
+                ))
+            # solo l'ultimo messaggio può essere ancora da leggere
+            for message in messages[:-1] if rng.random() < 0.3 else messages:
+                message.is_read_by_client = message.is_read_by_partner = True
+
+        subtotal = sum((item.total_price for item, _ in lines), Decimal("0.00"))
+        shipping_cost = rng.choice(SHIPPING_COSTS)
+        orders.append(Order(
+            client_id=client_id,
+            structure_id=rng.choice(structure_ids),
+            status=status,
+            payment_method=rng.choice(PAYMENT_METHODS),
+            subtotal=subtotal,
+            shipping_cost=shipping_cost,
+            total=subtotal + shipping_cost,
+            created_at=created_at,
+            updated_at=min(now, created_at + timedelta(days=rng.randint(0, 10))),
+            unread_for_client=sum(not m.is_read_by_client for m in messages),
+            unread_for_partner=sum(not m.is_read_by_partner for m in messages),
+        ))
+        order_lines.append(lines)
+        order_messages.append(messages)
+
+    with explicit_timestamps(Order, OrderItemStatusLog, OrderMessage, ProductRating), transaction.atomic():
+        Order.objects.bulk_create(orders, batch_size=batch_size)
+
+        items = []
+        for order, lines in zip(orders, order_lines):
+            for item, _ in lines:
+                item.order_id = order.pk
+                items.append(item)
+        OrderItem.objects.bulk_create(items, batch_size=batch_size)
+
+        logs, ratings, summaries = [], [], {}
+        for order, lines in zip(orders, order_lines):
+            for item, partner_user_id in lines:
+                changed_at = order.created_at
+                for old_status, new_status in _status_steps(item.partner_status):
+                    changed_at += timedelta(hours=rng.randint(1, 36))
+                    logs.append(OrderItemStatusLog(
+                        order_item_id=item.pk,
+                        old_status=old_status,
+                        new_status=new_status,
+                        changed_by_id=partner_user_id,
+                        changed_at=min(now, changed_at),
+                    ))
+                if item.partner_status == OrderItem.PARTNER_STATUS_COMPLETED and rng.random() < RATING_SHARE:
+                    stars = rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0]
+                    moderation = rng.choices(
+                        [ProductRating.STATUS_APPROVED, ProductRating.STATUS_PENDING, ProductRating.STATUS_REJECTED],
+                        weights=[85, 10, 5],
+                    )[0]
+                    ratings.append(ProductRating(
+                        product_id=item.product_id,
+                        user_id=order.client_id,
+                        rating=stars,
+                        comment="Servizio puntuale." if stars >= 4 else "Consegna in ritardo.",
+                        is_approved=moderation == ProductRating.STATUS_APPROVED,
+                        moderation_status=moderation,
+                        created_at=min(now, changed_at + timedelta(days=rng.randint(1, 10))),
+                    ))
+                summary = summaries.setdefault((order.pk, item.partner_id), PartnerOrderSummary(
+                    order_id=order.pk,
+                    partner_id=item.partner_id,
+                    order_created_at=order.created_at,
+                    last_activity_at=order.updated_at,
+                ))
+                summary.items_count += 1
+                summary.completed_count += item.partner_status == OrderItem.PARTNER_STATUS_COMPLETED
+        for summary in summaries.values():
+            summary.is_archived = summary.items_count == summary.completed_count
+
+        messages = []
+        for order, order_message_list in zip(orders, order_messages):
+            for message in order_message_list:
+                message.order_id = order.pk
+                messages.append(message)
+
+        OrderItemStatusLog.objects.bulk_create(logs, batch_size=batch_size)
+        OrderMessage.objects.bulk_create(messages, batch_size=batch_size)
+        PartnerOrderSummary.objects.bulk_create(summaries.values(), batch_size=batch_size)
+        # stessa coppia (prodotto, cliente) già recensita in un altro lotto: ignorata
+        ProductRating.objects.bulk_create(ratings, batch_size=batch_size, ignore_conflicts=True)
+
+    return {
+        "orders": len(orders),
+        "items": len(items),
+        "logs": len(logs),
+        "messages": len(messages),
+        "ratings": len(ratings),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un dataset sintetico ad alto volume (partner, clienti, prodotti, ordini, "
+        "righe, log, messaggi, recensioni, payout) con bulk_create, per i benchmark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--partners", type=int, default=50)
+        parser.add_argument("--clients", type=int, default=500)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=10000)
+        parser.add_argument("--avg-lines", type=float, default=3.0, help="Righe medie per ordine.")
+        parser.add_argument("--max-lines", type=int, default=25, help="Righe massime per ordine.")
+        parser.add_argument("--days", type=int, default=365, help="Giorni di storico (fino a --end-date).")
+        parser.add_argument("--end-date", help="Ultimo giorno dello storico (YYYY-MM-DD). Default: oggi.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=1000, help="Righe per INSERT.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Ordini per lotto / transazione.")
+        parser.add_argument("--workers", type=int, default=1, help="Processi paralleli (solo PostgreSQL).")
+        parser.add_argument("--prefix", default="load", help="Prefisso di username, slug e ragioni sociali.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(f"Esistono già utenti con prefisso '{prefix}_': usa un altro --prefix.")
+        if min(options["partners"], options["clients"], options["products"]) < 1:
+            raise CommandError("Servono almeno un partner, un cliente e un prodotto.")
+
+        try:
+            end_date = (
+                datetime.strptime(options["end_date"], "%Y-%m-%d").date()
+                if options["end_date"] else timezone.localdate()
+            )
+        except ValueError:
+            raise CommandError("Formato data non valido. Usa YYYY-MM-DD.")
+        start_date = end_date - timedelta(days=options["days"] - 1)
+
+        workers = options["workers"]
+        if workers > 1 and connection.vendor == "sqlite":
+            self.stdout.write(self.style.WARNING("SQLite ammette un solo processo di scrittura: --workers ignorato."))
+            workers = 1
+
+        rng = random.Random(options["seed"])
+        plan = self._create_catalog(rng, prefix, options)
+        plan.update(
+            batch_size=options["batch_size"],
+            now=min(timezone.now(), day_start(end_date + timedelta(days=1))),
+            start=day_start(start_date),
+            span_days=options["days"],
+            avg_lines=options["avg_lines"],
+            max_lines=options["max_lines"],
+        )
+        self.stdout.write(
+            f"Catalogo: {options['partners']} partner, {options['clients']} clienti, "
+            f"{options['products']} prodotti ({time.perf_counter() - started:.1f}s)"
+        )
+
+        chunk_size = options["chunk_size"]
+        tasks = [
+            {
+                "seed": options["seed"],
+                "chunk": chunk,
+                "orders": min(chunk_size, options["orders"] - chunk * chunk_size),
+                "plan": plan,
+            }
+            for chunk in range(math.ceil(options["orders"] / chunk_size))
+        ]
+        totals = {}
+        if workers > 1:
+            # i processi figli aprono connessioni proprie
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                results = pool.map(generate_order_chunk, tasks)
+                self._collect(results, totals, started)
+        else:
+            self._collect(map(generate_order_chunk, tasks), totals, started)
+
+        payouts = self._create_payouts(plan["partner_ids"], end_date)
+        self._refresh_derived(prefix, start_date, end_date)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Dataset generato in {time.perf_counter() - started:.1f}s: "
+            f"{totals.get('orders', 0)} ordini, {totals.get('items', 0)} righe, "
+            f"{totals.get('logs', 0)} log di stato, {totals.get('messages', 0)} messaggi, "
+            f"{totals.get('ratings', 0)} recensioni, {payouts} payout."
+        ))
+
+    def _collect(self, results, totals, started):
+        for result in results:
+            for key, value in result.items():
+                totals[key] = totals.get(key, 0) + value
+            self.stdout.write(
+                f"Ordini {totals['orders']} / righe {totals['items']} "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+
+    def _create_catalog(self, rng, prefix, options):
+        """Utenti, partner, strutture, categorie e prodotti; restituisce i dati serializzabili per i lotti."""
+        batch_size = options["batch_size"]
+        password = make_password("load")
+
+        with transaction.atomic():
+            partner_users = User.objects.bulk_create(
+                (
+                    User(
+                        username=f"{prefix}_partner_{n}",
+                        email=f"{prefix}_partner_{n}@example.com",
+                        password=password,
+                        role=User.ROLE_PARTNER,
+                    )
+                    for n in range(options["partners"])
+                ),
+                batch_size=batch_size,
+            )
+            partners = PartnerProfile.objects.bulk_create(
+                (
+                    PartnerProfile(
+                        user=user,
+                        company_name=f"{prefix.title()} Partner {n} Srl",
+                        vat_number=f"IT{n:011d}",
+                        city=rng.choice(CITIES),
+                        default_commission_percent=rng.choice(COMMISSION_RATES),
+                    )
+                    for n, user in enumerate(partner_users)
+                ),
+                batch_size=batch_size,
+            )
+            client_users = User.objects.bulk_create(
+                (
+                    User(
+                        username=f"{prefix}_client_{n}",
+                        email=f"{prefix}_client_{n}@example.com",
+                        password=password,
+                        role=User.ROLE_CLIENT,
+                        company_name=f"Hotel {prefix.title()} {n}",
+                    )
+                    for n in range(options["clients"])
+                ),
+                batch_size=batch_size,
+            )
+            structures = ClientStructure.objects.bulk_create(
+                (
+                    ClientStructure(
+                        owner=user,
+                        name=f"Hotel {prefix.title()} {n}-{s}",
+                        address=f"Via del Mare {s + 1}",
+                        city=rng.choice(CITIES),
+                        zip_code=f"{rng.randrange(10000, 99999)}",
+                        is_default_shipping=s == 0,
+                    )
+                    for n, user in enumerate(client_users)
+                    # strutture per cliente: per lo più una, alcune catene
+                    for s in range(rng.choices((1, 2, 3, 5), weights=(70, 18, 8, 4))[0])
+                ),
+                batch_size=batch_size,
+            )
+            categories = Category.objects.bulk_create(
+                Category(name=f"{name} {prefix}", slug=f"{prefix}-{n}-categoria")
+                for n, name in enumerate(CATEGORY_NAMES)
+            )
+
+            partner_cum = _cumulative(_zipf_weights(len(partners), 0.9, rng))
+            products = Product.objects.bulk_create(
+                (
+                    Product(
+                        category=rng.choice(categories),
+                        name=f"{rng.choice(PRODUCT_NAMES)} {prefix} {n}",
+                        slug=f"{prefix}-prodotto-{n}",
+                        supplier=rng.choices(partners, cum_weights=partner_cum)[0],
+                        is_service=rng.random() < 0.4,
+                        base_price=_money(min(500, max(5, rng.lognormvariate(3.5, 0.6)))),
+                        # circa un prodotto su cinque ha una commissione propria
+                        partner_commission_rate=rng.choice(COMMISSION_RATES) if rng.random() < 0.2 else None,
+                    )
+                    for n in range(options["products"])
+                ),
+                batch_size=batch_size,
+            )
+
+        structures_by_client = {}
+        for structure in structures:
+            structures_by_client.setdefault(structure.owner_id, []).append(structure.pk)
+        partner_by_id = {partner.pk: partner for partner in partners}
+        return {
+            "partner_ids": [partner.pk for partner in partners],
+            "products": [
+                (
+                    product.pk,
+                    product.supplier_id,
+                    partner_by_id[product.supplier_id].user_id,
+                    product.base_price,
+                    product.partner_commission_rate or partner_by_id[product.supplier_id].default_commission_percent,
+                )
+                for product in products
+            ],
+            "product_cum": _cumulative(_zipf_weights(len(products), 0.8, rng)),
+            "clients": [(user.pk, structures_by_client[user.pk]) for user in client_users],
+            "client_cum": _cumulative([rng.lognormvariate(0, 1) for _ in client_users]),
+        }
+
+    def _create_payouts(self, partner_ids, end_date):
+        """
+        Un payout per partner e mese chiuso con righe pagabili (stesso
+        perimetro di orders.payout_runs, importo partner): pagati (righe
+        liquidate) tranne l'ultimo mese, confermato.
+        """
+        month_start = end_date.replace(day=1)
+        last_closed = (month_start - timedelta(days=1)).replace(day=1)
+        rows = (
+            OrderItem.objects
+            .filter(
+                partner_id__in=partner_ids,
+                order_status=Order.STATUS_COMPLETED,
+                partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
+                commission_amount__gt=0,
+                payout__isnull=True,
+                order_created_at__lt=day_start(month_start),
+            )
+            .annotate(month=TruncMonth("order_created_at"))
+            .values("partner_id", "month")
+            .annotate(total=Sum("partner_earnings"))
+            .order_by("month", "partner_id")
+        )
+
+        payouts = []
+        for row in rows:
+            period_start = row["month"].date()
+            period_end = (period_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            paid = period_start < last_closed
+            closed_at = day_start(period_end + timedelta(days=10))
+            payouts.append(PartnerPayout(
+                partner_id=row["partner_id"],
+                period_start=period_start,
+                period_end=period_end,
+                total_commission=row["total"],
+                status=PartnerPayout.STATUS_PAID if paid else PartnerPayout.STATUS_CONFIRMED,
+                paid_at=closed_at if paid else None,
+                created_at=day_start(period_end + timedelta(days=1)),
+                updated_at=closed_at,
+            ))
+
+        with explicit_timestamps(PartnerPayout), transaction.atomic():
+            PartnerPayout.objects.bulk_create(payouts)
+            for payout in payouts:
+                OrderItem.objects.filter(
+                    period_q("order_created_at", payout.period_start, payout.period_end),
+                    partner_id=payout.partner_id,
+                    order_status=Order.STATUS_COMPLETED,
+                    partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
+                    commission_amount__gt=0,
+                    payout__isnull=True,
+                ).update(payout=payout, is_liquidated=payout.status == PartnerPayout.STATUS_PAID)
+            Order.refresh_accounting_lock(
+                OrderItem.objects.filter(payout__in=payouts).values("order_id")
+            )
+        return len(payouts)
+
+    def _refresh_derived(self, prefix, start_date, end_date):
+        """
+        Dati derivati ricalcolati in blocco: aggregati recensioni, indice di
+        ricerca, fatti commissioni, saldo iniziale nel registro partner.
+        """
+        products = Product.objects.filter(slug__startswith=f"{prefix}-prodotto-", ratings__isnull=False).distinct()
+        for product in products.only("pk").iterator(chunk_size=500):
+            product.refresh_rating_stats()
+        search.rebuild_index(Product.objects.all())
+        rebuild_commission_facts(start_date, end_date)
+        # righe completate e payout pagati creati con bulk_create: una voce di apertura per partner
+        partners = PartnerProfile.objects.filter(user__username__startswith=f"{prefix}_partner_")
+        partner_ledger.fix_ledger(list(partners.values_list("pk", flat=True)), note="Saldo iniziale")
+        bump_report_generation()
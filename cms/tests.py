@@ -1,3 +1,102 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Count, Sum
 from django.test import TestCase
 
-# Create your tests here.
+from catalog.models import Product, ProductRating
+from orders.models import CommissionDailyFact, Order, OrderItem, OrderMessage, PartnerPayout
+from partners.models import PartnerOrderSummary
+
+
+class GenerateLoadDatasetTests(TestCase):
+    """Comando generate_load_dataset: volumi, coerenza dei dati derivati, determinismo."""
+
+    OPTIONS = {
+        "partners": 4,
+        "clients": 12,
+        "products": 20,
+        "orders": 150,
+        "days": 120,
+        "end_date": "2025-06-30",
+        "chunk_size": 40,
+        "batch_size": 50,
+    }
+
+    def _generate(self, prefix, **options):
+        out = StringIO()
+        call_command("generate_load_dataset", prefix=prefix, stdout=out, **{**self.OPTIONS, **options})
+        return out.getvalue()
+
+    def _orders(self, prefix):
+        return Order.objects.filter(client__username__startswith=f"{prefix}_")
+
+    def test_dataset_volumes_and_derived_data(self):
+        output = self._generate("bench")
+
+        orders = self._orders("bench")
+        self.assertEqual(orders.count(), 150)
+        self.assertIn("150 ordini", output)
+        items = OrderItem.objects.filter(order__in=orders)
+        self.assertGreater(items.count(), 150)
+
+        # copie denormalizzate dell'ordine sulle righe
+        out = StringIO()
+        call_command("check_order_item_copies", stdout=out)
+        self.assertIn("allineate su tutte le righe", out.getvalue())
+
+        # riepiloghi partner: una riga per coppia (ordine, partner)
+        pairs = items.values("order_id", "partner_id").distinct().count()
+        self.assertEqual(PartnerOrderSummary.objects.count(), pairs)
+
+        # contatori dei messaggi non letti
+        for order in orders.filter(messages__isnull=False).distinct():
+            self.assertEqual(
+                order.unread_for_client,
+                OrderMessage.objects.filter(order=order, is_read_by_client=False).count(),
+            )
+
+        # fatti commissioni ricostruiti sul periodo
+        self.assertEqual(
+            CommissionDailyFact.objects.aggregate(total=Sum("commission"))["total"],
+            items.filter(commission_amount__gt=0).aggregate(total=Sum("commission_amount"))["total"],
+        )
+
+        # payout: totale (importo partner) = righe agganciate, liquidate solo se pagato
+        self.assertTrue(PartnerPayout.objects.exists())
+        for payout in PartnerPayout.objects.annotate(n=Count("items")):
+            self.assertGreater(payout.n, 0)
+            self.assertEqual(
+                payout.items.aggregate(total=Sum("partner_earnings"))["total"], payout.total_commission
+            )
+            self.assertEqual(
+                payout.items.filter(is_liquidated=True).count(),
+                payout.n if payout.status == PartnerPayout.STATUS_PAID else 0,
+            )
+        self.assertFalse(orders.filter(items__payout__isnull=False, accounting_lock=Order.LOCK_NONE).exists())
+
+        # registro partner allineato a righe completate e payout pagati
+        out = StringIO()
+        call_command("reconcile_partner_ledger", stdout=out)
+        self.assertIn("Registro partner allineato", out.getvalue())
+
+        # aggregati recensioni allineati
+        for product in Product.objects.filter(ratings__isnull=False).distinct():
+            self.assertEqual(
+                product.rating_count, ProductRating.objects.filter(product=product, is_approved=True).count()
+            )
+
+    def test_same_seed_same_dataset(self):
+        self._generate("first", orders=60)
+        self._generate("second", orders=60)
+        self._generate("other", orders=60, seed=7)
+
+        def fingerprint(prefix):
+            orders = self._orders(prefix)
+            return (
+                list(orders.order_by("created_at").values_list("created_at", "status", "total")),
+                OrderItem.objects.filter(order__in=orders).aggregate(Sum("commission_amount")),
+            )
+
+        self.assertEqual(fingerprint("first"), fingerprint("second"))
+        self.assertNotEqual(fingerprint("first"), fingerprint("other"))
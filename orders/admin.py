@@ -1,7 +1,6 @@
 from django.contrib import admin
-from .models import Order, OrderItem, PartnerPayout
-from django.core.files.base import ContentFile
-from .pdf_utils import render_payout_pdf_bytes
+from .models import Order, OrderItem, PartnerLedgerEntry, PartnerPayout, PartnerPayoutAttachLog, PayoutReceiptJob
+from .payout_payments import enqueue_receipts, mark_payouts_confirmed, mark_payouts_paid
 
 
 class OrderItemInline(admin.TabularInline):
@@ -37,6 +36,17 @@ class OrderItemAdmin(admin.ModelAdmin):
     search_fields = ("order__id", "product__name", "partner__company_name")
 
 
+class PartnerPayoutAttachLogInline(admin.TabularInline):
+    model = PartnerPayoutAttachLog
+    extra = 0
+    can_delete = False
+    fields = ("created_at", "source", "items_count", "amount", "total_after", "created_by")
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(PartnerPayout)
 class PartnerPayoutAdmin(admin.ModelAdmin):
     list_display = (
@@ -50,23 +60,27 @@ class PartnerPayoutAdmin(admin.ModelAdmin):
     list_filter = ("status", "period_start", "period_end", "partner")
     search_fields = ("partner__company_name",)
     date_hierarchy = "period_end"
+    inlines = [PartnerPayoutAttachLogInline]
 
     actions = ["mark_as_paid", "mark_as_confirmed"]
 
     def mark_as_paid(self, request, queryset):
-        from django.utils import timezone
-
-        updated = queryset.update(
-            status=PartnerPayout.STATUS_PAID,
-            paid_at=timezone.now(),
-        )
-        self.message_user(request, f"{updated} payout segnati come PAGATI.")
+        # liquidazione righe in blocco; le ricevute PDF vanno in coda (process_payout_receipts)
+        result = mark_payouts_paid(queryset, user=request.user)
+        message = f"{result['paid']} payout segnati come PAGATI, {result['items']} righe liquidate."
+        if result["job"]:
+            message += f" Ricevute PDF in generazione (job #{result['job'].pk})."
+        self.message_user(request, message)
 
     mark_as_paid.short_description = "Segna come PAGATI i payout selezionati"
 
     def mark_as_confirmed(self, request, queryset):
-        updated = queryset.update(status=PartnerPayout.STATUS_CONFIRMED)
-        self.message_user(request, f"{updated} payout segnati come CONFERMATI.")
+        # i payout già pagati stornano il pagamento nel registro partner
+        result = mark_payouts_confirmed(queryset)
+        message = f"{result['confirmed']} payout segnati come CONFERMATI."
+        if result["cancelled"]:
+            message += f" Pagamento annullato per {result['cancelled']} payout già pagati."
+        self.message_user(request, message)
 
     mark_as_confirmed.short_description = "Segna come CONFERMATI i payout selezionati"
     
@@ -74,21 +88,63 @@ class PartnerPayoutAdmin(admin.ModelAdmin):
         # Salviamo prima lo stato aggiornato
         old_status = None
         if change and obj.pk:
-            try:
-                old_status = PartnerPayout.objects.get(pk=obj.pk).status
-            except PartnerPayout.DoesNotExist:
-                old_status = None
+            # stato come caricato dal DB (snapshot from_db, nessuna query)
+            old_status = obj.previous_values("status")["status"]
 
         super().save_model(request, obj, form, change)
 
-        # Se è stato appena messo su "Pagato" e NON ha ancora ricevuta → genera PDF
+        # Se è stato appena messo su "Pagato" e NON ha ancora ricevuta → PDF in coda
+        # (generato fuori dalla richiesta da process_payout_receipts)
         if (
             obj.status == PartnerPayout.STATUS_PAID
             and old_status != PartnerPayout.STATUS_PAID
             and not obj.payment_receipt  # nome campo FileField
         ):
-            pdf_bytes = render_payout_pdf_bytes(obj)
-            filename = f"payout_{obj.id}.pdf"
+            enqueue_receipts([obj.pk], user=request.user)
+
+
+@admin.register(PayoutReceiptJob)
+class PayoutReceiptJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "status",
+        "progress_display",
+        "done",
+        "failed",
+        "total",
+        "created_by",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    readonly_fields = (
+        "status", "total", "done", "failed", "last_error", "created_by",
+        "created_at", "started_at", "heartbeat_at", "finished_at", "payouts",
+    )
+
+    def progress_display(self, obj):
+        return f"{obj.progress}%"
+    progress_display.short_description = "Avanzamento"
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PartnerLedgerEntry)
+class PartnerLedgerEntryAdmin(admin.ModelAdmin):
+    """Registro partner in sola lettura: le correzioni sono voci di rettifica (reconcile_partner_ledger --fix)."""
+
+    list_display = ("id", "partner", "kind", "amount", "earned_total", "paid_total", "balance", "created_at")
+    list_filter = ("kind",)
+    search_fields = ("partner__company_name",)
+    list_select_related = ("partner",)
+    raw_id_fields = ("partner", "order_item", "payout")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
-            # Salva il file sul FileField
-            obj.payment_receipt.save(filename, ContentFile(pdf_bytes), save=True)
+    def has_delete_permission(self, request, obj=None):
+        return False
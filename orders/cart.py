@@ -4,6 +4,7 @@ from django.conf import settings  # eventualmente usabile in futuro
 from catalog.models import Product
 
 CART_SESSION_ID = "cart"
+CART_SUMMARY_SESSION_ID = "cart_summary"
 
 
 class Cart:
@@ -18,14 +19,22 @@ class Cart:
             },
             ...
         }
+        session[CART_SUMMARY_SESSION_ID] = {
+            "count": <int>,          # pezzi totali
+            "total": "<str Decimal>",
+        }
+
+    La sessione viene scritta SOLO dalle operazioni che modificano il carrello
+    (add / remove / clear): istanziarlo e leggerlo non la marca mai come
+    modificata, quindi le pagine visitate non riscrivono la riga di sessione.
+    Il riepilogo (numero pezzi, totale) è salvato insieme al carrello e
+    letto così com'è dal context processor.
     """
 
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(CART_SESSION_ID)
-        if not cart:
-            cart = self.session[CART_SESSION_ID] = {}
-        self.cart = cart
+        # nessuna assegnazione in sessione finché il carrello non cambia
+        self.cart = self.session.get(CART_SESSION_ID) or {}
 
     def add(self, product, quantity=1, override_quantity=False):
         """
@@ -62,49 +71,89 @@ class Cart:
 
     def save(self):
         """
-        Segna la sessione come modificata.
+        Salva carrello e riepilogo in sessione e la segna come modificata.
+        Da chiamare solo dopo una modifica effettiva del carrello.
         """
+        self.session[CART_SESSION_ID] = self.cart
+        self.session[CART_SUMMARY_SESSION_ID] = self._compute_summary()
         self.session.modified = True
 
+    def _compute_summary(self):
+        count = 0
+        total = Decimal("0.00")
+        for item in self.cart.values():
+            quantity = int(item["quantity"])
+            count += quantity
+            total += Decimal(item["price"]) * quantity
+        return {"count": count, "total": str(total)}
+
+    def summary(self):
+        """
+        Riepilogo {"count", "total"} (total come stringa Decimal).
+        Usa quello salvato in sessione; per sessioni precedenti al riepilogo
+        lo ricalcola senza scriverlo.
+        """
+        if not self.cart:
+            return {"count": 0, "total": "0.00"}
+        summary = self.session.get(CART_SUMMARY_SESSION_ID)
+        if summary is None:
+            summary = self._compute_summary()
+        return summary
+
     def __iter__(self):
         """
         Itera sugli elementi del carrello e aggiunge gli oggetti Product reali,
         i prezzi come Decimal e il totale riga.
+
+        Restituisce copie delle righe: i dati in sessione restano serializzabili
+        e non vengono alterati dalla lettura.
         """
         product_ids = self.cart.keys()
         products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
 
         for product in products:
-            item = cart[str(product.id)]
+            stored = self.cart[str(product.id)]
+            item = dict(stored)
             item["product"] = product
-            item["price"] = Decimal(item["price"])
-            item["quantity"] = int(item["quantity"])
+            item["price"] = Decimal(stored["price"])
+            item["quantity"] = int(stored["quantity"])
             item["total_price"] = item["price"] * item["quantity"]
             yield item
 
+    def lines(self):
+        """
+        Righe del carrello come (product_id, quantity, unit_price) senza
+        interrogare il DB: formato atteso da orders.services.build_order.
+        """
+        return [
+            (int(product_id), int(item["quantity"]), Decimal(item["price"]))
+            for product_id, item in self.cart.items()
+        ]
+
     def __len__(self):
         """
         Numero totale di pezzi nel carrello (somma delle quantità).
         """
-        return sum(int(item["quantity"]) for item in self.cart.values())
+        return int(self.summary()["count"])
 
     def get_total_price(self):
         """
         Totale complessivo del carrello.
         """
-        return sum(
-            Decimal(item["price"]) * int(item["quantity"])
-            for item in self.cart.values()
-        )
+        return Decimal(self.summary()["total"])
 
     def clear(self):
         """
         Svuota completamente il carrello.
         """
-        if CART_SESSION_ID in self.session:
-            del self.session[CART_SESSION_ID]
-            self.save()
+        changed = False
+        for key in (CART_SESSION_ID, CART_SUMMARY_SESSION_ID):
+            if key in self.session:
+                del self.session[key]
+                changed = True
+        self.cart = {}
+        if changed:
+            self.session.modified = True
 
     def is_empty(self):
         """
@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from .cart import Cart
 
 
@@ -8,6 +10,9 @@ def cart_summary(request):
         - cart_total: totale carrello
 
     Solo per utenti autenticati con ruolo 'client' (per sicurezza).
+
+    Legge il riepilogo già salvato con il carrello: niente query, niente
+    ricalcolo dei Decimal e nessuna scrittura della sessione.
     """
     user = getattr(request, "user", None)
     if not user or not user.is_authenticated:
@@ -17,8 +22,8 @@ def cart_summary(request):
     if getattr(user, "role", None) == "partner":
         return {}
 
-    cart = Cart(request)
+    summary = Cart(request).summary()
     return {
-        "cart_item_count": len(cart),
-        "cart_total": cart.get_total_price(),
+        "cart_item_count": summary["count"],
+        "cart_total": Decimal(summary["total"]),
     }
@@ -0,0 +1,129 @@
+"""
+Fatti giornalieri delle commissioni (CommissionDailyFact).
+
+Grana: (giorno ordine, partner, categoria prodotto, stato ordine), solo righe
+con commission_amount > 0 (stesso perimetro del report commissioni).
+
+- Aggiornamento incrementale: i save() di righe / ordini mettono in coda il
+  giorno dell'ordine (CommissionFactDirtyDay); refresh_commission_facts()
+  ricalcola solo quei giorni (delete + una query di aggregazione + bulk insert).
+- Ricostruzione completa o per intervallo: rebuild_commission_facts()
+  (comando manage.py rebuild_commission_facts).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from b2b_portale.periods import days_q, period_q
+
+from .models import CommissionDailyFact, CommissionFactDirtyDay, OrderItem
+
+BATCH_SIZE = 1000
+
+_MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _money_sum(expression):
+    return Coalesce(Sum(expression), Value(Decimal("0.00")), output_field=_MONEY)
+
+
+def fact_rows(items):
+    """
+    Aggregazione delle righe indicate alla grana dei fatti.
+    Un ordine conta una volta sola: nel bucket della sua prima riga con
+    commissione (order_count) e, per partner, della prima riga del partner
+    (partner_order_count).
+    """
+    commissioned = OrderItem.objects.filter(
+        order=OuterRef("order"),
+        commission_amount__gt=0,
+        pk__lt=OuterRef("pk"),
+    )
+    return (
+        items
+        .filter(commission_amount__gt=0)
+        .annotate(
+            fact_day=TruncDate("order_created_at"),
+            has_previous=Exists(commissioned),
+            has_previous_for_partner=Exists(commissioned.filter(partner=OuterRef("partner"))),
+        )
+        .values("fact_day", "partner_id", "product__category_id", "order_status")
+        .annotate(
+            revenue=_money_sum("total_price"),
+            commission=_money_sum("commission_amount"),
+            partner_earnings=_money_sum(F("total_price") - F("commission_amount")),
+            item_count=Count("pk"),
+            order_count=Count("pk", filter=Q(has_previous=False)),
+            partner_order_count=Count("pk", filter=Q(has_previous_for_partner=False)),
+        )
+        .order_by()
+    )
+
+
+def _insert_facts(items):
+    facts = (
+        CommissionDailyFact(
+            day=row["fact_day"],
+            partner_id=row["partner_id"],
+            category_id=row["product__category_id"],
+            order_status=row["order_status"],
+            revenue=row["revenue"],
+            commission=row["commission"],
+            partner_earnings=row["partner_earnings"],
+            item_count=row["item_count"],
+            order_count=row["order_count"],
+            partner_order_count=row["partner_order_count"],
+        )
+        for row in fact_rows(items).iterator()
+    )
+    return len(CommissionDailyFact.objects.bulk_create(facts, batch_size=BATCH_SIZE))
+
+
+def rebuild_days(days):
+    """Ricalcola i fatti dei giorni indicati. Restituisce il numero di righe di fatto scritte."""
+    days = sorted(set(days))
+    if not days:
+        return 0
+    with transaction.atomic():
+        CommissionDailyFact.objects.filter(day__in=days).delete()
+        return _insert_facts(OrderItem.objects.filter(days_q("order_created_at", days)))
+
+
+def rebuild_commission_facts(start=None, end=None):
+    """
+    Ricostruzione completa (o limitata all'intervallo di giorni [start, end]).
+    Svuota anche la coda dei giorni coperti.
+    """
+    facts = CommissionDailyFact.objects.all()
+    queue = CommissionFactDirtyDay.objects.all()
+    items = OrderItem.objects.all()
+    if start:
+        facts = facts.filter(day__gte=start)
+        queue = queue.filter(day__gte=start)
+    if end:
+        facts = facts.filter(day__lte=end)
+        queue = queue.filter(day__lte=end)
+    items = items.filter(period_q("order_created_at", start, end))
+
+    with transaction.atomic():
+        queue.delete()
+        facts.delete()
+        return _insert_facts(items)
+
+
+def refresh_commission_facts():
+    """
+    Ricalcola i giorni in coda (se presenti). Con coda vuota costa una query:
+    chiamato all'apertura di report ed export commissioni.
+    """
+    with transaction.atomic():
+        days = list(CommissionFactDirtyDay.objects.values_list("day", flat=True))
+        if not days:
+            return 0
+        # prima si svuota la coda: un giorno segnato di nuovo durante il ricalcolo
+        # resta in coda per il refresh successivo
+        CommissionFactDirtyDay.objects.filter(day__in=days).delete()
+        rebuild_days(days)
+    return len(days)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from orders.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica che le copie di data e stato ordine sulle righe d'ordine "
+        "(OrderItem.order_created_at / order_status) coincidano con l'ordine; "
+        "con --fix riallinea le righe divergenti."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Riallinea le righe divergenti (Order.sync_item_copies).",
+        )
+
+    def handle(self, *args, **options):
+        stale = OrderItem.objects.filter(
+            Q(order_created_at__isnull=True)
+            | ~Q(order_created_at=F("order__created_at"))
+            | ~Q(order_status=F("order__status"))
+        )
+        order_ids = sorted(set(stale.values_list("order_id", flat=True)))
+
+        if not order_ids:
+            self.stdout.write(self.style.SUCCESS("Copie data / stato ordine allineate su tutte le righe."))
+            return
+
+        self.stdout.write(
+            self.style.WARNING(
+                f"Righe con copie non allineate: {stale.count()} "
+                f"(ordini: {', '.join(str(pk) for pk in order_ids[:20])}"
+                f"{' …' if len(order_ids) > 20 else ''})."
+            )
+        )
+
+        if options["fix"]:
+            updated = Order.sync_item_copies(order_ids)
+            self.stdout.write(self.style.SUCCESS(f"Righe riallineate: {updated}."))
+        else:
+            self.stdout.write("Esegui di nuovo con --fix per riallinearle.")
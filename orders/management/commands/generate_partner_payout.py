@@ -1,15 +1,23 @@
 from datetime import datetime
 from django.core.management.base import BaseCommand, CommandError
 
-from orders.services import build_partner_payouts
+from orders.payout_runs import ACTION_CREATE, payout_run_preview, run_payouts
 
 
 class Command(BaseCommand):
-    help = "Genera/aggiorna i PartnerPayout per un intervallo di date (YYYY-MM-DD YYYY-MM-DD)."
+    help = (
+        "Payout run: crea/aggiorna le bozze PartnerPayout di tutti i partner "
+        "per un intervallo di date (YYYY-MM-DD YYYY-MM-DD)."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("period_start", type=str, help="Data inizio (YYYY-MM-DD)")
         parser.add_argument("period_end", type=str, help="Data fine (YYYY-MM-DD)")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Mostra solo l'anteprima (bozze da creare / aggiornare) senza scrivere.",
+        )
 
     def handle(self, *args, **options):
         try:
@@ -17,11 +25,29 @@ class Command(BaseCommand):
             period_end = datetime.strptime(options["period_end"], "%Y-%m-%d").date()
         except ValueError:
             raise CommandError("Formato data non valido. Usa YYYY-MM-DD.")
+        if period_start > period_end:
+            raise CommandError("La data di inizio è successiva alla data di fine.")
+
+        if options["dry_run"]:
+            preview = payout_run_preview(period_start, period_end)
+            for row in preview:
+                if row["action"] == ACTION_CREATE:
+                    change = f"nuova bozza {row['total']:.2f} €"
+                else:
+                    change = f"bozza #{row['payout_id']} {row['current_total']:.2f} → {row['total']:.2f} €"
+                self.stdout.write(
+                    f"{row['company_name']}: {row['items']} righe, +{row['amount']:.2f} € ({change})"
+                )
+            self.stdout.write(
+                f"Anteprima {period_start} → {period_end}: {len(preview)} partner, nessuna modifica salvata."
+            )
+            return
 
-        payouts = build_partner_payouts(period_start, period_end)
+        result = run_payouts(period_start, period_end)
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"Generati/aggiornati {len(payouts)} payout per il periodo {period_start} → {period_end}."
+                f"Payout run {period_start} → {period_end}: {len(result['created'])} bozze create, "
+                f"{len(result['updated'])} aggiornate, {result['items']} righe agganciate."
             )
         )
@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.models import PayoutReceiptJob
+from orders.payout_payments import requeue_stale_receipt_jobs, run_receipt_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera le ricevute PDF dei payout pagati in coda (PayoutReceiptJob), "
+        "con un pool di processi. Da eseguire periodicamente (cron / worker)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processi paralleli per la generazione dei PDF (default: numero di CPU).",
+        )
+        parser.add_argument(
+            "--job", type=int, help="Esegue solo il job indicato (anche se già terminato, non se in corso)."
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_receipt_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"{requeued} job fermi rimessi in coda."))
+
+        statuses = (PayoutReceiptJob.STATUS_PENDING,)
+        if options["job"]:
+            jobs = PayoutReceiptJob.objects.filter(pk=options["job"])
+            if not jobs.exists():
+                raise CommandError(f"Job {options['job']} inesistente.")
+            statuses += (PayoutReceiptJob.STATUS_DONE, PayoutReceiptJob.STATUS_FAILED)
+        else:
+            jobs = PayoutReceiptJob.objects.filter(status=PayoutReceiptJob.STATUS_PENDING).order_by("created_at")
+
+        processed = 0
+        for job in list(jobs):
+            job = run_receipt_job(job, workers=options["workers"], statuses=statuses)
+            if job is None:
+                # preso nel frattempo da un altro worker
+                continue
+            processed += 1
+            style = self.style.SUCCESS if job.status == PayoutReceiptJob.STATUS_DONE else self.style.WARNING
+            self.stdout.write(style(
+                f"Job #{job.pk}: {job.done}/{job.total} ricevute generate, {job.failed} errori."
+                + (f" Ultimo errore: {job.last_error}" if job.failed else "")
+            ))
+
+        if not processed:
+            self.stdout.write("Nessun job di ricevute in coda.")
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.facts import rebuild_commission_facts
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricostruisce i fatti giornalieri delle commissioni (CommissionDailyFact) "
+        "dalle righe d'ordine, per intero o per intervallo di giorni."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="Giorno iniziale (YYYY-MM-DD)")
+        parser.add_argument("--to", dest="end", help="Giorno finale (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options["start"], "%Y-%m-%d").date() if options["start"] else None
+            end = datetime.strptime(options["end"], "%Y-%m-%d").date() if options["end"] else None
+        except ValueError:
+            raise CommandError("Formato data non valido. Usa YYYY-MM-DD.")
+
+        count = rebuild_commission_facts(start, end)
+
+        self.stdout.write(self.style.SUCCESS(f"Fatti commissioni ricostruiti: {count} righe."))
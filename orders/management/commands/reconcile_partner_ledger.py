@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+
+from orders.partner_ledger import fix_ledger, reconcile
+from partners.models import PartnerProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica il registro contabile dei partner (PartnerLedgerEntry) contro "
+        "righe d'ordine completate e payout pagati; con --fix aggiunge le voci "
+        "di rettifica per riallinearlo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--partner",
+            type=int,
+            action="append",
+            dest="partners",
+            help="Solo il partner indicato (ripetibile).",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Aggiunge voci di rettifica per maturato e pagato divergenti.",
+        )
+
+    def handle(self, *args, **options):
+        partner_ids = options["partners"]
+        differences = reconcile(partner_ids)
+
+        if not differences:
+            self.stdout.write(self.style.SUCCESS("Registro partner allineato a righe e payout."))
+            return
+
+        names = dict(
+            PartnerProfile.objects
+            .filter(pk__in=[row["partner_id"] for row in differences])
+            .values_list("pk", "company_name")
+        )
+        for row in differences:
+            problems = []
+            if row["earned"] != row["expected_earned"]:
+                problems.append(f"maturato {row['earned']:.2f} € (righe: {row['expected_earned']:.2f} €)")
+            if row["paid"] != row["expected_paid"]:
+                problems.append(f"pagato {row['paid']:.2f} € (payout: {row['expected_paid']:.2f} €)")
+            if not row["consistent"]:
+                problems.append("voci incoerenti con i totali progressivi")
+            self.stdout.write(self.style.WARNING(
+                f"{names.get(row['partner_id'], row['partner_id'])}: {', '.join(problems)}."
+            ))
+
+        if not options["fix"]:
+            self.stdout.write("Esegui di nuovo con --fix per aggiungere le voci di rettifica.")
+            return
+
+        entries = fix_ledger(partner_ids)
+        self.stdout.write(self.style.SUCCESS(f"Voci di rettifica aggiunte: {len(entries)}."))
+        if any(not row["consistent"] for row in reconcile(partner_ids)):
+            self.stdout.write(self.style.ERROR(
+                "Alcune voci restano incoerenti (non correggibili con rettifiche): verificare il registro."
+            ))
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from orders.models import PartnerPayout
+from orders.pdf_utils import render_payout_pdf_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera in anticipo i PDF dei payout di un periodo (YYYY-MM-DD YYYY-MM-DD) nella "
+        "cache su storage, con un pool di processi. I PDF già aggiornati non vengono rigenerati."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("period_start", type=str, help="Data inizio (YYYY-MM-DD)")
+        parser.add_argument("period_end", type=str, help="Data fine (YYYY-MM-DD)")
+        parser.add_argument(
+            "--status",
+            choices=[value for value, _ in PartnerPayout.STATUS_CHOICES],
+            help="Solo i payout in questo stato.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processi paralleli (default: numero di CPU).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            period_start = datetime.strptime(options["period_start"], "%Y-%m-%d").date()
+            period_end = datetime.strptime(options["period_end"], "%Y-%m-%d").date()
+        except ValueError:
+            raise CommandError("Formato data non valido. Usa YYYY-MM-DD.")
+
+        # payout il cui periodo ricade nell'intervallo indicato
+        payouts = PartnerPayout.objects.filter(period_start__gte=period_start, period_end__lte=period_end)
+        if options["status"]:
+            payouts = payouts.filter(status=options["status"])
+        payout_ids = list(payouts.order_by("pk").values_list("pk", flat=True))
+
+        started = time.perf_counter()
+        workers = options["workers"]
+        if workers > 1 and len(payout_ids) > 1:
+            # i processi figli aprono connessioni proprie
+            connections.close_all()
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                results = list(pool.map(render_payout_pdf_task, payout_ids))
+        else:
+            results = [render_payout_pdf_task(payout_id) for payout_id in payout_ids]
+
+        rendered = sum(1 for _, was_rendered, error in results if was_rendered and not error)
+        errors = [error for _, _, error in results if error]
+        for error in errors:
+            self.stderr.write(error)
+
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f"PDF payout {period_start} → {period_end}: {rendered} generati, "
+            f"{len(results) - rendered - len(errors)} già in cache, {len(errors)} errori "
+            f"({time.perf_counter() - started:.1f}s)."
+        ))
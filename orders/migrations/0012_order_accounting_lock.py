@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:42
+
+from django.db import migrations, models
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+
+
+def backfill_accounting_lock(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+
+    items = OrderItem.objects.filter(order=OuterRef("pk"))
+    paid_items = items.filter(Q(is_liquidated=True) | Q(payout__status="paid"))
+    Order.objects.update(
+        accounting_lock=Case(
+            When(Exists(paid_items), then=Value("paid")),
+            When(Exists(items.filter(payout__isnull=False)), then=Value("payout")),
+            default=Value(""),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_orderitem_payout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='accounting_lock',
+            field=models.CharField(blank=True, choices=[('', 'Nessuno'), ('payout', 'Payout emesso'), ('paid', 'Payout pagato / righe liquidate')], default='', editable=False, max_length=10, verbose_name='Lock contabile'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending_payment', 'In attesa conferma pagamento'), ('paid', 'Pagato')], default='pending_payment', max_length=20, verbose_name='Stato ordine'),
+        ),
+        migrations.RunPython(backfill_accounting_lock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:46
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderMessage = apps.get_model("orders", "OrderMessage")
+
+    def unread(flag):
+        counts = (
+            OrderMessage.objects
+            .filter(order=OuterRef("pk"), **{flag: False})
+            .order_by()
+            .values("order")
+            .annotate(n=Count("pk"))
+            .values("n")
+        )
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    Order.objects.update(
+        unread_for_client=unread("is_read_by_client"),
+        unread_for_partner=unread("is_read_by_partner"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_accounting_lock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='unread_for_client',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Messaggi non letti dal cliente'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='unread_for_partner',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Messaggi non letti dal partner'),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
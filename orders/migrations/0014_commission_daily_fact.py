@@ -0,0 +1,106 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:53
+
+import django.db.models.deletion
+from decimal import Decimal
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, Exists, F, OuterRef, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_facts(apps, schema_editor):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    CommissionDailyFact = apps.get_model("orders", "CommissionDailyFact")
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+
+    def money_sum(expression):
+        return Coalesce(Sum(expression), Value(Decimal("0.00")), output_field=money)
+
+    commissioned = OrderItem.objects.filter(
+        order=OuterRef("order"), commission_amount__gt=0, pk__lt=OuterRef("pk")
+    )
+    rows = (
+        OrderItem.objects
+        .filter(commission_amount__gt=0)
+        .annotate(
+            fact_day=TruncDate("order__created_at"),
+            has_previous=Exists(commissioned),
+            has_previous_for_partner=Exists(commissioned.filter(partner=OuterRef("partner"))),
+        )
+        .values("fact_day", "partner_id", "product__category_id", "order__status")
+        .annotate(
+            revenue=money_sum("total_price"),
+            commission=money_sum("commission_amount"),
+            partner_earnings=money_sum(F("total_price") - F("commission_amount")),
+            item_count=Count("pk"),
+            order_count=Count("pk", filter=Q(has_previous=False)),
+            partner_order_count=Count("pk", filter=Q(has_previous_for_partner=False)),
+        )
+        .order_by()
+    )
+    CommissionDailyFact.objects.bulk_create(
+        (
+            CommissionDailyFact(
+                day=row["fact_day"],
+                partner_id=row["partner_id"],
+                category_id=row["product__category_id"],
+                order_status=row["order__status"],
+                revenue=row["revenue"],
+                commission=row["commission"],
+                partner_earnings=row["partner_earnings"],
+                item_count=row["item_count"],
+                order_count=row["order_count"],
+                partner_order_count=row["partner_order_count"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_product_cache_version'),
+        ('orders', '0013_order_unread_counters'),
+        ('partners', '0004_partnerordersummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionFactDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='Giorno')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Giorno da ricalcolare (commissioni)',
+                'verbose_name_plural': 'Giorni da ricalcolare (commissioni)',
+            },
+        ),
+        migrations.CreateModel(
+            name='CommissionDailyFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Giorno')),
+                ('order_status', models.CharField(max_length=20, verbose_name='Stato ordine')),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Fatturato')),
+                ('commission', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Commissioni portale')),
+                ('partner_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14, verbose_name='Guadagno partner')),
+                ('item_count', models.PositiveIntegerField(default=0, verbose_name='Righe')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='Ordini')),
+                ('partner_order_count', models.PositiveIntegerField(default=0, verbose_name='Ordini partner')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='commission_facts', to='catalog.category')),
+                ('partner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='commission_facts', to='partners.partnerprofile')),
+            ],
+            options={
+                'verbose_name': 'Fatto giornaliero commissioni',
+                'verbose_name_plural': 'Fatti giornalieri commissioni',
+                'indexes': [models.Index(fields=['day', 'partner'], name='orders_cdf_day_partner_idx'), models.Index(fields=['partner', 'day'], name='orders_cdf_partner_day_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_facts, migrations.RunPython.noop),
+    ]
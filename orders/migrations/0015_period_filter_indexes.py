@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_user_role'),
+        ('catalog', '0013_product_cache_version'),
+        ('orders', '0014_commission_daily_fact'),
+        ('partners', '0004_partnerordersummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'status'], name='orders_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order', 'partner'], name='orders_item_order_partner_idx'),
+        ),
+    ]
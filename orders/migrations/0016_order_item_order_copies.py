@@ -0,0 +1,50 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_order_copies(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+
+    order = Order.objects.filter(pk=OuterRef("order_id"))
+    OrderItem.objects.update(
+        order_created_at=Subquery(order.values("created_at")[:1]),
+        order_status=Subquery(order.values("status")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_product_cache_version'),
+        ('orders', '0015_period_filter_indexes'),
+        ('partners', '0004_partnerordersummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='order_created_at',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Data ordine'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='order_status',
+            field=models.CharField(blank=True, editable=False, max_length=20, verbose_name='Stato ordine'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['partner', 'order_created_at'], name='orders_item_partner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['partner', 'partner_status'], name='orders_item_partner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['order_created_at', 'order_status'], name='orders_item_order_date_idx'),
+        ),
+        migrations.RunPython(backfill_order_copies, migrations.RunPython.noop),
+    ]
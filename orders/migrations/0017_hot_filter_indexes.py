@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_user_role'),
+        ('catalog', '0014_hot_filter_indexes'),
+        ('orders', '0016_order_item_order_copies'),
+        ('partners', '0005_hot_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', 'created_at'], name='orders_order_client_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['partner', 'is_liquidated', 'payout'], name='orders_item_partner_liq_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordermessage',
+            index=models.Index(fields=['order', 'is_read_by_partner'], name='orders_msg_unread_partner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordermessage',
+            index=models.Index(fields=['order', 'is_read_by_client'], name='orders_msg_unread_client_idx'),
+        ),
+    ]
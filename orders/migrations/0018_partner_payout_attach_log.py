@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:22
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0017_hot_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartnerPayoutAttachLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('backoffice', 'Backoffice (singolo partner)'), ('run', 'Payout run di periodo')], max_length=20, verbose_name='Origine')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Righe agganciate')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Importo partner agganciato')),
+                ('total_after', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name="Totale payout dopo l'aggancio")),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payout_attach_logs', to=settings.AUTH_USER_MODEL, verbose_name='Eseguito da')),
+                ('payout', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attach_logs', to='orders.partnerpayout', verbose_name='Payout')),
+            ],
+            options={
+                'verbose_name': 'Log aggancio payout',
+                'verbose_name_plural': 'Log agganci payout',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0018_partner_payout_attach_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutReceiptJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'In coda'), ('running', 'In corso'), ('done', 'Completato'), ('failed', 'Completato con errori')], default='pending', max_length=20, verbose_name='Stato')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Ricevute da generare')),
+                ('done', models.PositiveIntegerField(default=0, verbose_name='Generate')),
+                ('failed', models.PositiveIntegerField(default=0, verbose_name='Errori')),
+                ('last_error', models.TextField(blank=True, verbose_name='Ultimo errore')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creato il')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Iniziato il')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Terminato il')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payout_receipt_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Avviato da')),
+                ('payouts', models.ManyToManyField(related_name='receipt_jobs', to='orders.partnerpayout', verbose_name='Payout')),
+            ],
+            options={
+                'verbose_name': 'Generazione ricevute payout',
+                'verbose_name_plural': 'Generazioni ricevute payout',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:32
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_opening_balances(apps, schema_editor):
+    """Saldo iniziale per partner: maturato e pagato attuali come prime voci del registro."""
+    OrderItem = apps.get_model("orders", "OrderItem")
+    PartnerPayout = apps.get_model("orders", "PartnerPayout")
+    PartnerLedgerEntry = apps.get_model("orders", "PartnerLedgerEntry")
+
+    earned = dict(
+        OrderItem.objects.filter(partner_status="completed", partner__isnull=False)
+        .values("partner_id").annotate(total=Sum("partner_earnings")).order_by()
+        .values_list("partner_id", "total")
+    )
+    paid = dict(
+        PartnerPayout.objects.filter(status="paid")
+        .values("partner_id").annotate(total=Sum("total_commission")).order_by()
+        .values_list("partner_id", "total")
+    )
+
+    entries = []
+    for partner_id in sorted({*earned, *paid}):
+        # somme su SQLite (REAL): arrotondate al centesimo
+        earned_total = Decimal(earned.get(partner_id) or 0).quantize(Decimal("0.01"))
+        paid_total = Decimal(paid.get(partner_id) or 0).quantize(Decimal("0.01"))
+        entries.append(PartnerLedgerEntry(
+            partner_id=partner_id, kind="adjusted", amount=earned_total, note="Saldo iniziale",
+            earned_total=earned_total, balance=earned_total,
+        ))
+        if paid_total:
+            entries.append(PartnerLedgerEntry(
+                partner_id=partner_id, kind="paid", amount=paid_total, note="Saldo iniziale",
+                earned_total=earned_total, paid_total=paid_total, balance=earned_total - paid_total,
+            ))
+    PartnerLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0019_payout_receipt_job'),
+        ('partners', '0005_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartnerLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('earned', 'Riga completata'), ('reversed', 'Riga stornata'), ('adjusted', 'Rettifica'), ('attached', 'Aggancio a payout'), ('paid', 'Pagamento')], max_length=20, verbose_name='Movimento')),
+                ('amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Importo')),
+                ('note', models.CharField(blank=True, max_length=255, verbose_name='Nota')),
+                ('earned_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Maturato')),
+                ('paid_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Pagato')),
+                ('balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Saldo')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Data')),
+                ('order_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='orders.orderitem', verbose_name="Riga d'ordine")),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='partners.partnerprofile', verbose_name='Partner')),
+                ('payout', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='orders.partnerpayout', verbose_name='Payout')),
+            ],
+            options={
+                'verbose_name': 'Movimento registro partner',
+                'verbose_name_plural': 'Registro partner',
+                'ordering': ['-pk'],
+                'indexes': [models.Index(fields=['partner', 'id'], name='orders_ledger_partner_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0020_partner_ledger_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(verbose_name='Generazione')),
+            ],
+            options={
+                'verbose_name': 'Generazione dati report',
+                'verbose_name_plural': 'Generazione dati report',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0021_report_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payoutreceiptjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Ultimo avanzamento'),
+        ),
+    ]
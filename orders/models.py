@@ -1,12 +1,98 @@
 from decimal import Decimal
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from .utils import get_commission_rate_for_item
+from b2b_portale.periods import period_q
+from b2b_portale.report_generation import bump_report_generation
+from partners.counters import invalidate_partner_counters
+from partners.models import PartnerOrderSummary
 from django.core.exceptions import ValidationError
 
 
-class Order(models.Model):
+class LoadedStateMixin:
+    """
+    Snapshot dei valori "come letti dal DB" per i campi in ``tracked_fields``
+    (catturato in from_db e aggiornato dopo ogni save / refresh_from_db).
+
+    Permette ai save() con guardie di transizione di confrontare lo stato
+    precedente senza rileggere la riga. Se il valore non è disponibile
+    (istanza non caricata dal DB o campo differito) si ricade sulla query.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_loaded_state()
+        return instance
+
+    def _snapshot_loaded_state(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_state = {
+            name: getattr(self, name) for name in self.tracked_fields if name not in deferred
+        }
+
+    def previous_values(self, *names):
+        """Valori precedenti dei campi indicati (snapshot, oppure 1 query di fallback)."""
+        loaded = getattr(self, "_loaded_state", {})
+        if all(name in loaded for name in names):
+            return {name: loaded[name] for name in names}
+        row = type(self)._default_manager.filter(pk=self.pk).values(*names).first()
+        return row or {name: None for name in names}
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_loaded_state()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_loaded_state()
+
+
+class OrderQuerySet(models.QuerySet):
+    """
+    UPDATE massivi su Order: quando cambiano status o created_at riallinea,
+    come Order.save(), le copie sulle righe (sync_item_copies), la data sui
+    riepiloghi partner, i giorni dei fatti commissioni e la generazione dei
+    report. Gli altri UPDATE restano un'unica query.
+    """
+
+    COPIED_FIELDS = ("status", "created_at")
+
+    def update(self, **kwargs):
+        if not any(name in kwargs for name in self.COPIED_FIELDS):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            # id e date letti prima: dopo l'UPDATE il filtro può non valere più
+            before = dict(self.order_by().values_list("pk", "created_at"))
+            rows = super().update(**kwargs)
+            if not before:
+                return rows
+
+            order_ids = list(before)
+            days = {timezone.localdate(created_at) for created_at in before.values()}
+            self.model.sync_item_copies(order_ids)
+            if "created_at" in kwargs:
+                order = self.model.objects.filter(pk=OuterRef("order_id"))
+                PartnerOrderSummary.objects.filter(order_id__in=order_ids).update(
+                    order_created_at=Subquery(order.values("created_at")[:1])
+                )
+                days.update(
+                    timezone.localdate(created_at)
+                    for created_at in self.model.objects.filter(pk__in=order_ids)
+                    .values_list("created_at", flat=True)
+                )
+            CommissionFactDirtyDay.mark(*days)
+        bump_report_generation()
+        return rows
+
+
+class Order(LoadedStateMixin, models.Model):
     STATUS_DRAFT = "draft"
     STATUS_PENDING_PAYMENT = "pending_payment"
     STATUS_PAID = "paid"
@@ -25,6 +111,17 @@ class Order(models.Model):
 #        (STATUS_CANCELLED, "Annullato"),
     ]
 
+    # Lock contabile (denormalizzato, vedi refresh_accounting_lock)
+    LOCK_NONE = ""
+    LOCK_PAYOUT = "payout"  # almeno una riga agganciata a un payout (bozza/confermato)
+    LOCK_PAID = "paid"      # almeno una riga liquidata o in un payout pagato
+
+    ACCOUNTING_LOCK_CHOICES = [
+        (LOCK_NONE, "Nessuno"),
+        (LOCK_PAYOUT, "Payout emesso"),
+        (LOCK_PAID, "Payout pagato / righe liquidate"),
+    ]
+
     PAYMENT_PAYPAL = "paypal"
     PAYMENT_BANK_TRANSFER = "bank_transfer"
     PAYMENT_COD = "cash_on_delivery"
@@ -80,55 +177,195 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     review_invite_sent_at = models.DateTimeField(null=True, blank=True)
     review_reminder_sent_at = models.DateTimeField(null=True, blank=True)
-    
-def save(self, *args, **kwargs):
-    """
-    Hard-lock contabile:
-    se esiste almeno una riga liquidata o legata a payout PAID,
-    impedisce downgrade dello stato ordine e annullamento.
-    (Protegge anche Django admin standard e shell.)
-    """
-    previous_status = None
-    if self.pk:
-        previous_status = (
-            Order.objects
-            .filter(pk=self.pk)
-            .values_list("status", flat=True)
-            .first()
+
+    # 🔒 Lock contabile denormalizzato (vedi refresh_accounting_lock):
+    # evita le query exists() sulle righe a ogni salvataggio / dettaglio ordine
+    accounting_lock = models.CharField(
+        "Lock contabile",
+        max_length=10,
+        choices=ACCOUNTING_LOCK_CHOICES,
+        default=LOCK_NONE,
+        blank=True,
+        editable=False,
+    )
+
+    # 💬 Messaggi non letti per lato (denormalizzati, vedi OrderMessage):
+    # badge di lista ordini senza query per singolo ordine
+    unread_for_client = models.PositiveIntegerField(
+        "Messaggi non letti dal cliente", default=0, editable=False
+    )
+    unread_for_partner = models.PositiveIntegerField(
+        "Messaggi non letti dal partner", default=0, editable=False
+    )
+
+    objects = OrderQuerySet.as_manager()
+
+    # campi mantenuti solo con UPDATE mirati: mai riscritti da un save() completo
+    DENORMALIZED_FIELDS = ("accounting_lock", "unread_for_client", "unread_for_partner")
+
+    tracked_fields = ("status", "accounting_lock", "created_at")
+
+    class Meta:
+        verbose_name = "Ordine"
+        verbose_name_plural = "Ordini"
+        indexes = [
+            # filtri di periodo dei report (intervalli semiaperti su created_at,
+            # b2b_portale.periods) + esclusione degli annullati
+            models.Index(fields=["created_at", "status"], name="orders_order_created_idx"),
+            # storico ordini del cliente (più recenti prima)
+            models.Index(fields=["client", "created_at"], name="orders_order_client_date_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Ordine #{self.id} - {self.client}"
+
+    @classmethod
+    def refresh_accounting_lock(cls, order_ids):
+        """
+        Ricalcola (con un solo UPDATE) il lock contabile degli ordini indicati
+        (lista di id o subquery di order_id). Va chiamato ogni volta che delle
+        righe vengono agganciate/sganciate da un payout, liquidate o quando
+        cambia lo stato di un payout.
+        """
+        items = OrderItem.objects.filter(order=OuterRef("pk"))
+        paid_items = items.filter(
+            Q(is_liquidated=True) | Q(payout__status=PartnerPayout.STATUS_PAID)
+        )
+        return cls.objects.filter(pk__in=order_ids).update(
+            accounting_lock=Case(
+                When(Exists(paid_items), then=Value(cls.LOCK_PAID)),
+                When(Exists(items.filter(payout__isnull=False)), then=Value(cls.LOCK_PAYOUT)),
+                default=Value(cls.LOCK_NONE),
+            )
         )
 
-    # Se lo stato non cambia, non bloccare (consenti update di note, fattura, ecc.)
-    if previous_status and self.status != previous_status:
+    @classmethod
+    def sync_item_copies(cls, order_ids):
+        """
+        Riallinea (con un solo UPDATE) le copie di data e stato ordine sulle
+        righe degli ordini indicati (lista di id o subquery di id).
+        Chiamato da Order.objects.update() quando cambiano status o
+        created_at (i save() le aggiornano da soli) e da check_order_item_copies.
+        """
+        order = cls.objects.filter(pk=OuterRef("order_id"))
+        return OrderItem.objects.filter(order_id__in=order_ids).update(
+            order_created_at=Subquery(order.values("created_at")[:1]),
+            order_status=Subquery(order.values("status")[:1]),
+        )
 
-        has_paid_payout = (
-            self.items.filter(is_liquidated=True).exists()
-            or self.items.filter(payout__status="paid").exists()
+    @classmethod
+    def refresh_unread_counters(cls, order_ids):
+        """
+        Ricalcola (con un solo UPDATE) i contatori dei messaggi non letti
+        degli ordini indicati (lista di id o subquery di order_id).
+        """
+        def unread(flag):
+            counts = (
+                OrderMessage.objects
+                .filter(order=OuterRef("pk"), **{flag: False})
+                .order_by()
+                .values("order")
+                .annotate(n=Count("pk"))
+                .values("n")
+            )
+            return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+        return cls.objects.filter(pk__in=order_ids).update(
+            unread_for_client=unread("is_read_by_client"),
+            unread_for_partner=unread("is_read_by_partner"),
         )
 
-        if has_paid_payout:
+    def save(self, *args, **kwargs):
+        """
+        Hard-lock contabile:
+        se esiste almeno una riga liquidata o legata a payout PAID,
+        impedisce downgrade dello stato ordine e annullamento.
+        (Protegge anche Django admin standard e shell.)
+
+        Lo stato precedente arriva dallo snapshot caricato (from_db) e il lock
+        dal campo denormalizzato accounting_lock: nessuna query aggiuntiva,
+        tranne la verifica del lock sul DB quando la transizione sarebbe vietata.
+        """
+        previous_status = previous_created_at = None
+        if not self._state.adding:
+            prev = self.previous_values("status", "created_at")
+            previous_status, previous_created_at = prev["status"], prev["created_at"]
+
+        # Se lo stato non cambia, non bloccare (consenti update di note, fattura, ecc.)
+        if previous_status and self.status != previous_status:
             # ranking stati (stessa sequenza di STATUS_CHOICES)
             status_rank = {code: idx for idx, (code, _lbl) in enumerate(self.STATUS_CHOICES)}
 
-            # 1) vieta annullamento
-            if hasattr(self, "STATUS_CANCELLED") and self.status == self.STATUS_CANCELLED:
-                raise ValidationError(
-                    "Operazione non consentita: esiste già un payout pagato (o righe liquidate) su questo ordine."
-                )
-
-            # 2) vieta downgrade (es. paid -> pending_payment)
-            if (
+            is_cancel = self.status == self.STATUS_CANCELLED
+            is_downgrade = (
                 self.status in status_rank
                 and previous_status in status_rank
                 and status_rank[self.status] < status_rank[previous_status]
-            ):
+            )
+
+            if (is_cancel or is_downgrade) and self._has_paid_lock():
+                # 1) vieta annullamento
+                if is_cancel:
+                    raise ValidationError(
+                        "Operazione non consentita: esiste già un payout pagato (o righe liquidate) su questo ordine."
+                    )
+
+                # 2) vieta downgrade (es. paid -> pending_payment)
                 raise ValidationError(
                     "Operazione non consentita: esiste già un payout pagato (o righe liquidate) su questo ordine. "
                     "Non puoi retrocedere lo stato ordine."
                 )
 
-    super().save(*args, **kwargs)
+        # accounting_lock e contatori non letti sono mantenuti solo da UPDATE mirati:
+        # un save() completo con valori in memoria non aggiornati non deve sovrascriverli
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.DENORMALIZED_FIELDS
+            ]
+
+        super().save(*args, **kwargs)
+
+        # copie di stato / data sulle righe (report senza join su Order)
+        copies = {}
+        if previous_status and self.status != previous_status:
+            copies["order_status"] = self.status
+        if previous_created_at and self.created_at != previous_created_at:
+            copies["order_created_at"] = self.created_at
+        if copies:
+            OrderItem.objects.filter(order=self).update(**copies)
+        if "order_created_at" in copies:
+            PartnerOrderSummary.objects.filter(order=self).update(order_created_at=self.created_at)
+            CommissionFactDirtyDay.mark(timezone.localdate(previous_created_at))
+
+        # lo stato ordine è una dimensione dei fatti giornalieri commissioni
+        if copies:
+            CommissionFactDirtyDay.mark_order(self)
+        bump_report_generation()
+
+    def delete(self, *args, **kwargs):
+        """
+        Le righe vengono eliminate in CASCADE senza passare da OrderItem.delete():
+        storni nel registro partner e contatori dei partner sono gestiti qui.
+        """
+        from .partner_ledger import deleted_item_entries, record
+
+        items = list(self.items.only("pk", "order", "partner", "partner_status", "partner_earnings"))
+        entries = [entry for item in items for entry in deleted_item_entries(item)]
+        CommissionFactDirtyDay.mark_order(self)
+        with transaction.atomic(savepoint=False):
+            result = super().delete(*args, **kwargs)
+            record(entries)
+        invalidate_partner_counters(*{item.partner_id for item in items})
+        bump_report_generation()
+        return result
+
+    def _has_paid_lock(self):
+        if self.accounting_lock == self.LOCK_PAID:
+            return True
+        # il valore in memoria può essere precedente all'ultimo payout: verifica sul DB
+        return Order.objects.filter(pk=self.pk, accounting_lock=self.LOCK_PAID).exists()
 
-    
     def recalculate_commissions(self):
         """
         Ricalcola le commissioni per tutte le righe dell'ordine
@@ -144,16 +381,8 @@ def save(self, *args, **kwargs):
             item.calculate_commission(default_rate=rate)
             item.save(update_fields=["commission_rate", "partner_earnings"])
 
-    class Meta:
-        verbose_name = "Ordine"
-        verbose_name_plural = "Ordini"
 
-    def __str__(self) -> str:
-        return f"Ordine #{self.id} - {self.client}"
-        
-
-
-class OrderItem(models.Model):
+class OrderItem(LoadedStateMixin, models.Model):
     PARTNER_STATUS_PENDING = "pending"
     PARTNER_STATUS_ACCEPTED = "accepted"
     PARTNER_STATUS_IN_PROGRESS = "in_progress"
@@ -231,25 +460,64 @@ class OrderItem(models.Model):
     help_text="Indica se la commissione di questa riga è già stata liquidata tramite payout."
     )
 
+    # 📅 Copie di data e stato dell'ordine (denormalizzate): report commissioni,
+    # payout e analytics partner filtrano / raggruppano senza join su Order.
+    # Mantenute da Order.save() e Order.objects.update() (sync_item_copies),
+    # verificabili con manage.py check_order_item_copies.
+    order_created_at = models.DateTimeField("Data ordine", null=True, editable=False)
+    order_status = models.CharField(
+        "Stato ordine",
+        max_length=20,
+        blank=True,
+        editable=False,
+    )
+
     class Meta:
         verbose_name = "Riga d'ordine"
         verbose_name_plural = "Righe d'ordine"
+        indexes = [
+            # righe del partner negli ordini di un periodo (report / payout)
+            models.Index(fields=["order", "partner"], name="orders_item_order_partner_idx"),
+            # scansioni a tabella singola sulle copie di data / stato ordine
+            models.Index(fields=["partner", "order_created_at"], name="orders_item_partner_date_idx"),
+            models.Index(fields=["partner", "partner_status"], name="orders_item_partner_status_idx"),
+            models.Index(fields=["order_created_at", "order_status"], name="orders_item_order_date_idx"),
+            # righe del partner da liquidare / già in payout
+            models.Index(fields=["partner", "is_liquidated", "payout"], name="orders_item_partner_liq_idx"),
+        ]
+
+    # campi mantenuti dall'ordine: mai riscritti da un save() completo della riga
+    DENORMALIZED_FIELDS = ("order_created_at", "order_status")
+
+    tracked_fields = (
+        "partner_status", "partner_id", "payout_id", "is_liquidated",
+        "product_id", "total_price", "commission_amount", "partner_earnings",
+    )
+
+    # campi che alimentano CommissionDailyFact (oltre alla creazione della riga)
+    FACT_FIELDS = ("partner_id", "product_id", "total_price", "commission_amount")
+
+    # importi riportati nel PDF del payout a cui la riga è agganciata
+    AMOUNT_FIELDS = ("total_price", "commission_amount", "partner_earnings")
 
     def __str__(self) -> str:
         return f"{self.product} x{self.quantity}"
 
     # 🔹 METODO DI SUPPORTO
-    def calculate_commission(self, default_rate=None):
+    def calculate_commission(self, default_rate=None, resolver=None):
         """
         Calcola la commissione del portale e il netto partner.
 
         Priorità della percentuale di commissione:
         1) default_rate passato esplicitamente (se non None)
-        2) get_commission_rate_for_item(self.partner, self.product)
+        2) resolver.rate_for_item(self) (CommissionRateResolver condiviso dal batch);
+           senza resolver: get_commission_rate_for_item(self.partner, self.product)
         """
 
         if default_rate is not None:
             rate = default_rate
+        elif resolver is not None:
+            rate = resolver.rate_for_item(self)
         else:
             rate = get_commission_rate_for_item(self.partner, self.product)
 
@@ -266,48 +534,118 @@ class OrderItem(models.Model):
         # quota partner
         partner_net = gross - commission
         self.partner_earnings = partner_net.quantize(Decimal("0.01"))
-        
-def save(self, *args, **kwargs):
-    completed = self.PARTNER_STATUS_COMPLETED
-
-    previous_status = None
-    previous_payout_id = None
-    previous_is_liquidated = None
-
-    if self.pk:
-        prev = (
-            OrderItem.objects
-            .filter(pk=self.pk)
-            .values("partner_status", "payout_id", "is_liquidated")
-            .first()
-        )
-        if prev:
+
+    def save(self, *args, **kwargs):
+        """
+        - blocco hard sul cambio di partner_status se la riga è già liquidata
+        - calcolo commissione al passaggio a COMPLETATO (una sola volta)
+
+        Lo stato precedente arriva dallo snapshot caricato (from_db), senza
+        rileggere la riga.
+        """
+        completed = self.PARTNER_STATUS_COMPLETED
+
+        previous_status = None
+        previous_partner_id = None
+        adding = self._state.adding
+        prev = {}
+
+        if not adding:
+            prev = self.previous_values(
+                "partner_status", "payout_id", "is_liquidated", "partner_earnings", *self.FACT_FIELDS
+            )
             previous_status = prev["partner_status"]
-            previous_payout_id = prev["payout_id"]
-            previous_is_liquidated = prev["is_liquidated"]
+            previous_partner_id = prev["partner_id"]
 
             # 🔒 BLOCCO HARD: se già liquidata, non permettere cambio partner_status
-            already_paid = bool(previous_payout_id) or bool(previous_is_liquidated)
+            already_paid = bool(prev["payout_id"]) or bool(prev["is_liquidated"])
             status_changed = previous_status != self.partner_status
             if already_paid and status_changed:
                 raise ValidationError(
                     "Impossibile cambiare lo stato: la riga è già stata liquidata tramite payout."
                 )
 
-    # Trigger: al passaggio a COMPLETATO (calcolo una sola volta)
-    if (
-        self.partner_status == completed
-        and previous_status != completed
-        and self.partner is not None
-        and (self.commission_amount is None or self.commission_amount == Decimal("0.00"))
-    ):
-        # usa la logica già esistente e funzionante
-        if self.commission_rate and self.commission_rate > Decimal("0.00"):
-            self.calculate_commission(default_rate=self.commission_rate)
-        else:
-            self.calculate_commission()
-
-    super().save(*args, **kwargs)
+        # Trigger: al passaggio a COMPLETATO (calcolo una sola volta)
+        if (
+            self.partner_status == completed
+            and previous_status != completed
+            and self.partner_id is not None
+            and (self.commission_amount is None or self.commission_amount == Decimal("0.00"))
+        ):
+            # usa la logica già esistente e funzionante
+            if self.commission_rate and self.commission_rate > Decimal("0.00"):
+                self.calculate_commission(default_rate=self.commission_rate)
+            else:
+                self.calculate_commission()
+
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {
+                    *update_fields, "commission_rate", "commission_amount", "partner_earnings"
+                }
+
+        if adding:
+            if self.order_created_at is None:
+                self.order_created_at = self.order.created_at
+            if not self.order_status:
+                self.order_status = self.order.status
+        elif kwargs.get("update_fields") is None:
+            # le copie dell'ordine in memoria possono essere precedenti all'ultimo cambio di stato
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.DENORMALIZED_FIELDS
+            ]
+
+        # registro partner: completamento, storno o rettifica del maturato, salvati
+        # nella stessa transazione della riga (import locale: partner_ledger importa i modelli)
+        from .partner_ledger import item_entries, record
+        entries = item_entries(
+            self, prev.get("partner_status"), prev.get("partner_id"), prev.get("partner_earnings")
+        )
+        # aggancio a un payout / liquidazione cambiati (anche da admin): lock contabile
+        # dell'ordine ricalcolato nella stessa transazione della riga
+        accounting_changed = not adding and (
+            prev["payout_id"] != self.payout_id or prev["is_liquidated"] != self.is_liquidated
+        )
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            record(entries)
+            if accounting_changed:
+                Order.refresh_accounting_lock([self.order_id])
+
+        # contatori partner (sidebar / dashboard) e riepiloghi ordine per partner:
+        # nuova riga, cambio stato o cambio partner
+        partner_changed = previous_partner_id != self.partner_id
+        if previous_status != self.partner_status or partner_changed:
+            invalidate_partner_counters(self.partner_id, previous_partner_id)
+            PartnerOrderSummary.refresh(self.order_id, [self.partner_id, previous_partner_id])
+
+        # fatti giornalieri commissioni: giorno dell'ordine da ricalcolare (dalla copia
+        # della data sulla riga, senza caricare l'ordine); altri campi non li toccano
+        if adding or any(prev[name] != getattr(self, name) for name in self.FACT_FIELDS):
+            CommissionFactDirtyDay.mark_datetime(self.order_created_at)
+        # PDF dei payout in cache (nome da updated_at): importi o aggancio della riga cambiati
+        if not adding and (
+            prev["payout_id"] != self.payout_id
+            or any(prev[name] != getattr(self, name) for name in self.AMOUNT_FIELDS)
+        ):
+            PartnerPayout.touch(prev["payout_id"], self.payout_id)
+        bump_report_generation()
+
+    def delete(self, *args, **kwargs):
+        from .partner_ledger import deleted_item_entries, record
+
+        order_id, partner_id, payout_id = self.order_id, self.partner_id, self.payout_id
+        entries = deleted_item_entries(self)
+        CommissionFactDirtyDay.mark_datetime(self.order_created_at)
+        with transaction.atomic(savepoint=False):
+            result = super().delete(*args, **kwargs)
+            record(entries)
+        PartnerPayout.touch(payout_id)
+        invalidate_partner_counters(partner_id)
+        PartnerOrderSummary.refresh(order_id, [partner_id])
+        bump_report_generation()
+        return result
 
 
 # ============================================================
@@ -438,11 +776,64 @@ class OrderMessage(models.Model):
         verbose_name = "Messaggio ordine"
         verbose_name_plural = "Messaggi ordine"
         ordering = ["created_at"]
+        indexes = [
+            # messaggi non letti per lato (mark_read / refresh_unread_counters)
+            models.Index(fields=["order", "is_read_by_partner"], name="orders_msg_unread_partner_idx"),
+            models.Index(fields=["order", "is_read_by_client"], name="orders_msg_unread_client_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Msg ordine #{self.order_id} da {self.sender} ({self.created_at:%d/%m/%Y %H:%M})"
+
+    def save(self, *args, **kwargs):
+        """
+        Mantiene Order.unread_for_client / unread_for_partner:
+        - nuovo messaggio → +1 sui lati che non l'hanno ancora letto (UPDATE con F)
+        - modifica di un messaggio esistente → ricalcolo dei contatori dell'ordine
+        """
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+
+        if not adding:
+            Order.refresh_unread_counters([self.order_id])
+            return
+
+        increments = {}
+        if not self.is_read_by_client:
+            increments["unread_for_client"] = F("unread_for_client") + 1
+        if not self.is_read_by_partner:
+            increments["unread_for_partner"] = F("unread_for_partner") + 1
+        if increments:
+            Order.objects.filter(pk=self.order_id).update(**increments)
+        PartnerOrderSummary.touch(self.order_id)
+
+    def delete(self, *args, **kwargs):
+        order_id = self.order_id
+        result = super().delete(*args, **kwargs)
+        Order.refresh_unread_counters([order_id])
+        return result
+
+    @classmethod
+    def mark_read(cls, order, role):
+        """
+        Segna come letti tutti i messaggi dell'ordine per il lato indicato
+        (ROLE_CLIENT / ROLE_PARTNER) e azzera il relativo contatore.
+        Con contatore a zero (ordine appena letto dal DB) nessuna query.
+        """
+        flag, counter = {
+            cls.ROLE_CLIENT: ("is_read_by_client", "unread_for_client"),
+            cls.ROLE_PARTNER: ("is_read_by_partner", "unread_for_partner"),
+        }[role]
+
+        if not getattr(order, counter):
+            return 0
+
+        updated = cls.objects.filter(order=order, **{flag: False}).update(**{flag: True})
+        Order.objects.filter(pk=order.pk).update(**{counter: 0})
+        setattr(order, counter, 0)
+        return updated
         
-class PartnerPayout(models.Model):
+class PartnerPayout(LoadedStateMixin, models.Model):
     """
     Riepilogo pagamenti delle commissioni verso un partner.
     Non calcola le commissioni (quelle stanno su OrderItem),
@@ -513,6 +904,18 @@ class PartnerPayout(models.Model):
             f"({self.period_start} → {self.period_end}) - {self.total_commission} €"
         )
 
+    tracked_fields = ("status",)
+
+    @classmethod
+    def touch(cls, *payout_ids):
+        """
+        Nuovo updated_at per i payout indicati (None ignorati), con un solo
+        UPDATE: i dati del PDF sono cambiati fuori dal payout (righe, partner).
+        """
+        payout_ids = {pk for pk in payout_ids if pk}
+        if payout_ids:
+            cls.objects.filter(pk__in=payout_ids).update(updated_at=timezone.now())
+
     def liquidate_items(self):
         """Marca come liquidate le righe d'ordine incluse in questo payout.
 
@@ -540,9 +943,8 @@ class PartnerPayout(models.Model):
 
         # --- Fallback legacy (safe): aggancia e liquida SOLO righe non ancora associate a payout ---
         legacy_qs = OrderItem.objects.filter(
+            period_q("order_created_at", self.period_start, self.period_end),
             partner=self.partner,
-            order__created_at__date__gte=self.period_start,
-            order__created_at__date__lte=self.period_end,
             commission_amount__gt=0,
             partner_status=completed_value,
             is_liquidated=False,
@@ -562,15 +964,12 @@ class PartnerPayout(models.Model):
         Se lo stato passa a PAID:
         - imposta automaticamente paid_at (se non valorizzato)
         - liquida le righe di commissione del periodo per questo partner
+
+        A ogni cambio di stato riallinea il lock contabile degli ordini collegati.
         """
         previous_status = None
-        if self.pk:
-            previous_status = (
-                PartnerPayout.objects
-                .filter(pk=self.pk)
-                .values_list("status", flat=True)
-                .first()
-            )
+        if not self._state.adding:
+            previous_status = self.previous_values("status")["status"]
 
         # se da admin imposti direttamente "Pagato" e non c'è paid_at, lo settiamo ora
         if self.status == self.STATUS_PAID and self.paid_at is None:
@@ -581,6 +980,318 @@ class PartnerPayout(models.Model):
         # Se prima NON era pagato e ora è pagato → liquida le righe una sola volta
         if previous_status != self.STATUS_PAID and self.status == self.STATUS_PAID:
             self.liquidate_items()
-            
-            
+        # registro partner: pagamento registrato o annullato
+        if (previous_status == self.STATUS_PAID) != (self.status == self.STATUS_PAID):
+            from .partner_ledger import payout_paid_entry, record
+            record([payout_paid_entry(self, cancelled=previous_status == self.STATUS_PAID)])
+        if previous_status != self.status:
+            Order.refresh_accounting_lock(self.items.values("order_id"))
+        # liquidazione e stato payout cambiano i report commissioni
+        bump_report_generation()
+
+    def delete(self, *args, **kwargs):
+        # le righe vengono sganciate (SET_NULL): riallineiamo il lock dei loro ordini
+        order_ids = list(self.items.values_list("order_id", flat=True).distinct())
+        result = super().delete(*args, **kwargs)
+        Order.refresh_accounting_lock(order_ids)
+        bump_report_generation()
+        return result
+
+
+class PartnerPayoutAttachLog(models.Model):
+    """
+    Audit degli agganci di righe a un payout: una voce per operazione
+    (creazione payout da backoffice o payout run), non per riga.
+    """
+
+    SOURCE_BACKOFFICE = "backoffice"
+    SOURCE_RUN = "run"
 
+    SOURCE_CHOICES = [
+        (SOURCE_BACKOFFICE, "Backoffice (singolo partner)"),
+        (SOURCE_RUN, "Payout run di periodo"),
+    ]
+
+    payout = models.ForeignKey(
+        PartnerPayout,
+        on_delete=models.CASCADE,
+        related_name="attach_logs",
+        verbose_name="Payout",
+    )
+    source = models.CharField("Origine", max_length=20, choices=SOURCE_CHOICES)
+    items_count = models.PositiveIntegerField("Righe agganciate", default=0)
+    amount = models.DecimalField(
+        "Importo partner agganciato",
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0.00"),
+    )
+    total_after = models.DecimalField(
+        "Totale payout dopo l'aggancio",
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0.00"),
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="payout_attach_logs",
+        verbose_name="Eseguito da",
+    )
+    created_at = models.DateTimeField("Data", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Log aggancio payout"
+        verbose_name_plural = "Log agganci payout"
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Payout #{self.payout_id}: +{self.items_count} righe, +{self.amount} € ({self.get_source_display()})"
+
+
+class PayoutReceiptJob(models.Model):
+    """
+    Generazione in blocco delle ricevute PDF dei payout pagati, fuori dalla
+    richiesta: creata da "Segna come pagati" / salvataggio in admin,
+    eseguita dal comando process_payout_receipts (orders/payout_payments.py).
+    done / failed avanzano man mano che i PDF vengono prodotti.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "In coda"),
+        (STATUS_RUNNING, "In corso"),
+        (STATUS_DONE, "Completato"),
+        (STATUS_FAILED, "Completato con errori"),
+    ]
+
+    payouts = models.ManyToManyField(PartnerPayout, related_name="receipt_jobs", verbose_name="Payout")
+    status = models.CharField("Stato", max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total = models.PositiveIntegerField("Ricevute da generare", default=0)
+    done = models.PositiveIntegerField("Generate", default=0)
+    failed = models.PositiveIntegerField("Errori", default=0)
+    last_error = models.TextField("Ultimo errore", blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="payout_receipt_jobs",
+        verbose_name="Avviato da",
+    )
+    created_at = models.DateTimeField("Creato il", auto_now_add=True)
+    started_at = models.DateTimeField("Iniziato il", null=True, blank=True)
+    finished_at = models.DateTimeField("Terminato il", null=True, blank=True)
+    # ultimo segno di vita del worker (presa in carico / ogni PDF): un job "in corso"
+    # fermo da troppo tempo è di un worker terminato e torna in coda
+    heartbeat_at = models.DateTimeField("Ultimo avanzamento", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Generazione ricevute payout"
+        verbose_name_plural = "Generazioni ricevute payout"
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:
+        return f"Ricevute #{self.pk}: {self.done + self.failed}/{self.total} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Percentuale di ricevute elaborate (generate o in errore)."""
+        if not self.total:
+            return 100
+        return int((self.done + self.failed) * 100 / self.total)
+
+
+class PartnerLedgerEntry(models.Model):
+    """
+    Registro contabile del partner (solo inserimenti, vedi orders/partner_ledger.py).
+
+    Ogni voce porta il proprio movimento (amount, con segno) e i totali
+    progressivi del partner dopo il movimento: l'ultima voce di un partner è
+    il suo saldo attuale, senza aggregare righe e payout.
+
+    - maturato (earned_total): righe completate, storni e rettifiche
+    - pagato (paid_total): payout pagati (e pagamenti annullati)
+    - aggancio a payout: voce informativa, non cambia i totali
+    """
+
+    KIND_EARNED = "earned"
+    KIND_REVERSED = "reversed"
+    KIND_ADJUSTED = "adjusted"
+    KIND_ATTACHED = "attached"
+    KIND_PAID = "paid"
+
+    KIND_CHOICES = [
+        (KIND_EARNED, "Riga completata"),
+        (KIND_REVERSED, "Riga stornata"),
+        (KIND_ADJUSTED, "Rettifica"),
+        (KIND_ATTACHED, "Aggancio a payout"),
+        (KIND_PAID, "Pagamento"),
+    ]
+
+    # voci che muovono il maturato / il pagato
+    EARNED_KINDS = (KIND_EARNED, KIND_REVERSED, KIND_ADJUSTED)
+    PAID_KINDS = (KIND_PAID,)
+
+    partner = models.ForeignKey(
+        "partners.PartnerProfile",
+        on_delete=models.CASCADE,
+        related_name="ledger_entries",
+        verbose_name="Partner",
+    )
+    kind = models.CharField("Movimento", max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField("Importo", max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    order_item = models.ForeignKey(
+        OrderItem,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ledger_entries",
+        verbose_name="Riga d'ordine",
+    )
+    payout = models.ForeignKey(
+        PartnerPayout,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ledger_entries",
+        verbose_name="Payout",
+    )
+    note = models.CharField("Nota", max_length=255, blank=True)
+
+    # totali progressivi del partner dopo questa voce
+    earned_total = models.DecimalField("Maturato", max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    paid_total = models.DecimalField("Pagato", max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    balance = models.DecimalField("Saldo", max_digits=12, decimal_places=2, default=Decimal("0.00"))
+
+    created_at = models.DateTimeField("Data", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Movimento registro partner"
+        verbose_name_plural = "Registro partner"
+        ordering = ["-pk"]
+        indexes = [
+            # ultima voce del partner (saldo) e pagine del registro per id
+            models.Index(fields=["partner", "id"], name="orders_ledger_partner_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.partner_id} {self.get_kind_display()} {self.amount} € (saldo {self.balance} €)"
+
+
+# ============================================================
+#   FATTI GIORNALIERI COMMISSIONI (analytics)
+# ============================================================
+
+class CommissionDailyFact(models.Model):
+    """
+    Aggregato giornaliero delle righe con commissione (commission_amount > 0)
+    per (giorno ordine, partner, categoria prodotto, stato ordine).
+    Alimenta report commissioni ed export (vedi orders/facts.py).
+
+    Conteggio ordini senza doppi conteggi sommando più righe di fatto:
+    - order_count: ordini attribuiti al bucket della loro prima riga con commissione
+    - partner_order_count: ordini attribuiti al bucket della prima riga del partner
+      (somma per partner = ordini distinti del partner)
+    """
+
+    day = models.DateField("Giorno")
+    partner = models.ForeignKey(
+        "partners.PartnerProfile",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="commission_facts",
+    )
+    category = models.ForeignKey(
+        "catalog.Category",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="commission_facts",
+    )
+    order_status = models.CharField("Stato ordine", max_length=20)
+
+    revenue = models.DecimalField("Fatturato", max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    commission = models.DecimalField(
+        "Commissioni portale", max_digits=14, decimal_places=2, default=Decimal("0.00")
+    )
+    partner_earnings = models.DecimalField(
+        "Guadagno partner", max_digits=14, decimal_places=2, default=Decimal("0.00")
+    )
+    item_count = models.PositiveIntegerField("Righe", default=0)
+    order_count = models.PositiveIntegerField("Ordini", default=0)
+    partner_order_count = models.PositiveIntegerField("Ordini partner", default=0)
+
+    class Meta:
+        verbose_name = "Fatto giornaliero commissioni"
+        verbose_name_plural = "Fatti giornalieri commissioni"
+        indexes = [
+            models.Index(fields=["day", "partner"], name="orders_cdf_day_partner_idx"),
+            models.Index(fields=["partner", "day"], name="orders_cdf_partner_day_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.day} / partner {self.partner_id} / cat. {self.category_id} ({self.order_status})"
+
+
+class CommissionFactDirtyDay(models.Model):
+    """
+    Coda dei giorni da ricalcolare in CommissionDailyFact: popolata dai save()
+    che cambiano dati rilevanti (righe, importi, stato ordine), svuotata da
+    orders.facts.refresh_commission_facts().
+    """
+
+    day = models.DateField("Giorno", unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Giorno da ricalcolare (commissioni)"
+        verbose_name_plural = "Giorni da ricalcolare (commissioni)"
+
+    def __str__(self) -> str:
+        return str(self.day)
+
+    @classmethod
+    def mark(cls, *days):
+        """Mette in coda i giorni indicati (già in coda → ignorati), con un solo INSERT."""
+        days = {day for day in days if day is not None}
+        if days:
+            cls.objects.bulk_create([cls(day=day) for day in days], ignore_conflicts=True)
+
+    @classmethod
+    def mark_datetime(cls, value):
+        """Mette in coda il giorno (ora locale) della data/ora indicata (None ignorato)."""
+        if value is not None:
+            cls.mark(timezone.localdate(value))
+
+    @classmethod
+    def mark_order(cls, order):
+        """Mette in coda il giorno (ora locale) di creazione dell'ordine."""
+        if order is not None:
+            cls.mark_datetime(order.created_at)
+
+
+
+class ReportGeneration(models.Model):
+    """
+    Generazione dei dati dei report (una sola riga, vedi
+    b2b_portale/report_generation.py). Sta nel DB e non nella cache perché
+    la cache di default è locale al processo: con più worker ognuno avrebbe
+    la sua generazione e una scrittura non invaliderebbe i report degli altri.
+    """
+
+    value = models.BigIntegerField("Generazione")
+
+    class Meta:
+        verbose_name = "Generazione dati report"
+        verbose_name_plural = "Generazione dati report"
+
+    def __str__(self) -> str:
+        return str(self.value)
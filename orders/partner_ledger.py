@@ -0,0 +1,371 @@
+"""
+Registro contabile dei partner (PartnerLedgerEntry): maturato, pagato e
+saldo progressivi, senza aggregare righe e payout a ogni lettura.
+
+Ogni evento che cambia quanto è dovuto a un partner aggiunge una voce con i
+totali aggiornati:
+
+- riga completata (+ importo partner), riga che esce da "completato", ad es.
+  rifiutata (storno), importo partner cambiato su una riga completata
+  (rettifica): OrderItem.save() / OrderItem.delete() / Order.delete();
+- righe agganciate a un payout (voce informativa, totali invariati):
+  run_payouts, attach_partner_items;
+- payout pagato (o pagamento annullato): PartnerPayout.save(),
+  mark_payouts_paid.
+
+Le voci non vengono mai modificate: le correzioni sono nuove voci di
+rettifica (manage.py reconcile_partner_ledger --fix). I totali progressivi
+sono calcolati sotto lock_partners, quindi due scritture concorrenti sullo
+stesso partner non partono mai dallo stesso saldo; il saldo attuale è
+l'ultima voce del partner (indice partner, id).
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from partners.models import PartnerProfile
+
+from .models import OrderItem, PartnerLedgerEntry, PartnerPayout
+
+ZERO = Decimal("0.00")
+# voci per INSERT
+BATCH_SIZE = 1000
+# voci per pagina del registro (pagina commissioni partner)
+PAGE_SIZE = 25
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _money_sum(expression, **extra):
+    return Coalesce(Sum(expression, **extra), Value(ZERO), output_field=_MONEY)
+
+
+def _cents(value):
+    # somme su SQLite (REAL): arrotondate al centesimo prima dei confronti
+    return Decimal(value).quantize(ZERO)
+
+
+def lock_partners(partners):
+    """
+    Serializza fino a fine transazione le operazioni contabili (registro,
+    payout) dei partner indicati (queryset di PartnerProfile). Va chiamata
+    come prima istruzione della transazione.
+
+    Con lock di riga (PostgreSQL): SELECT ... FOR UPDATE sui partner.
+    SQLite ha solo il lock dell'intero database: un UPDATE neutro prende
+    subito il lock di scrittura, così una transazione concorrente attende
+    qui invece di leggere righe o saldi che stanno per cambiare.
+    """
+    if connection.features.has_select_for_update:
+        list(partners.select_for_update().values_list("pk", flat=True))
+    else:
+        partners.update(id=F("id"))
+
+
+def _latest_entries(entries):
+    """{partner_id: ultima voce (maturato, pagato, saldo)} tra le voci del queryset."""
+    last_ids = entries.values("partner_id").annotate(last=Max("pk")).values("last").order_by()
+    rows = PartnerLedgerEntry.objects.filter(pk__in=last_ids).values(
+        "partner_id", "earned_total", "paid_total", "balance"
+    )
+    return {row["partner_id"]: row for row in rows}
+
+
+def append_entries(entries):
+    """
+    Salva le voci (PartnerLedgerEntry non salvate, nell'ordine dato)
+    calcolando i totali progressivi di ciascun partner a partire dalla sua
+    ultima voce. Il chiamante tiene il lock dei partner (lock_partners)
+    nella transazione in corso.
+    """
+    if not entries:
+        return []
+    latest = _latest_entries(
+        PartnerLedgerEntry.objects.filter(partner_id__in={entry.partner_id for entry in entries})
+    )
+    totals = {partner_id: (row["earned_total"], row["paid_total"]) for partner_id, row in latest.items()}
+    for entry in entries:
+        earned, paid = totals.get(entry.partner_id, (ZERO, ZERO))
+        if entry.kind in PartnerLedgerEntry.EARNED_KINDS:
+            earned += entry.amount
+        elif entry.kind in PartnerLedgerEntry.PAID_KINDS:
+            paid += entry.amount
+        entry.earned_total, entry.paid_total, entry.balance = earned, paid, earned - paid
+        totals[entry.partner_id] = (earned, paid)
+    return PartnerLedgerEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+
+def record(entries):
+    """
+    append_entries con lock dei partner coinvolti, in una transazione propria
+    o in quella già aperta dal chiamante (senza savepoint).
+    """
+    if not entries:
+        return []
+    with transaction.atomic(savepoint=False):
+        lock_partners(PartnerProfile.objects.filter(pk__in={entry.partner_id for entry in entries}))
+        return append_entries(entries)
+
+
+# ------------------------------------------------------------
+#   Voci per evento
+# ------------------------------------------------------------
+
+def _matured(status, partner_id, earnings):
+    """Contributo di una riga al maturato del partner: importo partner se completata."""
+    if status == OrderItem.PARTNER_STATUS_COMPLETED and partner_id is not None:
+        return earnings or ZERO
+    return ZERO
+
+
+def item_entries(item, previous_status=None, previous_partner_id=None, previous_earnings=None):
+    """
+    Voci per il salvataggio di una riga, dato lo stato precedente (None per
+    una riga nuova): completamento, storno o rettifica del maturato.
+    """
+    before = _matured(previous_status, previous_partner_id, previous_earnings)
+    after = _matured(item.partner_status, item.partner_id, item.partner_earnings)
+
+    if previous_partner_id != item.partner_id:
+        entries = []
+        if before:
+            entries.append(PartnerLedgerEntry(
+                partner_id=previous_partner_id,
+                kind=PartnerLedgerEntry.KIND_REVERSED,
+                amount=-before,
+                order_item=item,
+                note="Riga assegnata a un altro partner",
+            ))
+        if after:
+            entries.append(PartnerLedgerEntry(
+                partner_id=item.partner_id, kind=PartnerLedgerEntry.KIND_EARNED, amount=after, order_item=item
+            ))
+        return entries
+
+    delta = after - before
+    if not delta:
+        return []
+    if not before:
+        kind = PartnerLedgerEntry.KIND_EARNED
+    elif not after:
+        kind = PartnerLedgerEntry.KIND_REVERSED
+    else:
+        kind = PartnerLedgerEntry.KIND_ADJUSTED
+    return [PartnerLedgerEntry(partner_id=item.partner_id, kind=kind, amount=delta, order_item=item)]
+
+
+def deleted_item_entries(item):
+    """Storno del maturato di una riga eliminata (nessuna voce se non era completata)."""
+    amount = _matured(item.partner_status, item.partner_id, item.partner_earnings)
+    if not amount:
+        return []
+    return [PartnerLedgerEntry(
+        partner_id=item.partner_id,
+        kind=PartnerLedgerEntry.KIND_REVERSED,
+        amount=-amount,
+        note=f"Riga #{item.pk} dell'ordine #{item.order_id} eliminata",
+    )]
+
+
+def attach_entry(payout, items_count, amount):
+    """Voce informativa per righe agganciate a un payout."""
+    return PartnerLedgerEntry(
+        partner_id=payout.partner_id,
+        kind=PartnerLedgerEntry.KIND_ATTACHED,
+        amount=amount,
+        payout=payout,
+        note=f"{items_count} righe",
+    )
+
+
+def payout_paid_entry(payout, cancelled=False):
+    """Pagamento del payout (importo negativo se il pagamento viene annullato)."""
+    return PartnerLedgerEntry(
+        partner_id=payout.partner_id,
+        kind=PartnerLedgerEntry.KIND_PAID,
+        amount=-payout.total_commission if cancelled else payout.total_commission,
+        payout=payout,
+        note="Pagamento annullato" if cancelled else "",
+    )
+
+
+# ------------------------------------------------------------
+#   Letture
+# ------------------------------------------------------------
+
+def partner_balance(partner):
+    """Totali attuali del partner {"earned_total", "paid_total", "balance"} (zero senza voci)."""
+    row = (
+        PartnerLedgerEntry.objects
+        .filter(partner=partner)
+        .order_by("-pk")
+        .values("earned_total", "paid_total", "balance")
+        .first()
+    )
+    return row or {"earned_total": ZERO, "paid_total": ZERO, "balance": ZERO}
+
+
+def latest_value(field="balance"):
+    """Espressione per annotare PartnerProfile con un totale della sua ultima voce."""
+    return Coalesce(
+        Subquery(
+            PartnerLedgerEntry.objects
+            .filter(partner=OuterRef("pk"))
+            .order_by("-pk")
+            .values(field)[:1]
+        ),
+        Value(ZERO),
+        output_field=_MONEY,
+    )
+
+
+class LedgerPage:
+    """Pagina di voci del registro con i cursori (id) per la pagina successiva/precedente."""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next and bool(object_list)
+        self.has_previous = has_previous and bool(object_list)
+        self.next_cursor = object_list[-1].pk if self.has_next else ""
+        self.previous_cursor = object_list[0].pk if self.has_previous else ""
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _cursor(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def ledger_page(partner, per_page=PAGE_SIZE, after=None, before=None):
+    """
+    Voci del partner dalla più recente, a cursore sull'id come il catalogo
+    (nessun COUNT né OFFSET: ogni pagina legge per_page + 1 voci dall'indice).
+
+    - ``after``: id dell'ultima voce della pagina precedente (avanti)
+    - ``before``: id della prima voce della pagina successiva (indietro)
+    Un cursore non valido riporta alla prima pagina.
+    """
+    entries = PartnerLedgerEntry.objects.filter(partner=partner).select_related("order_item", "payout")
+    after, before = _cursor(after), _cursor(before)
+
+    if before is not None:
+        rows = list(entries.filter(pk__gt=before).order_by("pk")[: per_page + 1])
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        rows.reverse()
+        return LedgerPage(rows, has_next=True, has_previous=has_more)
+
+    if after is not None:
+        entries = entries.filter(pk__lt=after)
+    rows = list(entries.order_by("-pk")[: per_page + 1])
+    return LedgerPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after is not None)
+
+
+# ------------------------------------------------------------
+#   Riconciliazione
+# ------------------------------------------------------------
+
+def reconcile(partner_ids=None):
+    """
+    Confronta il registro con righe d'ordine e payout, per partner:
+
+    - maturato: importo partner delle righe completate;
+    - pagato: totale dei payout in stato "Pagato";
+    - coerenza delle voci: somma dei movimenti = totali dell'ultima voce.
+
+    Restituisce solo i partner con differenze, ordinati per id:
+    [{"partner_id", "earned", "expected_earned", "paid", "expected_paid", "consistent"}]
+    """
+    items = OrderItem.objects.filter(partner_status=OrderItem.PARTNER_STATUS_COMPLETED, partner__isnull=False)
+    payouts = PartnerPayout.objects.filter(status=PartnerPayout.STATUS_PAID)
+    entries = PartnerLedgerEntry.objects.all()
+    if partner_ids is not None:
+        items = items.filter(partner_id__in=partner_ids)
+        payouts = payouts.filter(partner_id__in=partner_ids)
+        entries = entries.filter(partner_id__in=partner_ids)
+
+    expected_earned = {
+        partner_id: _cents(total)
+        for partner_id, total in items.values("partner_id").annotate(total=_money_sum("partner_earnings"))
+        .order_by().values_list("partner_id", "total")
+    }
+    expected_paid = {
+        partner_id: _cents(total)
+        for partner_id, total in payouts.values("partner_id").annotate(total=_money_sum("total_commission"))
+        .order_by().values_list("partner_id", "total")
+    }
+    movements = {
+        row["partner_id"]: {"earned": _cents(row["earned"]), "paid": _cents(row["paid"])}
+        for row in entries.values("partner_id").annotate(
+            earned=_money_sum("amount", filter=Q(kind__in=PartnerLedgerEntry.EARNED_KINDS)),
+            paid=_money_sum("amount", filter=Q(kind__in=PartnerLedgerEntry.PAID_KINDS)),
+        ).order_by()
+    }
+    latest = _latest_entries(entries)
+
+    differences = []
+    for partner_id in sorted({*expected_earned, *expected_paid, *latest}):
+        last = latest.get(partner_id, {"earned_total": ZERO, "paid_total": ZERO, "balance": ZERO})
+        moved = movements.get(partner_id, {"earned": ZERO, "paid": ZERO})
+        consistent = (
+            moved["earned"] == last["earned_total"]
+            and moved["paid"] == last["paid_total"]
+            and last["balance"] == last["earned_total"] - last["paid_total"]
+        )
+        row = {
+            "partner_id": partner_id,
+            "earned": last["earned_total"],
+            "expected_earned": expected_earned.get(partner_id, ZERO),
+            "paid": last["paid_total"],
+            "expected_paid": expected_paid.get(partner_id, ZERO),
+            "consistent": consistent,
+        }
+        if not consistent or row["earned"] != row["expected_earned"] or row["paid"] != row["expected_paid"]:
+            differences.append(row)
+    return differences
+
+
+def fix_ledger(partner_ids=None, note="Rettifica da riconciliazione"):
+    """
+    Allinea maturato e pagato del registro a righe e payout con voci di
+    rettifica (ricalcolando le differenze sotto lock). Restituisce le voci
+    create; le voci incoerenti non si correggono con rettifiche e restano
+    segnalate da reconcile().
+    """
+    with transaction.atomic():
+        if partner_ids is None:
+            lock_partners(PartnerProfile.objects.all())
+        else:
+            lock_partners(PartnerProfile.objects.filter(pk__in=partner_ids))
+        entries = []
+        for row in reconcile(partner_ids):
+            if row["earned"] != row["expected_earned"]:
+                entries.append(PartnerLedgerEntry(
+                    partner_id=row["partner_id"],
+                    kind=PartnerLedgerEntry.KIND_ADJUSTED,
+                    amount=row["expected_earned"] - row["earned"],
+                    note=note,
+                ))
+            if row["paid"] != row["expected_paid"]:
+                entries.append(PartnerLedgerEntry(
+                    partner_id=row["partner_id"],
+                    kind=PartnerLedgerEntry.KIND_PAID,
+                    amount=row["expected_paid"] - row["paid"],
+                    note=note,
+                ))
+        return append_entries(entries)
@@ -0,0 +1,208 @@
+"""
+Conferma di pagamento dei payout in blocco e ricevute PDF fuori dalla richiesta.
+
+- mark_payouts_paid(): in una transazione porta N payout a "Pagato" con un
+  UPDATE, liquida le righe agganciate con un UPDATE (stesso perimetro di
+  PartnerPayout.liquidate_items, fallback legacy solo per i payout senza
+  righe da liquidare), registra i pagamenti nel registro partner, riallinea il
+  lock contabile con un UPDATE e mette in coda le ricevute mancanti
+  (PayoutReceiptJob). La richiesta non genera PDF.
+- mark_payouts_confirmed(): riporta N payout a "Confermato", stornando nel
+  registro partner i pagamenti di quelli che erano pagati.
+- run_receipt_job(): prende in carico un job (UPDATE condizionato sullo
+  stato: due worker non eseguono mai lo stesso job) e ne genera le ricevute,
+  in un pool di processi (WeasyPrint è CPU-bound), aggiornando i contatori di
+  avanzamento del job a ogni PDF prodotto. Eseguita dal comando
+  process_payout_receipts.
+- requeue_stale_receipt_jobs(): rimette in coda i job "in corso" senza
+  avanzamenti da STALE_AFTER (worker terminato a metà job).
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from b2b_portale.report_generation import bump_report_generation
+from partners.models import PartnerProfile
+
+from .models import Order, OrderItem, PartnerPayout, PayoutReceiptJob
+from .partner_ledger import append_entries, lock_partners, payout_paid_entry
+from .pdf_utils import cached_payout_pdf_bytes
+
+# job "in corso" senza avanzamenti (nessun PDF prodotto) da più di così: worker perso
+STALE_AFTER = timedelta(minutes=30)
+
+
+def _without_receipt(payouts):
+    return payouts.filter(Q(payment_receipt="") | Q(payment_receipt__isnull=True))
+
+
+def enqueue_receipts(payout_ids, user=None):
+    """Job di generazione per i payout indicati ancora senza ricevuta (None se non ce ne sono)."""
+    ids = list(
+        _without_receipt(PartnerPayout.objects.filter(pk__in=payout_ids)).values_list("pk", flat=True)
+    )
+    if not ids:
+        return None
+    job = PayoutReceiptJob.objects.create(total=len(ids), created_by=user)
+    job.payouts.add(*ids)
+    return job
+
+
+def mark_payouts_paid(payouts, user=None):
+    """
+    Segna come pagati i payout del queryset (quelli già pagati sono ignorati)
+    e liquida le loro righe. Restituisce {"paid", "items", "job"}.
+    """
+    with transaction.atomic():
+        lock_partners(PartnerProfile.objects.filter(pk__in=payouts.values("partner_id")))
+        ids = list(payouts.exclude(status=PartnerPayout.STATUS_PAID).values_list("pk", flat=True))
+        if not ids:
+            return {"paid": 0, "items": 0, "job": None}
+
+        now = timezone.now()
+        PartnerPayout.objects.filter(pk__in=ids).update(
+            status=PartnerPayout.STATUS_PAID,
+            paid_at=Coalesce(F("paid_at"), now),
+            updated_at=now,
+        )
+
+        to_liquidate = OrderItem.objects.filter(
+            payout_id__in=ids,
+            commission_amount__gt=0,
+            partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
+            is_liquidated=False,
+        )
+        with_items = set(to_liquidate.values_list("payout_id", flat=True).distinct())
+        liquidated = to_liquidate.update(is_liquidated=True)
+        # payout legacy senza righe agganciate da liquidare: fallback per periodo (raro)
+        for payout in PartnerPayout.objects.filter(pk__in=set(ids) - with_items).select_related("partner"):
+            liquidated += payout.liquidate_items()
+
+        # registro partner: un pagamento per payout
+        paid = PartnerPayout.objects.filter(pk__in=ids).only("pk", "partner", "total_commission").order_by("pk")
+        append_entries([payout_paid_entry(payout) for payout in paid])
+        Order.refresh_accounting_lock(OrderItem.objects.filter(payout_id__in=ids).values("order_id"))
+        bump_report_generation()
+        job = enqueue_receipts(ids, user=user)
+
+    return {"paid": len(ids), "items": liquidated, "job": job}
+
+
+def mark_payouts_confirmed(payouts):
+    """
+    Porta a "Confermato" i payout del queryset. Per quelli che erano pagati
+    il registro partner riceve lo storno del pagamento (come
+    PartnerPayout.save). Restituisce {"confirmed", "cancelled"}.
+    """
+    with transaction.atomic():
+        lock_partners(PartnerProfile.objects.filter(pk__in=payouts.values("partner_id")))
+        ids = list(payouts.values_list("pk", flat=True))
+        paid = list(
+            PartnerPayout.objects.filter(pk__in=ids, status=PartnerPayout.STATUS_PAID)
+            .only("pk", "partner", "total_commission")
+            .order_by("pk")
+        )
+        confirmed = PartnerPayout.objects.filter(pk__in=ids).update(
+            status=PartnerPayout.STATUS_CONFIRMED, updated_at=timezone.now()
+        )
+        append_entries([payout_paid_entry(payout, cancelled=True) for payout in paid])
+        Order.refresh_accounting_lock(OrderItem.objects.filter(payout_id__in=ids).values("order_id"))
+        bump_report_generation()
+
+    return {"confirmed": confirmed, "cancelled": len(paid)}
+
+
+def _render_pdf(payout):
+    # PDF dalla cache su storage se lo stesso payout è già stato scaricato / generato
+    return cached_payout_pdf_bytes(payout)
+
+
+def render_receipt(payout_id):
+    """
+    Genera e salva la ricevuta di un payout (se ancora mancante).
+    Eseguibile in un processo separato: restituisce (payout_id, errore o None).
+    """
+    try:
+        payout = PartnerPayout.objects.select_related("partner", "partner__user").get(pk=payout_id)
+        if payout.payment_receipt:
+            return payout_id, None
+        pdf_bytes = _render_pdf(payout)
+        payout.payment_receipt.save(f"payout_{payout.pk}.pdf", ContentFile(pdf_bytes), save=False)
+        # solo il campo file: nessun effetto collaterale di PartnerPayout.save()
+        PartnerPayout.objects.filter(pk=payout.pk).update(payment_receipt=payout.payment_receipt.name)
+    except Exception as exc:
+        return payout_id, f"payout #{payout_id}: {exc}"
+    return payout_id, None
+
+
+def requeue_stale_receipt_jobs(now=None):
+    """
+    Rimette in coda i job rimasti "in corso" senza avanzamenti da STALE_AFTER
+    (worker terminato o riavviato a metà job). Restituisce quanti.
+    Le ricevute già salvate non vengono rigenerate (render_receipt le salta).
+    """
+    now = now or timezone.now()
+    return PayoutReceiptJob.objects.filter(
+        status=PayoutReceiptJob.STATUS_RUNNING,
+        heartbeat_at__lt=now - STALE_AFTER,
+    ).update(status=PayoutReceiptJob.STATUS_PENDING)
+
+
+def claim_receipt_job(job, statuses=(PayoutReceiptJob.STATUS_PENDING,)):
+    """
+    Prende in carico il job se è in uno degli stati indicati, con un solo
+    UPDATE condizionato: fra più worker (cron sovrapposti) lo vince uno solo.
+    I contatori ripartono da zero (le ricevute già presenti contano come fatte).
+    """
+    now = timezone.now()
+    return bool(
+        PayoutReceiptJob.objects.filter(pk=job.pk, status__in=statuses).update(
+            status=PayoutReceiptJob.STATUS_RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+            finished_at=None,
+            done=0,
+            failed=0,
+            last_error="",
+        )
+    )
+
+
+def run_receipt_job(job, workers=1, statuses=(PayoutReceiptJob.STATUS_PENDING,)):
+    """
+    Genera le ricevute del job (workers > 1: pool di processi) aggiornando
+    done / failed a ogni PDF. Restituisce il job aggiornato, oppure None se
+    il job non era in uno degli stati indicati (già preso da un altro worker).
+    """
+    if not claim_receipt_job(job, statuses):
+        return None
+    payout_ids = list(job.payouts.order_by("pk").values_list("pk", flat=True))
+
+    if workers > 1 and len(payout_ids) > 1:
+        # i processi figli aprono connessioni proprie
+        connections.close_all()
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+            _track(job, pool.map(render_receipt, payout_ids))
+    else:
+        _track(job, map(render_receipt, payout_ids))
+
+    job.refresh_from_db()
+    job.status = PayoutReceiptJob.STATUS_FAILED if job.failed else PayoutReceiptJob.STATUS_DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at"])
+    return job
+
+
+def _track(job, results):
+    jobs = PayoutReceiptJob.objects.filter(pk=job.pk)
+    for _, error in results:
+        if error:
+            jobs.update(failed=F("failed") + 1, last_error=error, heartbeat_at=timezone.now())
+        else:
+            jobs.update(done=F("done") + 1, heartbeat_at=timezone.now())
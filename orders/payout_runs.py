@@ -0,0 +1,326 @@
+"""
+Payout run di fine periodo: bozze PartnerPayout per tutti i partner in blocco
+(comando manage.py generate_partner_payout, backoffice "Payout run"), e
+aggancio delle righe di un singolo partner da backoffice
+(attach_partner_items, vista partner_payout_create).
+
+Righe pagabili del periodo: ordine e riga completati, commissione > 0, non
+liquidate e non ancora agganciate a un payout (stesso perimetro di
+PartnerPayout.liquidate_items).
+
+- Anteprima (payout_run_preview): una query di aggregazione per partner sulle
+  righe pagabili + una sulle bozze già esistenti del periodo; per ogni
+  partner: righe e importo nuovi, bozza attuale e totale risultante.
+- Esecuzione (run_payouts), in una transazione: bulk_create delle bozze
+  mancanti, aggancio delle righe con un UPDATE a blocchi di partner
+  (CASE partner -> payout), totali ricalcolati dalle righe agganciate e
+  salvati con bulk_update, lock contabile riallineato con un solo UPDATE.
+
+Il run si può ripetere: le righe già agganciate non sono più pagabili, quelle
+nuove finiscono nella bozza esistente del partner (o in una nuova bozza se il
+payout del periodo è già confermato / pagato). Il totale di ogni bozza
+toccata è sempre la somma delle sue righe (importo partner).
+
+Concorrenza: run e aggancio singolo bloccano per prima cosa i partner
+coinvolti (lock_partners), quindi due operazioni sugli stessi partner non
+leggono mai le stesse righe libere; ogni aggancio scrive una voce
+PartnerPayoutAttachLog (una per payout, non per riga) e la corrispondente
+voce informativa del registro partner (orders/partner_ledger.py).
+"""
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, DecimalField, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from b2b_portale.periods import period_q
+from b2b_portale.report_generation import bump_report_generation
+from partners.models import PartnerProfile
+
+from .models import CommissionFactDirtyDay, Order, OrderItem, PartnerPayout, PartnerPayoutAttachLog
+from .partner_ledger import append_entries, attach_entry, item_entries, lock_partners
+
+# partner per UPDATE di aggancio (due parametri per ramo del CASE)
+PARTNER_BATCH = 400
+# righe per UPDATE / bulk_update nell'aggancio di un singolo partner
+BATCH_SIZE = 1000
+
+ACTION_CREATE = "create"
+ACTION_UPDATE = "update"
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _money_sum(expression):
+    return Coalesce(Sum(expression), Value(Decimal("0.00")), output_field=_MONEY)
+
+
+def payable_items(period_start, period_end):
+    """Righe pagabili del periodo [period_start, period_end], non ancora in un payout."""
+    return OrderItem.objects.filter(
+        period_q("order_created_at", period_start, period_end),
+        order_status=Order.STATUS_COMPLETED,
+        partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
+        commission_amount__gt=0,
+        is_liquidated=False,
+        payout__isnull=True,
+        partner__isnull=False,
+    )
+
+
+def partner_open_items(partner, period_start, period_end):
+    """
+    Righe del partner nel periodo non liquidate e non agganciate: perimetro
+    della creazione payout da backoffice (qualunque stato riga / ordine).
+    """
+    return OrderItem.objects.filter(
+        period_q("order_created_at", period_start, period_end),
+        partner=partner,
+        is_liquidated=False,
+        payout__isnull=True,
+    )
+
+
+def _locked(queryset):
+    """
+    SELECT ... FOR UPDATE delle righe (SKIP LOCKED dove supportato: le righe
+    bloccate da un'altra transazione restano a lei). Su SQLite invariato: la
+    transazione è già serializzata da lock_partners.
+    """
+    features = connection.features
+    if not features.has_select_for_update:
+        return queryset
+    return queryset.select_for_update(skip_locked=features.has_select_for_update_skip_locked)
+
+
+def _drafts_by_partner(period_start, period_end, partner_ids):
+    """
+    Bozza del periodo per partner (la più recente se ce n'è più d'una), con
+    righe già agganciate e relativo importo (attached_count / attached_total).
+    """
+    drafts = (
+        PartnerPayout.objects
+        .filter(
+            partner_id__in=partner_ids,
+            period_start=period_start,
+            period_end=period_end,
+            status=PartnerPayout.STATUS_DRAFT,
+        )
+        .annotate(attached_count=Count("items"), attached_total=_money_sum("items__partner_earnings"))
+        .order_by("pk")
+    )
+    return {draft.partner_id: draft for draft in drafts}
+
+
+def payout_run_preview(period_start, period_end):
+    """
+    Differenze che il run applicherebbe, una riga per partner con righe
+    pagabili (ordinate per ragione sociale):
+
+        {"partner_id", "company_name", "items", "amount",
+         "payout_id", "current_total", "total", "action"}
+
+    action è ACTION_CREATE (nuova bozza) o ACTION_UPDATE (righe aggiunte alla
+    bozza payout_id, che passa da current_total a total).
+    """
+    rows = list(
+        payable_items(period_start, period_end)
+        .values("partner_id", "partner__company_name")
+        .annotate(items=Count("pk"), amount=_money_sum("partner_earnings"))
+        .order_by("partner__company_name", "partner_id")
+    )
+    drafts = _drafts_by_partner(period_start, period_end, [row["partner_id"] for row in rows])
+
+    preview = []
+    for row in rows:
+        draft = drafts.get(row["partner_id"])
+        current_total = draft.total_commission if draft else Decimal("0.00")
+        preview.append({
+            "partner_id": row["partner_id"],
+            "company_name": row["partner__company_name"],
+            "items": row["items"],
+            "amount": row["amount"],
+            "payout_id": draft.pk if draft else None,
+            "current_total": current_total,
+            "total": current_total + row["amount"],
+            "action": ACTION_UPDATE if draft else ACTION_CREATE,
+        })
+    return preview
+
+
+def _attach_items(period_start, period_end, payout_by_partner):
+    """Aggancia le righe pagabili ai payout indicati ({partner_id: payout_id}); restituisce le righe agganciate."""
+    partner_ids = list(payout_by_partner)
+    attached = 0
+    for offset in range(0, len(partner_ids), PARTNER_BATCH):
+        batch = partner_ids[offset:offset + PARTNER_BATCH]
+        attached += payable_items(period_start, period_end).filter(partner_id__in=batch).update(
+            payout_id=Case(
+                *[When(partner_id=partner_id, then=Value(payout_by_partner[partner_id])) for partner_id in batch],
+                output_field=models.IntegerField(),
+            )
+        )
+    return attached
+
+
+def _attached_totals(payouts):
+    """{payout_id: (righe agganciate, importo partner)} con una query di aggregazione."""
+    rows = (
+        OrderItem.objects
+        .filter(payout__in=payouts)
+        .values("payout_id")
+        .annotate(count=Count("pk"), total=_money_sum("partner_earnings"))
+        .order_by()
+    )
+    return {row["payout_id"]: (row["count"], row["total"]) for row in rows}
+
+
+def run_payouts(period_start, period_end, user=None):
+    """
+    Esegue il payout run del periodo in una transazione.
+    Restituisce {"created": [...], "updated": [...], "items": righe agganciate}
+    con i PartnerPayout creati e le bozze aggiornate (totali già ricalcolati).
+    """
+    with transaction.atomic():
+        payable = payable_items(period_start, period_end)
+        lock_partners(PartnerProfile.objects.filter(pk__in=payable.values("partner_id")))
+        partner_ids = list(
+            payable
+            .values_list("partner_id", flat=True)
+            .distinct()
+            .order_by("partner_id")
+        )
+        if not partner_ids:
+            return {"created": [], "updated": [], "items": 0}
+
+        drafts = _drafts_by_partner(period_start, period_end, partner_ids)
+        before = {draft.pk: (draft.attached_count, draft.attached_total) for draft in drafts.values()}
+        created = PartnerPayout.objects.bulk_create(
+            PartnerPayout(
+                partner_id=partner_id,
+                period_start=period_start,
+                period_end=period_end,
+                status=PartnerPayout.STATUS_DRAFT,
+            )
+            for partner_id in partner_ids
+            if partner_id not in drafts
+        )
+        payouts = [*created, *drafts.values()]
+        attached = _attach_items(
+            period_start, period_end, {payout.partner_id: payout.pk for payout in payouts}
+        )
+
+        after = _attached_totals(payouts)
+        now = timezone.now()
+        logs = []
+        for payout in payouts:
+            count, total = after.get(payout.pk, (0, Decimal("0.00")))
+            previous_count, previous_total = before.get(payout.pk, (0, Decimal("0.00")))
+            payout.total_commission = total
+            payout.updated_at = now
+            logs.append(PartnerPayoutAttachLog(
+                payout=payout,
+                source=PartnerPayoutAttachLog.SOURCE_RUN,
+                items_count=count - previous_count,
+                amount=total - previous_total,
+                total_after=total,
+                created_by=user,
+            ))
+        PartnerPayout.objects.bulk_update(payouts, ["total_commission", "updated_at"])
+        PartnerPayoutAttachLog.objects.bulk_create(logs)
+        append_entries([attach_entry(log.payout, log.items_count, log.amount) for log in logs])
+
+        Order.refresh_accounting_lock(OrderItem.objects.filter(payout__in=payouts).values("order_id"))
+        bump_report_generation()
+
+    return {"created": created, "updated": list(drafts.values()), "items": attached}
+
+
+def attach_partner_items(partner, period_start, period_end, user=None):
+    """
+    Aggancia le righe aperte del partner nel periodo (partner_open_items) alla
+    sua bozza del periodo, creandola se non esiste. In una transazione:
+
+    - lock del partner e delle righe (FOR UPDATE / SKIP LOCKED; su SQLite
+      transazione serializzata): due richieste contemporanee non contano mai
+      la stessa riga in due bozze;
+    - commissioni mancanti ricalcolate in memoria e salvate con bulk_update;
+    - aggancio con UPDATE a blocchi di id, totale della bozza riletto una
+      volta sola dalle righe agganciate, una voce PartnerPayoutAttachLog.
+
+    Restituisce {"payout", "created", "items", "amount"}, oppure None se non
+    ci sono righe da agganciare.
+    """
+    with transaction.atomic():
+        lock_partners(PartnerProfile.objects.filter(pk=partner.pk))
+        items = list(
+            _locked(partner_open_items(partner, period_start, period_end))
+            .only(
+                "pk", "partner", "order_created_at", "partner_status", "total_price",
+                "commission_rate", "commission_amount", "partner_earnings",
+            )
+            .order_by("pk")
+        )
+        if not items:
+            return None
+
+        # commissioni non ancora calcolate (righe mai passate da "completato")
+        stale = [item for item in items if not item.commission_amount or not item.partner_earnings]
+        entries = []
+        for item in stale:
+            previous_earnings = item.partner_earnings
+            item.calculate_commission(
+                default_rate=item.commission_rate or partner.default_commission_percent or Decimal("0.00")
+            )
+            # righe già completate: il maturato del registro cambia con l'importo partner
+            entries += item_entries(item, item.partner_status, partner.pk, previous_earnings)
+        OrderItem.objects.bulk_update(
+            stale, ["commission_rate", "commission_amount", "partner_earnings"], batch_size=BATCH_SIZE
+        )
+        CommissionFactDirtyDay.mark(*{timezone.localdate(item.order_created_at) for item in stale})
+
+        payout = (
+            PartnerPayout.objects
+            .filter(
+                partner=partner,
+                period_start=period_start,
+                period_end=period_end,
+                status=PartnerPayout.STATUS_DRAFT,
+            )
+            .order_by("-pk")
+            .first()
+        )
+        created = payout is None
+        if created:
+            payout = PartnerPayout.objects.create(
+                partner=partner,
+                period_start=period_start,
+                period_end=period_end,
+                status=PartnerPayout.STATUS_DRAFT,
+            )
+
+        ids = [item.pk for item in items]
+        for offset in range(0, len(ids), BATCH_SIZE):
+            OrderItem.objects.filter(pk__in=ids[offset:offset + BATCH_SIZE]).update(payout=payout)
+
+        total = payout.items.aggregate(total=_money_sum("partner_earnings"))["total"]
+        payout.total_commission, payout.updated_at = total, timezone.now()
+        PartnerPayout.objects.filter(pk=payout.pk).update(
+            total_commission=payout.total_commission, updated_at=payout.updated_at
+        )
+
+        amount = sum((item.partner_earnings for item in items), Decimal("0.00"))
+        PartnerPayoutAttachLog.objects.create(
+            payout=payout,
+            source=PartnerPayoutAttachLog.SOURCE_BACKOFFICE,
+            items_count=len(items),
+            amount=amount,
+            total_after=total,
+            created_by=user,
+        )
+        append_entries([*entries, attach_entry(payout, len(items), amount)])
+        Order.refresh_accounting_lock(payout.items.values("order_id"))
+        bump_report_generation()
+
+    return {"payout": payout, "created": created, "items": len(items), "amount": amount}
@@ -1,25 +1,52 @@
+"""
+PDF dei payout (template backoffice/partner_payout_report.html, WeasyPrint).
+
+I PDF generati sono salvati su storage con un nome derivato dal contenuto
+che li determina: id del payout, updated_at e versione del template (hash
+del sorgente del template e dei template che estende / include, più
+PAYOUT_PDF_VERSION). Finché payout e template non cambiano, i download
+successivi leggono il file già pronto (cached_payout_pdf); una modifica del
+payout o del template produce un nome nuovo e le versioni precedenti vengono
+eliminate.
+
+updated_at del payout cambia anche quando cambiano i dati riportati nel PDF
+fuori dal payout: importi delle righe agganciate (OrderItem.save / delete) e
+ragione sociale del partner (PartnerProfile.save).
+"""
+import hashlib
 from decimal import Decimal
+from functools import lru_cache
 
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db.models import Sum, DecimalField, Value
 from django.db.models.functions import Coalesce
-from django.template.loader import render_to_string
-
-from weasyprint import HTML
+from django.template.loader import get_template, render_to_string
+from django.template.loader_tags import ExtendsNode, IncludeNode
 
 from .models import PartnerPayout  # adatta se il path è diverso
 
+PAYOUT_PDF_TEMPLATE = "backoffice/partner_payout_report.html"
+PAYOUT_PDF_DIR = "payout_pdfs"
+
+# da incrementare a mano per i cambi che l'hash dei template non vede:
+# include con nome dinamico, CSS / font esterni, versione di WeasyPrint
+PAYOUT_PDF_VERSION = 1
+
 
 def render_payout_pdf_bytes(payout: PartnerPayout) -> bytes:
     """
     Genera un PDF (bytes) per il payout usando il template
     backoffice/partner_payout_report.html
     """
+    # import locale: WeasyPrint serve solo quando si genera davvero un PDF
+    from weasyprint import HTML
 
     # Righe collegate a questo payout
     items_qs = (
         payout.items
         .select_related("order", "order__client", "product")
-        .order_by("order__created_at", "id")
+        .order_by("order_created_at", "id")
     )
 
     aggregates = items_qs.aggregate(
@@ -48,6 +75,81 @@ def render_payout_pdf_bytes(payout: PartnerPayout) -> bytes:
         "total_partner_net": aggregates["total_partner_net"],
     }
 
-    html = render_to_string("backoffice/partner_payout_report.html", context)
+    html = render_to_string(PAYOUT_PDF_TEMPLATE, context)
     pdf_bytes = HTML(string=html).write_pdf()
     return pdf_bytes
+
+
+def _template_sources(name, sources):
+    """Sorgenti del template e dei template che estende / include con nome costante."""
+    if name in sources:
+        return
+    template = get_template(name).template
+    sources[name] = template.source
+    for node_type, attr in ((ExtendsNode, "parent_name"), (IncludeNode, "template")):
+        for node in template.nodelist.get_nodes_by_type(node_type):
+            expression = getattr(node, attr)
+            # nome letterale ("base.html"): le variabili si risolvono solo al render
+            if isinstance(expression.var, str) and not expression.filters:
+                _template_sources(expression.var, sources)
+
+
+@lru_cache(maxsize=None)
+def payout_template_version() -> str:
+    """
+    Versione del template del PDF: hash dei sorgenti (template, extends e
+    include) e di PAYOUT_PDF_VERSION, calcolato una volta per processo.
+    """
+    sources = {}
+    _template_sources(PAYOUT_PDF_TEMPLATE, sources)
+    digest = hashlib.sha256(str(PAYOUT_PDF_VERSION).encode())
+    for name in sorted(sources):
+        digest.update(f"\0{name}\0{sources[name]}".encode())
+    return digest.hexdigest()[:12]
+
+
+def payout_pdf_name(payout: PartnerPayout) -> str:
+    """Nome su storage del PDF per lo stato attuale del payout e la versione del template."""
+    key = hashlib.sha256(
+        f"{payout.pk}:{payout.updated_at.isoformat()}:{payout_template_version()}".encode()
+    ).hexdigest()
+    return f"{PAYOUT_PDF_DIR}/{payout.pk}/{key[:24]}.pdf"
+
+
+def cached_payout_pdf(payout: PartnerPayout, storage=None) -> tuple[str, bool]:
+    """
+    Nome su storage del PDF del payout, generato solo se manca.
+    Restituisce (nome, True se è stato generato ora).
+    """
+    storage = storage or default_storage
+    name = payout_pdf_name(payout)
+    if storage.exists(name):
+        return name, False
+
+    saved = storage.save(name, ContentFile(render_payout_pdf_bytes(payout)))
+    # versioni precedenti (payout o template cambiati) non più raggiungibili
+    folder = f"{PAYOUT_PDF_DIR}/{payout.pk}"
+    for filename in storage.listdir(folder)[1]:
+        if f"{folder}/{filename}" not in (name, saved):
+            storage.delete(f"{folder}/{filename}")
+    return saved, True
+
+
+def cached_payout_pdf_bytes(payout: PartnerPayout) -> bytes:
+    """PDF del payout (bytes), dalla copia su storage se già generato."""
+    name, _ = cached_payout_pdf(payout)
+    with default_storage.open(name, "rb") as pdf:
+        return pdf.read()
+
+
+def render_payout_pdf_task(payout_id: int):
+    """
+    Genera (se manca) il PDF di un payout. Eseguibile in un processo separato:
+    restituisce (payout_id, True se generato ora, errore o None).
+    """
+    try:
+        payout = PartnerPayout.objects.select_related("partner", "partner__user").get(pk=payout_id)
+        _, rendered = cached_payout_pdf(payout)
+    except Exception as exc:
+        return payout_id, False, f"payout #{payout_id}: {exc}"
+    return payout_id, rendered, None
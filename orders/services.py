@@ -1,62 +1,152 @@
 from datetime import date
 from decimal import Decimal
 
-from django.db.models import Sum
+from django.db import transaction
 
-from .models import Order, OrderItem, PartnerPayout
-from partners.models import PartnerProfile
+from .models import CommissionFactDirtyDay, Order, OrderItem, PartnerPayout
+from .payout_runs import run_payouts
+from .shipping import calculate_shipping
+from .utils import CommissionRateResolver
+from b2b_portale.report_generation import bump_report_generation
+from catalog.models import Product
+from partners.counters import invalidate_partner_counters
+from partners.models import PartnerOrderSummary
 
 
-def build_partner_payouts(period_start: date, period_end: date) -> list[PartnerPayout]:
+class _SubtotalCart:
+    """Adattatore minimo per calculate_shipping() (che si aspetta un carrello)."""
+
+    def __init__(self, total):
+        self._total = total
+
+    def get_total_price(self):
+        return self._total
+
+
+def build_order(
+    *,
+    client,
+    structure,
+    lines,
+    shipping_cost=None,
+    use_partner_default_rate=False,
+    resolver=None,
+    created_at=None,
+    **order_fields,
+):
     """
-    Calcola/aggiorna i PartnerPayout per tutti i partner
-    nel periodo [period_start, period_end] compreso.
-
-    Logica:
-    - considera solo ordini COMPLETED
-    - somma le commissioni di OrderItem (commission_amount)
-    - per ogni partner fa get_or_create di un PartnerPayout
-      con quel periodo, e aggiorna total_commission.
+    Crea un Order con tutte le sue righe in poche query, indipendentemente
+    dal numero di righe:
+
+    - 1 query per prodotti + partner (select_related)
+    - al più 1 query per le commissioni categoria (CommissionRateResolver)
+    - 1 INSERT per l'ordine + 1 bulk_create per le righe
+
+    ``lines``: iterabile di (product_id, quantity) oppure
+    (product_id, quantity, unit_price). Senza unit_price si usa il
+    base_price corrente del prodotto. Righe con quantità <= 0 o prodotti
+    inesistenti vengono ignorate.
+
+    Commissione:
+    - default: priorità standard (prodotto > categoria > default partner)
+    - use_partner_default_rate=True: solo default del partner (checkout)
+
+    ``shipping_cost`` None -> calcolato con calculate_shipping().
+    ``created_at`` (opzionale, es. dati demo / import): data dell'ordine al
+    posto di "adesso", già riportata su righe e riepiloghi partner.
+    Gli altri kwargs (status, payment_method, notes, ...) vanno sull'Order.
+
+    Restituisce l'Order creato, oppure None se nessuna riga è valida.
     """
-    payouts = []
-
-    # Trova tutte le righe con commissioni in ordini completati nel periodo
-    items = (
-        OrderItem.objects
-        .filter(
-            order__status=Order.STATUS_COMPLETED,
-            order__created_at__date__gte=period_start,
-            order__created_at__date__lte=period_end,
-            partner__isnull=False,
-        )
-        .select_related("partner")
-    )
+    normalized = []
+    for line in lines:
+        product_id, quantity = line[0], int(line[1] or 0)
+        unit_price = line[2] if len(line) > 2 else None
+        if quantity > 0:
+            normalized.append((product_id, quantity, unit_price))
 
-    # Aggrega per partner
-    totals_by_partner = (
-        items
-        .values("partner")
-        .annotate(total_commission=Sum("commission_amount"))
+    products = Product.objects.select_related("supplier").in_bulk(
+        {product_id for product_id, _, _ in normalized}
     )
 
-    for row in totals_by_partner:
-        partner_id = row["partner"]
-        total_commission = row["total_commission"] or Decimal("0.00")
+    if resolver is None:
+        resolver = CommissionRateResolver()
+    if not use_partner_default_rate:
+        resolver.prime(
+            (products[pid].supplier_id, products[pid]) for pid, _, _ in normalized if pid in products
+        )
+
+    items = []
+    subtotal = Decimal("0.00")
+    for product_id, quantity, unit_price in normalized:
+        product = products.get(product_id)
+        if product is None:
+            continue
 
-        partner = PartnerProfile.objects.get(id=partner_id)
+        if unit_price is None:
+            unit_price = product.base_price or Decimal("0.00")
+        unit_price = Decimal(unit_price).quantize(Decimal("0.01"))
+        total_price = (unit_price * quantity).quantize(Decimal("0.01"))
 
-        payout, created = PartnerPayout.objects.get_or_create(
-            partner=partner,
-            period_start=period_start,
-            period_end=period_end,
-            defaults={"total_commission": total_commission},
+        item = OrderItem(
+            product=product,
+            partner=product.supplier,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_price=total_price,
+            partner_status=OrderItem.PARTNER_STATUS_PENDING,
         )
+        if use_partner_default_rate:
+            if item.partner:
+                item.calculate_commission(
+                    default_rate=item.partner.default_commission_percent or Decimal("0.00")
+                )
+        else:
+            item.calculate_commission(resolver=resolver)
+
+        items.append(item)
+        subtotal += total_price
 
-        if not created:
-            # Se esiste già, aggiorniamo l'importo (snapshot ricalcolabile)
-            payout.total_commission = total_commission
-            payout.save(update_fields=["total_commission", "updated_at"])
+    if not items:
+        return None
+
+    if shipping_cost is None:
+        shipping_cost = calculate_shipping(_SubtotalCart(subtotal), structure)
+    shipping_cost = (shipping_cost or Decimal("0.00")).quantize(Decimal("0.01"))
+
+    with transaction.atomic():
+        order = Order.objects.create(
+            client=client,
+            structure=structure,
+            subtotal=subtotal,
+            shipping_cost=shipping_cost,
+            total=subtotal + shipping_cost,
+            **order_fields,
+        )
+        if created_at is not None:
+            # created_at è auto_now_add: la data richiesta va scritta con un UPDATE
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+            order.created_at = created_at
+        for item in items:
+            item.order = order
+            item.order_created_at = order.created_at
+            item.order_status = order.status
+        OrderItem.objects.bulk_create(items)
 
-        payouts.append(payout)
+    partner_ids = {item.partner_id for item in items}
+    invalidate_partner_counters(*partner_ids)
+    PartnerOrderSummary.refresh(order.pk, partner_ids)
+    CommissionFactDirtyDay.mark_order(order)
+    bump_report_generation()
 
-    return payouts
+    return order
+
+
+def build_partner_payouts(period_start: date, period_end: date) -> list[PartnerPayout]:
+    """
+    Crea/aggiorna le bozze PartnerPayout di tutti i partner
+    nel periodo [period_start, period_end] compreso (payout run in blocco,
+    vedi orders.payout_runs). Restituisce i payout creati o aggiornati.
+    """
+    result = run_payouts(period_start, period_end)
+    return [*result["created"], *result["updated"]]
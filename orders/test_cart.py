@@ -1,9 +1,15 @@
 # orders/test_cart.py
 
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
 from catalog.models import Category, Product
-from .cart import Cart
+from .cart import CART_SUMMARY_SESSION_ID, Cart
 
 
 class DummySession(dict):
@@ -132,3 +138,74 @@ class CartTests(TestCase):
         self.assertEqual(len(new_cart), 0)
         if hasattr(new_cart, "is_empty"):
             self.assertTrue(new_cart.is_empty())
+
+    def test_reading_empty_cart_does_not_modify_session(self):
+        """
+        Istanziare e leggere un carrello vuoto non deve sporcare la sessione.
+        """
+        cart = Cart(self.request)
+        self.assertEqual(len(cart), 0)
+        self.assertEqual(cart.get_total_price(), 0)
+        self.assertTrue(cart.is_empty())
+        list(cart)
+
+        self.assertFalse(self.request.session.modified)
+        self.assertNotIn("cart", self.request.session)
+
+    def test_summary_is_stored_with_cart(self):
+        """
+        Il riepilogo (pezzi, totale) è salvato insieme al carrello.
+        """
+        self.product1.base_price = Decimal("12.50")
+        self.cart.add(self.product1, quantity=2)
+        self.cart.add(self.product2, quantity=1)
+
+        summary = self.request.session[CART_SUMMARY_SESSION_ID]
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(Decimal(summary["total"]), Decimal("25.00"))
+
+        # l'iterazione non altera i dati in sessione (restano serializzabili)
+        list(self.cart)
+        self.assertEqual(
+            self.request.session["cart"][str(self.product1.id)],
+            {"quantity": 2, "price": "12.50"},
+        )
+
+
+class CartSessionWriteTests(TestCase):
+    """
+    Le pagine visitate (GET) da un cliente non devono riscrivere la sessione
+    a causa del carrello (context processor cart_summary).
+    """
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username="client1", password="pass1234", role=User.ROLE_CLIENT
+        )
+        category = Category.objects.create(name="Categoria", slug="categoria")
+        self.product = Product.objects.create(
+            name="Prodotto", category=category, base_price=Decimal("10.00"), is_active=True
+        )
+        self.client.force_login(self.user)
+
+    def _session_writes(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return [
+            q["sql"] for q in ctx.captured_queries
+            if "django_session" in q["sql"] and not q["sql"].lstrip().upper().startswith("SELECT")
+        ]
+
+    def test_get_with_empty_cart_does_not_write_session(self):
+        self.assertEqual(self._session_writes(reverse("catalog:product_list")), [])
+        self.assertEqual(self._session_writes(reverse("orders:cart_detail")), [])
+
+    def test_get_with_items_does_not_write_session(self):
+        self.client.get(reverse("orders:cart_add", args=[self.product.id]))
+
+        self.assertEqual(self._session_writes(reverse("catalog:product_list")), [])
+        resp = self.client.get(reverse("catalog:product_list"))
+        self.assertEqual(resp.context["cart_item_count"], 1)
+        self.assertEqual(resp.context["cart_total"], Decimal("10.00"))
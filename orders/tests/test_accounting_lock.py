@@ -0,0 +1,153 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from accounts.models import ClientStructure
+from catalog.models import Category, Product
+from orders.models import Order, OrderItem, PartnerPayout
+from partners.models import PartnerProfile
+
+
+class AccountingLockTests(TestCase):
+    """Snapshot dello stato caricato + lock contabile denormalizzato su Order.
+
+    Verifica che:
+    - i save() di Order / OrderItem non rileggano la riga (nessuna SELECT sulla riga salvata)
+    - accounting_lock segua aggancio a payout, pagamento e cancellazione payout
+    - le guardie di transizione restino attive anche con istanze "vecchie"
+    """
+
+    def setUp(self):
+        User = get_user_model()
+
+        partner_user = User.objects.create_user(
+            username="partner1", password="pass", role=User.ROLE_PARTNER
+        )
+        self.partner = PartnerProfile.objects.create(
+            user=partner_user,
+            company_name="Partner Srl",
+            vat_number="IT00000000000",
+            default_commission_percent=Decimal("10.00"),
+        )
+        client_user = User.objects.create_user(
+            username="client1", password="pass", role=User.ROLE_CLIENT
+        )
+        structure = ClientStructure.objects.create(
+            owner=client_user,
+            name="Struttura 1",
+            address="Via Test 1",
+            city="Reggio Emilia",
+            zip_code="42100",
+            country="Italia",
+            phone="000000",
+        )
+        category = Category.objects.create(name="Categoria")
+        product = Product.objects.create(
+            category=category,
+            name="Prodotto",
+            supplier=self.partner,
+            base_price=Decimal("100.00"),
+            is_active=True,
+        )
+
+        self.order = Order.objects.create(
+            client=client_user,
+            structure=structure,
+            status=Order.STATUS_PAID,
+            subtotal=Decimal("100.00"),
+            total=Decimal("100.00"),
+        )
+        self.item = OrderItem.objects.create(
+            order=self.order,
+            product=product,
+            partner=self.partner,
+            quantity=1,
+            unit_price=Decimal("100.00"),
+            total_price=Decimal("100.00"),
+            partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
+        )
+        self.item.calculate_commission(default_rate=Decimal("10.00"))
+        self.item.save()
+
+    def _payout(self):
+        payout = PartnerPayout.objects.create(
+            partner=self.partner,
+            period_start=date(2025, 1, 1),
+            period_end=date(2025, 12, 31),
+        )
+        OrderItem.objects.filter(pk=self.item.pk).update(payout=payout)
+        Order.refresh_accounting_lock([self.order.pk])
+        return payout
+
+    def _lock(self):
+        return Order.objects.values_list("accounting_lock", flat=True).get(pk=self.order.pk)
+
+    def test_saves_do_not_reread_the_row(self):
+        order = Order.objects.get(pk=self.order.pk)
+        item = OrderItem.objects.get(pk=self.item.pk)
+
+        with self.assertNumQueries(1):
+            order.notes = "nota"
+            order.save()
+        # UPDATE della riga + aggiornamento del riepilogo partner (aggregazione + upsert)
+        # + storno nel registro partner (lock partner, ultima voce, INSERT)
+        with self.assertNumQueries(6):
+            item.partner_status = OrderItem.PARTNER_STATUS_SHIPPED
+            item.save(update_fields=["partner_status"])
+
+    def test_lock_follows_payout_lifecycle(self):
+        self.assertEqual(self._lock(), Order.LOCK_NONE)
+
+        payout = self._payout()
+        self.assertEqual(self._lock(), Order.LOCK_PAYOUT)
+
+        payout.status = PartnerPayout.STATUS_PAID
+        payout.save()
+        self.assertEqual(self._lock(), Order.LOCK_PAID)
+
+        payout.delete()
+        # la riga resta liquidata: il lock "paid" rimane
+        self.assertEqual(self._lock(), Order.LOCK_PAID)
+
+    def test_full_save_does_not_overwrite_lock(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        self._payout()
+
+        stale.notes = "aggiornamento note"
+        stale.save()
+        self.assertEqual(self._lock(), Order.LOCK_PAYOUT)
+
+    def test_downgrade_blocked_with_stale_instance(self):
+        stale = Order.objects.get(pk=self.order.pk)
+        payout = self._payout()
+        payout.status = PartnerPayout.STATUS_PAID
+        payout.save()
+
+        stale.status = Order.STATUS_PENDING_PAYMENT
+        with self.assertRaises(ValidationError):
+            stale.save()
+
+    def test_item_status_locked_once_in_payout(self):
+        self._payout()
+        item = OrderItem.objects.get(pk=self.item.pk)
+
+        item.partner_status = OrderItem.PARTNER_STATUS_REJECTED
+        with self.assertRaises(ValidationError):
+            item.save()
+
+    def test_item_edit_refreshes_lock(self):
+        # modifica di payout / liquidazione dalla singola riga (admin, inline)
+        payout = PartnerPayout.objects.create(
+            partner=self.partner, period_start=date(2025, 1, 1), period_end=date(2025, 12, 31)
+        )
+        item = OrderItem.objects.get(pk=self.item.pk)
+        item.payout = payout
+        item.save()
+        self.assertEqual(self._lock(), Order.LOCK_PAYOUT)
+
+        item.is_liquidated = True
+        item.save()
+        self.assertEqual(self._lock(), Order.LOCK_PAID)
@@ -0,0 +1,159 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import ClientStructure
+from catalog.models import Category, Product
+from orders.facts import rebuild_commission_facts, refresh_commission_facts
+from orders.models import CommissionDailyFact, CommissionFactDirtyDay, Order, OrderItem
+from partners.models import PartnerProfile
+
+
+class CommissionDailyFactTests(TestCase):
+    """Fatti giornalieri commissioni: coda dei giorni modificati + ricostruzione."""
+
+    def setUp(self):
+        User = get_user_model()
+
+        self.partners = []
+        for idx in range(2):
+            user = User.objects.create_user(
+                username=f"partner{idx}", password="pass", role=User.ROLE_PARTNER
+            )
+            self.partners.append(
+                PartnerProfile.objects.create(
+                    user=user,
+                    company_name=f"Partner {idx}",
+                    vat_number="IT00000000000",
+                    default_commission_percent=Decimal("10.00"),
+                )
+            )
+        client_user = User.objects.create_user(
+            username="client", password="pass", role=User.ROLE_CLIENT
+        )
+        structure = ClientStructure.objects.create(owner=client_user, name="Hotel Test")
+        self.categories = [
+            Category.objects.create(name="Cat A", slug="cat-a"),
+            Category.objects.create(name="Cat B", slug="cat-b"),
+        ]
+        self.order = Order.objects.create(
+            client=client_user,
+            structure=structure,
+            status=Order.STATUS_PAID,
+            subtotal=Decimal("400.00"),
+            total=Decimal("400.00"),
+        )
+        # partner 0: due righe su due categorie, partner 1: una riga
+        for partner, category in (
+            (self.partners[0], self.categories[0]),
+            (self.partners[0], self.categories[1]),
+            (self.partners[1], self.categories[0]),
+        ):
+            product = Product.objects.create(
+                category=category,
+                name=f"Prodotto {partner.pk}-{category.pk}",
+                supplier=partner,
+                base_price=Decimal("100.00"),
+            )
+            OrderItem.objects.create(
+                order=self.order,
+                product=product,
+                partner=partner,
+                quantity=1,
+                unit_price=Decimal("100.00"),
+                total_price=Decimal("100.00"),
+                commission_rate=Decimal("10.00"),
+                commission_amount=Decimal("10.00"),
+                partner_earnings=Decimal("90.00"),
+            )
+
+    def test_only_fact_fields_queue_the_day(self):
+        CommissionFactDirtyDay.objects.all().delete()
+        item = OrderItem.objects.get(pk=OrderItem.objects.values_list("pk", flat=True)[0])
+
+        item.partner_status = OrderItem.PARTNER_STATUS_SHIPPED
+        item.save()
+        self.assertFalse(CommissionFactDirtyDay.objects.exists())
+
+        item.total_price = Decimal("120.00")
+        item.save()
+        self.assertEqual(
+            list(CommissionFactDirtyDay.objects.values_list("day", flat=True)),
+            [timezone.localdate(self.order.created_at)],
+        )
+
+    def _totals(self, **filters):
+        return CommissionDailyFact.objects.filter(**filters).aggregate(
+            revenue=Sum("revenue"),
+            commission=Sum("commission"),
+            earnings=Sum("partner_earnings"),
+            orders=Sum("order_count"),
+            partner_orders=Sum("partner_order_count"),
+        )
+
+    def test_changes_are_queued_and_refreshed(self):
+        self.assertEqual(
+            list(CommissionFactDirtyDay.objects.values_list("day", flat=True)),
+            [timezone.localdate(self.order.created_at)],
+        )
+        self.assertEqual(refresh_commission_facts(), 1)
+        self.assertFalse(CommissionFactDirtyDay.objects.exists())
+
+        self.assertEqual(CommissionDailyFact.objects.count(), 3)
+        totals = self._totals()
+        self.assertEqual(totals["revenue"], Decimal("300.00"))
+        self.assertEqual(totals["commission"], Decimal("30.00"))
+        self.assertEqual(totals["earnings"], Decimal("270.00"))
+        # un solo ordine in totale, uno per ciascun partner
+        self.assertEqual(totals["orders"], 1)
+        self.assertEqual(self._totals(partner=self.partners[0])["partner_orders"], 1)
+        self.assertEqual(self._totals(partner=self.partners[1])["partner_orders"], 1)
+
+    def test_order_status_change_moves_facts(self):
+        refresh_commission_facts()
+
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = Order.STATUS_CANCELLED
+        order.save()
+        refresh_commission_facts()
+
+        self.assertEqual(
+            set(CommissionDailyFact.objects.values_list("order_status", flat=True)),
+            {Order.STATUS_CANCELLED},
+        )
+
+    def test_status_only_item_change_is_not_queued(self):
+        refresh_commission_facts()
+
+        item = OrderItem.objects.filter(order=self.order).first()
+        item.partner_status = OrderItem.PARTNER_STATUS_SHIPPED
+        item.save()
+        self.assertFalse(CommissionFactDirtyDay.objects.exists())
+
+        item.delete()
+        refresh_commission_facts()
+        self.assertEqual(self._totals()["revenue"], Decimal("200.00"))
+
+    def test_rebuild_matches_incremental(self):
+        refresh_commission_facts()
+        incremental = sorted(
+            CommissionDailyFact.objects.values_list(
+                "day", "partner_id", "category_id", "order_status", "revenue", "order_count"
+            )
+        )
+
+        CommissionDailyFact.objects.all().delete()
+        call_command("rebuild_commission_facts", stdout=open("/dev/null", "w"))
+        rebuilt = sorted(
+            CommissionDailyFact.objects.values_list(
+                "day", "partner_id", "category_id", "order_status", "revenue", "order_count"
+            )
+        )
+        self.assertEqual(incremental, rebuilt)
+
+        day = timezone.localdate(self.order.created_at)
+        self.assertEqual(rebuild_commission_facts(start=day, end=day), 3)
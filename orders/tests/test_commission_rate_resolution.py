@@ -5,7 +5,7 @@ from django.contrib.auth import get_user_model
 
 from catalog.models import Category, Product
 from partners.models import PartnerProfile, PartnerCategoryCommission
-from orders.utils import get_commission_rate_for_item
+from orders.utils import CommissionRateResolver, get_commission_rate_for_item
 from uuid import uuid4
 from django.utils.text import slugify
 
@@ -91,3 +91,26 @@ class CommissionRateResolutionTests(TestCase):
     def test_rate_partner_default_is_fallback(self):
         rate = get_commission_rate_for_item(self.partner, self.prod_c)
         self.assertEqual(rate, Decimal("10.00"))
+
+
+class CommissionRateResolverTests(CommissionRateResolutionTests):
+    """Il resolver a batch deve dare gli stessi risultati con una sola query."""
+
+    def test_batch_matches_single_lookup(self):
+        products = [self.prod_a, self.prod_b, self.prod_c]
+        expected = [get_commission_rate_for_item(self.partner, p) for p in products]
+
+        resolver = CommissionRateResolver()
+        with self.assertNumQueries(1):
+            resolver.prime((self.partner, p) for p in products)
+            rates = [resolver.rate_for(self.partner, p) for p in products]
+
+        self.assertEqual(rates, expected)
+        self.assertEqual(rates, [Decimal("20.00"), Decimal("15.00"), Decimal("10.00")])
+
+    def test_lookups_are_memoized(self):
+        resolver = CommissionRateResolver()
+        with self.assertNumQueries(1):
+            for _ in range(3):
+                resolver.rate_for(self.partner, self.prod_b)
+                resolver.rate_for(self.partner, self.prod_c)
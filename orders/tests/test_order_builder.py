@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import ClientStructure
+from catalog.models import Category, Product
+from orders.models import Order
+from orders.services import build_order
+from partners.models import PartnerCategoryCommission, PartnerProfile
+
+
+class BuildOrderServiceTests(TestCase):
+    """Test del service build_order (checkout / duplicazione / ordini demo).
+
+    Verifica che:
+    - totali e commissioni seguano le regole correnti
+    - il numero di query NON cresca con il numero di righe
+    """
+
+    def setUp(self):
+        User = get_user_model()
+
+        partner_user = User.objects.create_user(
+            username="partner", password="pass", role=User.ROLE_PARTNER
+        )
+        self.partner = PartnerProfile.objects.create(
+            user=partner_user,
+            company_name="Partner Srl",
+            vat_number="IT00000000000",
+            default_commission_percent=Decimal("10.00"),
+        )
+        self.client_user = User.objects.create_user(
+            username="client", password="pass", role=User.ROLE_CLIENT
+        )
+        self.structure = ClientStructure.objects.create(
+            owner=self.client_user,
+            name="Struttura 1",
+            address="Via Test 1",
+            city="Reggio Emilia",
+            zip_code="42100",
+            country="Italia",
+            phone="000000",
+        )
+        self.category = Category.objects.create(name="Categoria", slug="categoria")
+        PartnerCategoryCommission.objects.create(
+            partner=self.partner, category=self.category, commission_rate=Decimal("15.00")
+        )
+        self.products = [
+            Product.objects.create(
+                category=self.category,
+                name=f"Prodotto {i}",
+                supplier=self.partner,
+                base_price=Decimal("20.00"),
+                is_active=True,
+            )
+            for i in range(60)
+        ]
+
+    def _build(self, n_lines, **kwargs):
+        return build_order(
+            client=self.client_user,
+            structure=self.structure,
+            lines=[(p.id, 2) for p in self.products[:n_lines]],
+            **kwargs,
+        )
+
+    def test_totals_and_commissions(self):
+        order = self._build(3, status=Order.STATUS_DRAFT)
+
+        self.assertEqual(order.status, Order.STATUS_DRAFT)
+        self.assertEqual(order.subtotal, Decimal("120.00"))
+        self.assertEqual(order.total, order.subtotal + order.shipping_cost)
+
+        items = list(order.items.all())
+        self.assertEqual(len(items), 3)
+        for item in items:
+            # commissione categoria (15%) sul totale riga da 40€
+            self.assertEqual(item.total_price, Decimal("40.00"))
+            self.assertEqual(item.commission_rate, Decimal("15.00"))
+            self.assertEqual(item.commission_amount, Decimal("6.00"))
+            self.assertEqual(item.partner_earnings, Decimal("34.00"))
+
+    def test_partner_default_rate_and_explicit_prices(self):
+        order = build_order(
+            client=self.client_user,
+            structure=self.structure,
+            lines=[(self.products[0].id, 1, Decimal("50.00")), (self.products[1].id, 0)],
+            use_partner_default_rate=True,
+        )
+
+        item = order.items.get()
+        self.assertEqual(item.unit_price, Decimal("50.00"))
+        self.assertEqual(item.commission_rate, Decimal("10.00"))
+        self.assertEqual(item.commission_amount, Decimal("5.00"))
+
+    def test_no_valid_lines_creates_nothing(self):
+        self.assertIsNone(self._build(0))
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count_does_not_depend_on_lines(self):
+        with CaptureQueriesContext(connection) as small:
+            self._build(2)
+        with CaptureQueriesContext(connection) as large:
+            self._build(60)
+
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 9)
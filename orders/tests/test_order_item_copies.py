@@ -0,0 +1,128 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import ClientStructure
+from catalog.models import Category, Product
+from orders.models import CommissionFactDirtyDay, Order, OrderItem
+from orders.services import build_order
+from partners.models import PartnerOrderSummary, PartnerProfile
+
+
+class OrderItemCopiesTests(TestCase):
+    """Copie di data e stato ordine su OrderItem (order_created_at / order_status)."""
+
+    def setUp(self):
+        User = get_user_model()
+        partner_user = User.objects.create_user(
+            username="partner1", password="pass", role=User.ROLE_PARTNER
+        )
+        self.partner = PartnerProfile.objects.create(
+            user=partner_user,
+            company_name="Partner Srl",
+            vat_number="IT00000000000",
+            default_commission_percent=Decimal("10.00"),
+        )
+        self.client_user = User.objects.create_user(
+            username="client1", password="pass", role=User.ROLE_CLIENT
+        )
+        self.structure = ClientStructure.objects.create(owner=self.client_user, name="Hotel Test")
+        category = Category.objects.create(name="Categoria", slug="categoria")
+        self.product = Product.objects.create(
+            category=category, name="Prodotto", supplier=self.partner, base_price=Decimal("100.00")
+        )
+        self.order = Order.objects.create(
+            client=self.client_user,
+            structure=self.structure,
+            status=Order.STATUS_PENDING_PAYMENT,
+            subtotal=Decimal("100.00"),
+            total=Decimal("100.00"),
+        )
+        self.item = OrderItem.objects.create(
+            order=self.order,
+            product=self.product,
+            partner=self.partner,
+            unit_price=Decimal("100.00"),
+            total_price=Decimal("100.00"),
+        )
+
+    def _copies(self, item):
+        return OrderItem.objects.values_list("order_created_at", "order_status").get(pk=item.pk)
+
+    def test_new_items_copy_order_date_and_status(self):
+        self.assertEqual(
+            self._copies(self.item), (self.order.created_at, Order.STATUS_PENDING_PAYMENT)
+        )
+
+        order = build_order(
+            client=self.client_user,
+            structure=self.structure,
+            lines=[(self.product.pk, 2)],
+            status=Order.STATUS_PAID,
+        )
+        for item in order.items.all():
+            self.assertEqual(self._copies(item), (order.created_at, Order.STATUS_PAID))
+
+    def test_order_save_updates_items_and_stale_item_save_keeps_copies(self):
+        stale_item = OrderItem.objects.get(pk=self.item.pk)
+
+        self.order.status = Order.STATUS_PAID
+        self.order.created_at -= timedelta(days=3)
+        self.order.save()
+        self.assertEqual(self._copies(self.item), (self.order.created_at, Order.STATUS_PAID))
+
+        stale_item.quantity = 2
+        stale_item.save()
+        self.assertEqual(self._copies(self.item), (self.order.created_at, Order.STATUS_PAID))
+
+    def test_bulk_update_resyncs_copies(self):
+        created_at = self.order.created_at - timedelta(days=5)
+        PartnerOrderSummary.refresh(self.order.pk, [self.partner.pk])
+
+        updated = Order.objects.filter(status=Order.STATUS_PENDING_PAYMENT).update(
+            status=Order.STATUS_PAID, created_at=created_at
+        )
+
+        self.assertEqual(updated, 1)
+        self.assertEqual(self._copies(self.item), (created_at, Order.STATUS_PAID))
+        self.assertEqual(PartnerOrderSummary.objects.get(order=self.order).order_created_at, created_at)
+        self.assertEqual(
+            set(CommissionFactDirtyDay.objects.values_list("day", flat=True)),
+            {timezone.localdate(self.order.created_at), timezone.localdate(created_at)},
+        )
+
+    def test_build_order_with_created_at(self):
+        created_at = timezone.now() - timedelta(days=7)
+
+        order = build_order(
+            client=self.client_user,
+            structure=self.structure,
+            lines=[(self.product.pk, 1)],
+            created_at=created_at,
+        )
+
+        self.assertEqual(Order.objects.get(pk=order.pk).created_at, created_at)
+        self.assertEqual(self._copies(order.items.get())[0], created_at)
+        self.assertEqual(PartnerOrderSummary.objects.get(order=order).order_created_at, created_at)
+        self.assertTrue(CommissionFactDirtyDay.objects.filter(day=timezone.localdate(created_at)).exists())
+
+    def test_consistency_command(self):
+        # copia divergente (es. UPDATE diretto sulle righe)
+        OrderItem.objects.filter(pk=self.item.pk).update(order_status=Order.STATUS_CANCELLED)
+
+        out = StringIO()
+        call_command("check_order_item_copies", stdout=out)
+        self.assertIn("non allineate: 1", out.getvalue())
+        self.assertEqual(self._copies(self.item)[1], Order.STATUS_CANCELLED)
+
+        call_command("check_order_item_copies", "--fix", stdout=out)
+        self.assertEqual(self._copies(self.item)[1], Order.STATUS_PENDING_PAYMENT)
+
+        out = StringIO()
+        call_command("check_order_item_copies", stdout=out)
+        self.assertIn("allineate su tutte le righe", out.getvalue())
@@ -0,0 +1,165 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from orders.models import Order, OrderItem, PartnerLedgerEntry, PartnerPayout
+from orders.partner_ledger import ledger_page, partner_balance, reconcile
+from orders.payout_payments import mark_payouts_confirmed, mark_payouts_paid
+from orders.payout_runs import run_payouts
+
+from .test_payout_runs import PayoutFixturesMixin
+
+
+class PartnerLedgerTests(PayoutFixturesMixin, TestCase):
+    """Registro partner: voci per evento, saldo progressivo, paginazione a cursore, riconciliazione."""
+
+    def _completed_order(self, partner):
+        order = self._order(partner, completed=False)
+        for item in order.items.all():
+            item.partner_status = OrderItem.PARTNER_STATUS_COMPLETED
+            item.save()
+        return order
+
+    def _entries(self, partner):
+        return list(
+            PartnerLedgerEntry.objects.filter(partner=partner)
+            .order_by("pk")
+            .values_list("kind", "amount", "earned_total", "paid_total", "balance")
+        )
+
+    def test_completion_and_rejection_move_the_balance(self):
+        order = self._completed_order(self.partners[0])
+        item = order.items.get()
+
+        item.partner_status = OrderItem.PARTNER_STATUS_REJECTED
+        item.save()
+
+        self.assertEqual(self._entries(self.partners[0]), [
+            (PartnerLedgerEntry.KIND_EARNED, Decimal("90.00"), Decimal("90.00"), Decimal("0.00"), Decimal("90.00")),
+            (PartnerLedgerEntry.KIND_REVERSED, Decimal("-90.00"), Decimal("0.00"), Decimal("0.00"), Decimal("0.00")),
+        ])
+        # cambi di stato fuori da "completato" non scrivono voci
+        item.partner_status = OrderItem.PARTNER_STATUS_PENDING
+        item.save()
+        self.assertEqual(PartnerLedgerEntry.objects.count(), 2)
+
+    def test_order_delete_reverses_cascaded_lines(self):
+        order = self._completed_order(self.partners[0])
+
+        order.delete()
+
+        self.assertEqual(self._entries(self.partners[0])[-1][:2], (PartnerLedgerEntry.KIND_REVERSED, Decimal("-90.00")))
+        self.assertEqual(partner_balance(self.partners[0])["balance"], Decimal("0.00"))
+        self.assertEqual(reconcile(), [])
+
+    def test_attach_and_payment_entries(self):
+        self._completed_order(self.partners[0])
+        self._completed_order(self.partners[0])
+        payout = run_payouts(self.today, self.today)["created"][0]
+
+        mark_payouts_paid(PartnerPayout.objects.filter(pk=payout.pk))
+
+        self.assertEqual(self._entries(self.partners[0])[2:], [
+            (PartnerLedgerEntry.KIND_ATTACHED, Decimal("180.00"), Decimal("180.00"), Decimal("0.00"), Decimal("180.00")),
+            (PartnerLedgerEntry.KIND_PAID, Decimal("180.00"), Decimal("180.00"), Decimal("180.00"), Decimal("0.00")),
+        ])
+        self.assertEqual(
+            partner_balance(self.partners[0]),
+            {"earned_total": Decimal("180.00"), "paid_total": Decimal("180.00"), "balance": Decimal("0.00")},
+        )
+
+        # pagamento annullato da admin
+        payout.refresh_from_db()
+        payout.status = PartnerPayout.STATUS_CONFIRMED
+        payout.save()
+        self.assertEqual(partner_balance(self.partners[0])["balance"], Decimal("180.00"))
+        self.assertEqual(reconcile(), [])
+
+    def test_bulk_confirm_cancels_payments_of_paid_payouts(self):
+        self._completed_order(self.partners[0])
+        self._completed_order(self.partners[1])
+        run_payouts(self.today, self.today)
+        mark_payouts_paid(PartnerPayout.objects.filter(partner=self.partners[0]))
+
+        result = mark_payouts_confirmed(PartnerPayout.objects.all())
+
+        self.assertEqual(result, {"confirmed": 2, "cancelled": 1})
+        self.assertEqual(
+            set(PartnerPayout.objects.values_list("status", flat=True)), {PartnerPayout.STATUS_CONFIRMED}
+        )
+        self.assertEqual(self._entries(self.partners[0])[-1][0], PartnerLedgerEntry.KIND_PAID)
+        self.assertEqual(partner_balance(self.partners[0])["paid_total"], Decimal("0.00"))
+        self.assertEqual(reconcile(), [])
+
+    def test_ledger_page_by_cursor(self):
+        for _ in range(5):
+            self._completed_order(self.partners[0])
+        ids = list(
+            PartnerLedgerEntry.objects.filter(partner=self.partners[0]).order_by("-pk").values_list("pk", flat=True)
+        )
+
+        first = ledger_page(self.partners[0], per_page=2)
+        second = ledger_page(self.partners[0], per_page=2, after=first.next_cursor)
+        last = ledger_page(self.partners[0], per_page=2, after=second.next_cursor)
+        back = ledger_page(self.partners[0], per_page=2, before=last.previous_cursor)
+
+        self.assertEqual([entry.pk for entry in first], ids[:2])
+        self.assertFalse(first.has_previous)
+        self.assertEqual([entry.pk for entry in second], ids[2:4])
+        self.assertEqual([entry.pk for entry in last], ids[4:])
+        self.assertFalse(last.has_next)
+        self.assertEqual([entry.pk for entry in back], ids[2:4])
+        self.assertEqual([entry.pk for entry in ledger_page(self.partners[0], after="x")], ids[:25])
+
+    def test_commissions_page_reads_the_ledger(self):
+        self._completed_order(self.partners[0])
+        self._completed_order(self.partners[0])
+        # riga completata con UPDATE: fuori dal registro finché non si riconcilia
+        self._order(self.partners[0])
+        self.client.force_login(self.partners[0].user)
+
+        response = self.client.get(reverse("partners:commissions"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_commission_matured"], Decimal("180.00"))
+        self.assertEqual(response.context["total_commission_unpaid"], Decimal("180.00"))
+        self.assertEqual(len(response.context["ledger_entries"]), 2)
+
+    def test_reconcile_command_reports_and_fixes(self):
+        self._completed_order(self.partners[0])
+        self._order(self.partners[1])
+        paid = self._order(self.partners[1], status=Order.STATUS_COMPLETED)
+        payout = PartnerPayout.objects.create(
+            partner=self.partners[1], period_start=self.today, period_end=self.today,
+            total_commission=Decimal("90.00"),
+        )
+        paid.items.update(payout=payout)
+        PartnerPayout.objects.filter(pk=payout.pk).update(status=PartnerPayout.STATUS_PAID)
+        out = StringIO()
+
+        call_command("reconcile_partner_ledger", stdout=out)
+        self.assertIn("Partner 1 Srl: maturato 0.00 € (righe: 180.00 €), pagato 0.00 € (payout: 90.00 €).", out.getvalue())
+        self.assertNotIn("Partner 0 Srl", out.getvalue())
+
+        call_command("reconcile_partner_ledger", "--fix", stdout=out)
+        self.assertIn("Voci di rettifica aggiunte: 2.", out.getvalue())
+        self.assertEqual(
+            partner_balance(self.partners[1]),
+            {"earned_total": Decimal("180.00"), "paid_total": Decimal("90.00"), "balance": Decimal("90.00")},
+        )
+
+        out = StringIO()
+        call_command("reconcile_partner_ledger", stdout=out)
+        self.assertIn("Registro partner allineato", out.getvalue())
+
+    def test_reconcile_flags_tampered_entries(self):
+        self._completed_order(self.partners[0])
+        PartnerLedgerEntry.objects.update(amount=Decimal("1.00"))
+
+        self.assertEqual(
+            [(row["partner_id"], row["consistent"]) for row in reconcile()],
+            [(self.partners[0].pk, False)],
+        )
@@ -81,6 +81,8 @@ class PartnerPayoutLiquidationTests(TestCase):
                 timezone.datetime(created_at.year, created_at.month, created_at.day)
             )
         )
+        # le righe copiano la data dall'istanza dell'ordine
+        order.refresh_from_db(fields=["created_at"])
 
         item = OrderItem.objects.create(
             order=order,
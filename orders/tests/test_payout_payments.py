@@ -0,0 +1,157 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from orders.models import Order, OrderItem, PartnerPayout, PayoutReceiptJob
+from orders.payout_payments import (
+    STALE_AFTER,
+    mark_payouts_paid,
+    requeue_stale_receipt_jobs,
+    run_receipt_job,
+)
+from orders.payout_runs import run_payouts
+
+from .test_payout_runs import PayoutFixturesMixin
+
+
+class MarkPayoutsPaidTests(PayoutFixturesMixin, TestCase):
+    """Conferma pagamento in blocco: liquidazione con UPDATE di insieme, ricevute in coda."""
+
+    def _drafts(self):
+        run_payouts(self.today, self.today)
+        return PartnerPayout.objects.filter(status=PartnerPayout.STATUS_DRAFT)
+
+    def test_marks_paid_liquidates_lines_and_queues_receipts(self):
+        self._order(self.partners[0], self.partners[1])
+        self._order(self.partners[0])
+
+        result = mark_payouts_paid(self._drafts())
+
+        self.assertEqual((result["paid"], result["items"]), (2, 3))
+        for payout in PartnerPayout.objects.all():
+            self.assertEqual(payout.status, PartnerPayout.STATUS_PAID)
+            self.assertIsNotNone(payout.paid_at)
+        self.assertFalse(OrderItem.objects.filter(payout__isnull=False, is_liquidated=False).exists())
+        self.assertEqual(set(Order.objects.values_list("accounting_lock", flat=True)), {Order.LOCK_PAID})
+
+        job = result["job"]
+        self.assertEqual((job.status, job.total), (PayoutReceiptJob.STATUS_PENDING, 2))
+        self.assertEqual(set(job.payouts.all()), set(PartnerPayout.objects.all()))
+
+    def test_already_paid_payouts_are_skipped(self):
+        self._order(self.partners[0])
+        mark_payouts_paid(self._drafts())
+
+        result = mark_payouts_paid(PartnerPayout.objects.all())
+
+        self.assertEqual(result, {"paid": 0, "items": 0, "job": None})
+        self.assertEqual(PayoutReceiptJob.objects.count(), 1)
+
+    def test_legacy_payout_without_lines_uses_period_fallback(self):
+        self._order(self.partners[0])
+        payout = PartnerPayout.objects.create(
+            partner=self.partners[0], period_start=self.today, period_end=self.today
+        )
+
+        result = mark_payouts_paid(PartnerPayout.objects.filter(pk=payout.pk))
+
+        self.assertEqual(result["items"], 1)
+        self.assertEqual(payout.items.filter(is_liquidated=True).count(), 1)
+
+    def test_query_count_does_not_grow_with_payouts(self):
+        self._order(self.partners[0])
+        drafts = self._drafts()
+        with CaptureQueriesContext(connection) as few:
+            mark_payouts_paid(drafts)
+
+        self.partners += [self._partner(n) for n in range(3, 12)]
+        self._order(*self.partners[1:])
+        drafts = self._drafts()
+        with CaptureQueriesContext(connection) as many:
+            result = mark_payouts_paid(drafts)
+
+        self.assertEqual(result["paid"], 11)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+class ReceiptJobTests(PayoutFixturesMixin, TestCase):
+    """Ricevute PDF generate dal job (PDF simulato: WeasyPrint non serve al test)."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self._order(self.partners[0], self.partners[1])
+        run_payouts(self.today, self.today)
+        self.job = mark_payouts_paid(PartnerPayout.objects.all())["job"]
+
+    @mock.patch("orders.payout_payments._render_pdf", return_value=b"%PDF-1.4 ricevuta")
+    def test_job_saves_receipts_and_tracks_progress(self, render):
+        job = run_receipt_job(self.job)
+
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual((job.status, job.done, job.failed, job.progress), (PayoutReceiptJob.STATUS_DONE, 2, 0, 100))
+        self.assertIsNotNone(job.finished_at)
+        for payout in PartnerPayout.objects.all():
+            self.assertEqual(payout.payment_receipt.name, f"payout_receipts/payout_{payout.pk}.pdf")
+            with payout.payment_receipt.open("rb") as receipt:
+                self.assertEqual(receipt.read(), b"%PDF-1.4 ricevuta")
+
+    def test_failures_are_counted_and_reported(self):
+        broken = PartnerPayout.objects.order_by("pk").first()
+
+        def render(payout):
+            if payout.pk == broken.pk:
+                raise ValueError("template non valido")
+            return b"%PDF-1.4"
+
+        with mock.patch("orders.payout_payments._render_pdf", side_effect=render):
+            job = run_receipt_job(self.job)
+
+        self.assertEqual((job.status, job.done, job.failed), (PayoutReceiptJob.STATUS_FAILED, 1, 1))
+        self.assertIn(f"payout #{broken.pk}: template non valido", job.last_error)
+        broken.refresh_from_db()
+        self.assertFalse(broken.payment_receipt)
+
+    @mock.patch("orders.payout_payments._render_pdf", return_value=b"%PDF-1.4")
+    def test_command_processes_pending_jobs(self, render):
+        out = StringIO()
+
+        call_command("process_payout_receipts", "--workers", "1", stdout=out)
+        call_command("process_payout_receipts", "--workers", "1", stdout=out)
+
+        self.assertIn(f"Job #{self.job.pk}: 2/2 ricevute generate, 0 errori.", out.getvalue())
+        self.assertIn("Nessun job di ricevute in coda.", out.getvalue())
+        self.assertEqual(render.call_count, 2)
+
+    @mock.patch("orders.payout_payments._render_pdf", return_value=b"%PDF-1.4")
+    def test_job_is_claimed_once(self, render):
+        self.assertIsNotNone(run_receipt_job(self.job))
+        # secondo worker con la stessa istanza (lista letta prima della presa in carico)
+        self.assertIsNone(run_receipt_job(self.job))
+        self.assertEqual(render.call_count, 2)
+
+    @mock.patch("orders.payout_payments._render_pdf", return_value=b"%PDF-1.4")
+    def test_stale_running_job_is_requeued(self, render):
+        # worker terminato dopo la presa in carico
+        PayoutReceiptJob.objects.filter(pk=self.job.pk).update(
+            status=PayoutReceiptJob.STATUS_RUNNING, heartbeat_at=timezone.now() - timedelta(minutes=5), done=1
+        )
+        self.assertEqual(requeue_stale_receipt_jobs(), 0)
+        self.assertIsNone(run_receipt_job(self.job))
+
+        self.assertEqual(requeue_stale_receipt_jobs(timezone.now() + STALE_AFTER), 1)
+        job = run_receipt_job(self.job)
+        self.assertEqual((job.status, job.done, job.failed), (PayoutReceiptJob.STATUS_DONE, 2, 0))
@@ -0,0 +1,138 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from orders.models import OrderItem, PartnerPayout
+from orders.payout_runs import run_payouts
+from orders.pdf_utils import PAYOUT_PDF_DIR, cached_payout_pdf, payout_pdf_name, payout_template_version
+from partners.models import PartnerProfile
+
+from .test_payout_runs import PayoutFixturesMixin
+
+
+@mock.patch("orders.pdf_utils.render_payout_pdf_bytes", return_value=b"%PDF-1.4 payout")
+class PayoutPdfCacheTests(PayoutFixturesMixin, TestCase):
+    """PDF dei payout salvati su storage per (id, updated_at, versione template)."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self._order(self.partners[0], self.partners[1])
+        run_payouts(self.today, self.today)
+        self.payout = PartnerPayout.objects.order_by("pk").first()
+
+    def test_repeat_requests_are_served_from_storage(self, render):
+        name, rendered = cached_payout_pdf(self.payout)
+        self.assertEqual((name, rendered), (payout_pdf_name(self.payout), True))
+
+        self.assertEqual(cached_payout_pdf(self.payout), (name, False))
+        self.assertEqual(render.call_count, 1)
+        with default_storage.open(name, "rb") as pdf:
+            self.assertEqual(pdf.read(), b"%PDF-1.4 payout")
+
+    def test_name_depends_on_updated_at_and_template(self, render):
+        name = payout_pdf_name(self.payout)
+
+        self.payout.updated_at += timedelta(seconds=1)
+        self.assertNotEqual(payout_pdf_name(self.payout), name)
+        self.payout.updated_at -= timedelta(seconds=1)
+        with mock.patch("orders.pdf_utils.payout_template_version", return_value="altro"):
+            self.assertNotEqual(payout_pdf_name(self.payout), name)
+        self.assertEqual(payout_pdf_name(self.payout), name)
+
+    def test_template_version_covers_extended_and_included_templates(self, render):
+        templates = {
+            "report.html": '{% extends "base.html" %}{% block body %}{% include "righe.html" %}{% endblock %}',
+            "base.html": "<html>{% block body %}{% endblock %}</html>",
+            "righe.html": "<table></table>",
+        }
+        engine = [{
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "OPTIONS": {"loaders": [("django.template.loaders.locmem.Loader", templates)]},
+        }]
+        self.addCleanup(payout_template_version.cache_clear)
+
+        def version(**changes):
+            payout_template_version.cache_clear()
+            with override_settings(TEMPLATES=engine), \
+                    mock.patch("orders.pdf_utils.PAYOUT_PDF_TEMPLATE", "report.html"):
+                templates.update(changes)
+                return payout_template_version()
+
+        start = version()
+        self.assertEqual(version(), start)
+        with mock.patch("orders.pdf_utils.PAYOUT_PDF_VERSION", 2):
+            self.assertNotEqual(version(), start)
+
+        extended = version(**{"base.html": "<html lang='it'>{% block body %}{% endblock %}</html>"})
+        self.assertNotEqual(extended, start)
+        self.assertNotEqual(version(**{"righe.html": "<table class='righe'></table>"}), extended)
+
+    def test_name_follows_line_amounts_and_partner_name(self, render):
+        def name():
+            return payout_pdf_name(PartnerPayout.objects.get(pk=self.payout.pk))
+
+        start = name()
+        partner = PartnerProfile.objects.get(pk=self.payout.partner_id)
+        partner.phone = "0541 000000"
+        partner.save()
+        self.assertEqual(name(), start)
+
+        partner.company_name = "Partner 0 Spa"
+        partner.save()
+        renamed = name()
+        self.assertNotEqual(renamed, start)
+
+        item = OrderItem.objects.get(payout=self.payout)
+        item.total_price += 10
+        item.save()
+        self.assertNotEqual(name(), renamed)
+
+    def test_changed_payout_replaces_previous_version(self, render):
+        old_name, _ = cached_payout_pdf(self.payout)
+        self.payout.notes = "Bonifico del 5"
+        self.payout.save()
+
+        new_name, rendered = cached_payout_pdf(self.payout)
+
+        self.assertTrue(rendered)
+        self.assertNotEqual(new_name, old_name)
+        self.assertEqual(
+            default_storage.listdir(f"{PAYOUT_PDF_DIR}/{self.payout.pk}")[1], [new_name.rsplit("/", 1)[1]]
+        )
+
+    def test_backoffice_download(self, render):
+        User = get_user_model()
+        self.client.force_login(User.objects.create_user(username="admin1", password="pass", role=User.ROLE_ADMIN))
+        url = reverse("backoffice:partner_payout_pdf", args=[self.payout.pk])
+
+        for _ in range(2):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF-1.4 payout")
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertIn(f'filename="payout_{self.payout.pk}.pdf"', response["Content-Disposition"])
+        self.assertEqual(render.call_count, 1)
+
+    def test_command_renders_period_once(self, render):
+        period = [self.today.isoformat(), self.today.isoformat()]
+        out = StringIO()
+
+        call_command("render_payout_pdfs", *period, "--workers", "1", stdout=out)
+        call_command("render_payout_pdfs", *period, "--workers", "1", stdout=out)
+
+        self.assertIn("2 generati, 0 già in cache, 0 errori", out.getvalue())
+        self.assertIn("0 generati, 2 già in cache, 0 errori", out.getvalue())
+        self.assertEqual(render.call_count, 2)
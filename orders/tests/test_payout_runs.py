@@ -0,0 +1,273 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import ClientStructure
+from catalog.models import Category, Product
+from orders.models import CommissionFactDirtyDay, Order, OrderItem, PartnerPayout, PartnerPayoutAttachLog
+from orders.payout_runs import (
+    ACTION_CREATE,
+    ACTION_UPDATE,
+    attach_partner_items,
+    payout_run_preview,
+    run_payouts,
+)
+from orders.services import build_order
+from partners.models import PartnerProfile
+
+
+class PayoutFixturesMixin:
+    def setUp(self):
+        User = get_user_model()
+        self.client_user = User.objects.create_user(username="client1", password="pass", role=User.ROLE_CLIENT)
+        self.structure = ClientStructure.objects.create(
+            owner=self.client_user, name="Hotel", address="Via Roma 1", city="Rimini", zip_code="47921"
+        )
+        self.category = Category.objects.create(name="Categoria")
+        self.partners = [self._partner(n) for n in range(3)]
+        self.today = timezone.localdate()
+
+    def _partner(self, n):
+        User = get_user_model()
+        partner = PartnerProfile.objects.create(
+            user=User.objects.create_user(username=f"partner{n}", password="pass", role=User.ROLE_PARTNER),
+            company_name=f"Partner {n} Srl",
+            vat_number=f"IT0000000000{n}",
+            default_commission_percent=Decimal("10.00"),
+        )
+        partner.product = Product.objects.create(
+            category=self.category, name=f"Prodotto {n}", supplier=partner, base_price=Decimal("100.00")
+        )
+        return partner
+
+    def _order(self, *partners, status=Order.STATUS_COMPLETED, completed=True):
+        order = build_order(
+            client=self.client_user,
+            structure=self.structure,
+            lines=[(partner.product.pk, 1) for partner in partners],
+            status=status,
+        )
+        if completed:
+            order.items.update(partner_status=OrderItem.PARTNER_STATUS_COMPLETED)
+        return order
+
+
+class PayoutRunTests(PayoutFixturesMixin, TestCase):
+    """Payout run di periodo: anteprima, bozze in blocco, aggancio righe, ripetibilità."""
+
+    def _run(self):
+        return run_payouts(self.today, self.today)
+
+    def test_preview_lists_new_drafts_without_writing(self):
+        self._order(self.partners[0], self.partners[1])
+        self._order(self.partners[0])
+
+        preview = payout_run_preview(self.today, self.today)
+
+        self.assertEqual(
+            [(row["company_name"], row["items"], row["amount"], row["action"]) for row in preview],
+            [
+                ("Partner 0 Srl", 2, Decimal("180.00"), ACTION_CREATE),
+                ("Partner 1 Srl", 1, Decimal("90.00"), ACTION_CREATE),
+            ],
+        )
+        self.assertFalse(PartnerPayout.objects.exists())
+
+    def test_run_creates_drafts_and_attaches_payable_lines(self):
+        self._order(self.partners[0], self.partners[1])
+        # non pagabili: ordine non completato, riga non completata
+        self._order(self.partners[2], status=Order.STATUS_SHIPPED)
+        pending = self._order(self.partners[0], completed=False)
+
+        result = self._run()
+
+        self.assertEqual(len(result["created"]), 2)
+        self.assertEqual(result["items"], 2)
+        for payout in PartnerPayout.objects.all():
+            self.assertEqual(payout.status, PartnerPayout.STATUS_DRAFT)
+            self.assertEqual(payout.total_commission, Decimal("90.00"))
+            self.assertEqual(payout.items.count(), 1)
+        self.assertFalse(PartnerPayout.objects.filter(partner=self.partners[2]).exists())
+        self.assertFalse(pending.items.filter(payout__isnull=False).exists())
+        self.assertEqual(
+            set(Order.objects.filter(items__payout__isnull=False).values_list("accounting_lock", flat=True)),
+            {Order.LOCK_PAYOUT},
+        )
+
+    def test_rerun_adds_new_lines_to_existing_draft(self):
+        self._order(self.partners[0])
+        self._run()
+
+        self.assertEqual(self._run(), {"created": [], "updated": [], "items": 0})
+
+        self._order(self.partners[0])
+        preview = payout_run_preview(self.today, self.today)
+        draft = PartnerPayout.objects.get()
+        self.assertEqual(
+            [(row["action"], row["payout_id"], row["current_total"], row["total"]) for row in preview],
+            [(ACTION_UPDATE, draft.pk, Decimal("90.00"), Decimal("180.00"))],
+        )
+
+        result = self._run()
+
+        self.assertEqual(result["updated"], [draft])
+        draft.refresh_from_db()
+        self.assertEqual(draft.total_commission, Decimal("180.00"))
+        self.assertEqual(draft.items.count(), 2)
+
+    def test_paid_payout_is_not_touched(self):
+        self._order(self.partners[0])
+        payout = self._run()["created"][0]
+        payout.status = PartnerPayout.STATUS_PAID
+        payout.save()
+
+        self._order(self.partners[0])
+        result = self._run()
+
+        self.assertEqual(len(result["created"]), 1)
+        payout.refresh_from_db()
+        self.assertEqual(payout.total_commission, Decimal("90.00"))
+        self.assertEqual(
+            OrderItem.objects.filter(payout=result["created"][0]).aggregate(total=Sum("partner_earnings"))["total"],
+            result["created"][0].total_commission,
+        )
+
+    def test_query_count_does_not_grow_with_partners(self):
+        self._order(self.partners[0])
+        with CaptureQueriesContext(connection) as few:
+            self._run()
+
+        self.partners += [self._partner(n) for n in range(3, 12)]
+        self._order(*self.partners)
+        with CaptureQueriesContext(connection) as many:
+            result = self._run()
+
+        self.assertEqual(len(result["created"]) + len(result["updated"]), 12)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_command_dry_run_and_run(self):
+        self._order(self.partners[0])
+        period = [self.today.isoformat(), self.today.isoformat()]
+        out = StringIO()
+
+        call_command("generate_partner_payout", *period, "--dry-run", stdout=out)
+        self.assertIn("Partner 0 Srl: 1 righe, +90.00 € (nuova bozza 90.00 €)", out.getvalue())
+        self.assertFalse(PartnerPayout.objects.exists())
+
+        call_command("generate_partner_payout", *period, stdout=out)
+        self.assertIn("1 bozze create, 0 aggiornate, 1 righe agganciate", out.getvalue())
+        self.assertEqual(PartnerPayout.objects.get().total_commission, Decimal("90.00"))
+
+    def test_run_writes_one_audit_entry_per_payout(self):
+        self._order(self.partners[0], self.partners[1])
+        self._run()
+        self._order(self.partners[0])
+        self._order(self.partners[0])
+
+        self._run()
+
+        draft = PartnerPayout.objects.get(partner=self.partners[0])
+        self.assertEqual(
+            list(draft.attach_logs.order_by("pk").values_list("source", "items_count", "amount", "total_after")),
+            [
+                (PartnerPayoutAttachLog.SOURCE_RUN, 1, Decimal("90.00"), Decimal("90.00")),
+                (PartnerPayoutAttachLog.SOURCE_RUN, 2, Decimal("180.00"), Decimal("270.00")),
+            ],
+        )
+        self.assertEqual(PartnerPayoutAttachLog.objects.count(), 3)
+
+
+class AttachPartnerItemsTests(PayoutFixturesMixin, TestCase):
+    """Aggancio righe di un partner da backoffice: blocco, ricalcolo in blocco, audit."""
+
+    def _attach(self, user=None):
+        return attach_partner_items(self.partners[0], self.today, self.today, user=user)
+
+    def test_attach_creates_draft_with_open_lines(self):
+        self._order(self.partners[0])
+        # riga aperta anche se non completata (perimetro della vista backoffice)
+        self._order(self.partners[0], status=Order.STATUS_PAID, completed=False)
+        self._order(self.partners[1])
+
+        result = self._attach(user=self.client_user)
+
+        payout = result["payout"]
+        self.assertTrue(result["created"])
+        self.assertEqual(result["items"], 2)
+        self.assertEqual(payout.items.count(), 2)
+        self.assertEqual(payout.total_commission, Decimal("180.00"))
+        payout.refresh_from_db()
+        self.assertEqual(payout.total_commission, Decimal("180.00"))
+        log = payout.attach_logs.get()
+        self.assertEqual(
+            (log.source, log.items_count, log.amount, log.total_after, log.created_by),
+            (PartnerPayoutAttachLog.SOURCE_BACKOFFICE, 2, Decimal("180.00"), Decimal("180.00"), self.client_user),
+        )
+        self.assertIsNone(self._attach())
+
+    def test_missing_commissions_are_recomputed_in_bulk(self):
+        order = self._order(self.partners[0], self.partners[0])
+        order.items.update(
+            commission_amount=Decimal("0.00"), partner_earnings=Decimal("0.00"), commission_rate=Decimal("0.00")
+        )
+        CommissionFactDirtyDay.objects.all().delete()
+
+        result = self._attach()
+
+        self.assertEqual(result["amount"], Decimal("180.00"))
+        self.assertEqual(
+            set(order.items.values_list("commission_rate", "commission_amount", "partner_earnings")),
+            {(Decimal("10.00"), Decimal("10.00"), Decimal("90.00"))},
+        )
+        self.assertTrue(CommissionFactDirtyDay.objects.filter(day=self.today).exists())
+
+    def test_existing_draft_total_is_reread_from_lines(self):
+        self._order(self.partners[0])
+        payout = self._attach()["payout"]
+        # totale salvato disallineato: il nuovo aggancio lo riallinea alle righe
+        PartnerPayout.objects.filter(pk=payout.pk).update(total_commission=Decimal("1.00"))
+        self._order(self.partners[0])
+
+        result = self._attach()
+
+        self.assertFalse(result["created"])
+        self.assertEqual(result["payout"].pk, payout.pk)
+        payout.refresh_from_db()
+        self.assertEqual(payout.total_commission, Decimal("180.00"))
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self._order(self.partners[0])
+        for _ in range(20):
+            self._order(self.partners[1], self.partners[1])
+
+        with CaptureQueriesContext(connection) as few:
+            attach_partner_items(self.partners[0], self.today, self.today)
+        with CaptureQueriesContext(connection) as many:
+            result = attach_partner_items(self.partners[1], self.today, self.today)
+
+        self.assertEqual(result["items"], 40)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_backoffice_view_attaches_and_redirects(self):
+        User = get_user_model()
+        admin = User.objects.create_user(username="admin1", password="pass", role=User.ROLE_ADMIN)
+        self.client.force_login(admin)
+        self._order(self.partners[0])
+
+        response = self.client.post(
+            reverse("backoffice:partner_payout_create", args=[self.partners[0].pk]),
+            {"period_start": self.today.isoformat(), "period_end": self.today.isoformat()},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        log = PartnerPayoutAttachLog.objects.get()
+        self.assertEqual((log.items_count, log.created_by), (1, admin))
+        self.assertEqual(log.payout.total_commission, Decimal("90.00"))
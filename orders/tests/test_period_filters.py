@@ -0,0 +1,109 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from accounts.models import ClientStructure
+from b2b_portale.periods import days_q, period_q
+from orders.models import Order
+
+
+class PeriodFilterTests(TestCase):
+    """Filtri di periodo semiaperti (period_q / days_q) equivalenti a __date ai confini del giorno."""
+
+    # istanti a cavallo della mezzanotte locale (incluso il passaggio all'ora legale)
+    LOCAL_TIMES = [
+        datetime(2025, 3, 28, 23, 59, 59, 999999),
+        datetime(2025, 3, 29, 0, 0),
+        datetime(2025, 3, 29, 23, 59, 59, 999999),
+        datetime(2025, 3, 30, 0, 0),
+        datetime(2025, 3, 30, 3, 0),
+        datetime(2025, 3, 30, 23, 59, 59),
+        datetime(2025, 3, 31, 0, 0),
+        datetime(2025, 4, 1, 0, 0),
+    ]
+
+    RANGES = [
+        (None, None),
+        (date(2025, 3, 29), None),
+        (None, date(2025, 3, 29)),
+        (date(2025, 3, 29), date(2025, 3, 30)),
+        (date(2025, 3, 30), date(2025, 3, 30)),
+        (date(2025, 3, 31), date(2025, 3, 29)),
+    ]
+
+    def setUp(self):
+        User = get_user_model()
+        client_user = User.objects.create_user(
+            username="client1", password="pass", role=User.ROLE_CLIENT
+        )
+        self.structure = ClientStructure.objects.create(owner=client_user, name="Hotel Test")
+        self.client_user = client_user
+
+    def _create_orders(self, tz_name):
+        tz = ZoneInfo(tz_name)
+        for local_time in self.LOCAL_TIMES:
+            order = Order.objects.create(
+                client=self.client_user,
+                structure=self.structure,
+                subtotal=Decimal("10.00"),
+                total=Decimal("10.00"),
+            )
+            # created_at è auto_now_add: data impostata con un UPDATE diretto
+            Order.objects.filter(pk=order.pk).update(created_at=local_time.replace(tzinfo=tz))
+
+    def _ids(self, qs):
+        return sorted(qs.values_list("pk", flat=True))
+
+    def _assert_same_as_date_lookup(self):
+        for start, end in self.RANGES:
+            legacy = Order.objects.all()
+            if start:
+                legacy = legacy.filter(created_at__date__gte=start)
+            if end:
+                legacy = legacy.filter(created_at__date__lte=end)
+            with self.subTest(start=start, end=end):
+                self.assertEqual(
+                    self._ids(Order.objects.filter(period_q("created_at", start, end))),
+                    self._ids(legacy),
+                )
+
+    @override_settings(TIME_ZONE="UTC")
+    def test_day_boundaries_utc(self):
+        self._create_orders("UTC")
+        self._assert_same_as_date_lookup()
+
+    @override_settings(TIME_ZONE="Europe/Rome")
+    def test_day_boundaries_local_time_zone(self):
+        self._create_orders("Europe/Rome")
+        self._assert_same_as_date_lookup()
+
+        # a mezzanotte locale il giorno UTC è ancora quello precedente
+        self.assertEqual(
+            Order.objects.filter(period_q("created_at", date(2025, 3, 29), date(2025, 3, 29))).count(),
+            2,
+        )
+
+    @override_settings(TIME_ZONE="Europe/Rome")
+    def test_days_q_matches_date_in(self):
+        self._create_orders("Europe/Rome")
+        for days in (
+            [],
+            [date(2025, 3, 30)],
+            [date(2025, 3, 29), date(2025, 3, 30), date(2025, 4, 1)],
+            [date(2025, 3, 28) + timedelta(days=n) for n in range(0, 6, 2)],
+        ):
+            with self.subTest(days=days):
+                self.assertEqual(
+                    self._ids(Order.objects.filter(days_q("created_at", days))),
+                    self._ids(Order.objects.filter(created_at__date__in=days)),
+                )
+
+    def test_no_cast_on_the_column(self):
+        sql = str(Order.objects.filter(period_q("created_at", date(2025, 1, 1), date(2025, 1, 31))).query)
+
+        self.assertNotIn("cast_date", sql.lower())
+        self.assertIn('"orders_order"."created_at" >=', sql)
+        self.assertIn('"orders_order"."created_at" <', sql)
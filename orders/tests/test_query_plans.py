@@ -0,0 +1,123 @@
+import re
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from b2b_portale.view_budgets import budget_url, prepare_client, seed_view_dataset, view_budgets
+from catalog.models import ProductAvailability, ProductRating
+from orders.models import CommissionDailyFact, Order, OrderItem, OrderMessage
+from partners.models import PartnerNotification, PartnerOrderSummary
+
+# tabelle grandi: una SCAN senza indice su queste è una regressione
+HOT_TABLES = {
+    Order._meta.db_table,
+    OrderItem._meta.db_table,
+    OrderMessage._meta.db_table,
+    PartnerNotification._meta.db_table,
+    PartnerOrderSummary._meta.db_table,
+    ProductRating._meta.db_table,
+    ProductAvailability._meta.db_table,
+    CommissionDailyFact._meta.db_table,
+}
+
+# "SCAN tabella" / "SCAN tabella AS alias" senza "USING ... INDEX": lettura di tutta la tabella
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+# solo le istruzioni con un piano da verificare (niente SAVEPOINT / INSERT di sessione)
+PLANNED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+
+
+class QueryPlanTests(TestCase):
+    """
+    Piani di esecuzione (EXPLAIN QUERY PLAN, SQLite) delle query realmente
+    eseguite dalle viste più usate (catturate con CaptureQueriesContext su una
+    GET, dataset di b2b_portale.view_budgets): nessuna scansione completa
+    delle tabelle grandi.
+    """
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("piani verificati solo su SQLite")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_view_dataset()
+        cls.budgets = dict(view_budgets())
+
+    def _plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def _full_scans(self, sql):
+        plan = self._plan(sql)
+        return [
+            detail for detail in plan
+            if (match := FULL_SCAN.match(detail)) and match.group(1) in HOT_TABLES
+        ]
+
+    def _view_queries(self, name, params=None):
+        """SQL eseguito dalla GET della vista (cache vuota: nessun risultato già pronto)."""
+        budget = self.budgets[name]
+        prepare_client(self.client, budget, self.data)
+        cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(budget_url(name, budget, self.data), params)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, name)
+        return [
+            query["sql"] for query in captured.captured_queries
+            if query["sql"].lstrip().upper().startswith(PLANNED_STATEMENTS)
+        ]
+
+    def assertViewsWithoutFullScan(self, *names, params=None):
+        for name in names:
+            with self.subTest(view=name):
+                queries = self._view_queries(name, params)
+                self.assertTrue(queries, name)
+                scans = {sql: scans for sql in queries if (scans := self._full_scans(sql))}
+                self.assertEqual(scans, {}, "\n\n".join(f"{sql}\n-> {s}" for sql, s in scans.items()))
+
+    def test_partner_views(self):
+        self.assertViewsWithoutFullScan(
+            "partners:dashboard",
+            "partners:order_list",
+            "partners:order_archive",
+            "partners:order_detail",
+            "partners:commissions",
+            "partners:notifications",
+        )
+
+    def test_client_views(self):
+        self.assertViewsWithoutFullScan(
+            "accounts:my_dashboard",
+            "accounts:my_orders",
+            "accounts:my_order_detail",
+        )
+
+    def test_catalog_views(self):
+        self.assertViewsWithoutFullScan(
+            "catalog:product_list",
+            "catalog:product_detail",
+            "catalog:product_availability",
+        )
+
+    def test_report_views(self):
+        # senza periodo i report leggono per definizione tutto lo storico
+        today = date.today()
+        self.assertViewsWithoutFullScan(
+            "backoffice:commission_report",
+            "backoffice:commission_report_detail",
+            "backoffice:unliquidated_commission_list",
+            "backoffice:liquidated_commission_list",
+            params={"period_start": today.replace(day=1).isoformat(), "period_end": today.isoformat()},
+        )
+
+    def test_detects_full_scan(self):
+        # controllo del controllo: un filtro su colonna non indicizzata viene segnalato
+        sql = str(OrderItem.objects.filter(quantity=3).query)
+        self.assertEqual(self._full_scans(sql), [f"SCAN {OrderItem._meta.db_table}"])
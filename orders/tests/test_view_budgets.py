@@ -0,0 +1,55 @@
+from django.test import TestCase
+
+from b2b_portale.view_budgets import (
+    budget_url,
+    check_budget,
+    grow_view_dataset,
+    measure_view,
+    prepare_client,
+    seed_view_dataset,
+    view_budgets,
+)
+
+
+class ViewBudgetTests(TestCase):
+    """Budget di query / tempo dichiarati in VIEW_BUDGETS accanto agli urls.py delle app."""
+
+    def _measure_all(self, data):
+        # un'eccezione in una vista diventa uno status 500 nel report, non blocca le altre
+        self.client.raise_request_exception = False
+        results = {}
+        for name, budget in view_budgets():
+            if budget is None or budget.get("skip"):
+                continue
+            prepare_client(self.client, budget, data)
+            results[name] = measure_view(self.client, budget_url(name, budget, data))
+        return results
+
+    def _report(self, results):
+        return "\n".join(
+            f"{name}: {r['status']} {r['queries']} query, {r['duplicates']} duplicate, {r['ms']:.0f} ms"
+            for name, r in results.items()
+        )
+
+    def test_every_url_has_a_budget(self):
+        missing = [name for name, budget in view_budgets() if budget is None]
+
+        self.assertEqual(missing, [])
+
+    def test_views_within_budget_and_constant_in_row_count(self):
+        data = seed_view_dataset()
+        small = self._measure_all(data)
+        grow_view_dataset(data, 5)
+        large = self._measure_all(data)
+
+        budgets = dict(view_budgets())
+        errors = []
+        for name, result in large.items():
+            for error in check_budget(budgets[name], result):
+                errors.append(f"{name}: {error}")
+            if result["queries"] != small[name]["queries"]:
+                errors.append(
+                    f"{name}: query da {small[name]['queries']} a {result['queries']} "
+                    f"con più righe (N+1?)"
+                )
+        self.assertEqual(errors, [], self._report(large))
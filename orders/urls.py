@@ -13,3 +13,18 @@ urlpatterns = [
     path("order/<int:order_id>/", views.order_detail, name="order_detail"),
     path("orders/confirmation/<int:order_id>/", views.order_confirmation, name="order_confirmation"),
 ]
+
+
+# Budget per vista (b2b_portale.view_budgets, test orders/tests/test_view_budgets.py):
+# ruolo dell'utente di prova, argomenti dell'URL (chiavi del dataset di prova),
+# numero massimo di query con il dataset ingrandito.
+VIEW_BUDGETS = {
+    "cart_detail": {"role": "client", "queries": 2},
+    "cart_add": {"skip": "modifica il carrello anche in GET"},
+    "cart_update": {"skip": "solo POST"},
+    "cart_remove": {"skip": "modifica il carrello"},
+    "cart_clear": {"skip": "solo POST"},
+    "checkout": {"role": "client", "cart": True, "queries": 4},
+    "order_detail": {"role": "client", "args": ["order"], "queries": 6},
+    "order_confirmation": {"role": "client", "args": ["order"], "queries": 4},
+}
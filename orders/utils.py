@@ -4,6 +4,100 @@ from catalog.models import Product
 from partners.models import PartnerProfile, PartnerCategoryCommission
 
 
+class CommissionRateResolver:
+    """
+    Risolve la commissione delle righe ordine con la stessa priorità di
+    get_commission_rate_for_item, ma caricando le commissioni categoria
+    dei partner coinvolti in blocco e memorizzandole (per richiesta / per batch):
+
+    1) product.partner_commission_rate (se valorizzato)
+    2) PartnerCategoryCommission(partner, product.category)
+    3) partner.default_commission_percent
+    4) 0.00
+
+    Uso tipico:
+        resolver = CommissionRateResolver()
+        resolver.prime((item.partner_id, item.product) for item in items)  # 1 query
+        for item in items:
+            item.calculate_commission(resolver=resolver)                    # 0 query
+    """
+
+    REQUEST_ATTR = "_commission_rate_resolver"
+
+    def __init__(self):
+        # (partner_id, category_id) -> rate, per i partner già caricati
+        self._category_rates = {}
+        self._loaded_partners = set()
+
+    @classmethod
+    def for_request(cls, request):
+        """Resolver memorizzato sulla richiesta (condiviso da tutte le righe gestite)."""
+        resolver = getattr(request, cls.REQUEST_ATTR, None)
+        if resolver is None:
+            resolver = cls()
+            setattr(request, cls.REQUEST_ATTR, resolver)
+        return resolver
+
+    def prime(self, pairs):
+        """
+        Carica con UNA query tutte le commissioni categoria dei partner delle
+        coppie (partner o partner_id, product) indicate, saltando i partner già
+        caricati e le righe che non ne hanno bisogno (commissione prodotto).
+        """
+        partner_ids = set()
+        for partner, product in pairs:
+            partner_id = getattr(partner, "pk", partner)
+            if partner_id is None or product is None or product.category_id is None:
+                continue
+            if getattr(product, "partner_commission_rate", None) is not None:
+                continue
+            if partner_id not in self._loaded_partners:
+                partner_ids.add(partner_id)
+
+        if not partner_ids:
+            return
+
+        rows = PartnerCategoryCommission.objects.filter(
+            partner_id__in=partner_ids,
+        ).values_list("partner_id", "category_id", "commission_rate")
+        for partner_id, category_id, rate in rows:
+            self._category_rates[(partner_id, category_id)] = rate
+        self._loaded_partners |= partner_ids
+
+    def prime_items(self, items):
+        """Come prime(), per righe ordine (con product già caricato, es. select_related)."""
+        self.prime((item.partner_id, item.product) for item in items)
+
+    def category_rate(self, partner, product):
+        partner_id = getattr(partner, "pk", partner)
+        if partner_id not in self._loaded_partners:
+            self.prime([(partner_id, product)])
+        return self._category_rates.get((partner_id, product.category_id))
+
+    def rate_for(self, partner: PartnerProfile, product: Product) -> Decimal:
+        # 1) Commissione specifica prodotto
+        product_rate = getattr(product, "partner_commission_rate", None)
+        if product_rate is not None:
+            return product_rate
+
+        # 2) Commissione categoria per questo partner
+        if product.category_id and partner is not None:
+            category_rate = self.category_rate(partner, product)
+            if category_rate is not None:
+                return category_rate
+
+        # 3) Fallback: default partner (campo reale su PartnerProfile)
+        default_rate = getattr(partner, "default_commission_percent", None)
+        if default_rate is not None:
+            return default_rate
+
+        # fallback finale di sicurezza
+        return Decimal("0.00")
+
+    def rate_for_item(self, item) -> Decimal:
+        return self.rate_for(item.partner, item.product)
+
+
 def get_commission_rate_for_item(partner: PartnerProfile, product: Product) -> Decimal:
     """
     Restituisce la commissione da applicare per una riga ordine
@@ -12,28 +106,7 @@ def get_commission_rate_for_item(partner: PartnerProfile, product: Product) -> D
     1) product.partner_commission_rate (se valorizzato)
     2) PartnerCategoryCommission(partner, product.category)
     3) partner.default_commission_percent
-    """
 
-    # 1) Commissione specifica prodotto
-    product_rate = getattr(product, "partner_commission_rate", None)
-    if product_rate is not None:
-        return product_rate
-
-    # 2) Commissione categoria per questo partner
-    if product.category_id:
-        try:
-            cat_commission = PartnerCategoryCommission.objects.get(
-                partner=partner,
-                category=product.category,
-            )
-            return cat_commission.commission_rate
-        except PartnerCategoryCommission.DoesNotExist:
-            pass
-
-    # 3) Fallback: default partner (campo reale su PartnerProfile)
-    default_rate = getattr(partner, "default_commission_percent", None)
-    if default_rate is not None:
-        return default_rate
-
-    # fallback finale di sicurezza
-    return Decimal("0.00")
+    Per più righe usare CommissionRateResolver (una query per tutto il batch).
+    """
+    return CommissionRateResolver().rate_for(partner, product)
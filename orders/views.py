@@ -1,5 +1,3 @@
-from decimal import Decimal
-
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
@@ -13,6 +11,7 @@ from partners.models import PartnerProfile
 from .cart import Cart
 from .forms import CheckoutForm
 from .models import Order, OrderItem, OrderMessage
+from .services import build_order
 from .shipping import calculate_shipping
 
 
@@ -108,47 +107,21 @@ def checkout(request):
             payment_method = form.cleaned_data["payment_method"]
             notes = form.cleaned_data.get("notes", "")
 
-            subtotal = cart.get_total_price()
             shipping_cost = calculate_shipping(cart, structure)
-            total = subtotal + shipping_cost
 
-            # CREA ORDINE
-            order = Order.objects.create(
+            # CREA ORDINE + RIGHE (prodotti, partner e INSERT righe in blocco).
+            # Commissione di default del partner subito (se c'è un partner).
+            order = build_order(
                 client=request.user,
                 structure=structure,
-                subtotal=subtotal,
+                lines=cart.lines(),
                 shipping_cost=shipping_cost,
+                use_partner_default_rate=True,
                 payment_method=payment_method,
-                total=total,
                 notes=notes,
             )
-
-            # CREA RIGHE D’ORDINE
-            for item in cart:
-                product = item["product"]
-                quantity = item["quantity"]
-                unit_price = item["price"]
-                total_price = item["total_price"]
-
-                partner = getattr(product, "supplier", None)
-
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    partner=partner,
-                    quantity=quantity,
-                    unit_price=unit_price,
-                    total_price=total_price,
-                )
-
-                # 🔹 Calcolo commissione di default subito (se c'è un partner)
-                if partner:
-                    default_rate = partner.default_commission_percent or Decimal("0.00")
-                    order_item.commission_rate = default_rate
-                    order_item.calculate_commission(default_rate=default_rate)
-                    order_item.save(
-                        update_fields=["commission_rate", "commission_amount", "partner_earnings"]
-                    )
+            if order is None:
+                return render(request, "orders/empty_cart.html")
 
             # Svuota il carrello e mostra conferma
             cart.clear()
@@ -194,6 +167,7 @@ def order_detail(request, order_id):
                 sender=request.user,
                 sender_role=OrderMessage.ROLE_CLIENT,
                 message=text,
+                is_read_by_client=True,   # lo sto inviando io cliente
             )
             messages.success(
                 request,
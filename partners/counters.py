@@ -0,0 +1,146 @@
+"""
+Contatori del partner mostrati in tutte le pagine (sidebar / menu / dashboard).
+
+- Calcolo: UNA query (aggregazione condizionale sulle righe d'ordine del
+  partner + subquery per le notifiche non lette).
+- Memo per richiesta (request._partner_counters).
+- Cache versionata per partner: ogni cambio di stato di una riga del partner
+  e ogni notifica creata/letta incrementa la versione al commit
+  (invalidate_partner_counters), quindi con cache calda le pagine partner
+  eseguono una sola query (profilo + versione) per i contatori.
+
+La versione è una colonna del profilo (PartnerProfile.counters_version), non
+una chiave di cache: la cache di default (LocMemCache) è separata per ogni
+processo / worker e un incremento fatto da un worker non sarebbe visto dagli
+altri. I contatori calcolati possono restare nella cache locale: la chiave
+include la versione letta dal DB.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+CACHE_TIMEOUT = 60 * 60 * 24
+REQUEST_ATTR = "_partner_counters"
+
+# Stati "da evadere" (stessi stati che usiamo nella lista ordini)
+OPEN_STATUSES = ("pending", "accepted", "in_progress", "shipped")
+
+
+def _data_key(partner_id, version):
+    return f"partner:counters:{partner_id}:v{version}"
+
+
+def new_counters_version():
+    """
+    Versione iniziale di un profilo: valore mai usato prima, così le voci in
+    cache di un DB precedente (ripristino, test) non tornano valide.
+    """
+    return time.time_ns()
+
+
+def invalidate_partner_counters(*partner_ids):
+    """
+    Nuova versione dei contatori per i partner indicati (None ignorati), al
+    commit della transazione corrente: contatori ricalcolati prima del commit
+    non finiscono in cache con la versione nuova; rollback = nessuna modifica.
+    """
+    partner_ids = {pid for pid in partner_ids if pid}
+    if partner_ids:
+        transaction.on_commit(lambda: _bump_versions(partner_ids))
+
+
+def _bump_versions(partner_ids):
+    from .models import PartnerProfile
+
+    PartnerProfile.objects.filter(pk__in=partner_ids).update(counters_version=F("counters_version") + 1)
+
+
+def compute_partner_counters(partner_id):
+    """Tutti i contatori del partner con una sola query."""
+    from orders.models import OrderItem
+    from .models import PartnerNotification, PartnerProfile
+
+    unread = (
+        PartnerNotification.objects
+        .filter(partner=OuterRef("pk"), is_read=False)
+        .order_by()
+        .values("partner")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    row = (
+        PartnerProfile.objects
+        .filter(pk=partner_id)
+        .values("pk")
+        .annotate(
+            total=Count("order_items"),
+            open=Count("order_items", filter=Q(order_items__partner_status__in=OPEN_STATUSES)),
+            completed=Count(
+                "order_items",
+                filter=Q(order_items__partner_status=OrderItem.PARTNER_STATUS_COMPLETED),
+            ),
+            rejected=Count(
+                "order_items",
+                filter=Q(order_items__partner_status=OrderItem.PARTNER_STATUS_REJECTED),
+            ),
+            unread_notifications=Coalesce(Subquery(unread, output_field=IntegerField()), 0),
+        )
+        .values("total", "open", "completed", "rejected", "unread_notifications")
+        .first()
+    )
+    return row or {"total": 0, "open": 0, "completed": 0, "rejected": 0, "unread_notifications": 0}
+
+
+def get_partner_counters(partner_id, version=None):
+    """Contatori dalla cache versionata (calcolati e salvati se mancanti)."""
+    from .models import PartnerProfile
+
+    if version is None:
+        version = (
+            PartnerProfile.objects.filter(pk=partner_id)
+            .values_list("counters_version", flat=True)
+            .first()
+        )
+        if version is None:
+            return compute_partner_counters(partner_id)
+
+    key = _data_key(partner_id, version)
+    counters = cache.get(key)
+    if counters is None:
+        counters = compute_partner_counters(partner_id)
+        cache.set(key, counters, CACHE_TIMEOUT)
+    return counters
+
+
+def _partner_version_for_user(user):
+    """
+    (id del PartnerProfile, versione dei contatori) dell'utente con una query.
+    Letti sempre dal DB, anche se il profilo è già caricato sull'utente: la
+    versione in memoria non vede gli incrementi fatti dopo il caricamento.
+    Restituisce None se l'utente non ha un profilo partner.
+    """
+    from .models import PartnerProfile
+
+    return PartnerProfile.objects.filter(user_id=user.pk).values_list("pk", "counters_version").first()
+
+
+def partner_counters_for_request(request):
+    """
+    Contatori del partner loggato, memorizzati sulla richiesta.
+    None se l'utente non è un partner (o non ha ancora un profilo).
+    """
+    if hasattr(request, REQUEST_ATTR):
+        return getattr(request, REQUEST_ATTR)
+
+    counters = None
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated and getattr(user, "role", None) == "partner":
+        row = _partner_version_for_user(user)
+        if row is not None:
+            counters = get_partner_counters(*row)
+
+    setattr(request, REQUEST_ATTR, counters)
+    return counters
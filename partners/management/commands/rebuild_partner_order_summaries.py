@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from partners.models import PartnerOrderSummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricostruisce i riepiloghi ordini per partner (PartnerOrderSummary) "
+        "dalle righe d'ordine. Da usare dopo import o modifiche massive fatte con update()."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = PartnerOrderSummary.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f"Riepiloghi ordini partner ricostruiti: {count}."))
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def backfill_summaries(apps, schema_editor):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    PartnerOrderSummary = apps.get_model("partners", "PartnerOrderSummary")
+
+    rows = (
+        OrderItem.objects
+        .filter(partner__isnull=False)
+        .values("order_id", "partner_id")
+        .annotate(
+            items=Count("pk"),
+            completed=Count("pk", filter=Q(partner_status="completed")),
+            created_at=Max("order__created_at"),
+            updated_at=Max("order__updated_at"),
+        )
+        .order_by()
+    )
+    PartnerOrderSummary.objects.bulk_create(
+        (
+            PartnerOrderSummary(
+                order_id=row["order_id"],
+                partner_id=row["partner_id"],
+                items_count=row["items"],
+                completed_count=row["completed"],
+                is_archived=row["items"] == row["completed"],
+                order_created_at=row["created_at"],
+                last_activity_at=row["updated_at"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_order_unread_counters'),
+        ('partners', '0003_partnercategorycommission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartnerOrderSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Righe del partner')),
+                ('completed_count', models.PositiveIntegerField(default=0, verbose_name='Righe completate')),
+                ('is_archived', models.BooleanField(default=False, verbose_name='Archiviato')),
+                ('order_created_at', models.DateTimeField(verbose_name='Data ordine')),
+                ('last_activity_at', models.DateTimeField(verbose_name='Ultima attività')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='partner_summaries', to='orders.order', verbose_name='Ordine')),
+                ('partner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_summaries', to='partners.partnerprofile', verbose_name='Partner')),
+            ],
+            options={
+                'verbose_name': 'Riepilogo ordine partner',
+                'verbose_name_plural': 'Riepiloghi ordini partner',
+                'indexes': [models.Index(fields=['partner', 'is_archived', '-order_created_at', '-order'], name='partners_pos_inbox_idx')],
+                'constraints': [models.UniqueConstraint(fields=('partner', 'order'), name='uniq_partner_order_summary')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-17 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0004_partnerordersummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='partnernotification',
+            index=models.Index(fields=['partner', 'is_read'], name='partners_notif_unread_idx'),
+        ),
+    ]
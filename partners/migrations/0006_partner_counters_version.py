@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 02:06
+
+import partners.counters
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partners', '0005_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partnerprofile',
+            name='counters_version',
+            field=models.BigIntegerField(default=partners.counters.new_counters_version, editable=False, verbose_name='Versione contatori'),
+        ),
+    ]
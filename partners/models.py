@@ -1,7 +1,11 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, Max, Q
+from django.utils import timezone
 from decimal import Decimal
-from catalog.models import Category
+from catalog.models import Category, Product
+
+from .counters import invalidate_partner_counters, new_counters_version
 
 
 class PartnerProfile(models.Model):
@@ -29,6 +33,12 @@ class PartnerProfile(models.Model):
         help_text="Percentuale di revenue riconosciuta al partner sugli ordini.",
     )
     is_active = models.BooleanField(default=True)
+    # versione dei contatori in cache (partners/counters.py), solo UPDATE mirati
+    counters_version = models.BigIntegerField(
+        "Versione contatori", default=new_counters_version, editable=False
+    )
+
+    DENORMALIZED_FIELDS = ("counters_version",)
 
     class Meta:
         verbose_name = "Partner"
@@ -36,6 +46,32 @@ class PartnerProfile(models.Model):
 
     def __str__(self) -> str:
         return self.company_name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # ragione sociale come letta dal DB (vedi save)
+        instance._loaded_company_name = instance.__dict__.get("company_name")
+        return instance
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        # la versione dei contatori è mantenuta solo da UPDATE mirati: un save()
+        # completo con il valore in memoria non aggiornato non deve sovrascriverla
+        if not adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+        # la ragione sociale compare nelle card in catalogo
+        Product.bump_cache_version(supplier=self)
+        # ... e nei PDF dei payout (in cache per updated_at del payout)
+        if not adding and self.company_name != getattr(self, "_loaded_company_name", None):
+            from orders.models import PartnerPayout  # import locale: orders importa partners
+
+            PartnerPayout.objects.filter(partner=self).update(updated_at=timezone.now())
+        self._loaded_company_name = self.company_name
         
     
 class PartnerCategoryCommission(models.Model):
@@ -115,6 +151,167 @@ class PartnerNotification(models.Model):
         verbose_name = "Notifica partner"
         verbose_name_plural = "Notifiche partner"
         ordering = ["-created_at"]
+        indexes = [
+            # notifiche non lette del partner (contatori / menu)
+            models.Index(fields=["partner", "is_read"], name="partners_notif_unread_idx"),
+        ]
 
     def __str__(self):
         return f"{self.partner.company_name} - {self.title}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_partner_counters(self.partner_id)
+
+
+# ============================================================
+#   RIEPILOGO ORDINI PER PARTNER (read model "inbox")
+# ============================================================
+
+class PartnerOrderSummary(models.Model):
+    """
+    Una riga per ogni coppia (partner, ordine) con almeno una riga d'ordine
+    del partner. Alimenta "Ordini da evadere" / "Archivio" / dashboard con
+    scansioni indicizzate, senza JOIN su items__partner, Count(distinct) o
+    .distinct().
+
+    Mantenuta da refresh() a ogni creazione di riga, cambio di partner_status
+    o di partner (OrderItem.save / delete, build_order). I messaggi non letti
+    restano il contatore denormalizzato Order.unread_for_partner (l'ordine è
+    già in select_related nelle liste).
+    """
+
+    partner = models.ForeignKey(
+        PartnerProfile,
+        on_delete=models.CASCADE,
+        related_name="order_summaries",
+        verbose_name="Partner",
+    )
+    order = models.ForeignKey(
+        "orders.Order",
+        on_delete=models.CASCADE,
+        related_name="partner_summaries",
+        verbose_name="Ordine",
+    )
+    items_count = models.PositiveIntegerField("Righe del partner", default=0)
+    completed_count = models.PositiveIntegerField("Righe completate", default=0)
+    # True quando tutte le righe del partner sono COMPLETATE (→ Archivio)
+    is_archived = models.BooleanField("Archiviato", default=False)
+    # copia di Order.created_at: ordinamento delle liste senza JOIN
+    order_created_at = models.DateTimeField("Data ordine")
+    last_activity_at = models.DateTimeField("Ultima attività")
+
+    class Meta:
+        verbose_name = "Riepilogo ordine partner"
+        verbose_name_plural = "Riepiloghi ordini partner"
+        constraints = [
+            models.UniqueConstraint(fields=["partner", "order"], name="uniq_partner_order_summary"),
+        ]
+        indexes = [
+            models.Index(
+                fields=["partner", "is_archived", "-order_created_at", "-order"],
+                name="partners_pos_inbox_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.partner_id} / ordine #{self.order_id}"
+
+    @classmethod
+    def for_partner(cls, partner, archived=None):
+        """Riepiloghi del partner (opzionalmente solo aperti / archiviati), dal più recente."""
+        qs = cls.objects.filter(partner=partner)
+        if archived is not None:
+            qs = qs.filter(is_archived=archived)
+        return qs.order_by("-order_created_at", "-order_id")
+
+    @classmethod
+    def refresh(cls, order_id, partner_ids):
+        """
+        Ricalcola i riepiloghi dell'ordine per i partner indicati:
+        1 query di aggregazione + 1 upsert + 1 delete per le coppie rimaste senza righe.
+        """
+        from orders.models import OrderItem
+
+        partner_ids = {pid for pid in partner_ids if pid}
+        if not order_id or not partner_ids:
+            return
+
+        rows = (
+            OrderItem.objects
+            .filter(order_id=order_id, partner_id__in=partner_ids)
+            .values("partner_id")
+            .annotate(
+                items=Count("pk"),
+                completed=Count("pk", filter=Q(partner_status=OrderItem.PARTNER_STATUS_COMPLETED)),
+                created_at=Max("order_created_at"),
+            )
+            .order_by()
+        )
+        now = timezone.now()
+        summaries = [
+            cls(
+                partner_id=row["partner_id"],
+                order_id=order_id,
+                items_count=row["items"],
+                completed_count=row["completed"],
+                is_archived=row["items"] == row["completed"],
+                order_created_at=row["created_at"],
+                last_activity_at=now,
+            )
+            for row in rows
+        ]
+        if summaries:
+            cls.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=["partner", "order"],
+                update_fields=["items_count", "completed_count", "is_archived", "last_activity_at"],
+            )
+
+        stale = partner_ids - {s.partner_id for s in summaries}
+        if stale:
+            cls.objects.filter(order_id=order_id, partner_id__in=stale).delete()
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Ricostruisce da zero tutti i riepiloghi dalle righe d'ordine
+        (ultima attività = ultimo aggiornamento dell'ordine). Restituisce il numero di righe.
+        """
+        from orders.models import OrderItem
+
+        rows = (
+            OrderItem.objects
+            .filter(partner__isnull=False)
+            .values("order_id", "partner_id")
+            .annotate(
+                items=Count("pk"),
+                completed=Count("pk", filter=Q(partner_status=OrderItem.PARTNER_STATUS_COMPLETED)),
+                created_at=Max("order_created_at"),
+                updated_at=Max("order__updated_at"),
+            )
+            .order_by()
+        )
+        cls.objects.all().delete()
+        created = cls.objects.bulk_create(
+            (
+                cls(
+                    order_id=row["order_id"],
+                    partner_id=row["partner_id"],
+                    items_count=row["items"],
+                    completed_count=row["completed"],
+                    is_archived=row["items"] == row["completed"],
+                    order_created_at=row["created_at"],
+                    last_activity_at=row["updated_at"],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=1000,
+        )
+        return len(created)
+
+    @classmethod
+    def touch(cls, order_id):
+        """Aggiorna l'ultima attività di tutti i riepiloghi dell'ordine (es. nuovo messaggio)."""
+        cls.objects.filter(order_id=order_id).update(last_activity_at=timezone.now())
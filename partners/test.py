@@ -1,13 +1,19 @@
 from decimal import Decimal
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
 from accounts.models import ClientStructure
 from catalog.models import Product, Category
-from orders.models import Order, OrderItem
-from partners.models import PartnerProfile
+from orders.models import Order, OrderItem, OrderMessage
+from partners.context_processors import partner_context
+from partners.counters import invalidate_partner_counters
+from partners.models import PartnerNotification, PartnerOrderSummary, PartnerProfile
 
 
 User = get_user_model()
@@ -240,3 +246,317 @@ def test_partner_cannot_update_other_partner_item_status(self):
         self.assertIn(resp.status_code, (403, 404))
 
 
+
+
+class PartnerCountersTests(TestCase):
+    """Contatori partner del context processor (una query, cache versionata)."""
+
+    def setUp(self):
+        cache.clear()
+        client_user = User.objects.create_user(
+            username="client1", password="pass1234", role="client"
+        )
+        self.partner_user = User.objects.create_user(
+            username="partner1", password="pass1234", role="partner"
+        )
+        self.partner = PartnerProfile.objects.create(
+            user=self.partner_user, company_name="Partner srl"
+        )
+        category = Category.objects.create(name="Categoria test", slug="categoria-test")
+        structure = ClientStructure.objects.create(owner=client_user, name="Hotel Test")
+        product = Product.objects.create(
+            name="Prodotto test",
+            supplier=self.partner,
+            base_price=Decimal("100.00"),
+            is_active=True,
+            category=category,
+        )
+        order = Order.objects.create(
+            client=client_user,
+            structure=structure,
+            subtotal=Decimal("100.00"),
+            total=Decimal("100.00"),
+        )
+        self.items = [
+            OrderItem.objects.create(
+                order=order,
+                product=product,
+                partner=self.partner,
+                quantity=1,
+                unit_price=Decimal("50.00"),
+                total_price=Decimal("50.00"),
+                partner_status=status,
+            )
+            for status in (
+                OrderItem.PARTNER_STATUS_PENDING,
+                OrderItem.PARTNER_STATUS_SHIPPED,
+                OrderItem.PARTNER_STATUS_COMPLETED,
+            )
+        ]
+        PartnerNotification.objects.create(partner=self.partner, title="Nuovo ordine", message="-")
+
+    def _request(self):
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=self.partner_user.pk)
+        return request
+
+    def _context(self):
+        return partner_context(self._request())
+
+    def test_counters_computed_in_one_query(self):
+        request = self._request()
+        with self.assertNumQueries(2):  # profilo + versione, contatori
+            context = partner_context(request)
+
+        self.assertEqual(context["partner_total_items"], 3)
+        self.assertEqual(context["partner_open_items_count"], 2)
+        self.assertEqual(context["partner_completed_items"], 1)
+        self.assertEqual(context["partner_rejected_items"], 0)
+        self.assertEqual(context["partner_unread_notifications_count"], 1)
+
+    def test_warm_cache_needs_only_the_version(self):
+        self._context()
+        request = self._request()
+        with self.assertNumQueries(1):  # profilo + versione, contatori dalla cache
+            partner_context(request)
+            partner_context(request)
+
+    def test_version_is_shared_through_the_database(self):
+        self._context()
+        # incremento fatto da un altro processo: nessuna chiave della cache locale cambia
+        OrderItem.objects.filter(pk=self.items[0].pk).update(
+            partner_status=OrderItem.PARTNER_STATUS_REJECTED
+        )
+        PartnerProfile.objects.filter(pk=self.partner.pk).update(counters_version=F("counters_version") + 1)
+        self.assertEqual(self._context()["partner_rejected_items"], 1)
+
+    def test_full_save_keeps_the_version(self):
+        stale = PartnerProfile.objects.get(pk=self.partner.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_partner_counters(self.partner.pk)
+        stale.phone = "000"
+        stale.save()
+        self.assertEqual(
+            PartnerProfile.objects.get(pk=self.partner.pk).counters_version, stale.counters_version + 1
+        )
+
+    def test_status_change_and_notifications_invalidate(self):
+        self._context()
+
+        item = OrderItem.objects.get(pk=self.items[0].pk)
+        item.partner_status = OrderItem.PARTNER_STATUS_REJECTED
+        # nuova versione al commit: prima i contatori in cache restano quelli vecchi
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+            self.assertEqual(self._context()["partner_rejected_items"], 0)
+        context = self._context()
+        self.assertEqual(context["partner_open_items_count"], 1)
+        self.assertEqual(context["partner_rejected_items"], 1)
+
+        self.client.login(username="partner1", password="pass1234")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse("partners:notifications"))
+        self.assertEqual(self._context()["partner_unread_notifications_count"], 0)
+
+
+class UnreadMessageBadgeTests(TestCase):
+    """Badge "nuovi messaggi" da contatori denormalizzati su Order (niente N+1)."""
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            username="client1", password="pass1234", role="client"
+        )
+        self.partner_user = User.objects.create_user(
+            username="partner1", password="pass1234", role="partner"
+        )
+        self.partner = PartnerProfile.objects.create(
+            user=self.partner_user, company_name="Partner srl"
+        )
+        category = Category.objects.create(name="Categoria test", slug="categoria-test")
+        self.structure = ClientStructure.objects.create(owner=self.client_user, name="Hotel Test")
+        self.product = Product.objects.create(
+            name="Prodotto test",
+            supplier=self.partner,
+            base_price=Decimal("100.00"),
+            is_active=True,
+            category=category,
+        )
+
+    def _order_with_message(self):
+        order = Order.objects.create(
+            client=self.client_user,
+            structure=self.structure,
+            subtotal=Decimal("100.00"),
+            total=Decimal("100.00"),
+        )
+        OrderItem.objects.create(
+            order=order,
+            product=self.product,
+            partner=self.partner,
+            quantity=1,
+            unit_price=Decimal("100.00"),
+            total_price=Decimal("100.00"),
+        )
+        OrderMessage.objects.create(
+            order=order,
+            sender=self.client_user,
+            sender_role=OrderMessage.ROLE_CLIENT,
+            message="Ciao",
+            is_read_by_client=True,
+        )
+        return order
+
+    def _unread(self, order):
+        return Order.objects.values_list("unread_for_client", "unread_for_partner").get(pk=order.pk)
+
+    def test_order_list_queries_do_not_grow_with_orders(self):
+        self.client.login(username="partner1", password="pass1234")
+        self._order_with_message()
+        self.client.get(reverse("partners:order_list"))  # cache contatori calda
+
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(reverse("partners:order_list"))
+        self.assertContains(response, "bg-red-600")
+
+        for _ in range(5):
+            self._order_with_message()
+        self.client.get(reverse("partners:order_list"))
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("partners:order_list"))
+
+        self.assertEqual(len(many), len(few))
+
+    def test_counters_follow_messages_and_reads(self):
+        order = self._order_with_message()
+        self.assertEqual(self._unread(order), (0, 1))
+
+        self.client.login(username="partner1", password="pass1234")
+        self.client.post(
+            reverse("partners:order_detail", args=[order.id]), {"message": "Risposta"}, follow=True
+        )
+        self.assertEqual(self._unread(order), (1, 0))
+
+        self.client.login(username="client1", password="pass1234")
+        self.client.get(reverse("accounts:my_order_detail", args=[order.id]))
+        self.assertEqual(self._unread(order), (0, 0))
+        self.assertFalse(OrderMessage.objects.filter(is_read_by_client=False).exists())
+
+    def test_refresh_unread_counters(self):
+        order = self._order_with_message()
+        Order.objects.filter(pk=order.pk).update(unread_for_partner=7, unread_for_client=3)
+
+        Order.refresh_unread_counters([order.pk])
+        self.assertEqual(self._unread(order), (0, 1))
+
+
+class PartnerOrderSummaryTests(TestCase):
+    """Read model (partner, ordine) per "Ordini da evadere" / "Archivio"."""
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = User.objects.create_user(
+            username="client1", password="pass1234", role="client"
+        )
+        self.partner_user = User.objects.create_user(
+            username="partner1", password="pass1234", role="partner"
+        )
+        self.partner = PartnerProfile.objects.create(
+            user=self.partner_user, company_name="Partner srl"
+        )
+        other_user = User.objects.create_user(
+            username="partner2", password="pass1234", role="partner"
+        )
+        self.other = PartnerProfile.objects.create(user=other_user, company_name="Altro srl")
+        category = Category.objects.create(name="Categoria test", slug="categoria-test")
+        structure = ClientStructure.objects.create(owner=self.client_user, name="Hotel Test")
+        self.product = Product.objects.create(
+            name="Prodotto test",
+            supplier=self.partner,
+            base_price=Decimal("100.00"),
+            is_active=True,
+            category=category,
+        )
+        self.order = Order.objects.create(
+            client=self.client_user,
+            structure=structure,
+            subtotal=Decimal("200.00"),
+            total=Decimal("200.00"),
+        )
+        self.items = [
+            OrderItem.objects.create(
+                order=self.order,
+                product=self.product,
+                partner=self.partner,
+                quantity=1,
+                unit_price=Decimal("100.00"),
+                total_price=Decimal("100.00"),
+            )
+            for _ in range(2)
+        ]
+
+    def _summary(self, partner=None):
+        return PartnerOrderSummary.objects.get(partner=partner or self.partner, order=self.order)
+
+    def _complete(self, item):
+        item = OrderItem.objects.get(pk=item.pk)
+        item.partner_status = OrderItem.PARTNER_STATUS_COMPLETED
+        item.save()
+
+    def test_summary_follows_item_status(self):
+        summary = self._summary()
+        self.assertEqual((summary.items_count, summary.completed_count), (2, 0))
+        self.assertFalse(summary.is_archived)
+        self.assertEqual(summary.order_created_at, self.order.created_at)
+
+        self._complete(self.items[0])
+        self.assertFalse(self._summary().is_archived)
+
+        self._complete(self.items[1])
+        summary = self._summary()
+        self.assertEqual(summary.completed_count, 2)
+        self.assertTrue(summary.is_archived)
+
+    def test_partner_change_moves_summary(self):
+        item = OrderItem.objects.get(pk=self.items[0].pk)
+        item.partner = self.other
+        item.save()
+
+        self.assertEqual(self._summary().items_count, 1)
+        self.assertEqual(self._summary(self.other).items_count, 1)
+
+        OrderItem.objects.get(pk=self.items[1].pk).delete()
+        self.assertFalse(
+            PartnerOrderSummary.objects.filter(partner=self.partner, order=self.order).exists()
+        )
+
+    def test_list_and_archive_pages(self):
+        self.client.login(username="partner1", password="pass1234")
+        response = self.client.get(reverse("partners:order_list"))
+        self.assertEqual([o.pk for o in response.context["orders"]], [self.order.pk])
+        self.assertEqual(response.context["page_obj"].paginator.count, 1)
+
+        for item in self.items:
+            self._complete(item)
+        response = self.client.get(reverse("partners:order_list"))
+        self.assertEqual(response.context["orders"], [])
+        response = self.client.get(reverse("partners:order_archive"))
+        self.assertEqual([o.pk for o in response.context["orders"]], [self.order.pk])
+
+    def test_rebuild(self):
+        PartnerOrderSummary.objects.all().delete()
+        self.assertEqual(PartnerOrderSummary.rebuild(), 1)
+        self.assertEqual(self._summary().items_count, 2)
+
+    def test_order_export_csv_streams_filtered_rows(self):
+        self._complete(self.items[0])
+        self.client.login(username="partner1", password="pass1234")
+
+        response = self.client.get(reverse("partners:order_export_csv"), {"status": "completed"})
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        row = lines[1].split(";")
+        self.assertEqual(row[0], str(self.items[0].pk))
+        self.assertEqual(row[2], str(self.order.structure))
+        self.assertEqual(row[6], "Completato")
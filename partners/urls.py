@@ -48,3 +48,24 @@ urlpatterns = [
 
     path("notifications/", views.partner_notification_list, name="notifications"),
 ]
+
+
+# Budget per vista (b2b_portale.view_budgets, test orders/tests/test_view_budgets.py):
+# ruolo dell'utente di prova, argomenti dell'URL (chiavi del dataset di prova),
+# numero massimo di query con il dataset ingrandito.
+VIEW_BUDGETS = {
+    "dashboard": {"role": "partner", "queries": 16},
+    "analytics": {"role": "partner", "queries": 13},
+    "commissions": {"role": "partner", "queries": 8},
+    "order_list": {"role": "partner", "queries": 7},
+    "order_archive": {"role": "partner", "queries": 6},
+    "order_detail": {"role": "partner", "args": ["order"], "queries": 11},
+    "order_export_csv": {"role": "partner", "queries": 4},
+    "order_export_xlsx": {"role": "partner", "queries": 4},
+    "update_item_status": {"role": "partner", "args": ["item"], "queries": 5},
+    "profile": {"role": "partner", "queries": 5},
+    "product_list": {"role": "partner", "queries": 6},
+    "product_create": {"role": "partner", "queries": 6},
+    "product_edit": {"role": "partner", "args": ["product_id"], "queries": 7},
+    "notifications": {"role": "partner", "queries": 7},
+}
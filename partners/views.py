@@ -1,22 +1,25 @@
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import HttpResponseForbidden
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib import messages
 from django.urls import reverse
 
 from django.core.mail import send_mail
+from django.core.paginator import Paginator
 from django.conf import settings
 from datetime import timedelta
 
 import json
-import csv
-from io import BytesIO
-from openpyxl import Workbook
 
 from decimal import Decimal
 
-from .models import PartnerProfile, PartnerNotification
+from .models import PartnerProfile, PartnerNotification, PartnerOrderSummary
 from orders.models import Order, OrderItem, OrderItemStatusLog, OrderMessage, PartnerPayout
+from orders.partner_ledger import ledger_page, partner_balance
+from orders.utils import CommissionRateResolver
+from .counters import invalidate_partner_counters
+from b2b_portale import exports
+from b2b_portale.periods import period_q
 from django.core.exceptions import ValidationError
 from django.db.models import Count, Q, F
 
@@ -135,7 +138,9 @@ def partner_update_item_status(request, item_id):
             if new_status == OrderItem.PARTNER_STATUS_COMPLETED:
                 # NON ricalcoliamo se già calcolata: la fissiamo una volta sola
                 if item.commission_amount in (None, Decimal("0.00")):
-                    item.calculate_commission()
+                    item.calculate_commission(
+                        resolver=CommissionRateResolver.for_request(request)
+                    )
 
             # Se la riga viene RIFIUTATA, azzeriamo la commissione
             if new_status == OrderItem.PARTNER_STATUS_REJECTED:
@@ -214,6 +219,23 @@ def partner_update_item_status(request, item_id):
 #   LISTA ORDINI PARTNER
 # ============================================================
 
+ORDERS_PER_PAGE = 25
+
+
+def _partner_inbox_page(request, partner, archived):
+    """
+    Pagina di ordini del partner dal read model PartnerOrderSummary
+    (scansione sull'indice partner / is_archived / data ordine).
+    Restituisce (page, orders) con gli Order già in select_related.
+    """
+    summaries = (
+        PartnerOrderSummary.for_partner(partner, archived=archived)
+        .select_related("order__client", "order__structure")
+    )
+    page = Paginator(summaries, ORDERS_PER_PAGE).get_page(request.GET.get("page"))
+    return page, [summary.order for summary in page]
+
+
 @login_required
 def partner_order_list(request):
     partner = _get_partner_profile_or_403(request.user)
@@ -224,38 +246,14 @@ def partner_order_list(request):
     # - visualizziamo l'ordine in "Ordini da evadere" se esiste ALMENO una riga
     #   del partner NON in stato COMPLETATO.
     # - se TUTTE le righe del partner sono COMPLETATE, l'ordine va in Archivio.
-    completed = OrderItem.PARTNER_STATUS_COMPLETED
-
-    base_qs = (
-        Order.objects
-        .filter(items__partner=partner)
-        .annotate(
-            partner_items=Count("items", filter=Q(items__partner=partner), distinct=True),
-            partner_completed_items=Count(
-                "items",
-                filter=Q(items__partner=partner, items__partner_status=completed),
-                distinct=True,
-            ),
-        )
-        .filter(partner_items__gt=0)
-    )
-
-    orders = (
-        base_qs
-        .exclude(partner_items=F("partner_completed_items"))
-        .order_by("-created_at")
-    )
-
-    # calcolo badge nuovi messaggi per ogni ordine
-    for o in orders:
-        o.unread_messages = OrderMessage.objects.filter(
-            order=o,
-            is_read_by_partner=False,
-        ).exists()
+    # (flag is_archived mantenuto su PartnerOrderSummary; il badge nuovi messaggi
+    #  è il contatore denormalizzato Order.unread_for_partner)
+    page, orders = _partner_inbox_page(request, partner, archived=False)
 
     context = {
         "partner": partner,
         "orders": orders,
+        "page_obj": page,
     }
     return render(request, "partners/order_list.html", context)
 
@@ -271,38 +269,13 @@ def partner_order_archive(request):
     if partner is None:
         return redirect("catalog:product_list")
 
-    completed = OrderItem.PARTNER_STATUS_COMPLETED
-
-    base_qs = (
-        Order.objects
-        .filter(items__partner=partner)
-        .annotate(
-            partner_items=Count("items", filter=Q(items__partner=partner), distinct=True),
-            partner_completed_items=Count(
-                "items",
-                filter=Q(items__partner=partner, items__partner_status=completed),
-                distinct=True,
-            ),
-        )
-        .filter(partner_items__gt=0)
-    )
-
-    orders = (
-        base_qs
-        .filter(partner_items=F("partner_completed_items"))
-        .order_by("-created_at")
-    )
-
-    # calcolo badge nuovi messaggi per ogni ordine
-    for o in orders:
-        o.unread_messages = OrderMessage.objects.filter(
-            order=o,
-            is_read_by_partner=False,
-        ).exists()
+    # ordini con TUTTE le righe del partner COMPLETATE
+    page, orders = _partner_inbox_page(request, partner, archived=True)
 
     context = {
         "partner": partner,
         "orders": orders,
+        "page_obj": page,
     }
     return render(request, "partners/order_archive.html", context)
 
@@ -325,10 +298,10 @@ def partner_order_detail(request, order_id):
         return redirect("catalog:product_list")
 
     # queryset di ordini che hanno almeno una riga per questo partner
+    # (un solo riepilogo per coppia partner/ordine: niente duplicati né distinct)
     qs = (
         Order.objects
-        .filter(items__partner=partner)
-        .distinct()  # evita duplicati se ci sono più righe per lo stesso ordine
+        .filter(partner_summaries__partner=partner)
         .select_related("client", "structure")
     )
 
@@ -369,7 +342,7 @@ def partner_order_detail(request, order_id):
     )
 
     # Il partner ora li ha visti: segniamo come letti lato partner
-    messages_qs.filter(is_read_by_partner=False).update(is_read_by_partner=True)
+    OrderMessage.mark_read(order, OrderMessage.ROLE_PARTNER)
 
     context = {
         "partner": partner,
@@ -409,7 +382,7 @@ def partner_dashboard(request):
         OrderItem.objects
         .filter(partner=profile)
         .select_related("order", "product")
-        .order_by("-order__created_at")
+        .order_by("-order_created_at")
     )
 
     from django.db.models import Sum
@@ -433,7 +406,7 @@ def partner_dashboard(request):
     # Ricavi del mese (valore numerico)
     # ------------------------------------------------------------
     revenue_month = (
-        items.filter(order__created_at__year=now.year, order__created_at__month=now.month)
+        items.filter(period_q("order_created_at", timezone.localdate(now).replace(day=1)))
         .aggregate(total=Sum("total_price"))
         .get("total") or 0
     )
@@ -448,15 +421,16 @@ def partner_dashboard(request):
     )
 
     # Ultime 10 righe assegnate
-    latest_items = items[:10]
+    latest_items = items.select_related("order__structure")[:10]
 
     # Ultimi 5 ordini
-    recent_orders = (
-        Order.objects
-        .filter(items__partner=profile)
-        .distinct()
-        .order_by("-created_at")[:5]
-    )
+    recent_orders = [
+        summary.order
+        for summary in (
+            PartnerOrderSummary.for_partner(profile)
+            .select_related("order__client", "order__structure")[:5]
+        )
+    ]
 
     # Notifiche
     unread_notifications_count = PartnerNotification.objects.filter(
@@ -531,8 +505,8 @@ def partner_analytics(request):
     # 1) Vendite per mese (somma total_price per mese)
     # ------------------------------------------------------------
     revenue_by_month_qs = (
-        items.filter(order__created_at__gte=start_date)
-        .annotate(month=TruncMonth("order__created_at"))
+        items.filter(order_created_at__gte=start_date)
+        .annotate(month=TruncMonth("order_created_at"))
         .values("month")
         .annotate(total=Sum("total_price"))
         .order_by("month")
@@ -614,39 +588,27 @@ def partner_commissions(request):
     """
     Pagina riepilogo commissioni e pagamenti del partner.
 
-    LATO PARTNER:
-    - totale GUADAGNO MATURATO = somma di partner_earnings
+    LATO PARTNER (dal registro contabile, orders/partner_ledger.py):
+    - totale GUADAGNO MATURATO = partner_earnings delle righe completate
       (cioè totale righe ordine meno commissione portale)
-    - totale GUADAGNO GIA' PAGATO = somma dei payout in stato 'Pagato'
+    - totale GUADAGNO GIA' PAGATO = payout in stato 'Pagato'
     - saldo da ricevere = maturato - pagato
-    - elenco righe commissionate
+    - movimenti del registro, paginati a cursore (?after= / ?before=)
     - elenco pagamenti registrati
+
+    I totali sono quelli dell'ultima voce del registro: nessuna aggregazione
+    su righe e payout a ogni apertura della pagina.
     """
     profile = _get_partner_profile_or_403(request.user)
     if profile is None:
         return HttpResponseForbidden("Non sei abilitato come partner.")
 
-    from django.db.models import Sum
-
-    # Righe completate che generano GUADAGNO per il partner,
-    # solo su ordini COMPLETI (stato 'completed')
-    items = (
-        OrderItem.objects
-        .filter(
-            partner=profile,
-            partner_status=OrderItem.PARTNER_STATUS_COMPLETED,
-            order__status=Order.STATUS_PAID,
-        )
-        .select_related("order", "product")
-        .order_by("-order__created_at")
-    )
-
-    # 🔹 Totale GUADAGNO partner maturato (NON la commissione del portale)
-    totals = items.aggregate(
-        total_partner=Sum("partner_earnings"),
-        total_portal=Sum("commission_amount"),  # se vuoi usarlo altrove
+    balance = partner_balance(profile)
+    entries = ledger_page(
+        profile,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
     )
-    total_commission_matured = totals.get("total_partner") or Decimal("0.00")
 
     # Pagamenti registrati per il partner
     payouts = (
@@ -655,25 +617,14 @@ def partner_commissions(request):
         .order_by("-period_end", "-created_at")
     )
 
-    # 🔹 Importo già PAGATO al partner
-    total_payout_paid = (
-        payouts.filter(status=PartnerPayout.STATUS_PAID)
-        .aggregate(total=Sum("total_commission"))
-        .get("total") or Decimal("0.00")
-    )
-
-    # 🔹 Saldo ancora da ricevere
-    total_commission_unpaid = total_commission_matured - total_payout_paid
-    if total_commission_unpaid < Decimal("0.00"):
-        total_commission_unpaid = Decimal("0.00")
-
     context = {
         "partner": profile,
-        "commission_items": items,
+        "ledger_entries": entries,
         "payouts": payouts,
-        "total_commission_matured": total_commission_matured,
-        "total_payout_paid": total_payout_paid,
-        "total_commission_unpaid": total_commission_unpaid,
+        "total_commission_matured": balance["earned_total"],
+        "total_payout_paid": balance["paid_total"],
+        # 🔹 Saldo ancora da ricevere (mai negativo a video)
+        "total_commission_unpaid": max(balance["balance"], Decimal("0.00")),
     }
 
     return render(request, "partners/commissions.html", context)
@@ -706,10 +657,11 @@ def partner_notification_list(request):
     response = render(request, "partners/notifications.html", context)
 
     # 2) dopo aver mostrato la pagina, segniamo come lette le non lette
-    PartnerNotification.objects.filter(
+    if PartnerNotification.objects.filter(
         partner=profile,
         is_read=False,
-    ).update(is_read=True)
+    ).update(is_read=True):
+        invalidate_partner_counters(profile.pk)
 
     return response
 
@@ -804,30 +756,16 @@ def partner_product_edit(request, product_id):
 #   EXPORT RIGHE ORDINE PARTNER (CSV + XLSX)
 # ============================================================
 
-@login_required
-def partner_order_export_csv(request):
+def _partner_export_rows(request, partner):
     """
-    Esporta in CSV le righe d'ordine del partner,
-    applicando gli stessi filtri della lista ordini.
+    Righe d'ordine del partner per gli export (stessi filtri della lista ordini),
+    come proiezione values() letta a blocchi.
     """
-    if getattr(request.user, "role", None) != "partner":
-        return HttpResponseForbidden("Area riservata ai partner.")
-
-    partner = get_object_or_404(PartnerProfile, user=request.user)
-
-    # Base queryset
-    items = (
-        OrderItem.objects
-        .filter(partner=partner)
-        .select_related("order", "product", "order__structure")
-        .order_by("-order__created_at")
-    )
-
-    # --- FILTRI (COPIATI DA partner_order_list) ----------------
     from django.utils import timezone
-    from datetime import timedelta
     from django.db.models import Q
 
+    items = OrderItem.objects.filter(partner=partner)
+
     # Stato
     current_status = request.GET.get("status", "").strip()
     if current_status:
@@ -835,16 +773,14 @@ def partner_order_export_csv(request):
 
     # Periodo
     current_period = request.GET.get("period", "").strip()
-    now = timezone.now()
+    today = timezone.localdate()
 
     if current_period == "today":
-        items = items.filter(order__created_at__date=now.date())
+        items = items.filter(period_q("order_created_at", today, today))
     elif current_period == "week":
-        week_ago = now - timedelta(days=7)
-        items = items.filter(order__created_at__date__gte=week_ago.date())
+        items = items.filter(period_q("order_created_at", today - timedelta(days=7)))
     elif current_period == "month":
-        month_ago = now - timedelta(days=30)
-        items = items.filter(order__created_at__date__gte=month_ago.date())
+        items = items.filter(period_q("order_created_at", today - timedelta(days=30)))
 
     # Ricerca
     current_query = request.GET.get("q", "").strip()
@@ -855,41 +791,47 @@ def partner_order_export_csv(request):
             Q(order__structure__name__icontains=current_query)
         )
 
-    # --- CREAZIONE CSV -----------------------------------------
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="ordini_partner.csv"'
+    return exports.iter_rows(
+        items
+        .order_by("-order_created_at")
+        .values(
+            "id",
+            "order_id",
+            "order__structure__name",
+            "order__structure__city",
+            "product__name",
+            "quantity",
+            "total_price",
+            "partner_status",
+            "order_created_at",
+        )
+    )
+
+
+_PARTNER_STATUS_LABELS = dict(OrderItem.PARTNER_STATUS_CHOICES)
 
-    writer = csv.writer(response, delimiter=";")
-    writer.writerow([
-        "ID Riga",
-        "ID Ordine",
+PARTNER_EXPORT_COLUMNS = [
+    exports.Column("ID Riga", "id"),
+    exports.Column("ID Ordine", "order_id"),
+    exports.Column(
         "Struttura",
-        "Prodotto",
-        "Quantità",
-        "Totale",
+        lambda row: f"{row['order__structure__name']} - {row['order__structure__city']}",
+    ),
+    exports.Column("Prodotto", "product__name"),
+    exports.Column("Quantità", "quantity"),
+    exports.Column("Totale", lambda row: float(row["total_price"])),
+    exports.Column(
         "Stato partner",
-        "Data ordine",
-    ])
-
-    for item in items:
-        writer.writerow([
-            item.id,
-            item.order.id,
-            str(item.order.structure),
-            item.product.name,
-            item.quantity,
-            float(item.total_price),
-            item.get_partner_status_display(),
-            item.order.created_at.strftime("%d/%m/%Y %H:%M"),
-        ])
-
-    return response
+        lambda row: _PARTNER_STATUS_LABELS.get(row["partner_status"], row["partner_status"]),
+    ),
+    exports.Column("Data ordine", lambda row: row["order_created_at"].strftime("%d/%m/%Y %H:%M")),
+]
 
 
 @login_required
-def partner_order_export_xlsx(request):
+def partner_order_export_csv(request):
     """
-    Esporta in XLSX le righe d'ordine del partner,
+    Esporta in CSV (in streaming) le righe d'ordine del partner,
     applicando gli stessi filtri della lista ordini.
     """
     if getattr(request.user, "role", None) != "partner":
@@ -897,83 +839,25 @@ def partner_order_export_xlsx(request):
 
     partner = get_object_or_404(PartnerProfile, user=request.user)
 
-    # Base queryset
-    items = (
-        OrderItem.objects
-        .filter(partner=partner)
-        .select_related("order", "product", "order__structure")
-        .order_by("-order__created_at")
+    return exports.csv_response(
+        "ordini_partner.csv",
+        PARTNER_EXPORT_COLUMNS,
+        _partner_export_rows(request, partner),
     )
 
-    # --- FILTRI (COPIATI DA partner_order_list) ----------------
-    from django.utils import timezone
-    from datetime import timedelta
-    from django.db.models import Q
-
-    # Stato
-    current_status = request.GET.get("status", "").strip()
-    if current_status:
-        items = items.filter(partner_status=current_status)
-
-    # Periodo
-    current_period = request.GET.get("period", "").strip()
-    now = timezone.now()
 
-    if current_period == "today":
-        items = items.filter(order__created_at__date=now.date())
-    elif current_period == "week":
-        week_ago = now - timedelta(days=7)
-        items = items.filter(order__created_at__date__gte=week_ago.date())
-    elif current_period == "month":
-        month_ago = now - timedelta(days=30)
-        items = items.filter(order__created_at__date__gte=month_ago.date())
-
-    # Ricerca
-    current_query = request.GET.get("q", "").strip()
-    if current_query:
-        items = items.filter(
-            Q(order__id__icontains=current_query) |
-            Q(product__name__icontains=current_query) |
-            Q(order__structure__name__icontains=current_query)
-        )
+@login_required
+def partner_order_export_xlsx(request):
+    """
+    Esporta in XLSX (writer a memoria costante) le righe d'ordine del partner,
+    applicando gli stessi filtri della lista ordini.
+    """
+    if getattr(request.user, "role", None) != "partner":
+        return HttpResponseForbidden("Area riservata ai partner.")
 
-    # --- CREAZIONE XLSX ----------------------------------------
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Ordini Partner"
+    partner = get_object_or_404(PartnerProfile, user=request.user)
 
-    headers = [
-        "ID Riga",
-        "ID Ordine",
-        "Struttura",
-        "Prodotto",
-        "Quantità",
-        "Totale",
-        "Stato partner",
-        "Data ordine",
-    ]
-    ws.append(headers)
-
-    for item in items:
-        ws.append([
-            item.id,
-            item.order.id,
-            str(item.order.structure),
-            item.product.name,
-            item.quantity,
-            float(item.total_price),
-            item.get_partner_status_display(),
-            item.order.created_at.strftime("%d/%m/%Y %H:%M"),
-        ])
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    response = HttpResponse(
-        output.getvalue(),
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    return exports.xlsx_response(
+        "ordini_partner.xlsx",
+        [exports.Sheet("Ordini Partner", PARTNER_EXPORT_COLUMNS, _partner_export_rows(request, partner))],
     )
-    response["Content-Disposition"] = 'attachment; filename="ordini_partner.xlsx"'
-
-    return response